@@ -0,0 +1,160 @@
+# api/assets.py
+# 静态资源指纹化（无构建步骤）：启动时扫描 api/static，按内容哈希生成文件名，
+# 预先压缩出 .gz（装了 brotli 再出 .br）放进缓存目录；模板里用 asset_url('js/outbound.js') 取地址。
+# 文件名随内容变，所以可以 immutable 长缓存：改了 JS 就是新 URL，没改的工作站重复打开页面不再下载。
+from __future__ import annotations
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+from fastapi import APIRouter, Request
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli  # 可选：没装就只提供 gzip
+except ImportError:
+    brotli = None
+
+from api.deps import get_cfg
+
+router = APIRouter()
+
+# 值得压缩的类型；图片/字体等本身已压缩，只做指纹不做预压缩
+_COMPRESSIBLE = {".js", ".mjs", ".css", ".svg", ".json", ".html", ".txt", ".map"}
+_MIN_COMPRESS_BYTES = 512
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class Asset:
+    __slots__ = ("logical", "hashed", "digest", "media_type", "variants")
+
+    def __init__(self, logical: str, hashed: str, digest: str, media_type: str):
+        self.logical = logical
+        self.hashed = hashed
+        self.digest = digest
+        self.media_type = media_type
+        self.variants: dict[str, Path] = {}   # 编码 → 文件："" 为原文
+
+
+class AssetManifest:
+    """逻辑路径 → 指纹文件。只在构造时扫描一次；改了静态文件需重启进程（与模板字节码缓存一致）。"""
+
+    def __init__(self, src_dir: str, out_dir: str):
+        self.src_dir = Path(src_dir)
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._by_logical: dict[str, Asset] = {}
+        self._by_hashed: dict[str, Asset] = {}
+        self.bytes_raw = 0
+        self.bytes_gzip = 0
+        self.bytes_br = 0
+        self._build()
+
+    # ====== 生成 ======
+    def _build(self):
+        if not self.src_dir.is_dir():
+            return
+        for src in sorted(self.src_dir.rglob("*")):
+            if not src.is_file():
+                continue
+            rel = src.relative_to(self.src_dir)
+            logical = rel.as_posix()
+            data = src.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            # js/jsQR.min.js → js/jsQR.min.<哈希>.js
+            hashed = rel.with_name(f"{rel.stem}.{digest}{rel.suffix}").as_posix()
+            media_type = mimetypes.guess_type(src.name)[0] or "application/octet-stream"
+            if media_type.startswith("text/") or media_type in ("application/javascript", "application/json"):
+                media_type += "; charset=utf-8"
+            a = Asset(logical, hashed, digest, media_type)
+            a.variants[""] = self._emit(hashed, data)
+            self.bytes_raw += len(data)
+            if src.suffix.lower() in _COMPRESSIBLE and len(data) >= _MIN_COMPRESS_BYTES:
+                gz = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(gz) < len(data):
+                    a.variants["gzip"] = self._emit(hashed + ".gz", gz)
+                    self.bytes_gzip += len(gz)
+                if brotli is not None:
+                    br = brotli.compress(data, quality=11)
+                    if len(br) < len(data):
+                        a.variants["br"] = self._emit(hashed + ".br", br)
+                        self.bytes_br += len(br)
+            self._by_logical[logical] = a
+            self._by_hashed[hashed] = a
+
+    def _emit(self, name: str, data: bytes) -> Path:
+        """按内容寻址写入缓存目录；已存在即复用（多 worker 同时启动时先写临时文件再原子改名）。"""
+        out = self.out_dir / name
+        if out.is_file() and out.stat().st_size == len(data):
+            return out
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_name(f"{out.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, out)
+        return out
+
+    # ====== 查询 ======
+    def url(self, logical: str) -> str:
+        """模板用：指纹 URL；清单里没有（比如启动后才新增的文件）退回普通 /static 地址。"""
+        a = self._by_logical.get(logical.lstrip("/"))
+        return f"/assets/{a.hashed}" if a is not None else f"/static/{logical.lstrip('/')}"
+
+    def lookup(self, hashed: str) -> Asset | None:
+        return self._by_hashed.get(hashed)
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._by_logical),
+            "bytes_raw": self.bytes_raw,
+            "bytes_gzip": self.bytes_gzip,
+            "bytes_br": self.bytes_br,
+            "brotli": brotli is not None,
+        }
+
+
+def _accepts(request: Request) -> set[str]:
+    out = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        out.add(name.strip().lower())
+    return out
+
+
+# —— 进程内单例（启动时生成一次） ——
+_manifest: AssetManifest | None = None
+_manifest_lock = threading.Lock()
+
+def get_assets() -> AssetManifest:
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = AssetManifest("api/static", get_cfg().paths["asset_cache_dir"])
+    return _manifest
+
+def asset_url(logical: str) -> str:
+    return get_assets().url(logical)
+
+
+@router.get("/assets/{path:path}")
+def serve_asset(path: str, request: Request):
+    a = get_assets().lookup(path)
+    if a is None:
+        return Response(status_code=404)
+    accepted = _accepts(request)
+    enc = next((e for e in ("br", "gzip") if e in a.variants and e in accepted), "")
+    # 各编码的字节不同，ETag 也要不同（原文 "<哈希>"，压缩版 "<哈希>-gzip" / "<哈希>-br"），缓存/代理不会串用
+    etag = f'"{a.digest}-{enc}"' if enc else f'"{a.digest}"'
+    headers = {"Cache-Control": _IMMUTABLE, "ETag": etag, "Vary": "Accept-Encoding"}
+    if enc:
+        headers["Content-Encoding"] = enc
+    # If-None-Match 按弱比较：忽略 W/ 前缀
+    tags = [t.strip().removeprefix("W/") for t in request.headers.get("if-none-match", "").split(",")]
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(a.variants[enc], media_type=a.media_type, headers=headers)
@@ -0,0 +1,81 @@
+# api/conditional.py
+# 列表页条件 GET：ETag = hash(相关表版本 + 租户 + 用户 + 路径 + 查询参数 + 页面代码指纹)，
+# 浏览器带 If-None-Match / If-Modified-Since 回来且数据没变时直接 304，跳过查询与渲染。
+# 所有输入都与进程无关：多个 uvicorn worker 对同一数据给出同一个 ETag，请求落到哪个 worker 都能 304。
+from __future__ import annotations
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from api.deps import get_change_tracker, get_tenant
+
+def _page_build() -> tuple[str, int]:
+    """
+    页面代码指纹：模板与静态文件的内容哈希 + 最新修改时间。
+    发版改了模板/脚本时旧 ETag 失效；同一份代码的各个 worker、重启前后算出来都一样。
+    """
+    h = hashlib.sha1()
+    newest = 0
+    for root in ("api/templates", "api/static"):
+        for f in sorted(Path(root).rglob("*")):
+            if f.is_file():
+                h.update(f.as_posix().encode("utf-8"))
+                h.update(f.read_bytes())
+                newest = max(newest, int(f.stat().st_mtime))
+    return h.hexdigest()[:12], newest
+
+
+_BUILD_ID, _BUILD_TS = _page_build()
+
+
+class Validator:
+    """一次请求的校验器：先算（在查询之前算，竞态时最多多渲染一次，不会把新数据当旧的），再决定 304 还是渲染。"""
+
+    def __init__(self, request: Request, etag: str, last_modified: int):
+        self.request = request
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def _headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            # 页面因用户而异：只许浏览器私有缓存，且每次都要回源校验
+            "Cache-Control": "private, no-cache",
+            "Vary": "Cookie",
+        }
+
+    def is_fresh(self) -> bool:
+        inm = self.request.headers.get("if-none-match")
+        if inm is not None:
+            # 有 If-None-Match 时忽略 If-Modified-Since（RFC 9110 13.2.2）
+            tags = [t.strip() for t in inm.split(",")]
+            return "*" in tags or self.etag in tags or self.etag.removeprefix("W/") in tags
+        ims = self.request.headers.get("if-modified-since")
+        if ims:
+            try:
+                return int(parsedate_to_datetime(ims).timestamp()) >= self.last_modified
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def not_modified(self) -> Response:
+        return Response(status_code=304, headers=self._headers())
+
+    def apply(self, response: Response) -> Response:
+        if 200 <= response.status_code < 300:
+            for k, v in self._headers().items():
+                response.headers[k] = v
+        return response
+
+
+def validator(request: Request, user: dict, tables: tuple[str, ...]) -> Validator:
+    versions, changed_at = get_change_tracker().token(tables)
+    query = sorted(request.query_params.multi_items())
+    who = (user.get("id"), user.get("username"), tuple(sorted(user.get("roles") or [])))
+    raw = repr((_BUILD_ID, get_tenant().code, request.url.path, query, who, tables, versions))
+    etag = 'W/"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+    return Validator(request, etag, max(changed_at, _BUILD_TS))
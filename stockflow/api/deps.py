@@ -1,11 +1,20 @@
 # api/deps.py
 from __future__ import annotations
 import pathlib
-import sqlite3
 from fastapi import Request, HTTPException, status
 
 from utils.config import load_config
-from infra.db_interface import DB, run_migrations
+from infra.db_interface import DB, ChangeTracker, Checkpointer, SqliteTuning, migrate_all
+from infra.storage import SQLITE, open_storage
+from infra.invalidation import InvalidationBus
+from infra.maintenance import MaintenanceScheduler, vacuum_if_fragmented
+from infra.readers import ReaderPool
+from infra.writer import WriteQueue
+from api.fragments import FragmentCache
+from api.events import EventBus, product_listener
+from export.label_pdf import PdfCache
+from api import tenancy
+from api.tenancy import TenantRouter
 
 try:
     from core.services.inventory import InventoryService
@@ -13,105 +22,175 @@ try:
 except ModuleNotFoundError:
     from services.inventory import InventoryService
     from services.auth import AuthService
+from core.services.qr_index import QrIndex
+from core.services.analytics import InventoryAnalytics
+from core.services.catalog import ProductCatalog
+from core.services.outbox import OutboxExporter
+from export.event_logger import make_sinks
 
 _cfg = load_config()
-_db = DB(_cfg.database_path)
-
-def _has_column(conn, table: str, column: str) -> bool:
-    try:
-        cols = [c[1] for c in conn.execute(f"PRAGMA table_info({table})").fetchall()]
-        return column in cols
-    except Exception:
-        return False
-
-def ensure_all_migrations():
-    run_migrations(_db)
-
-    files_in_order = [
-        "0002_auth.sql",
-        "0003_product_photo.sql",
-        "0004_product_extra.sql",
-        "0005_product_tax.sql",
-        "0006_product_remark.sql",
-        "0007_settings.sql",
-        "0008_sku_qr.sql",
-        "0009_label_print.sql",
-        "0010_loans.sql",          # ✅ 新增
-    ]
-
-    with _db.connect() as conn:
-        for fname in files_in_order:
-            f = pathlib.Path(f"infra/migrations/{fname}")
-            if f.exists():
-                try:
-                    conn.executescript(f.read_text(encoding="utf-8"))
-                except sqlite3.OperationalError:
-                    pass  # 幂等忽略
-
-        # 兜底列（避免旧库缺列）
-        for col, ddl in [
-            ("photo_path",   "ALTER TABLE products ADD COLUMN photo_path TEXT"),
-            ("category",     "ALTER TABLE products ADD COLUMN category TEXT"),
-            ("detail",       "ALTER TABLE products ADD COLUMN detail TEXT"),
-            ("login_date",   "ALTER TABLE products ADD COLUMN login_date TEXT"),
-            ("tax_included", "ALTER TABLE products ADD COLUMN tax_included INTEGER NOT NULL DEFAULT 1"),
-            ("remark",       "ALTER TABLE products ADD COLUMN remark TEXT"),
-            ("status",       "ALTER TABLE products ADD COLUMN status TEXT"),
-            ("borrower",     "ALTER TABLE products ADD COLUMN borrower TEXT"),
-            # ✅ 新增借出字段兜底
-            ("borrower_company",  "ALTER TABLE products ADD COLUMN borrower_company TEXT"),
-            ("borrower_receiver", "ALTER TABLE products ADD COLUMN borrower_receiver TEXT"),
-            ("borrower_handler",  "ALTER TABLE products ADD COLUMN borrower_handler TEXT"),
-            ("borrowed_at",       "ALTER TABLE products ADD COLUMN borrowed_at TEXT"),
-            ("sku",          "ALTER TABLE products ADD COLUMN sku TEXT"),
-            ("qr_payload",   "ALTER TABLE products ADD COLUMN qr_payload TEXT"),
-        ]:
-            if not _has_column(conn, "products", col):
-                try:
-                    conn.execute(ddl)
-                except sqlite3.OperationalError:
-                    pass
-
-        # 默认 status
-        try:
-            conn.execute("UPDATE products SET status='在库' WHERE status IS NULL OR status=''")
-        except:
-            pass
-
-        try:
-            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products(sku)")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_qr_payload ON products(qr_payload)")
-        except sqlite3.OperationalError:
-            pass
-        try:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS sequences (
-                  scope TEXT PRIMARY KEY,
-                  next  INTEGER NOT NULL
-                )
-            """)
-        except sqlite3.OperationalError:
-            pass
-
-        conn.commit()
-
-    AuthService(_db).ensure_default_admin()
-
-ensure_all_migrations()
+# 读线程池按进程共享（所有租户共用）；其余按库的状态见 TenantState
+_readers = ReaderPool(_cfg.performance["reader_workers"], _cfg.performance["reader_slow_wait_ms"])
+
+def ensure_all_migrations(db: DB):
+    migrate_all(db)
+    AuthService(db).ensure_default_admin()
+
+class TenantState:
+    """
+    一个库（默认库或某个租户库）的全部进程内状态：连接、写线程、检查点、变更令牌、
+    扫码索引、片段/PDF/报表缓存、SSE 事件总线、跨 worker 失效总线。
+    多租户时每个租户一份，缓存互不串用；close() 停掉后台线程。
+    """
+
+    def __init__(self, code: str, db_path: str, database_url: str = ""):
+        perf = _cfg.performance
+        self.code = code
+        self.active = 0             # 在途请求数（TenantRouter 据此判断能否关闭）
+        self.company_ready = False  # 已确认设置过 company_code（server 的引导中间件用）
+        self.db = open_storage(db_path, database_url, perf["pg_pool_min"], perf["pg_pool_max"],
+                               SqliteTuning.from_config(perf))
+        ensure_all_migrations(self.db)
+
+        self.writer = None
+        self.maintenance = None
+        self.checkpointer = Checkpointer(self.db, perf["checkpoint_interval_s"], perf["checkpoint_truncate_pages"])
+        if self.db.dialect is SQLITE:
+            # 迁移完成后再挂写线程：此后所有 db.run_write() 都走单写者合并提交
+            self.writer = WriteQueue(db_path,
+                                     window_ms=perf["writer_window_ms"],
+                                     max_batch=perf["writer_max_batch"],
+                                     busy_timeout_ms=perf["busy_timeout_ms"],
+                                     # 定时检查点开启时关闭写线程的自动检查点，两者不重复做
+                                     wal_autocheckpoint=0 if perf["checkpoint_interval_s"] > 0 else 1000)
+            self.db.attach_writer(self.writer)
+            self.checkpointer.start()
+
+        self.qr_index = QrIndex(self.db)
+        self.fragments = FragmentCache(perf["fragment_cache_rows"])
+        self.label_pdfs = PdfCache(perf["label_pdf_cache_mb"] * 1024 * 1024)
+        # 商品状态/售价变化经扫码索引的写后回调推给订阅的工作站（SSE）
+        self.events = EventBus(perf["event_buffer"])
+        self.qr_index.add_listener(product_listener(self.events))
+
+        self.changes = ChangeTracker(self.db)
+        # 报表列快照按 products 版本缓存，数据没变时不重复取数
+        self.analytics = InventoryAnalytics(self.db, self.changes)
+        # 商品列表类读取走列存目录，products 版本变了才增量同步
+        self.catalog = ProductCatalog(self.db, self.changes)
+
+        # 事件随业务事务写进 outbox，由后台线程按顺序导出到流水日志（租户各自一个子目录）
+        log_dir = pathlib.Path(_cfg.paths["event_log_dir"])
+        self.outbox = OutboxExporter(self.db, make_sinks(perf["outbox_sinks"], str(log_dir / code if code else log_dir)),
+                                     perf["outbox_poll_ms"], perf["outbox_batch"])
+        self.outbox.start()
+
+        # 空闲时收缩 WAL、定时 optimize / 回收空闲页 / 补账本结存检查点（只对 SQLite）
+        if self.db.dialect is SQLITE:
+            self.maintenance = MaintenanceScheduler(self.db, perf["maintenance_tick_s"], perf["maintenance_idle_s"])
+            self.maintenance.add("optimize", perf["optimize_interval_s"], self.db.optimize)
+            self.maintenance.add("vacuum", perf["vacuum_interval_s"],
+                                 lambda: vacuum_if_fragmented(self.db, perf["vacuum_free_ratio"],
+                                                              full_max_bytes=perf["vacuum_full_max_mb"] * 1024 * 1024))
+            ledger = InventoryService(self.db, perf["ledger_checkpoint_every"]).ledger
+            self.maintenance.add("ledger_checkpoint", perf["ledger_checkpoint_interval_s"],
+                                 lambda: {"pairs": ledger.checkpoint_all()})
+            self.maintenance.start()
+
+        # 跨 worker 失效：别的进程写了 products/settings，本进程的扫码索引先标记过期，
+        # 后台线程再增量同步（有扫码页在线时顺带把变化推给本进程的 SSE 订阅者）。
+        # 片段缓存/标签 PDF/报表快照的键本身带行版本或表版本，不需要订阅。
+        self.invalidation = InvalidationBus(self.changes, perf["invalidation_poll_ms"])
+        self.invalidation.subscribe(("products", "settings"), self.qr_index.invalidate)
+        self.invalidation.subscribe(("products", "settings"), self._sync_qr_index, background=True)
+        if perf["invalidation_poll_ms"] > 0:
+            self.invalidation.start()
+        else:
+            self.invalidation.check()
+
+    def _sync_qr_index(self, changed):
+        if self.qr_index.loaded or self.events.stats()["subscribers"]:
+            self.qr_index.ensure_loaded()
+
+    def close(self):
+        self.invalidation.stop()
+        self.outbox.stop()
+        if self.maintenance is not None:
+            self.maintenance.stop()
+        self.checkpointer.stop()
+        if self.writer is not None:
+            self.writer.stop()
+            self.db.writer = None
+        if hasattr(self.db, "close"):
+            self.db.close()
+
+
+# 默认库可以是 PostgreSQL（database_url）；租户库始终是各自目录下的 SQLite 文件
+_default = TenantState("", _cfg.database_path, _cfg.database_url)
+
+if _cfg.performance["sql_trace"]:
+    _default.db.enable_trace(_cfg.performance["sql_slow_ms"])
+
+_tenants = TenantRouter(_cfg.tenants, TenantState, _default)
+
+def get_tenant() -> TenantState:
+    """当前请求的租户状态（多租户中间件绑定）；未绑定时为默认库。"""
+    return tenancy.current() or _default
+
+def get_tenant_router():
+    return _tenants
 
 def get_cfg():
     return _cfg
 
 def get_db():
-    return _db
+    return get_tenant().db
+
+def get_readers():
+    return _readers
+
+def get_label_pdfs():
+    return get_tenant().label_pdfs
+
+def get_events():
+    return get_tenant().events
+
+def get_change_tracker():
+    return get_tenant().changes
+
+def get_analytics():
+    return get_tenant().analytics
+
+def get_catalog():
+    return get_tenant().catalog
+
+def get_outbox():
+    return get_tenant().outbox
+
+def get_invalidation():
+    return get_tenant().invalidation
+
+def get_fragments():
+    return get_tenant().fragments
+
+def get_checkpointer():
+    return get_tenant().checkpointer
+
+def get_maintenance():
+    return get_tenant().maintenance
+
+def get_writer():
+    return get_tenant().writer
+
+def get_qr_index():
+    return get_tenant().qr_index
 
 def get_services():
-    return InventoryService(_db), AuthService(_db)
+    db = get_tenant().db
+    return InventoryService(db, _cfg.performance["ledger_checkpoint_every"]), AuthService(db)
 
-def current_user(request: Request):
+# 只做 JWT 解码（纯 CPU、无 IO），声明为 async 以免每个请求都去占默认线程池
+async def current_user(request: Request):
     cookie_name = _cfg.security.get("cookie_name", "sf_session")
     token = request.cookies.get(cookie_name)
     if not token:
@@ -120,4 +199,14 @@ def current_user(request: Request):
     data = decode_jwt(token, _cfg.security["secret_key"])
     if not data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    # 令牌只在签发它的租户内有效（各租户的用户表是各自库里的）
+    if (data.get("tenant") or "") != get_tenant().code:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     return data
+
+# 管理接口：要求 admin 角色（角色随 JWT 下发，无需查库）
+async def admin_user(request: Request):
+    user = await current_user(request)
+    if "admin" not in (user.get("roles") or []):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return user
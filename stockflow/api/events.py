@@ -0,0 +1,167 @@
+# api/events.py
+# 服务端推送（SSE）：写路径提交后广播商品状态/售价变化，扫码工作站订阅后本地目录保持一致。
+# 事件带递增序号，断线重连时浏览器自动带 Last-Event-ID，从环形缓冲补发漏掉的事件；
+# 缓冲已覆盖不到（或服务重启过）时发 reset，前端整页重载目录。
+from __future__ import annotations
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def push(self, ev):
+        # 在订阅者所属的事件循环里执行；消费太慢时断开，让它重连后按序号补发
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventBus:
+    """
+    进程内广播：publish() 可在任意线程调用（路由线程池/写线程），
+    订阅者是各 SSE 连接的 asyncio.Queue，通过 call_soon_threadsafe 投递。
+    """
+
+    def __init__(self, buffer_size: int = 1000, queue_size: int = 256):
+        self.boot = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._ring: deque = deque(maxlen=max(1, int(buffer_size)))
+        self._subs: set[_Subscriber] = set()
+        self._queue_size = max(1, int(queue_size))
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.boot}-{seq}"
+
+    def parse_id(self, last_event_id: str | None) -> int | None:
+        """Last-Event-ID → 序号；不是本进程发出的（重启过）或格式不对返回 None。"""
+        boot, _, seq = (last_event_id or "").partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, kind: str, data: dict) -> int:
+        with self._lock:
+            self._seq += 1
+            ev = (self._seq, kind, data)
+            self._ring.append(ev)
+            self.published += 1
+            subs = list(self._subs)
+        for s in subs:
+            try:
+                s.loop.call_soon_threadsafe(s.push, ev)
+            except RuntimeError:
+                # 事件循环已关闭（进程退出中）
+                with self._lock:
+                    self._subs.discard(s)
+        return ev[0]
+
+    def subscribe(self, since: int | None):
+        """
+        注册订阅并取补发列表（同一把锁内完成，不会漏也不会重）。
+        返回 (订阅者, 补发事件列表 | None, 当前序号)；None 表示缓冲已覆盖不到 since，需要前端重载。
+        """
+        sub = _Subscriber(asyncio.get_running_loop(), self._queue_size)
+        with self._lock:
+            self._subs.add(sub)
+            seq = self._seq
+            if since is None or since > seq:
+                return sub, None, seq
+            oldest = self._ring[0][0] if self._ring else seq + 1
+            if since < oldest - 1:
+                return sub, None, seq
+            return sub, [ev for ev in self._ring if ev[0] > since], seq
+
+    def unsubscribe(self, sub: _Subscriber):
+        with self._lock:
+            self._subs.discard(sub)
+            if sub.overflowed:
+                self.dropped_subscribers += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "boot": self.boot,
+                "seq": self._seq,
+                "buffered": len(self._ring),
+                "subscribers": len(self._subs),
+                "published": self.published,
+                "dropped_subscribers": self.dropped_subscribers,
+            }
+
+    def format(self, ev) -> str:
+        seq, kind, data = ev
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        return f"id: {self.event_id(seq)}\nevent: {kind}\ndata: {payload}\n\n"
+
+    async def stream(self, request, last_event_id: str | None,
+                     heartbeat_s: float = 15.0, max_age_s: float = 300.0):
+        """
+        SSE 输出：先补发，再实时推送；空闲时发注释心跳防代理断流。
+        连接最长 max_age_s 后主动结束，浏览器按 retry 自动重连续传（也让停服不必等长连接）。
+        """
+        sub, backlog, last = self.subscribe(self.parse_id(last_event_id))
+        try:
+            yield "retry: 3000\n\n"
+            if not last_event_id:
+                # 新连接：告诉前端当前序号，之后断线从这里续传
+                yield f"id: {self.event_id(last)}\nevent: hello\ndata: {{}}\n\n"
+            elif backlog is None:
+                yield f"id: {self.event_id(last)}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                for ev in backlog:
+                    yield self.format(ev)
+            deadline = time.monotonic() + max_age_s
+            while time.monotonic() < deadline:
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat_s)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                if ev is None:          # 消费太慢被截断：结束连接，重连后补发
+                    break
+                if ev[0] <= last:       # 订阅前的事件（已在补发列表里或新连接不需要）
+                    continue
+                last = ev[0]
+                yield self.format(ev)
+        finally:
+            self.unsubscribe(sub)
+
+
+def product_event(item: dict) -> dict:
+    """商品变化的精简载荷：扫码页只关心能否借出与价格。"""
+    return {
+        "id": item["id"],
+        "sku": item["sku"],
+        "status": item["status"],
+        "borrower": item["borrower"],
+        "price": item["price"],
+    }
+
+
+def product_listener(bus: EventBus):
+    """挂到 QrIndex：写路径 refresh()/remove() 之后把变化广播出去。"""
+    def _on_change(items: list[dict], removed: list[dict]):
+        for it in items:
+            bus.publish("product", product_event(it))
+        for it in removed:
+            bus.publish("product_removed", {"id": it["id"], "sku": it.get("sku")})
+    return _on_change
@@ -0,0 +1,68 @@
+# api/fragments.py
+# 行级片段缓存：按 (商品 id, row_version) 缓存装饰后的行与渲染好的行 HTML，
+# 大列表的渲染成本只与“变了的行”成正比
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """线程安全 LRU。键里带 row_version，行一改键就变，旧条目自然被挤出，无需显式失效。"""
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = max(0, int(maxsize))
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        if key is None or self.maxsize == 0:
+            return build()
+        with self._lock:
+            val = self._data.get(key)
+            if val is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return val
+            self.misses += 1
+        val = build()
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return val
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def row_key(kind: str, row: dict):
+    """没有 row_version（迁移未完成的旧库）时返回 None = 不缓存。"""
+    if row.get("row_version") is None or row.get("id") is None:
+        return None
+    return (kind, row["id"], row["row_version"])
+
+
+def render_rows(cache: FragmentCache, env, template_name: str, rows: list[dict]) -> list[Markup]:
+    """逐行渲染局部模板（模板内变量名为 r），命中缓存的行直接复用 HTML。"""
+    tmpl = env.get_template(template_name)
+    return [
+        cache.get_or_build(row_key(template_name, r), lambda r=r: Markup(tmpl.render(r=r)))
+        for r in rows
+    ]
@@ -2,8 +2,10 @@
 
 from fastapi import APIRouter, Request, Form, Depends
 from fastapi.responses import HTMLResponse, RedirectResponse
-from api.deps import get_services, current_user, get_cfg
-from export.event_logger import append_event
+from api.deps import get_services, current_user, get_qr_index, get_readers, get_fragments, get_catalog
+from api.fragments import render_rows
+from api.conditional import validator
+from core.services.outbox import enqueue
 from core.services.settings import SettingsService
 from core.services.ids import alloc_sku
 from api.routes_qr import build_qr_payload
@@ -11,7 +13,8 @@ from api.routes_qr import build_qr_payload
 
 router = APIRouter()
 
-import re, os, sqlite3
+import re, os
+from infra.storage import table_names, column_names
 from datetime import datetime
 from fastapi import File, UploadFile
 
@@ -21,7 +24,7 @@ from fastapi import File, UploadFile
 
 
 def _list_loans_for_inbound(db, limit:int=50):
-    with db.connect() as conn:
+    with db.read() as conn:
         cur = conn.cursor()
         cur.execute("""
             SELECT id, loan_no, company, receiver, handler, discount, total_qty, total_amount, status, created_at
@@ -54,76 +57,110 @@ def _normalize_weight(s: str) -> str:
         s = parts[0] + ("." + parts[1] if len(parts) > 1 else "")
     return s
 
-def _decorate_products(rows: list[dict]) -> list[dict]:
-    """模板展示字段：金额千分位、克重+g、图片URL、品类/详情、登录日、含税勾叉、状态行色、备注等"""
+_PREDEF_CATEGORIES = {"戒指", "项链", "手链", "耳饰", "吊坠", "胸针"}
+
+def _product_rows() -> list[dict]:
+    """商品页的行：从商品目录取启用的商品（id 倒序），逐行装饰。"""
+    return _decorate_products(get_catalog().select(enabled_only=True)[1])
+
+def _decorate_products(keys) -> list[dict]:
+    """
+    keys 为商品目录给出的 [(id, row_version), ...]；装饰结果按该键缓存，
+    命中时连 dict 都不用物化。返回的 dict 在请求间共享，调用方只读不改。
+    """
+    cache, catalog = get_fragments(), get_catalog()
     out = []
-    PREDEF = {"戒指", "项链", "手链", "耳饰", "吊坠", "胸针"}
-    for r0 in rows:
-        r = dict(r0)
-
-        # 金额
-        try: r["cost_fmt"] = f'{int(r.get("cost_price") or 0):,}'
-        except: r["cost_fmt"] = "0"
-        try: r["price_fmt"] = f'{int(r.get("sale_price") or 0):,}'
-        except: r["price_fmt"] = "0"
-        r["cost_raw"]  = str(int(r.get("cost_price") or 0))
-        r["price_raw"] = str(int(r.get("sale_price") or 0))
-
-        # 克重
-        w = r.get("spec"); w_str = (str(w).strip() if w is not None else "")
-        r["weight_fmt"] = (f"{w_str} g" if w_str else "")
-
-        # 图片
-        pp = r.get("photo_path"); r["photo_url"] = (f"/photos/{os.path.basename(pp)}" if pp else "")
-
-        r["qr_url"] = f"/qr/{r['sku']}.png" if r.get("sku") else ""
-
-
-        # 品类/详情
-        r["category"] = r.get("category") or ""
-        r["detail"]   = r.get("detail") or ""
-        r["category_select"] = (r["category"] if r["category"] in PREDEF else "")
-        r["category_custom"] = ("" if r["category"] in PREDEF else r["category"])
-
-        # 登录日期
-        r["login_date"] = (r.get("login_date") or "")
-
-        # ✅ 含税勾叉
-        ti = r.get("tax_included")
-        r["tax_included"] = 1 if str(ti) == "1" else 0
-        r["tax_mark"] = "✓" if r["tax_included"] == 1 else "✗"
-
-        # ✅ 备注
-        r["remark"] = r.get("remark") or ""
-
-        # ✅ 状态与行色（红=借出 / 灰=已出售 / 白=在库）
-        status = (r.get("status") or "在库")
-        r["status"] = status
-        if status == "借出":
-            r["row_bg"] =  "#FCA5A5"   # 稍深一点的红
-        elif status == "已出售":
-            r["row_bg"] = "#F5F5F5"   # 淡灰
-        else:
-            r["row_bg"] = "#FFFFFF"   # 白
-
-        # 借出对象（预留显示用）
-        r["borrower"] = r.get("borrower") or ""
-
-        out.append(r)
+    for pid, ver in keys:
+        key = ("decorate", pid, ver) if ver is not None else None
+        r = cache.get_or_build(key, lambda pid=pid: _decorate_product(catalog.row(pid)))
+        if r is not None:
+            out.append(r)
     return out
 
+def _decorate_product(r0: dict | None) -> dict | None:
+    """模板展示字段：金额千分位、克重+g、图片URL、品类/详情、登录日、含税勾叉、状态行色、备注等"""
+    if r0 is None:
+        return None   # 取键之后被删掉的行
+    r = dict(r0)
+
+    # 金额
+    try: r["cost_fmt"] = f'{int(r.get("cost_price") or 0):,}'
+    except: r["cost_fmt"] = "0"
+    try: r["price_fmt"] = f'{int(r.get("sale_price") or 0):,}'
+    except: r["price_fmt"] = "0"
+    r["cost_raw"]  = str(int(r.get("cost_price") or 0))
+    r["price_raw"] = str(int(r.get("sale_price") or 0))
+
+    # 克重
+    w = r.get("spec"); w_str = (str(w).strip() if w is not None else "")
+    r["weight_fmt"] = (f"{w_str} g" if w_str else "")
+
+    # 图片
+    pp = r.get("photo_path"); r["photo_url"] = (f"/photos/{os.path.basename(pp)}" if pp else "")
+
+    r["qr_url"] = f"/qr/{r['sku']}.png" if r.get("sku") else ""
+
+
+    # 品类/详情
+    r["category"] = r.get("category") or ""
+    r["detail"]   = r.get("detail") or ""
+    r["category_select"] = (r["category"] if r["category"] in _PREDEF_CATEGORIES else "")
+    r["category_custom"] = ("" if r["category"] in _PREDEF_CATEGORIES else r["category"])
+
+    # 登录日期
+    r["login_date"] = (r.get("login_date") or "")
+
+    # ✅ 含税勾叉
+    ti = r.get("tax_included")
+    r["tax_included"] = 1 if str(ti) == "1" else 0
+    r["tax_mark"] = "✓" if r["tax_included"] == 1 else "✗"
+
+    # ✅ 备注
+    r["remark"] = r.get("remark") or ""
+
+    # ✅ 状态与行色（红=借出 / 灰=已出售 / 白=在库）
+    status = (r.get("status") or "在库")
+    r["status"] = status
+    if status == "借出":
+        r["row_bg"] =  "#FCA5A5"   # 稍深一点的红
+    elif status == "已出售":
+        r["row_bg"] = "#F5F5F5"   # 淡灰
+    else:
+        r["row_bg"] = "#FFFFFF"   # 白
+
+    # 借出对象（预留显示用）
+    r["borrower"] = r.get("borrower") or ""
+
+    return r
+
 # =========================
 # 商品：列表/新增/编辑/删除
 # =========================
 
 @router.get("/products", response_class=HTMLResponse)
-def products_page(request: Request, user=Depends(current_user)):
+async def products_page(request: Request, user=Depends(current_user)):
     inv, _ = get_services()
-    rows = _decorate_products(inv.list_products())
-    return request.app.templates.TemplateResponse(
-        "products.html",
-        {"request": request, "user": user, "rows": rows}
-    )
+    v = validator(request, user, ("products",))
+    if v.is_fresh():
+        return v.not_modified()
+
+    # 查询 + 渲染都放到读线程池，不占用事件循环与默认线程池
+    def _render():
+        rows = _product_rows()
+        rows_html = render_rows(get_fragments(), request.app.templates.env, "_product_row.html", rows)
+        return request.app.templates.TemplateResponse(
+            "products.html",
+            {"request": request, "user": user, "rows": rows, "rows_html": rows_html}
+        )
+    return v.apply(await get_readers().run(_render))
+
+def _drop_orphan_photo(path: str | None):
+    """照片先于写库落盘：事务失败回滚时删掉它，免得留下没有商品指向的文件。"""
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 @router.post("/products", response_class=HTMLResponse)
 def product_add(request: Request,
@@ -144,7 +181,7 @@ def product_add(request: Request,
     # 售价
     norm_price = _normalize_amount(price)
     if not norm_price:
-        rows = _decorate_products(inv.list_products())
+        rows = _product_rows()
         return request.app.templates.TemplateResponse(
             "products.html",
             {"request": request, "user": user, "rows": rows, "error": "售价必须为整数（日元）。"}
@@ -156,7 +193,7 @@ def product_add(request: Request,
     if cost.strip():
         norm_cost = _normalize_amount(cost)
         if not norm_cost:
-            rows = _decorate_products(inv.list_products())
+            rows = _product_rows()
             return request.app.templates.TemplateResponse(
                 "products.html",
                 {"request": request, "user": user, "rows": rows, "error": "成本价如填写，必须为整数（日元）。"}
@@ -168,7 +205,7 @@ def product_add(request: Request,
     if weight.strip():
         norm_weight = _normalize_weight(weight)
         if not norm_weight:
-            rows = _decorate_products(inv.list_products())
+            rows = _product_rows()
             return request.app.templates.TemplateResponse(
                 "products.html",
                 {"request": request, "user": user, "rows": rows, "error": "克重格式不正确（示例：12 或 12.5）。"}
@@ -182,7 +219,7 @@ def product_add(request: Request,
     ss = SettingsService(inv.db)
     company_code = ss.get("company_code")
     if not company_code:
-        rows = _decorate_products(inv.list_products())
+        rows = _product_rows()
         return request.app.templates.TemplateResponse(
             "products.html",
             {"request": request, "user": user, "rows": rows, "error": "未设置公司代码，请先完成“公司初始化”。"}
@@ -204,15 +241,7 @@ def product_add(request: Request,
     cfg = get_cfg()
     qr_payload = build_qr_payload(company_code, sku, cfg.security["secret_key"])
 
-    with inv.db.transaction() as conn:
-        conn.execute("""
-            UPDATE products
-               SET category=?, detail=?, login_date=?, tax_included=?, remark=?, status='在库', qr_payload=?
-             WHERE id=?""",
-            (category_val, detail_val, login_date_val, tax_flag, remark_val, qr_payload, pid)
-        )
-
-    # 照片
+    # 照片（先落盘，路径随扩展字段一起写库）
     saved_path = None
     if photo and photo.filename:
         from pathlib import Path
@@ -223,11 +252,8 @@ def product_add(request: Request,
         with open(dest, "wb") as f:
             f.write(photo.file.read())
         saved_path = str(dest)
-        with inv.db.transaction() as conn:
-            conn.execute("UPDATE products SET photo_path=? WHERE id=?", (saved_path, pid))
 
-    # 事件日志
-    from export.event_logger import append_event
+    # 事件日志：与扩展字段同一事务写进发件箱，由后台线程导出
     ev = {
         "type": "product_add", "sku": sku, "name": final_name, "user": user["username"],
         "sale_price": sale_price, "cost_price": cost_price, "weight_g": spec_val,
@@ -235,7 +261,22 @@ def product_add(request: Request,
         "qr_payload": qr_payload
     }
     if saved_path: ev["photo"] = saved_path
-    append_event(cfg.paths["event_log_dir"], ev)
+
+    def _save(conn):
+        conn.execute("""
+            UPDATE products
+               SET category=?, detail=?, login_date=?, tax_included=?, remark=?, status='在库', qr_payload=?,
+                   photo_path=?
+             WHERE id=?""",
+            (category_val, detail_val, login_date_val, tax_flag, remark_val, qr_payload, saved_path, pid))
+        enqueue(conn, ev)
+
+    try:
+        inv.db.run_write(_save)
+    except Exception:
+        _drop_orphan_photo(saved_path)
+        raise
+    get_qr_index().refresh([pid])
 
     return RedirectResponse(url="/products", status_code=303)
 
@@ -258,7 +299,7 @@ def product_update(request: Request,
                    user=Depends(current_user)):
     inv, _ = get_services()
 
-    with inv.db.connect() as conn:
+    with inv.db.read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM products WHERE id=?", (pid,))
         old = cur.fetchone()
@@ -275,7 +316,7 @@ def product_update(request: Request,
     if weight.strip():
         norm_weight = _normalize_weight(weight)
         if not norm_weight:
-            rows = _decorate_products(inv.list_products())
+            rows = _product_rows()
             return request.app.templates.TemplateResponse(
                 "products.html",
                 {"request": request, "user": user, "rows": rows, "error": "克重格式不正确（示例：12 或 12.5）。"}
@@ -297,17 +338,8 @@ def product_update(request: Request,
     tax_flag = 1 if str(tax_included) == "1" else 0
     remark_val = (remark.strip() if remark.strip() != "" else (old["remark"] if "remark" in old.keys() else None))
 
-    with inv.db.transaction() as conn:
-        conn.execute("""
-            UPDATE products
-               SET sku=?, name=?, spec=?, unit=?, cost_price=?, sale_price=?,
-                   category=?, detail=?, login_date=?, tax_included=?, remark=?
-             WHERE id=?""",
-            (keep_sku, final_name, spec_val, "pcs", cost_price, sale_price,
-             new_category or None, new_detail, login_date_val, tax_flag, remark_val, pid)
-        )
-
-    # 图片
+    # 图片（先落盘；没传新图则保留原路径）
+    new_photo = None
     if photo and photo.filename:
         from pathlib import Path
         photos_dir = Path("data/photos"); photos_dir.mkdir(parents=True, exist_ok=True)
@@ -316,35 +348,45 @@ def product_update(request: Request,
         dest = photos_dir / fname
         with open(dest, "wb") as f:
             f.write(photo.file.read())
-        with inv.db.transaction() as conn:
-            conn.execute("UPDATE products SET photo_path=? WHERE id=?", (str(dest), pid))
+        new_photo = str(dest)
 
-    # 事件日志
-    from export.event_logger import append_event
-    from api.deps import get_cfg
-    cfg = get_cfg()
-    append_event(cfg.paths["event_log_dir"], {
-        "type": "product_update", "id": pid, "sku": keep_sku, "name": final_name,
-        "user": user["username"], "sale_price": sale_price, "cost_price": cost_price,
-        "weight_g": spec_val, "login_date": login_date_val, "tax_included": tax_flag, "remark": remark_val or ""
-    })
+    # 更新与事件日志同一事务提交
+    def _save(conn):
+        conn.execute("""
+            UPDATE products
+               SET sku=?, name=?, spec=?, unit=?, cost_price=?, sale_price=?,
+                   category=?, detail=?, login_date=?, tax_included=?, remark=?,
+                   photo_path=COALESCE(?, photo_path)
+             WHERE id=?""",
+            (keep_sku, final_name, spec_val, "pcs", cost_price, sale_price,
+             new_category or None, new_detail, login_date_val, tax_flag, remark_val, new_photo, pid))
+        enqueue(conn, {
+            "type": "product_update", "id": pid, "sku": keep_sku, "name": final_name,
+            "user": user["username"], "sale_price": sale_price, "cost_price": cost_price,
+            "weight_g": spec_val, "login_date": login_date_val, "tax_included": tax_flag, "remark": remark_val or ""
+        })
+
+    try:
+        inv.db.run_write(_save)
+    except Exception:
+        _drop_orphan_photo(new_photo)
+        raise
+    get_qr_index().refresh([pid])
 
     return RedirectResponse(url="/products", status_code=303)
 
 
-def _product_has_activity(conn: sqlite3.Connection, pid: int) -> bool:
+def _product_has_activity(conn, pid: int) -> bool:
     """
     安全删除检查：遍历所有表，若存在带 product_id 列且有记录指向该商品，则视为有业务记录，禁止删除。
     这样即使你的实际业务表名不同（inbound/outbound/stock_moves/...），也能稳妥拦截。
     """
     # 列出所有非系统表
-    tbls = [r[0] for r in conn.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
-    ).fetchall()]
+    tbls = table_names(conn)
     for t in tbls:
         # 查该表是否有 product_id 列
         try:
-            cols = [c[1] for c in conn.execute(f"PRAGMA table_info({t})").fetchall()]
+            cols = column_names(conn, t)
         except Exception:
             continue
         if "product_id" in cols:
@@ -360,7 +402,7 @@ def _product_has_activity(conn: sqlite3.Connection, pid: int) -> bool:
 @router.post("/products/{pid}/delete", response_class=HTMLResponse)
 def product_delete(request: Request, pid: int, user=Depends(current_user)):
     inv, _ = get_services()
-    with inv.db.connect() as conn:
+    with inv.db.read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM products WHERE id=?", (pid,))
         row = cur.fetchone()
@@ -380,15 +422,15 @@ def product_delete(request: Request, pid: int, user=Depends(current_user)):
         except Exception:
             pass
 
-    # 真正删除记录
-    with inv.db.transaction() as conn:
+    # 真正删除记录（事件日志同一事务）
+    def _delete(conn):
         conn.execute("DELETE FROM products WHERE id=?", (pid,))
+        enqueue(conn, {
+            "type": "product_delete", "id": pid, "sku": row["sku"], "name": row["name"], "user": user["username"]
+        })
 
-    # 事件日志
-    cfg = get_cfg()
-    append_event(cfg.paths["event_log_dir"], {
-        "type": "product_delete", "id": pid, "sku": row["sku"], "name": row["name"], "user": user["username"]
-    })
+    inv.db.run_write(_delete)
+    get_qr_index().remove(pid)
 
     return RedirectResponse(url="/products", status_code=303)
 
@@ -399,60 +441,70 @@ def product_delete(request: Request, pid: int, user=Depends(current_user)):
 @router.get("/warehouses", response_class=HTMLResponse)
 def warehouses_page(request: Request, user=Depends(current_user)):
     inv, _ = get_services()
-    with inv.db.connect() as conn:
+    v = validator(request, user, ("warehouses",))
+    if v.is_fresh():
+        return v.not_modified()
+    with inv.db.read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM warehouses ORDER BY id DESC")
         whs = [dict(r) for r in cur.fetchall()]
-    return request.app.templates.TemplateResponse(
+    return v.apply(request.app.templates.TemplateResponse(
         "warehouses.html",
         {"request": request, "user": user, "rows": whs}
-    )
+    ))
 
 @router.post("/warehouses")
 def warehouse_add(request: Request, code: str = Form(...), name: str = Form(...),
                   user=Depends(current_user)):
     inv, _ = get_services()
-    inv.add_warehouse(code, name)
-    cfg = get_cfg()
-    append_event(cfg.paths["event_log_dir"], {
-        "type": "warehouse_add", "code": code, "name": name, "user": user["username"]
-    })
+
+    def _add(conn):
+        inv._add_warehouse(conn, code, name)
+        enqueue(conn, {"type": "warehouse_add", "code": code, "name": name, "user": user["username"]})
+
+    inv.db.run_write(_add)
     return RedirectResponse(url="/warehouses", status_code=303)
 
 @router.get("/inbound", response_class=HTMLResponse)
 def inbound_page(request: Request, user=Depends(current_user)):
     inv, _ = get_services()
-    prods = inv.list_products()
-    with inv.db.connect() as conn:
+    v = validator(request, user, ("products", "warehouses", "loan_orders"))
+    if v.is_fresh():
+        return v.not_modified()
+    catalog = get_catalog()
+    prods = catalog.products(catalog.select(enabled_only=True)[1])
+    with inv.db.read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM warehouses ORDER BY id DESC")
         whs = [dict(r) for r in cur.fetchall()]
     # ✅ 带上借出单列表（前 50 条，借出中优先）
     loans = _list_loans_for_inbound(inv.db, 50)
 
-    return request.app.templates.TemplateResponse(
+    return v.apply(request.app.templates.TemplateResponse(
         "inbound.html",
         {"request": request, "user": user, "products": prods, "warehouses": whs, "loans": loans}
-    )
+    ))
 
 
 @router.post("/inbound")
 def inbound_post(request: Request, product_id: int = Form(...), wh_id: int = Form(...),
                  qty: float = Form(...), user=Depends(current_user)):
     inv, _ = get_services()
-    inv.inbound(product_id, wh_id, qty)
-    cfg = get_cfg()
-    append_event(cfg.paths["event_log_dir"], {
-        "type": "inbound", "product_id": product_id, "warehouse_id": wh_id,
-        "qty": qty, "user": user["username"]
-    })
+
+    def _move(conn):
+        inv._inbound(conn, product_id, wh_id, qty)
+        enqueue(conn, {"type": "inbound", "product_id": product_id, "warehouse_id": wh_id,
+                       "qty": qty, "user": user["username"]})
+
+    inv.db.run_write(_move)
     return RedirectResponse(url="/inbound", status_code=303)
 
 @router.get("/outbound", response_class=HTMLResponse)
 def outbound_page(request: Request, user=Depends(current_user)):
     inv, _ = get_services()
-    prods = inv.list_products()
-    with inv.db.connect() as conn:
+    catalog = get_catalog()
+    prods = catalog.products(catalog.select(enabled_only=True)[1])
+    with inv.db.read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM warehouses ORDER BY id DESC")
         whs = [dict(r) for r in cur.fetchall()]
@@ -465,10 +517,11 @@ def outbound_page(request: Request, user=Depends(current_user)):
 def outbound_post(request: Request, product_id: int = Form(...), wh_id: int = Form(...),
                   qty: float = Form(...), user=Depends(current_user)):
     inv, _ = get_services()
-    inv.outbound(product_id, wh_id, qty)
-    cfg = get_cfg()
-    append_event(cfg.paths["event_log_dir"], {
-        "type": "outbound", "product_id": product_id, "warehouse_id": wh_id,
-        "qty": qty, "user": user["username"]
-    })
+
+    def _move(conn):
+        inv._outbound(conn, product_id, wh_id, qty)
+        enqueue(conn, {"type": "outbound", "product_id": product_id, "warehouse_id": wh_id,
+                       "qty": qty, "user": user["username"]})
+
+    inv.db.run_write(_move)
     return RedirectResponse(url="/outbound", status_code=303)
@@ -1,15 +1,19 @@
 # api/routes_labels.py
 from __future__ import annotations
-from fastapi import APIRouter, Request, Depends, Form, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, Request, Depends, Form, Query, HTTPException
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
 from datetime import datetime
-from api.deps import current_user, get_db
+from api.deps import current_user, get_db, get_cfg, get_readers, get_fragments, get_label_pdfs, get_catalog
+from core.services.qr_index import build_qr_payload
+from export.label_pdf import LabelLayout, iter_pdf, cache_key
+from api.fragments import render_rows
+from api.conditional import validator
 
 router = APIRouter()
 
 def _get_setting(key: str) -> str | None:
     db = get_db()
-    with db.connect() as conn:
+    with db.read() as conn:
         cur = conn.cursor()
         cur.execute("SELECT value FROM settings WHERE key=? LIMIT 1", (key,))
         r = cur.fetchone()
@@ -31,64 +35,44 @@ def _list_products(
     - 仅未打印：label_printed_count 为 0 或 NULL
     - include_sold=False 时，排除 status='已售出'
     - 分页：page>=1；page_size<=0 则不分页（返回全部）
+    过滤/排序/分页在商品目录（内存列存）里完成，只物化当前页、且装饰结果按 (id, row_version) 缓存。
     """
-    db = get_db()
-    sql_base = "FROM products"
-    conds, params = [], []
-
-    if keyword:
-        kw = f"%{keyword.strip()}%"
-        conds.append("(sku LIKE ? OR name LIKE ? OR detail LIKE ? OR category LIKE ?)")
-        params += [kw, kw, kw, kw]
-
-    if only_unprinted:
-        conds.append("(label_printed_count IS NULL OR label_printed_count = 0)")
-
-    if not include_sold:
+    catalog = get_catalog()
+    total, keys = catalog.select(
+        keyword=keyword,
+        only_unprinted=only_unprinted,
         # 默认不显示已售出
-        conds.append("(status IS NULL OR status <> '已售出')")
-
-    where_sql = (" WHERE " + " AND ".join(conds)) if conds else ""
-
-    # 先查总数（用于分页）
-    count_sql = f"SELECT COUNT(1) {sql_base}{where_sql}"
-    rows_sql = f"SELECT * {sql_base}{where_sql} ORDER BY COALESCE(login_date, '') DESC, id DESC"
-
-    with db.connect() as conn:
-        cur = conn.cursor()
-        # total
-        cur.execute(count_sql, tuple(params))
-        total = int(cur.fetchone()[0])
-
-        # rows（分页）
-        if page_size and page_size > 0:
-            # 合法化页码
-            page = max(1, int(page))
-            offset = (page - 1) * int(page_size)
-            rows_sql_limit = f"{rows_sql} LIMIT ? OFFSET ?"
-            cur.execute(rows_sql_limit, tuple(params) + (int(page_size), int(offset)))
-        else:
-            # 不分页，返回全部
-            cur.execute(rows_sql, tuple(params))
-
-        rows = [dict(r) for r in cur.fetchall()]
-
-        # 补充显示字段
-        for r in rows:
-            r["price_fmt"] = f"{int(r.get('sale_price') or 0):,}"
-            r["cost_fmt"] = f"{int(r.get('cost_price') or 0):,}"
-            status = (r.get("status") or "在库").strip()
-            borrower = (r.get("borrower") or "").strip()
-            if status == "借出" and borrower:
-                r["status_display"] = f"借出（{borrower}）"
-            else:
-                r["status_display"] = status
-            r["printed"] = (r.get("label_printed_count") or 0) > 0
-
-        return rows, total
+        exclude_status=None if include_sold else "已售出",
+        order="-login_date",
+        page=page,
+        page_size=page_size,
+    )
+    cache = get_fragments()
+    rows = []
+    for pid, ver in keys:
+        key = ("label", pid, ver) if ver is not None else None
+        r = cache.get_or_build(key, lambda pid=pid: _decorate_label_row(catalog.row(pid)))
+        if r is not None:
+            rows.append(r)
+    return rows, total
+
+def _decorate_label_row(r: dict | None) -> dict | None:
+    """补充显示字段（r 为商品目录物化出的新 dict，可直接改）。"""
+    if r is None:
+        return None
+    r["price_fmt"] = f"{int(r.get('sale_price') or 0):,}"
+    r["cost_fmt"] = f"{int(r.get('cost_price') or 0):,}"
+    status = (r.get("status") or "在库").strip()
+    borrower = (r.get("borrower") or "").strip()
+    if status == "借出" and borrower:
+        r["status_display"] = f"借出（{borrower}）"
+    else:
+        r["status_display"] = status
+    r["printed"] = (r.get("label_printed_count") or 0) > 0
+    return r
 
 @router.get("/labels", response_class=HTMLResponse)
-def labels_page(
+async def labels_page(
     request: Request,
     q: str = Query("", description="关键词：SKU/名称/详情/品类"),
     only_unprinted: int = Query(0, description="仅未打印：1=是/0=否"),
@@ -97,29 +81,39 @@ def labels_page(
     page_size: int = Query(0, description="每页数量；0或负数=显示全部"),
     user=Depends(current_user),
 ):
-    rows, total = _list_products(
-        keyword=q,
-        only_unprinted=(only_unprinted == 1),
-        include_sold=(include_sold == 1),
-        page=page,
-        page_size=page_size,
-    )
-    return request.app.templates.TemplateResponse(
-        "labels.html",
-        {
-            "request": request,
-            "user": user,
-            "rows": rows,
-            "q": q,
-            "only_unprinted": only_unprinted,
-            "include_sold": include_sold,
-            "company_code": _company_code(),
-            # 分页信息
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-        },
-    )
+    # 商品或公司代码（settings）没变且参数相同 → 304
+    v = validator(request, user, ("products", "settings"))
+    if v.is_fresh():
+        return v.not_modified()
+
+    # 查询 + 渲染放到读线程池执行
+    def _render():
+        rows, total = _list_products(
+            keyword=q,
+            only_unprinted=(only_unprinted == 1),
+            include_sold=(include_sold == 1),
+            page=page,
+            page_size=page_size,
+        )
+        rows_html = render_rows(get_fragments(), request.app.templates.env, "_label_row.html", rows)
+        return request.app.templates.TemplateResponse(
+            "labels.html",
+            {
+                "request": request,
+                "user": user,
+                "rows": rows,
+                "rows_html": rows_html,
+                "q": q,
+                "only_unprinted": only_unprinted,
+                "include_sold": include_sold,
+                "company_code": _company_code(),
+                # 分页信息
+                "total": total,
+                "page": page,
+                "page_size": page_size,
+            },
+        )
+    return v.apply(await get_readers().run(_render))
 
 @router.get("/labels/print", response_class=HTMLResponse)
 def labels_print(
@@ -141,13 +135,7 @@ def labels_print(
     id_list = [int(x) for x in ids.split(",") if x.strip().isdigit()]
     if not id_list:
         return RedirectResponse(url="/labels", status_code=302)
-
-    placeholders = ",".join(["?"] * len(id_list))
-    db = get_db()
-    with db.connect() as conn:
-        cur = conn.cursor()
-        cur.execute(f"SELECT * FROM products WHERE id IN ({placeholders}) ORDER BY id", tuple(id_list))
-        rows = [dict(r) for r in cur.fetchall()]
+    rows = _print_rows(id_list)
 
     # 计算 A4 网格（列/行）
     page_w, page_h = 210.0, 297.0
@@ -156,11 +144,6 @@ def labels_print(
     cols = max(1, int((inner_w + gap_x) // (w + gap_x)))
     rows_per_page = max(1, int((inner_h + gap_y) // (h + gap_y)))
 
-    # 供模板渲染
-    for r in rows:
-        r["price_fmt"] = f"{int(r.get('sale_price') or 0):,}"
-        r["weight_fmt"] = (str(r.get("spec")) + " g") if (r.get("spec") not in (None, "", " ")) else ""
-
     return request.app.templates.TemplateResponse(
         "labels_print.html",
         {
@@ -175,10 +158,76 @@ def labels_print(
             "fields": {"category": show_category, "detail": show_detail, "weight": show_weight},
             "font_mode": font_mode,
             "ids": ids,  # 用于打印后标记
+            "pdf_url": "/labels/print.pdf?" + request.url.query,
             # 也可以把分页/筛选状态带回去（若你从打印页想返回列表复用参数）
         },
     )
 
+def _print_rows(id_list: list[int]) -> list[dict]:
+    """打印页与 PDF 共用：按 id 取商品并补上金额/克重文字。"""
+    placeholders = ",".join(["?"] * len(id_list))
+    db = get_db()
+    with db.read() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT * FROM products WHERE id IN ({placeholders}) ORDER BY id", tuple(id_list))
+        rows = [dict(r) for r in cur.fetchall()]
+    for r in rows:
+        r["price_fmt"] = f"{int(r.get('sale_price') or 0):,}"
+        r["weight_fmt"] = (str(r.get("spec")) + " g") if (r.get("spec") not in (None, "", " ")) else ""
+    return rows
+
+@router.get("/labels/print.pdf")
+def labels_print_pdf(
+    request: Request,
+    ids: str,
+    w: float = 30.0, h: float = 30.0,
+    margin_top: float = 10.0, margin_right: float = 10.0,
+    margin_bottom: float = 10.0, margin_left: float = 10.0,
+    gap_x: float = 2.0, gap_y: float = 2.0,
+    start_row: int = 1, start_col: int = 1,
+    show_category: int = 1, show_detail: int = 1, show_weight: int = 1,
+    font_mode: str = "auto",
+    user=Depends(current_user),
+):
+    """
+    与 /labels/print 参数相同，直接输出矢量 PDF（二维码为原生路径），逐页流式发送。
+    同一批 id（且商品未改动）+ 同一版式命中缓存，重复打印不再重新排版。
+    """
+    try:
+        import qrcode  # noqa: F401  二维码矩阵由 qrcode 计算
+    except ImportError:
+        raise HTTPException(status_code=500, detail="缺少依赖：qrcode，请先安装 pip install qrcode")
+
+    id_list = [int(x) for x in ids.split(",") if x.strip().isdigit()]
+    if not id_list:
+        return RedirectResponse(url="/labels", status_code=302)
+    if w <= 0 or h <= 0:
+        raise HTTPException(status_code=400, detail="标签宽高必须大于 0")
+
+    layout = LabelLayout(w, h, margin_top, margin_right, margin_bottom, margin_left,
+                         gap_x, gap_y, start_row, start_col,
+                         show_category, show_detail, show_weight, font_mode)
+    rows = _print_rows(id_list)
+    company_code = _company_code()
+    secret = get_cfg().security["secret_key"]
+    for r in rows:
+        if not r.get("qr_payload"):
+            r["qr_payload"] = build_qr_payload(company_code, r["sku"], secret)
+
+    key = cache_key(layout, rows, company_code)
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache",
+               "Content-Disposition": 'inline; filename="labels.pdf"'}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    cache = get_label_pdfs()
+    pdf = cache.get(key)
+    if pdf is not None:
+        return Response(content=pdf, media_type="application/pdf", headers=headers)
+    return StreamingResponse(cache.tee(key, iter_pdf(rows, layout)),
+                             media_type="application/pdf", headers=headers)
+
 @router.post("/labels/mark-printed")
 def labels_mark_printed(ids: str = Form(...), user=Depends(current_user)):
     id_list = [int(x) for x in ids.split(",") if x.strip().isdigit()]
@@ -188,16 +237,13 @@ def labels_mark_printed(ids: str = Form(...), user=Depends(current_user)):
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     placeholders = ",".join(["?"] * len(id_list))
     db = get_db()
-    with db.connect() as conn:
-        cur = conn.cursor()
-        cur.execute(
-            f"""
-            UPDATE products
-               SET label_printed_count = COALESCE(label_printed_count,0) + 1,
-                   label_printed_at = ?
-             WHERE id IN ({placeholders})
-            """,
-            (now, *id_list),
-        )
-        conn.commit()
+    db.run_write(lambda conn: conn.execute(
+        f"""
+        UPDATE products
+           SET label_printed_count = COALESCE(label_printed_count,0) + 1,
+               label_printed_at = ?
+         WHERE id IN ({placeholders})
+        """,
+        (now, *id_list),
+    ))
     return RedirectResponse(url="/labels", status_code=303)
@@ -9,8 +9,11 @@ from fastapi import status as http_status
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, Field
 
-from api.deps import get_db, current_user, get_cfg
-from export.event_logger import append_event
+from api.deps import get_db, current_user, get_qr_index, get_readers
+from core.services.ids import next_sequence
+from infra.storage import SQLITE, dialect_of, column_names
+from core.services.outbox import enqueue
+from core.services.loans import LoanService
 
 router = APIRouter()
 
@@ -25,8 +28,15 @@ class LoanCreateIn(BaseModel):
     discount: float = Field(..., gt=0.0, le=1.0)
     items:    List[LoanItemIn]
 
+class LoanReturnIn(BaseModel):
+    codes:   List[str]                 # 扫码内容：SKU 或 SF1:<COMP>:<SKU>:<CHK>
+    loan_id: Optional[int] = None      # 可选：限定只归还某张借出单
+
 # ====== 表结构兜底：防止清库后 500 ======
 def _ensure_schema(conn) -> None:
+    # PostgreSQL 引擎的建表脚本是完整结构，兜底只针对旧的 SQLite 库
+    if dialect_of(conn) is not SQLITE:
+        return
     # 订单头
     conn.execute("""
     CREATE TABLE IF NOT EXISTS loan_orders (
@@ -65,7 +75,7 @@ def _ensure_schema(conn) -> None:
 
     # products 上用到的字段兜底（老库可能缺）
     try:
-        cols = [c[1] for c in conn.execute("PRAGMA table_info(products)").fetchall()]
+        cols = column_names(conn, "products")
         if "status" not in cols:
             conn.execute("ALTER TABLE products ADD COLUMN status TEXT;")
             conn.execute("UPDATE products SET status='在库' WHERE status IS NULL OR status='';")
@@ -77,14 +87,7 @@ def _ensure_schema(conn) -> None:
 # ====== 单号分配：LYYMMDDNNN（sequences 表） ======
 def _alloc_loan_no(conn) -> str:
     today = datetime.now().strftime("%y%m%d")  # YYMMDD
-    scope = f"LOAN-{today}"
-    row = conn.execute("SELECT next FROM sequences WHERE scope=? LIMIT 1", (scope,)).fetchone()
-    if not row:
-        conn.execute("INSERT INTO sequences(scope, next) VALUES(?, ?)", (scope, 2))
-        n = 1
-    else:
-        n = int(row["next"] or 1)
-        conn.execute("UPDATE sequences SET next=? WHERE scope=?", (n + 1, scope))
+    n = next_sequence(conn, f"LOAN-{today}")
     return f"L{today}{n:03d}"
 
 # ====== 创建借出单（兼容两个路径） ======
@@ -103,7 +106,9 @@ def create_loan(payload: LoanCreateIn, user=Depends(current_user)):
         raise HTTPException(http_status.HTTP_400_BAD_REQUEST, detail="SKU 为空")
 
     db = get_db()
-    with db.transaction() as conn:
+
+    # 整张借出单在写线程的一个任务里完成（HTTPException 会原样抛回，任务内的修改随之回滚）
+    def _create(conn):
         # 兜底建表
         _ensure_schema(conn)
 
@@ -112,7 +117,7 @@ def create_loan(payload: LoanCreateIn, user=Depends(current_user)):
         rows = conn.execute(f"""
             SELECT id, sku, sale_price, status, borrower
               FROM products
-             WHERE sku IN ({ph})
+             WHERE sku IN ({ph}){dialect_of(conn).for_update}
         """, tuple(sku_list)).fetchall()
         found = { (r["sku"] or "").upper(): r for r in rows }
 
@@ -179,22 +184,28 @@ def create_loan(payload: LoanCreateIn, user=Depends(current_user)):
              WHERE sku IN ({ph})
         """, (borrower_txt, *sku_list))
 
-    # 事件日志
-    cfg = get_cfg()
-    append_event(cfg.paths["event_log_dir"], {
-        "type": "loan_create",
-        "loan_id": loan_id,
-        "loan_no": loan_no,
-        "company": payload.company or "",
-        "receiver": payload.receiver or "",
-        "handler":  payload.handler  or "",
-        "discount": payload.discount,
-        "total_qty": total_qty,
-        "total_amount": total_amount,
-        "items": sku_list,
-        "user": user["username"],
-        "created_at": now_local
-    })
+        # 事件日志（与借出单同一事务）
+        enqueue(conn, {
+            "type": "loan_create",
+            "loan_id": loan_id,
+            "loan_no": loan_no,
+            "company": payload.company or "",
+            "receiver": payload.receiver or "",
+            "handler":  payload.handler  or "",
+            "discount": payload.discount,
+            "total_qty": total_qty,
+            "total_amount": total_amount,
+            "items": sku_list,
+            "user": user["username"],
+            "created_at": now_local
+        })
+
+        return loan_id, loan_no, total_qty, total_amount, now_local, [int(found[s]["id"]) for s in sku_list]
+
+    loan_id, loan_no, total_qty, total_amount, now_local, product_ids = db.run_write(_create)
+
+    # 扫码索引同步最新状态
+    get_qr_index().refresh(product_ids)
 
     return {
         "loan_id": loan_id,
@@ -204,15 +215,34 @@ def create_loan(payload: LoanCreateIn, user=Depends(current_user)):
         "created_at": now_local
     }
 
+# ====== 批量归还（扫码一次提交整批） ======
+@router.post("/api/loans/return")
+def return_loan_items(payload: LoanReturnIn, user=Depends(current_user)):
+    if not payload.codes:
+        raise HTTPException(http_status.HTTP_400_BAD_REQUEST, detail="扫码内容为空")
+
+    # 事件日志由服务在归还事务里写进发件箱
+    result = LoanService(get_db()).return_items(payload.codes, payload.loan_id, user=user["username"])
+    if not result["returned"]:
+        raise HTTPException(http_status.HTTP_404_NOT_FOUND,
+                            detail=f"没有可归还的借出明细: {', '.join(result['not_found'])}")
+    get_qr_index().refresh([it["product_id"] for it in result["items"]])
+    return result
+
 # ====== 详情页：/loans/{slug}，slug 可为 id 或 loan_no ======
 @router.get("/loans/{loan_id}", response_class=HTMLResponse)
-def loan_detail_page(request: Request, loan_id: int, user=Depends(current_user)):
+async def loan_detail_page(request: Request, loan_id: int, user=Depends(current_user)):
+    # 查询 + 渲染放到读线程池执行（404 等 HTTPException 原样抛回）
+    return await get_readers().run(_render_loan_detail, request, loan_id, user)
+
+def _render_loan_detail(request: Request, loan_id: int, user: dict):
     db = get_db()
-    with db.connect() as conn:
+    with db.read() as conn:
         # 头
         h = conn.execute("""
             SELECT id, loan_no, company, receiver, handler, discount,
-                   total_qty, total_amount, status, created_at
+                   total_qty, total_amount, status, created_at,
+                   returned_qty, returned_amt, closed_at
               FROM loan_orders
              WHERE id=?
              LIMIT 1
@@ -224,6 +254,8 @@ def loan_detail_page(request: Request, loan_id: int, user=Depends(current_user))
         rows = conn.execute("""
             SELECT li.sku,
                    li.price                   AS sale_price,
+                   li.returned,
+                   li.returned_at,
                    p.category,
                    p.detail,
                    p.photo_path,
@@ -1,40 +1,21 @@
 # api/routes_qr.py
-import hmac
-import hashlib
-from base64 import b32encode
 from io import BytesIO
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import Response
+from pydantic import BaseModel
 
-from api.deps import get_db, get_cfg
+from api.deps import get_db, get_cfg, get_qr_index, get_readers, current_user
+from core.services.qr_index import make_chk, build_qr_payload
 
 router = APIRouter()
 
 
 # ----------------------------
-# 载荷与校验码（沿用你现有规则）
+# 载荷与校验码（实现见 core.services.qr_index，此处保留原名供其他路由导入）
 # ----------------------------
-def _make_chk(secret: str, comp: str, sku: str) -> str:
-    """
-    计算 HMAC-SHA256 校验值，取前 6 个 base32 字符（约 30 bit），
-    足以防止误录与低概率冲突。
-    """
-    mac = hmac.new(
-        secret.encode("utf-8"),
-        f"{comp}|{sku}".encode("utf-8"),
-        hashlib.sha256,
-    ).digest()
-    return b32encode(mac)[:6].decode("ascii")
-
-
-def build_qr_payload(comp: str, sku: str, secret: str) -> str:
-    """
-    构建二维码载荷：SF1:<COMP>:<SKU>:<CHK>
-    """
-    chk = _make_chk(secret, comp, sku)
-    return f"SF1:{comp}:{sku}:{chk}"
+_make_chk = make_chk
 
 
 # ----------------------------
@@ -42,7 +23,7 @@ def build_qr_payload(comp: str, sku: str, secret: str) -> str:
 # ----------------------------
 def _get_company_code() -> str:
     db = get_db()
-    with db.connect() as conn:
+    with db.read() as conn:
         cur = conn.cursor()
         row = cur.execute(
             "SELECT value FROM settings WHERE key='company_code' LIMIT 1"
@@ -61,7 +42,7 @@ def _get_qr_payload_or_build(sku: str) -> str:
     company_code = _get_company_code()
     secret = cfg.security["secret_key"]
 
-    with db.connect() as conn:
+    with db.read() as conn:
         cur = conn.cursor()
         prow = cur.execute(
             "SELECT qr_payload FROM products WHERE sku=? LIMIT 1", (sku,)
@@ -78,10 +59,14 @@ def _get_qr_payload_or_build(sku: str) -> str:
 # GET /qr/{sku}.png
 # ----------------------------
 @router.get("/qr/{sku}.png")
-def qr_png(sku: str):
+async def qr_png(sku: str):
     """
     动态生成二维码 PNG，内容为 SF1:<COMP>:<SKU>:<CHK>
     """
+    return await get_readers().run(_qr_png, sku)
+
+
+def _qr_png(sku: str):
     try:
         import qrcode  # pillow 作为其依赖
     except ImportError:
@@ -110,11 +95,15 @@ def qr_png(sku: str):
 # GET /qr-svg/{sku}.svg
 # ----------------------------
 @router.get("/qr-svg/{sku}.svg")
-def qr_svg(sku: str):
+async def qr_svg(sku: str):
     """
     生成 SVG 矢量二维码（打印更清晰，无缩放损失）。
     内容同 PNG：SF1:<COMP>:<SKU>:<CHK>
     """
+    return await get_readers().run(_qr_svg, sku)
+
+
+def _qr_svg(sku: str):
     try:
         import qrcode
         import qrcode.image.svg as qsvg
@@ -134,3 +123,29 @@ def qr_svg(sku: str):
     svg_bytes = img.to_string()
 
     return Response(content=svg_bytes, media_type="image/svg+xml")
+
+
+# ----------------------------
+# 扫码解析（批量）
+# POST /api/qr/resolve  {"codes": ["SF1:...", "SKU", ...]}
+# ----------------------------
+class QrResolveIn(BaseModel):
+    codes: List[str]
+
+
+@router.post("/api/qr/resolve")
+async def qr_resolve(payload: QrResolveIn, user=Depends(current_user)):
+    """
+    先离线校验 SF1 载荷的 HMAC（伪造/误录直接拒绝，不查库），
+    再查进程内索引返回商品摘要（含最新状态）。
+    索引已装载且无待同步变更时纯内存计算，直接在事件循环里完成；需装载/同步时交给读线程池。
+    """
+    if not payload.codes:
+        raise HTTPException(status_code=400, detail="扫码内容为空")
+    cfg = get_cfg()
+    index = get_qr_index()
+    if index.ready:
+        results = index.resolve(payload.codes, cfg.security["secret_key"])
+    else:
+        results = await get_readers().run(index.resolve, payload.codes, cfg.security["secret_key"])
+    return {"results": results}
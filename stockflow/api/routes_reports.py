@@ -0,0 +1,99 @@
+# api/routes_reports.py
+# 报表（只读 JSON）：历史时点库存、区间出入库流水/汇总、库存估值/库龄/品类分析，均走读线程池
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from api.deps import get_services, get_readers, get_analytics, admin_user
+from core.services.analytics import AnalyticsUnavailable, DEFAULT_AGING_BUCKETS
+
+router = APIRouter()
+
+
+# ====== 历史时点库存：最近检查点 + 有界流水回放 ======
+@router.get("/api/reports/stock-as-of")
+async def report_stock_as_of(
+    date: str = Query(..., description="时点：YYYY-MM-DD（当天结束）或 YYYY-MM-DD HH:MM:SS"),
+    warehouse_id: Optional[int] = Query(None),
+    product_id: Optional[int] = Query(None, description="给定时需同时给 warehouse_id，只查单个商品"),
+    include_zero: int = Query(0),
+    user=Depends(admin_user),
+):
+    inv, _ = get_services()
+    if product_id is not None and warehouse_id is not None:
+        qty = await get_readers().run(inv.ledger.on_hand_as_of, product_id, warehouse_id, date)
+        return {"date": date, "product_id": product_id, "warehouse_id": warehouse_id, "qty": qty}
+    rows = await get_readers().run(inv.ledger.stock_as_of, date, warehouse_id, include_zero == 1)
+    return {"date": date, "warehouse_id": warehouse_id, "rows": rows}
+
+
+# ====== 区间流水（分页）与汇总 ======
+@router.get("/api/reports/movements")
+async def report_movements(
+    start: str = Query(..., description="起：YYYY-MM-DD 或完整时间"),
+    end: str = Query(..., description="止：YYYY-MM-DD（含当天）或完整时间"),
+    warehouse_id: Optional[int] = Query(None),
+    product_id: Optional[int] = Query(None),
+    limit: int = Query(500, ge=1, le=5000),
+    offset: int = Query(0, ge=0),
+    user=Depends(admin_user),
+):
+    inv, _ = get_services()
+    rows = await get_readers().run(inv.ledger.movements, start, end, warehouse_id, product_id, limit, offset)
+    return {"start": start, "end": end, "rows": rows, "limit": limit, "offset": offset}
+
+
+@router.get("/api/reports/movement-summary")
+async def report_movement_summary(
+    start: str = Query(...),
+    end: str = Query(...),
+    warehouse_id: Optional[int] = Query(None),
+    user=Depends(admin_user),
+):
+    inv, _ = get_services()
+    rows = await get_readers().run(inv.ledger.movement_summary, start, end, warehouse_id)
+    return {"start": start, "end": end, "rows": rows}
+
+
+# ====== 库存分析（NumPy 列式快照，products 不变时只做数组运算） ======
+async def _analyze(fn, *args):
+    try:
+        return await get_readers().run(fn, *args)
+    except AnalyticsUnavailable as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/api/reports/valuation")
+async def report_valuation(
+    include_sold: int = Query(0, description="1=含已出售"),
+    user=Depends(admin_user),
+):
+    return await _analyze(get_analytics().valuation, include_sold == 1)
+
+
+@router.get("/api/reports/aging")
+async def report_aging(
+    date: Optional[str] = Query(None, description="基准日 YYYY-MM-DD，默认今天"),
+    buckets: Optional[str] = Query(None, description="分桶上界（天），逗号分隔，如 30,90,180,365"),
+    include_sold: int = Query(0),
+    user=Depends(admin_user),
+):
+    try:
+        bounds = tuple(int(b) for b in buckets.split(",") if b.strip()) if buckets else DEFAULT_AGING_BUCKETS
+        if date:
+            datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="参数格式错误")
+    if not bounds or min(bounds) <= 0:
+        raise HTTPException(status_code=400, detail="分桶上界须为正整数")
+    return await _analyze(get_analytics().aging, date, bounds, include_sold == 1)
+
+
+@router.get("/api/reports/categories")
+async def report_categories(
+    include_sold: int = Query(0),
+    user=Depends(admin_user),
+):
+    return await _analyze(get_analytics().categories, include_sold == 1)
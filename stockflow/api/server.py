@@ -2,27 +2,46 @@
 # 应用入口
 
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 from pathlib import Path
+import hmac
+import ipaddress
+import time
 
-from api.deps import get_cfg, get_services, current_user, get_db
+from api.deps import (get_cfg, get_services, current_user, admin_user, get_db, get_readers, get_writer,
+                      get_checkpointer, get_fragments, get_change_tracker, get_events, get_label_pdfs, get_catalog,
+                      get_outbox, get_maintenance, get_invalidation, get_qr_index, get_tenant, get_tenant_router)
+from api import tenancy
+from api.tenancy import UnknownTenant
+from api.assets import router as assets_router, asset_url, get_assets
 from utils.security import issue_jwt
+from utils.metrics import http_metrics, begin_request, end_request
+from infra.db_interface import get_tracer
+from infra.storage import SQLITE
 
 # —— 创建应用（务必先有 app 再 include 路由）——
 app = FastAPI(title="StockFlow Web")
 
 # 模板
 templates = Jinja2Templates(directory="api/templates")
+# 编译结果落盘：多 worker / 重启后不必重新编译 outbound.html、labels_print.html 等大模板
+templates.env.bytecode_cache = FileSystemBytecodeCache(get_cfg().paths["template_cache_dir"])
 app.templates = templates   # 供路由里通过 request.app.templates 使用
+# 页面脚本走指纹 URL：{{ asset_url('js/outbound.js') }} → /assets/js/outbound.<哈希>.js
+templates.env.globals["asset_url"] = asset_url
 
 # —— 确保静态资源目录存在后再挂载（自动创建） ——
 Path("api/static").mkdir(parents=True, exist_ok=True)
 Path("data/photos").mkdir(parents=True, exist_ok=True)
 
-# 静态资源
+# 静态资源（/static 原样保留给旧链接；页面里用 /assets 的指纹地址）
 app.mount("/static", StaticFiles(directory="api/static"), name="static")
+# 启动时就做好指纹与预压缩，首个请求不用等
+get_assets()
+app.include_router(assets_router, prefix="", tags=["assets"])
 # 照片目录
 app.mount("/photos", StaticFiles(directory="data/photos"), name="photos")
 
@@ -35,14 +54,22 @@ except Exception:
     HAS_SETUP = False
 
 # —— 公司初始化强制引导中间件 ——
+def _has_company_code() -> bool:
+    db = get_db()
+    with db.read() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM settings WHERE key='company_code' LIMIT 1")
+        row = cur.fetchone()
+        return bool(row and (row["value"] or "").strip())
+
 @app.middleware("http")
 async def company_setup_guard(request: Request, call_next):
     """
     若尚未设置 company_code，则除允许的路径之外全部重定向到 /setup/company
-    允许路径：/setup/company、/static、/photos、/login、/logout、/favicon.ico
+    允许路径：/setup/company、/static、/assets、/photos、/login、/logout、/favicon.ico
     """
     path = request.url.path
-    allow_prefix = ["/setup/company", "/static", "/photos", "/login", "/logout", "/favicon.ico"]
+    allow_prefix = ["/setup/company", "/static", "/assets", "/photos", "/login", "/logout", "/favicon.ico", "/metrics"]
     if any(path.startswith(p) for p in allow_prefix):
         return await call_next(request)
 
@@ -50,21 +77,127 @@ async def company_setup_guard(request: Request, call_next):
     if not HAS_SETUP:
         return await call_next(request)
 
-    # 检查 settings 里的 company_code
-    db = get_db()
-    try:
-        with db.connect() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT value FROM settings WHERE key='company_code' LIMIT 1")
-            row = cur.fetchone()
-            if not row or not (row["value"] or "").strip():
-                return RedirectResponse(url="/setup/company", status_code=303)
-    except Exception:
-        # settings 表未建或查询异常时，仍跳设置页
-        return RedirectResponse(url="/setup/company", status_code=303)
+    # 检查 settings 里的 company_code（设置后不会再清空，每个租户确认过一次即不再查库）
+    tenant = get_tenant()
+    if not tenant.company_ready:
+        try:
+            tenant.company_ready = await get_readers().run(_has_company_code)
+        except Exception:
+            # settings 表未建或查询异常时，仍跳设置页
+            tenant.company_ready = False
+        if not tenant.company_ready:
+            return RedirectResponse(url="/setup/company", status_code=303)
 
     return await call_next(request)
 
+# —— 跨 worker 缓存失效：每个请求先看一眼别的进程有没有提交过（未变化时只是一条 PRAGMA data_version） ——
+@app.middleware("http")
+async def invalidation_check(request: Request, call_next):
+    bus = get_invalidation()
+    if get_db().dialect is SQLITE:
+        # 本地文件上的一条 PRAGMA：直接在事件循环上做；后台轮询正占着探测连接时不等，交给它
+        bus.check(blocking=False)
+    else:
+        # PostgreSQL 的版本查询要走网络（首次还要建连接）：放到读线程池，库慢/断开时不卡事件循环
+        await get_readers().run(bus.check)
+    return await call_next(request)
+
+# —— 多租户：按 Host（或配置的请求头）选库，绑定到本请求的上下文；要在引导/失效检查之外层 ——
+class _ReleaseAfterBody:
+    """
+    流式响应（SSE、分块 PDF）在中间件返回后才发送正文：发完/出错/aclose() 时才归还，期间租户不会被 LRU 关掉。
+    客户端在正文开始前就断开时正文一次都不会被读，靠对象回收（__del__）兜底归还；无论走哪条路只归还一次。
+    """
+
+    def __init__(self, body, release):
+        self._body = body
+        self._release = release
+
+    def _done(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._body.__anext__()
+        except BaseException:
+            self._done()
+            raise
+
+    async def aclose(self):
+        try:
+            close = getattr(self._body, "aclose", None)
+            if close is not None:
+                await close()
+        finally:
+            self._done()
+
+    def __del__(self):
+        self._done()
+
+@app.middleware("http")
+async def tenant_scope(request: Request, call_next):
+    router = get_tenant_router()
+    if not router.enabled:
+        return await call_next(request)
+    try:
+        code = router.resolve(request.headers)
+    except UnknownTenant as e:
+        return PlainTextResponse(str(e), status_code=404)
+    # 首次访问某租户要建库/迁移/起写线程，放到读线程池里做
+    state = await get_readers().run(router.acquire, code)
+    token = tenancy.bind(state)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        router.release(state)
+        raise
+    finally:
+        tenancy.unbind(token)
+    response.body_iterator = _ReleaseAfterBody(response.body_iterator, lambda: router.release(state))
+    return response
+
+# —— 请求指标中间件（后注册 = 最外层，重定向/异常也计入） ——
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    acc, token = begin_request()
+    http_metrics.enter()
+    t0 = time.perf_counter()
+    status_code, error = 500, True
+    try:
+        response = await call_next(request)
+        status_code, error = response.status_code, False
+        return response
+    finally:
+        # 路由模板（/loans/{loan_id}）而不是原始路径，控制标签基数
+        route = request.scope.get("route")
+        http_metrics.leave(request.method, getattr(route, "path", "<unmatched>"), status_code,
+                           time.perf_counter() - t0, acc.statements, acc.seconds, error=error)
+        end_request(token)
+
+def _metrics_allowed(request: Request) -> bool:
+    """/metrics 不走登录：带 security.metrics_token 的 Bearer 令牌，或来源地址在 security.metrics_allow 内。"""
+    sec = get_cfg().security
+    token = sec["metrics_token"]
+    if token and hmac.compare_digest(request.headers.get("authorization", "").encode(),
+                                     f"Bearer {token}".encode()):
+        return True
+    try:
+        ip = ipaddress.ip_address(request.client.host if request.client else "")
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(net, strict=False) for net in sec["metrics_allow"])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    if not _metrics_allowed(request):
+        return PlainTextResponse("forbidden", status_code=403)
+    return PlainTextResponse(http_metrics.render(), media_type="text/plain; version=0.0.4")
+
 # —— 基础页面 ——
 @app.get("/", response_class=HTMLResponse)
 def root(request: Request):
@@ -86,7 +219,8 @@ def login(request: Request, username: str = Form(...), password: str = Form(...)
     minutes = sec["access_token_minutes"]
     if remember:
         minutes = sec["refresh_token_days"] * 24 * 60
-    token = issue_jwt({"id": user["id"], "username": user["username"], "roles": user["roles"]},
+    token = issue_jwt({"id": user["id"], "username": user["username"], "roles": user["roles"],
+                       "tenant": get_tenant().code},
                       sec["secret_key"], minutes)
     resp = RedirectResponse(url="/dashboard", status_code=302)
     resp.set_cookie(key=sec["cookie_name"], value=token, httponly=True, samesite="lax")
@@ -104,6 +238,139 @@ def logout():
 def dashboard(request: Request, user=Depends(current_user)):
     return templates.TemplateResponse("dashboard.html", {"request": request, "user": user})
 
+# —— 读线程池统计（排队等待 vs 执行耗时） ——
+@app.get("/api/stats/readers")
+async def reader_stats(user=Depends(current_user)):
+    return get_readers().stats()
+
+# —— 行级片段缓存命中率 ——
+@app.get("/api/stats/fragments")
+async def fragment_stats(user=Depends(current_user)):
+    return get_fragments().stats()
+
+# —— 商品状态推送（SSE）：扫码工作站订阅，断线重连带 Last-Event-ID 续传 ——
+@app.get("/api/events")
+async def event_stream(request: Request, last_event_id: str = "", user=Depends(current_user)):
+    # 浏览器重连时带 Last-Event-ID 头；首连也可用 ?last_event_id= 指定（页面缓存了序号时）
+    since = request.headers.get("last-event-id") or last_event_id or None
+    return StreamingResponse(
+        get_events().stream(request, since, max_age_s=get_cfg().performance["event_stream_max_s"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/stats/events")
+async def event_stats(user=Depends(current_user)):
+    return get_events().stats()
+
+# —— 变更令牌（列表页 ETag）：data_version 检查次数 / 重读次数 / 各表版本 ——
+@app.get("/api/stats/changes")
+async def change_stats(user=Depends(current_user)):
+    return get_change_tracker().stats()
+
+# —— 跨 worker 失效总线 ——
+@app.get("/api/stats/invalidation")
+async def invalidation_stats(user=Depends(current_user)):
+    return {**get_invalidation().stats(), "qr_index_syncs": get_qr_index().syncs}
+
+# —— 多租户：已打开的租户库（在途请求数）/ 打开与淘汰次数 ——
+@app.get("/api/stats/tenants")
+async def tenant_stats(user=Depends(admin_user)):
+    return {"current": get_tenant().code, **get_tenant_router().stats()}
+
+# —— 标签 PDF 缓存 ——
+@app.get("/api/stats/label-pdf")
+async def label_pdf_stats(user=Depends(current_user)):
+    return get_label_pdfs().stats()
+
+@app.get("/api/stats/catalog")
+async def catalog_stats(user=Depends(current_user)):
+    return get_catalog().stats()
+
+@app.get("/api/stats/outbox")
+async def outbox_stats(user=Depends(current_user)):
+    return await get_readers().run(get_outbox().stats)
+
+@app.get("/api/stats/maintenance")
+async def maintenance_stats(user=Depends(current_user)):
+    m = get_maintenance()
+    if m is None:
+        return {"enabled": False}
+    return await get_readers().run(m.stats)
+
+@app.get("/api/stats/assets")
+async def assets_stats(user=Depends(current_user)):
+    return get_assets().stats()
+
+# —— 写线程统计（合并提交批大小 / 提交耗时） ——
+@app.get("/api/stats/writer")
+async def writer_stats(user=Depends(current_user)):
+    writer = get_writer()
+    if writer is None:
+        # PostgreSQL 引擎：没有写线程，返回连接池状态
+        return get_db().stats()
+    return writer.stats()
+
+# —— WAL 检查点：查看定时检查点状态 / 手动触发（独立连接，不占写线程） ——
+@app.get("/api/stats/wal")
+async def wal_stats(user=Depends(current_user)):
+    return get_checkpointer().stats()
+
+_CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+@app.post("/api/db/checkpoint")
+def db_checkpoint(mode: str = "PASSIVE", user=Depends(admin_user)):
+    # RESTART/TRUNCATE 会等所有读者结束，只给管理员
+    mode = (mode or "").upper()
+    if mode not in _CHECKPOINT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode 须为 {' / '.join(_CHECKPOINT_MODES)}")
+    return get_db().checkpoint(mode)
+
+# —— SQL 追踪（管理员）：聚合视图 / 运行时开关 / 导出给 CLI（python main.py sql-trace） ——
+def _sql_trace_path() -> str:
+    return str(Path(get_cfg().paths["event_log_dir"]) / "sql_trace.json")
+
+@app.get("/api/admin/sql-trace")
+async def sql_trace_view(order: str = "total_ms", limit: int = 50, user=Depends(admin_user)):
+    tracer = get_tracer()
+    if tracer is None:
+        return {"enabled": False, "statements": []}
+    return {"enabled": True, **tracer.snapshot(order_by=order, limit=limit)}
+
+@app.post("/api/admin/sql-trace/enable")
+async def sql_trace_enable(slow_ms: float = None, user=Depends(admin_user)):
+    if slow_ms is None:
+        slow_ms = get_cfg().performance["sql_slow_ms"]
+    get_db().enable_trace(slow_ms)
+    return {"enabled": True, "slow_ms": slow_ms}
+
+@app.post("/api/admin/sql-trace/disable")
+async def sql_trace_disable(user=Depends(admin_user)):
+    get_db().disable_trace()
+    return {"enabled": False}
+
+@app.post("/api/admin/sql-trace/reset")
+async def sql_trace_reset(user=Depends(admin_user)):
+    tracer = get_tracer()
+    if tracer:
+        tracer.reset()
+    return {"ok": True}
+
+@app.post("/api/admin/sql-trace/dump")
+def sql_trace_dump(user=Depends(admin_user)):
+    tracer = get_tracer()
+    if tracer is None:
+        raise HTTPException(status_code=400, detail="SQL 追踪未开启")
+    return {"path": tracer.dump(_sql_trace_path())}
+
+@app.on_event("shutdown")
+def _stop_writer():
+    tracer = get_tracer()
+    if tracer:
+        tracer.dump(_sql_trace_path())
+    # 默认库与所有已打开的租户库：停失效轮询 / 检查点线程 / 写线程
+    get_tenant_router().close_all()
+
 # —— 这里开始 include 各个路由（务必在 app 创建之后） ——
 # 公司初始化路由（必须在中间件之后 include）
 if HAS_SETUP and setup_router:
@@ -124,3 +391,7 @@ app.include_router(qr_router, prefix="", tags=["qr"])
 # ✅ 引入“借出单”路由（你新加的 api/routes_loans.py）
 from api.routes_loans import router as loans_router
 app.include_router(loans_router, prefix="", tags=["loans"])
+
+# 报表（历史时点库存 / 出入库流水）
+from api.routes_reports import router as reports_router
+app.include_router(reports_router, prefix="", tags=["reports"])
@@ -0,0 +1,542 @@
+// outbound.js —— 借出扫码页逻辑；商品目录 PRODUCTS 由页面内联脚本提供
+
+const $ = s => document.querySelector(s);
+const fmt = n => "¥" + (Math.round((n||0))).toLocaleString();
+
+/* === 折扣记忆：localStorage === */
+const DISCOUNT_KEY = "sf:lastLoanDiscount";
+function getSavedDiscount() {
+  const v = parseFloat(localStorage.getItem(DISCOUNT_KEY));
+  return (v > 0 && v <= 1) ? v : 0.80;   // 默认 0.80
+}
+function saveDiscount(v) {
+  const n = parseFloat(v);
+  if (n > 0 && n <= 1) localStorage.setItem(DISCOUNT_KEY, n.toFixed(2));
+}
+
+let state = {
+  started: false,
+  discount: getSavedDiscount(),     // ← 用记忆值初始化
+  meta: { company:"", receiver:"", handler:"" },
+  items: [], // {id, sku, name, price, category, spec, photo}
+  submitting: false,  // 提交中：本站自己的借出事件不当作“被别处借走”
+};
+
+/* === 顶部：开始借出 / 取消 / 完成 === */
+const btnStart = $("#btnStart"), btnFinish = $("#btnFinish"), btnCancel = $("#btnCancel");
+const btnRestart = $("#btnRestart");
+const dlg = $("#dlgInfo");
+
+btnStart.addEventListener("click", () => {
+  dlg.showModal();
+  $("#inCompany").value = state.meta.company || "";
+  $("#receiver").value  = state.meta.receiver || "";
+  $("#handler").value   = state.meta.handler || "";
+  $("#discount").value  = state.discount.toFixed(2);  // ← 带入记忆值
+});
+
+$("#btnInfoOk").addEventListener("click", async (ev) => {
+  ev.preventDefault();
+  const company = $("#inCompany").value.trim();
+  const receiver= $("#receiver").value.trim();
+  const handler = $("#handler").value.trim();
+  const discount = parseFloat($("#discount").value);
+
+  if (!company && !receiver && !handler) return alert("请至少填写：借入公司 / 接货负责人 / 本公司经手人 任一项。");
+  if (!(discount>0 && discount<=1)) return alert("VIP折扣必须是 0~1 之间的小数，比如 0.90");
+
+  state.started = true;
+  state.meta = {company, receiver, handler};
+  state.discount = discount;
+  saveDiscount(discount);                // ← 保存记忆
+
+  // 展示到顶部
+  $("#borrowInfo").style.display = "";
+  const show = (id, label, val) => { const el=$(id); if (val){ el.textContent = label + "：" + val; el.style.display="inline-block"; }else{ el.style.display="none"; } };
+  show("#tagCompany","借入公司", company);
+  show("#tagReceiver","接货负责人", receiver);
+  show("#tagHandler","经手人", handler);
+  $("#tagDiscount").textContent = "VIP折扣：" + discount.toFixed(2);
+
+  // 按钮切换
+  btnStart.style.display = "none";
+  btnFinish.style.display = "";
+  btnCancel.style.display = "";
+
+  dlg.close();
+
+  // 自动开摄像头
+  await startCam();
+});
+
+/* 取消：恢复初始状态 */
+btnCancel.addEventListener("click", () => {
+  resetUI();
+});
+
+/* ✅ 完成：提交 /api/loans/create，成功后复位并本地更新 PRODUCTS 状态，避免重复借出 */
+btnFinish.addEventListener("click", async () => {
+  if (state.items.length === 0) { alert("当前列表为空，无法生成借出单。"); return; }
+  const payload = {
+    company:  state.meta.company || "",
+    receiver: state.meta.receiver || "",
+    handler:  state.meta.handler || "",
+    discount: state.discount || 1,
+    items: state.items.map(x => ({ sku: x.sku }))
+  };
+  state.submitting = true;
+  try {
+    stopCam(); // 先停摄像头
+    const res = await fetch("/api/loans/create", {
+      method: "POST",
+      headers: {"Content-Type":"application/json"},
+      body: JSON.stringify(payload)
+    });
+    const text = await res.text();
+    if (!res.ok) {
+      throw new Error(text || ("HTTP " + res.status));
+    }
+    // 成功
+    const data = text ? JSON.parse(text) : {};
+    const sum = state.items.reduce((a,b)=>a+(Number(b.price)||0),0) * (state.discount||1);
+    const msg = `借出单已生成：${data.loan_no || ""}（件数 ${state.items.length}，折后 ¥${Math.round(sum).toLocaleString()}）`;
+    // 本地把已借出的 SKU 标为“借出”，并写 borrower，避免不刷新继续扫成功
+    const borrowerTxt = [
+      state.meta.company && ("借入公司：" + state.meta.company),
+      state.meta.receiver && ("接货负责人：" + state.meta.receiver),
+      state.meta.handler  && ("本公司经手人：" + state.meta.handler)
+    ].filter(Boolean).join("，");
+    state.items.forEach(it => {
+      const p = PRODUCTS[it.sku];
+      if (p) { p.status = "借出"; p.borrower = borrowerTxt; }
+    });
+    resetUI();
+    alert(msg);
+  } catch (e) {
+    alert("生成借出单失败：" + e.message);
+  } finally {
+    state.submitting = false;
+  }
+});
+
+/* === 简短蜂鸣（更短 & 确保停止） === */
+const AC = window.AudioContext || window.webkitAudioContext;
+let audioCtx;
+function blip({freq=1000, dur=70, type='sine', vol=0.18} = {}) {
+  try {
+    audioCtx = audioCtx || new AC();
+    audioCtx.resume?.();
+    const t0 = audioCtx.currentTime;
+    const osc = audioCtx.createOscillator();
+    const gain = audioCtx.createGain();
+    osc.type = type;
+    osc.frequency.setValueAtTime(freq, t0);
+    gain.gain.setValueAtTime(0, t0);
+    gain.gain.linearRampToValueAtTime(vol, t0 + 0.01);
+    gain.gain.linearRampToValueAtTime(0.0001, t0 + dur / 1000.0);
+    osc.connect(gain).connect(audioCtx.destination);
+    osc.start(t0);
+    osc.stop(t0 + dur / 1000.0 + 0.02);
+    osc.onended = () => { try { osc.disconnect(); gain.disconnect(); } catch(e){} };
+  } catch(e) {}
+}
+const beepOk  = () => blip({freq: 1000, dur: 60, type: 'sine',   vol: 0.15});
+const beepErr = () => blip({freq:  300, dur: 90, type: 'square', vol: 0.18});
+
+/* === 摄像头扫码（仅识别取景框内）===
+ * 主线程只取帧：取景框区域缩到 ROI_MAX 边长后转移给后台 Worker 解码（原生 BarcodeDetector 优先，回退 jsQR）；
+ * 上一帧没解完不取新帧，连续读不到码时拉长取帧间隔，同一个码停在框里只算一次。
+ * 没有 Worker 的老浏览器退回主线程解码（同样缩小 + 节流）。 */
+const video = $("#preview"), roi = $("#roi");
+let stream = null, rafId = null, vfcId = null, engine = null, detector = null;
+let scanning = false;
+
+const ROI_MAX = 480;                           // 送去解码的最大边长（px）；取景框里的码足够大，缩小不影响识别
+const FRAME_MIN_MS = 60, FRAME_MAX_MS = 250;   // 自适应取帧间隔：有码/刚读到时最快，空闲时逐步放慢
+const HOLD_MISS = 6;                           // 连续这么多帧读不到，才认为上一个码已离开取景框
+let frameGap = FRAME_MIN_MS, lastFrameAt = 0, idleFrames = 0;
+let busy = false, frameId = 0, roiRect = null;
+let heldCode = "", missFrames = 0;
+
+const WORKER_INIT_MS = 5000, WORKER_FRAME_MS = 2000;   // Worker 装载 / 单帧解码的最长等待：超时按卡死处理，重建 Worker
+let worker = null, workerReady = null, workerTimer = null;
+let useBitmap = !!(window.createImageBitmap && window.OffscreenCanvas);
+
+function layoutROI() {
+  const vb = video.getBoundingClientRect();
+  const size = Math.min(vb.width, vb.height) * 0.6;
+  roi.style.width = size + "px";
+  roi.style.height = size + "px";
+  roi.style.left = (vb.left + (vb.width - size)/2 - vb.left) + "px";
+  roi.style.top  = (vb.top  + (vb.height- size)/2 - vb.top ) + "px";
+  roiRect = null;   // 取帧窗口下次重算（避免每帧 getBoundingClientRect 触发布局）
+}
+window.addEventListener("resize", layoutROI);
+
+/* 取景框 → 视频像素窗口 + 缩放后的尺寸 */
+function frameRect(){
+  if (roiRect) return roiRect;
+  const vb = video.getBoundingClientRect();
+  const rx = roi.getBoundingClientRect();
+  const sx = (rx.left - vb.left) / vb.width  * video.videoWidth;
+  const sy = (rx.top  - vb.top ) / vb.height * video.videoHeight;
+  const sw = rx.width  / vb.width  * video.videoWidth;
+  const sh = rx.height / vb.height * video.videoHeight;
+  const k = Math.min(1, ROI_MAX / Math.max(sw, sh));
+  roiRect = {sx, sy, sw, sh, dw: Math.max(1, Math.round(sw * k)), dh: Math.max(1, Math.round(sh * k))};
+  return roiRect;
+}
+
+$("#btnRestart").addEventListener("click", async () => {
+  if (!state.started) return alert("请先点击“开始借出”并填写信息。");
+  await startCam();
+});
+
+/* 后台解码线程：只建一次，跨“开始/完成”复用；卡死时由 onWorkerStall() 重建 */
+function startWorker(){
+  if (workerReady) return workerReady;
+  if (!window.Worker) return (workerReady = Promise.resolve(null));
+  workerReady = new Promise(resolve => {
+    let w;
+    try { w = worker = new Worker(SF_ASSETS.qrWorker); }
+    catch (e) { resolve(null); return; }
+    const initTimer = setTimeout(() => { dropWorker(w); resolve(null); }, WORKER_INIT_MS);
+    w.onmessage = e => {
+      const m = e.data;
+      if (m.type === 'ready') { clearTimeout(initTimer); resolve(m.engine); }
+      else if (m.type === 'error') { clearTimeout(initTimer); resolve(null); }
+      else if (m.type === 'result' && m.id === frameId) { clearTimeout(workerTimer); onDecoded(m.text, m.ms); }
+    };
+    w.onerror = () => { clearTimeout(workerTimer); busy = false; resolve(null); };
+    w.postMessage({type: 'init', jsqr: new URL(SF_ASSETS.jsQR, location.href).href});
+  });
+  return workerReady;
+}
+
+/* 终止并丢弃一个 Worker；下次 startWorker() 重新创建 */
+function dropWorker(w){
+  if (!w) return;
+  w.terminate();
+  if (worker === w) { worker = null; workerReady = null; }
+}
+
+/* 一帧迟迟没有回音（Worker 卡死/被回收）：作废这帧，重建 Worker（建不起来就换引擎），扫码继续 */
+async function onWorkerStall(id){
+  if (id !== frameId || !busy) return;
+  frameId++;
+  dropWorker(worker);
+  engine = null;
+  engine = await pickEngine();
+  busy = false;
+  if (!engine && scanning) {
+    stopCam();
+    alert("扫码引擎失去响应，请点“重启摄像头”。");
+  }
+}
+
+function loadJsQR(){
+  if (window.jsQR) return Promise.resolve(true);
+  return new Promise(resolve => {
+    const s = document.createElement('script');
+    s.src = SF_ASSETS.jsQR;
+    s.onload = () => resolve(!!window.jsQR);
+    s.onerror = () => resolve(false);
+    document.head.appendChild(s);
+  });
+}
+
+async function nativeDetector(){
+  if (!('BarcodeDetector' in window)) return null;
+  try {
+    const fmts = await (window.BarcodeDetector.getSupportedFormats?.() || []);
+    return (fmts && fmts.includes('qr_code')) ? new BarcodeDetector({formats:['qr_code']}) : null;
+  } catch { return null; }
+}
+
+/* 引擎选择：Worker 里有原生检测器 > 主线程原生检测器（本身就异步、不占 UI）> Worker 里的 jsQR > 主线程 jsQR */
+async function pickEngine(){
+  if (engine) return engine;
+  const inWorker = await startWorker();
+  if (inWorker === 'barcode') return 'worker';
+  detector = await nativeDetector();
+  if (detector) return 'barcode';
+  if (inWorker === 'jsqr') return 'worker';
+  return (await loadJsQR()) ? 'jsqr' : null;
+}
+
+async function startCam(){
+  try{
+    stopCam(); // 防重复
+    engine = await pickEngine();
+    if (!engine) {
+      alert("没有可用的扫码引擎（请更新浏览器，或确保能加载 jsQR.min.js）。");
+      btnRestart.style.display = ""; return;
+    }
+    stream = await navigator.mediaDevices.getUserMedia({video:{facingMode:'environment'}});
+    video.srcObject = stream; await video.play();
+    btnRestart.style.display = "none";
+    layoutROI();
+    scanning = true; busy = false; frameGap = FRAME_MIN_MS; idleFrames = 0;
+    scheduleTick();
+    stream.getVideoTracks().forEach(t => {
+      t.addEventListener('ended', () => { if (state.started) btnRestart.style.display = ""; });
+    });
+  }catch(e){
+    console.error(e);
+    alert("无法启动摄像头：" + e.message);
+    btnRestart.style.display = "";
+  }
+}
+function stopCam(){
+  scanning = false;
+  if (rafId) cancelAnimationFrame(rafId), rafId=null;
+  if (vfcId && video.cancelVideoFrameCallback) video.cancelVideoFrameCallback(vfcId), vfcId=null;
+  frameId++;   // 在途的解码结果作废
+  busy = false; heldCode = ""; missFrames = 0;
+  clearTimeout(workerTimer);
+  if (video.srcObject) { video.pause(); video.srcObject.getTracks().forEach(t=>t.stop()); video.srcObject=null; }
+  if (state.started) btnRestart.style.display = ""; else btnRestart.style.display = "none";
+}
+document.addEventListener("visibilitychange", ()=>{
+  if (document.hidden) stopCam();
+  else if (state.started && !video.srcObject) btnRestart.style.display = "";
+});
+
+/* 有 requestVideoFrameCallback 就按“新视频帧”驱动，同一帧不重复解码 */
+function scheduleTick(){
+  if (!scanning) return;
+  if (video.requestVideoFrameCallback) vfcId = video.requestVideoFrameCallback(tick);
+  else rafId = requestAnimationFrame(tick);
+}
+
+const off = document.createElement('canvas'), ctx = off.getContext('2d', {willReadFrequently: true});
+
+function drawROI(r){
+  if (off.width !== r.dw || off.height !== r.dh) { off.width = r.dw; off.height = r.dh; }
+  ctx.drawImage(video, r.sx, r.sy, r.sw, r.sh, 0, 0, r.dw, r.dh);
+}
+
+async function postFrame(r, id){
+  if (useBitmap) {
+    try {
+      const bitmap = await createImageBitmap(video, r.sx, r.sy, r.sw, r.sh,
+                                             {resizeWidth: r.dw, resizeHeight: r.dh, resizeQuality: 'low'});
+      worker.postMessage({type: 'frame', id, bitmap}, [bitmap]);
+      return;
+    } catch (e) { useBitmap = false; }   // 不支持裁剪/缩放参数的浏览器：改走像素缓冲
+  }
+  drawROI(r);
+  const img = ctx.getImageData(0, 0, r.dw, r.dh);
+  worker.postMessage({type: 'frame', id, buffer: img.data.buffer, width: r.dw, height: r.dh}, [img.data.buffer]);
+}
+
+async function decodeHere(r){
+  drawROI(r);
+  if (engine === 'barcode') {
+    const codes = await detector.detect(off);
+    return codes && codes.length ? codes[0].rawValue : null;
+  }
+  const img = ctx.getImageData(0, 0, r.dw, r.dh);
+  const res = window.jsQR(img.data, img.width, img.height, { inversionAttempts: "dontInvert" });
+  return res ? res.data : null;
+}
+
+async function tick(){
+  rafId = vfcId = null;
+  if (!scanning) return;
+  const now = performance.now();
+  if (busy || !video.videoWidth || now - lastFrameAt < frameGap) { scheduleTick(); return; }
+  lastFrameAt = now;
+  busy = true;
+  const id = ++frameId, r = frameRect();
+  try {
+    if (engine === 'worker') {
+      await postFrame(r, id);   // 结果由 worker.onmessage → onDecoded；超时没回音就重建 Worker
+      clearTimeout(workerTimer);
+      workerTimer = setTimeout(() => onWorkerStall(id), WORKER_FRAME_MS);
+    }
+    else { const text = await decodeHere(r); if (id === frameId) onDecoded(text, performance.now() - now); }
+  } catch(e) { busy = false; }
+  scheduleTick();
+}
+
+/* 解码结果：调节取帧间隔 + 去重 */
+function onDecoded(text, ms){
+  busy = false;
+  text = (text || "").trim();
+  if (!text) {
+    if (++missFrames >= HOLD_MISS) heldCode = "";
+    // 空闲越久取帧越慢（省电），且不快于解码耗时的 2 倍（慢机器不排队）
+    idleFrames++;
+    const base = idleFrames > 30 ? FRAME_MAX_MS : (idleFrames > 10 ? FRAME_MIN_MS * 2 : FRAME_MIN_MS);
+    frameGap = Math.min(FRAME_MAX_MS, Math.max(base, ms * 2));
+    return;
+  }
+  missFrames = 0; idleFrames = 0;
+  frameGap = Math.min(FRAME_MAX_MS, Math.max(FRAME_MIN_MS, ms * 2));
+  if (text === heldCode) return;   // 还是框里那一个，不重复提交
+  heldCode = text;
+  handleScan(text);
+}
+
+/* === 解析扫描内容：SF1:COMP:SKU:CHK 或 SKU 本身 === */
+function parseSKU(s){
+  if (!s) return null;
+  if (s.startsWith("SF1:")){
+    const parts = s.split(":");
+    if (parts.length >= 4) return parts[2]; // 取 SKU
+  }
+  const m = s.match(/^[A-Z0-9]+-\d{4}-\d{4}$/i);
+  return m ? m[0].toUpperCase() : null;
+}
+
+/* === 列表与统计 === */
+const tbody = document.querySelector("#list tbody");
+
+function addItemBySKU(sku){
+  const key = sku.toUpperCase();
+  if (state.items.some(x=>x.sku===key)) { beepErr(); return alert("重复扫描：该商品已在列表\n" + key); }
+  const p = PRODUCTS[key];
+  if (!p) { beepErr(); return alert("该二维码对应的商品不在库或未建立：\n" + key); }
+
+  // ⛔ 非“在库”禁止借出（前端拦截）
+  const st = (p.status || "在库").trim();
+  if (st !== "在库") {
+    beepErr();
+    const who = p.borrower ? `（${p.borrower}）` : "";
+    return alert(`该商品当前状态为【${st}】，不可借出。\n${who}`);
+  }
+
+  state.items.push({
+    id:p.id, sku:p.sku, name:p.name,
+    price: Number(p.price)||0,
+    category: p.category || "",
+    spec: p.spec || "",
+    photo: p.photo || ""
+  });
+  renderList(); updateStats(); beepOk();
+}
+
+function removeAt(idx){ state.items.splice(idx,1); renderList(); updateStats(); }
+
+function renderList(){
+  tbody.innerHTML = "";
+  state.items.forEach((it, i)=>{
+    const wt = it.spec ? (it.spec + (/\bg$/.test(it.spec)? "" : " g")) : "";
+    const img = it.photo ? `<img class="thumb" src="${it.photo}" alt="" onerror="this.style.display='none'">` : "";
+    const tr = document.createElement("tr");
+    tr.innerHTML = `
+      <td>${it.sku}</td>
+      <td>${it.name||""}</td>
+      <td>${it.category||""}</td>
+      <td>${wt}</td>
+      <td>${img}</td>
+      <td>¥${(Number(it.price)||0).toLocaleString()}</td>
+      <td class="actions"><button class="btn" data-i="${i}">删除</button></td>
+    `;
+    tbody.appendChild(tr);
+  });
+  tbody.querySelectorAll("button[data-i]").forEach(btn=>{
+    btn.addEventListener("click", e=> removeAt(Number(btn.dataset.i)));
+  });
+}
+
+function totalAmount(){ return state.items.reduce((a,b)=> a + (Number(b.price)||0), 0) * (state.discount || 1); }
+function updateStats(){
+  $("#statCount").textContent = state.items.length;
+  $("#statAmount").textContent = fmt(totalAmount());
+}
+
+/* === 扫码与手动输入 === */
+let lastScanAt = 0, lastVal = "";
+async function handleScan(raw){
+  if (!state.started) return;
+  const now = Date.now();
+  if (raw === lastVal && now - lastScanAt < 1200) return; // 防抖
+  lastVal = raw; lastScanAt = now;
+  const sku = parseSKU(raw) || raw.trim().toUpperCase();
+  if (!sku) { beepErr(); return; }
+
+  // SF1 载荷交服务端校验 HMAC；本地目录里没有的 SKU 也向服务端查一次（新建商品无需刷新页面）
+  if (raw.startsWith("SF1:") || !PRODUCTS[sku]) {
+    const r = await resolveRemote(raw);
+    if (r && !r.ok && r.error !== "商品不存在") { beepErr(); return alert("无效的二维码：" + r.error + "\n" + raw); }
+    if (r && r.ok) PRODUCTS[r.sku] = Object.assign(PRODUCTS[r.sku] || {}, r.product);
+  }
+  addItemBySKU(sku);
+}
+
+/* 服务端解析（离线校验 + 内存索引）；网络异常时返回 null，按本地目录处理 */
+async function resolveRemote(raw){
+  try {
+    const res = await fetch("/api/qr/resolve", {
+      method: "POST",
+      headers: {"Content-Type":"application/json"},
+      body: JSON.stringify({codes: [raw]})
+    });
+    if (!res.ok) return null;
+    const data = await res.json();
+    return (data.results || [])[0] || null;
+  } catch(e) { return null; }
+}
+
+/* 手动输入栏 */
+const txtManual = $("#txtManual"), btnAddManual = $("#btnAddManual");
+btnAddManual.addEventListener("click", () => {
+  const raw = (txtManual.value||"").trim();
+  if (!raw) return;
+  handleScan(raw);
+  txtManual.value = "";
+  txtManual.focus();
+});
+txtManual.addEventListener("keydown", (e)=>{ if(e.key==="Enter"){ e.preventDefault(); btnAddManual.click(); } });
+
+/* === 复位（取消/完成后会调用） === */
+function resetUI(){
+  stopCam();
+  state.started = false;
+  state.meta = {company:"", receiver:"", handler:""};
+  state.discount = getSavedDiscount();  // ← 用记忆值复位
+  state.items = [];
+  lastScanAt = 0; lastVal = "";
+  $("#borrowInfo").style.display = "none";
+  btnStart.style.display = "";
+  btnFinish.style.display = "none";
+  btnCancel.style.display = "none";
+  btnRestart.style.display = "none";
+  renderList(); updateStats();
+  txtManual.value = "";
+}
+
+/* === 服务端推送：其他工作站借出/归还/改价后同步本地目录；断线由 EventSource 带 Last-Event-ID 自动续传 === */
+(function subscribeProductEvents(){
+  if (!window.EventSource) return;
+  const es = new EventSource("/api/events");
+  es.addEventListener("product", e => {
+    const d = JSON.parse(e.data);
+    const p = PRODUCTS[d.sku];
+    if (p) { p.status = d.status; p.borrower = d.borrower; p.price = d.price; }
+    // 已扫进本单的商品：被别处借走则移出并提示；改价则同步金额
+    const idx = state.items.findIndex(x => x.sku === d.sku);
+    if (idx < 0 || state.submitting) return;
+    if ((d.status || "在库") !== "在库") {
+      state.items.splice(idx, 1);
+      renderList(); updateStats(); beepErr();
+      alert(`${d.sku} 已在其他工作站变为【${d.status}】，已从本单移除。`);
+    } else if ((Number(state.items[idx].price)||0) !== (Number(d.price)||0)) {
+      state.items[idx].price = Number(d.price) || 0;
+      renderList(); updateStats();
+    }
+  });
+  es.addEventListener("product_removed", e => {
+    const d = JSON.parse(e.data);
+    if (d.sku) delete PRODUCTS[d.sku];
+  });
+  // 断线太久（缓冲已覆盖不到）或服务重启过：本单为空时直接重载目录，否则等本单完成后再刷新
+  es.addEventListener("reset", () => {
+    if (!state.items.length) location.reload();
+  });
+})();
+
+/* 初始统计 */
+renderList(); updateStats();
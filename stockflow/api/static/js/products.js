@@ -0,0 +1,38 @@
+// products.js —— 商品页表单输入规整、弹窗开关、滚动位置记忆
+function toHalfWidthNum(str){
+  if(!str) return "";
+  const fw = "０１２３４５６７８９，．、";
+  const hw = "0123456789,..";
+  const map = {}; for(let i=0;i<fw.length;i++){ map[fw[i]] = hw[i] || ""; }
+  return str.split("").map(ch => (map[ch] ?? ch)).join("");
+}
+function keepDigits(e){
+  const v = toHalfWidthNum(e.value);
+  e.value = v.replace(/[^\d]/g,'');
+}
+function keepNumberWithDot(e){
+  let v = toHalfWidthNum(e.value);
+  v = v.replace(/[gG]/g,'');
+  v = v.replace(/[^0-9.]/g,'');
+  const first = v.indexOf('.');
+  if (first !== -1) v = v.slice(0, first + 1) + v.slice(first + 1).replace(/\./g, '');
+  e.value = v;
+}
+function openDlg(id){ document.getElementById(id).showModal(); }
+function closeDlg(id){ document.getElementById(id).close(); }
+
+// 恢复滚动位置 + 新增表单默认日期
+document.addEventListener('DOMContentLoaded', function(){
+  const y = sessionStorage.getItem('products_scroll_y');
+  if (y) { window.scrollTo(0, parseInt(y)); }
+  const d = document.getElementById('login_date');
+  if (d && !d.value) {
+    const now = new Date();
+    const mm = String(now.getMonth()+1).padStart(2,'0');
+    const dd = String(now.getDate()).padStart(2,'0');
+    d.value = `${now.getFullYear()}-${mm}-${dd}`;
+  }
+});
+window.addEventListener('beforeunload', function(){
+  sessionStorage.setItem('products_scroll_y', String(window.scrollY));
+});
@@ -0,0 +1,56 @@
+// qr_worker.js —— 借出扫码页的后台解码线程（主线程只取帧，解码不占 UI 线程）
+// 引擎：本线程里有原生 BarcodeDetector 且支持 qr_code 就用它，否则 importScripts 加载 jsQR。
+// 帧格式：{bitmap}（ImageBitmap，可转移）或 {buffer, width, height}（RGBA 像素，ArrayBuffer 转移）。
+let detector = null, canvas = null, ctx = null;
+
+async function init(jsqrUrl){
+  if ('BarcodeDetector' in self) {
+    try {
+      const fmts = await BarcodeDetector.getSupportedFormats();
+      if (fmts && fmts.includes('qr_code')) {
+        detector = new BarcodeDetector({formats: ['qr_code']});
+        return 'barcode';
+      }
+    } catch (e) { /* 回退 jsQR */ }
+  }
+  importScripts(jsqrUrl);
+  return 'jsqr';
+}
+
+function pixels(m){
+  if (!m.bitmap) return {data: new Uint8ClampedArray(m.buffer), width: m.width, height: m.height};
+  const w = m.bitmap.width, h = m.bitmap.height;
+  if (!canvas || canvas.width !== w || canvas.height !== h) {
+    canvas = new OffscreenCanvas(w, h);
+    ctx = canvas.getContext('2d', {willReadFrequently: true});
+  }
+  ctx.drawImage(m.bitmap, 0, 0);
+  return ctx.getImageData(0, 0, w, h);
+}
+
+async function decode(m){
+  if (detector) {
+    const src = m.bitmap || new ImageData(new Uint8ClampedArray(m.buffer), m.width, m.height);
+    const codes = await detector.detect(src);
+    return codes && codes.length ? (codes[0].rawValue || null) : null;
+  }
+  const img = pixels(m);
+  const res = self.jsQR(img.data, img.width, img.height, {inversionAttempts: 'dontInvert'});
+  return res ? (res.data || null) : null;
+}
+
+self.onmessage = async (e) => {
+  const m = e.data;
+  if (m.type === 'init') {
+    try { self.postMessage({type: 'ready', engine: await init(m.jsqr)}); }
+    catch (err) { self.postMessage({type: 'error', error: String(err)}); }
+    return;
+  }
+  if (m.type !== 'frame') return;
+  const t0 = performance.now();
+  let text = null;
+  try { text = await decode(m); }
+  catch (err) { /* 单帧失败忽略 */ }
+  finally { if (m.bitmap && m.bitmap.close) m.bitmap.close(); }
+  self.postMessage({type: 'result', id: m.id, text, ms: performance.now() - t0});
+};
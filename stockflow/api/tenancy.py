@@ -0,0 +1,160 @@
+# api/tenancy.py
+# 多租户路由：一家店一个 SQLite 库。请求按 Host（可选请求头）映射到租户代码，
+# 租户的库连接、写线程、扫码索引、各类缓存打包成一份“租户状态”，放进 contextvar，
+# api.deps 的 get_*() 都从当前租户取——路由代码不用改，缓存天然按租户隔离。
+# 打开的租户状态按 LRU 限量，超出时关闭最久未用且没有在途请求的那个。
+from __future__ import annotations
+import re
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from pathlib import Path
+
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+_CODE_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_current: ContextVar = ContextVar("sf_tenant", default=None)
+
+
+class UnknownTenant(LookupError):
+    pass
+
+
+def tenant_db_path(conf: dict, code: str) -> str:
+    """租户代码 → 库文件路径；代码只允许字母数字/下划线/连字符，防止拼出目录穿越。"""
+    if not _CODE_RE.match(code or ""):
+        raise UnknownTenant(f"租户代码不合法：{code!r}")
+    return str(Path(conf["dir"]) / code / "stockflow.db")
+
+
+def current():
+    return _current.get()
+
+
+def bind(state):
+    return _current.set(state)
+
+
+def unbind(token):
+    _current.reset(token)
+
+
+class TenantRouter:
+    """
+    factory(code, db_path) 构建租户状态（建库/迁移/起写线程），状态对象需提供 close() 与 active 计数。
+    default 为 database_path 的默认库：未启用多租户、或 Host 未匹配且 fallback_default 时使用。
+    """
+
+    def __init__(self, conf: dict, factory, default):
+        self.conf = conf
+        self.enabled = bool(conf.get("enabled"))
+        self.hosts = {str(h).lower(): str(c) for h, c in (conf.get("hosts") or {}).items()}
+        self.header = (conf.get("header") or "").lower()
+        self.max_open = max(1, int(conf.get("max_open") or 16))
+        self.fallback_default = bool(conf.get("fallback_default", True))
+        self.factory = factory
+        self.default = default
+        self._lock = threading.Lock()
+        self._building: dict[str, threading.Lock] = {}
+        self._open: OrderedDict = OrderedDict()
+        self.opened = 0
+        self.evicted = 0
+
+    # —— 解析 ——
+    def resolve(self, headers) -> str | None:
+        """返回租户代码；None 表示默认库。"""
+        if self.header:
+            code = (headers.get(self.header) or "").strip()
+            if code:
+                if not self._known(code):
+                    raise UnknownTenant(f"未知租户：{code}")
+                return code
+        host = (headers.get("host") or "").split(":")[0].strip().lower()
+        code = self.hosts.get(host)
+        if code:
+            return code
+        if self.fallback_default:
+            return None
+        raise UnknownTenant(f"未知租户：{host}")
+
+    def _known(self, code: str) -> bool:
+        # 配置里登记过的，或库文件已存在的（由 CLI --tenant 预先建好）
+        return code in self.hosts.values() or Path(tenant_db_path(self.conf, code)).exists()
+
+    # —— 打开 / 归还 ——
+    def acquire(self, code: str | None):
+        """取租户状态并登记一个在途请求（务必配对 release）；首次打开会建库迁移，应在线程池里调用。"""
+        if code is None:
+            state = self.default
+            with self._lock:
+                state.active += 1
+            return state
+        with self._lock:
+            state = self._open.get(code)
+            if state is not None:
+                self._open.move_to_end(code)
+                state.active += 1
+                return state
+            build_lock = self._building.setdefault(code, threading.Lock())
+        # 同一租户并发首访只建一次；不同租户互不阻塞
+        with build_lock:
+            with self._lock:
+                state = self._open.get(code)
+            if state is None:
+                state = self.factory(code, tenant_db_path(self.conf, code))
+                logger.info(f"tenant opened: {code}")
+            with self._lock:
+                if code not in self._open:
+                    self._open[code] = state
+                    self.opened += 1
+                self._building.pop(code, None)
+                self._open.move_to_end(code)
+                state.active += 1
+                victims = self._pick_victims()
+        for v in victims:
+            self._close(v)
+        return state
+
+    def release(self, state):
+        with self._lock:
+            state.active -= 1
+
+    def _pick_victims(self) -> list:
+        victims = []
+        over = len(self._open) - self.max_open
+        for code in list(self._open):
+            if over <= 0:
+                break
+            if self._open[code].active == 0:
+                victims.append(self._open.pop(code))
+                self.evicted += 1
+                over -= 1
+        return victims
+
+    @staticmethod
+    def _close(state):
+        try:
+            state.close()
+            logger.info(f"tenant closed: {state.code or '(default)'}")
+        except Exception as e:
+            logger.warning(f"tenant close failed ({state.code or '(default)'}): {e}")
+
+    def close_all(self):
+        with self._lock:
+            states, self._open = list(self._open.values()), OrderedDict()
+        for s in states:
+            self._close(s)
+        self._close(self.default)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_open": self.max_open,
+                "open": {code: s.active for code, s in self._open.items()},
+                "opened": self.opened,
+                "evicted": self.evicted,
+            }
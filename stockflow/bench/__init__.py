@@ -0,0 +1,8 @@
+# bench：可复现的性能基准
+#   python -m bench.run --scale 10k                      # 生成(或复用)数据集并跑全部场景，结果写 JSON
+#   python -m bench.run --scale 100k --compare old.json  # 与上次结果对比 p95，回退超阈值时退出码为 1
+#   python -m bench.datagen --scale 1m                   # 只生成数据集
+# 均需在 stockflow/ 目录下运行（与 main.py 相同的相对路径约定）。
+# 登录凭据：--user/--password，或环境变量 STOCKFLOW_BENCH_USER / STOCKFLOW_BENCH_PASSWORD（不写死在代码里）。
+# 结果 JSON 默认写到 bench/results/（已在 .gitignore 中，不入库；要留存的基线用 --out 指到别处）。
+# 基准只操作 bench/_data 下的独立库，通过 STOCKFLOW_DATABASE_PATH 指过去，不会碰 data/stockflow.db。
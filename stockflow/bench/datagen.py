@@ -0,0 +1,247 @@
+# bench/datagen.py
+# 确定性合成数据：同样的 (规模, seed) 每次生成完全相同的商品/照片占位/库存/借出单/事件日志
+from __future__ import annotations
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+BENCH_DIR = Path("bench/_data")
+COMPANY = {"company_name": "基准测试株式会社", "company_abbrev": "BENCH", "company_code": "BENCH0001"}
+
+_CATEGORIES = ["戒指", "耳饰", "项链", "手链", "吊坠", "胸针"]
+_MATERIALS = ["钻石", "红宝石", "蓝宝石", "祖母绿", "珍珠", "翡翠", "铂金", "18K金"]
+_BASE_DATE = datetime(2024, 1, 1, 9, 0, 0)
+_SEQ_PER_SCOPE = 9999            # SKU 流水号保持 4 位：每满 9999 个换下一个 YYMM
+_PHOTO_FILES = 1000              # 照片占位文件数（带照片的商品循环引用）
+_JPEG_STUB = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xd9"
+
+
+def parse_scale(s: str) -> int:
+    s = str(s).strip().lower()
+    if s in SCALES:
+        return SCALES[s]
+    return int(s.replace("_", ""))
+
+
+def dataset_paths(n_products: int, seed: int) -> dict:
+    base = BENCH_DIR / f"n{n_products}_s{seed}"
+    return {"dir": base, "db": base / "stockflow.db", "run_db": base / "run.db",
+            "logs": base / "logs", "photos": base / "photos"}
+
+
+def use_dataset(n_products: int, seed: int, run_copy: bool = False) -> dict:
+    """
+    把应用配置指向基准库（环境变量覆盖 config.yaml）。
+    必须在导入任何 api.* 模块之前调用：api.deps 在导入时按配置打开数据库。
+    run_copy=True 时先把原始数据集复制为 run.db 再指过去——场景会写库，每次运行都从同一份数据开始。
+    """
+    paths = dataset_paths(n_products, seed)
+    paths["dir"].mkdir(parents=True, exist_ok=True)
+    target = paths["db"]
+    if run_copy:
+        target = paths["run_db"]
+        for suffix in ("", "-wal", "-shm"):
+            p = Path(str(target) + suffix)
+            if p.exists():
+                p.unlink()
+        src = sqlite3.connect(str(paths["db"]))
+        dst = sqlite3.connect(str(target))
+        src.backup(dst)
+        dst.close()
+        src.close()
+    os.environ["STOCKFLOW_DATABASE_PATH"] = str(target)
+    os.environ["STOCKFLOW_EVENT_LOG_DIR"] = str(paths["logs"])
+    return paths
+
+
+def _scope(i: int) -> tuple[str, int]:
+    """第 i 个商品（从 0 开始）→ (YYMM, 流水号)"""
+    k, seq = divmod(i, _SEQ_PER_SCOPE)
+    y, m = divmod(_BASE_DATE.month - 1 + k, 12)
+    return f"{(_BASE_DATE.year + y) % 100:02d}{m + 1:02d}", seq + 1
+
+
+def load_meta(n_products: int, seed: int) -> dict | None:
+    """已生成且完整的数据集返回其摘要，否则 None。"""
+    db_path = dataset_paths(n_products, seed)["db"]
+    if not db_path.exists():
+        return None
+    try:
+        conn = sqlite3.connect(str(db_path))
+        rows = dict(conn.execute("SELECT key, value FROM bench_meta").fetchall())
+        conn.close()
+    except sqlite3.Error:
+        return None
+    if rows.get("n_products") == str(n_products) and rows.get("seed") == str(seed) and rows.get("complete") == "1":
+        return {k: rows[k] for k in rows}
+    return None
+
+
+def generate(n_products: int, seed: int = 42, force: bool = False, loan_ratio: float = 0.05) -> dict:
+    """
+    生成数据集并返回摘要；已有同规模同 seed 的完整数据集时直接复用（force=True 重建）。
+    商品 → 照片占位 → 仓库/库存 → 借出单（约 60% 借出中、40% 已归还）→ 事件日志 CSV。
+    """
+    paths = use_dataset(n_products, seed)
+    db_path = paths["db"]
+    if not force:
+        hit = load_meta(n_products, seed)
+        if hit:
+            hit["cached"] = True
+            return hit
+    if "api.deps" in sys.modules:
+        raise RuntimeError("数据集需要重建时，generate() 必须在导入 api.* 之前调用")
+    for suffix in ("", "-wal", "-shm"):
+        p = Path(str(db_path) + suffix)
+        if p.exists():
+            p.unlink()
+
+    t0 = time.perf_counter()
+    # 导入即按 STOCKFLOW_DATABASE_PATH 建库并跑完全部迁移（含默认 admin 账号）
+    from api.deps import get_cfg
+    from core.services.qr_index import build_qr_payload
+    cfg = get_cfg()
+    secret = cfg.security["secret_key"]
+    comp = COMPANY["company_code"]
+    rng = random.Random(seed)
+
+    # 照片占位
+    paths["photos"].mkdir(parents=True, exist_ok=True)
+    photo_files = []
+    for k in range(min(_PHOTO_FILES, max(1, n_products // 10))):
+        f = paths["photos"] / f"stub_{k:04d}.jpg"
+        if not f.exists():
+            f.write_bytes(_JPEG_STUB)
+        photo_files.append(str(f))
+
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("PRAGMA foreign_keys = OFF;")
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    cur.execute("CREATE TABLE IF NOT EXISTS bench_meta (key TEXT PRIMARY KEY, value TEXT)")
+    cur.executemany("INSERT OR REPLACE INTO settings(key, value) VALUES (?, ?)", COMPANY.items())
+
+    # 仓库
+    warehouses = [("WH1", "总仓"), ("WH2", "门店"), ("WH3", "展会")]
+    cur.executemany("INSERT INTO warehouses(code, name) VALUES (?, ?)", warehouses)
+
+    # 商品
+    scopes: dict[str, int] = {}
+    skus: list[str] = []
+    prices: list[int] = []
+
+    def _products():
+        for i in range(n_products):
+            yymm, seq = _scope(i)
+            scopes[yymm] = seq
+            sku = f"{comp}-{yymm}-{seq:04d}"
+            cat = _CATEGORIES[rng.randrange(len(_CATEGORIES))]
+            mat = _MATERIALS[rng.randrange(len(_MATERIALS))]
+            price = rng.randrange(10_000, 2_000_000, 100)
+            login = (_BASE_DATE + timedelta(days=i * 1000 // max(1, n_products))).strftime("%Y-%m-%d")
+            photo = photo_files[i % len(photo_files)] if rng.random() < 0.1 else None
+            printed = 1 if rng.random() < 0.7 else 0
+            skus.append(sku)
+            prices.append(price)
+            yield (i + 1, sku, f"{mat}{cat} {rng.randint(1, 500) / 100:.2f}ct", f"{rng.randint(10, 300) / 10:.1f}",
+                   int(price * 0.7), price, cat, f"{mat} {cat}", login, photo, printed,
+                   (login + " 10:00:00") if printed else None, "在库", build_qr_payload(comp, sku, secret))
+
+    cur.executemany("""
+        INSERT INTO products(id, sku, name, spec, cost_price, sale_price, category, detail, login_date,
+                             photo_path, label_printed_count, label_printed_at, status, qr_payload)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, _products())
+    cur.executemany("INSERT OR REPLACE INTO sequences(scope, next) VALUES (?, ?)",
+                    [(k, v + 1) for k, v in scopes.items()])
+
+    # 库存：每件商品在一个仓库
+    cur.executemany("INSERT INTO stocks(product_id, warehouse_id, qty_on_hand) VALUES (?, ?, 1)",
+                    ((i + 1, i % len(warehouses) + 1) for i in range(n_products)))
+
+    # 借出单：从打乱后的商品序列里依次取 1~5 件，不重复
+    order = list(range(n_products))
+    rng.shuffle(order)
+    budget = int(n_products * loan_ratio)
+    pos = 0
+    n_loans = 0
+    events: dict[str, list[dict]] = {}
+    while pos < budget:
+        k = min(rng.randint(1, 5), budget - pos)
+        picked = order[pos:pos + k]
+        pos += k
+        n_loans += 1
+        created = _BASE_DATE + timedelta(minutes=n_loans * 37)
+        created_s = created.strftime("%Y-%m-%d %H:%M:%S")
+        discount = rng.choice([0.7, 0.8, 0.85, 0.9, 1.0])
+        company = f"客户{rng.randint(1, 200):03d}"
+        total = int(round(sum(prices[i] for i in picked) * discount))
+        open_ = rng.random() < 0.6
+        loan_no = f"L{created.strftime('%y%m%d')}{n_loans:06d}"
+        cur.execute("""
+            INSERT INTO loan_orders(id, loan_no, company, receiver, handler, discount, total_qty, total_amount,
+                                    status, created_at, returned_qty, returned_amt, closed_at)
+            VALUES (?, ?, ?, '', 'bench', ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (n_loans, loan_no, company, discount, k, total,
+              "借出中" if open_ else "已归还", created_s,
+              0 if open_ else k, 0 if open_ else total, None if open_ else created_s))
+        cur.executemany("""
+            INSERT INTO loan_items(order_id, product_id, sku, price, returned, returned_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(n_loans, i + 1, skus[i], prices[i], 0 if open_ else 1, None if open_ else created_s)
+              for i in picked])
+        if open_:
+            cur.executemany("UPDATE products SET status='借出', borrower=? WHERE id=?",
+                            [(f"借入公司：{company}，折扣：{discount:.2f}", i + 1) for i in picked])
+        events.setdefault(created.strftime("%Y%m%d"), []).append({
+            "type": "loan_create", "loan_id": n_loans, "loan_no": loan_no, "company": company,
+            "receiver": "", "handler": "bench", "discount": discount, "total_qty": k,
+            "total_amount": total, "items": [skus[i] for i in picked], "user": "bench",
+            "created_at": created_s,
+        })
+
+    meta = {"n_products": n_products, "seed": seed, "n_loans": n_loans, "n_loan_items": pos,
+            "n_photo_files": len(photo_files), "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    cur.executemany("INSERT OR REPLACE INTO bench_meta(key, value) VALUES (?, ?)",
+                    [(k, str(v)) for k, v in meta.items()])
+    cur.execute("COMMIT")
+    cur.execute("ANALYZE")
+    conn.execute("INSERT OR REPLACE INTO bench_meta(key, value) VALUES ('complete', '1')")
+    conn.commit()
+    conn.close()
+
+    # 事件日志：与 export.event_logger.append_event 同格式（按天一个 CSV）
+    paths["logs"].mkdir(parents=True, exist_ok=True)
+    for day, rows in events.items():
+        with (paths["logs"] / f"flow_{day}.csv").open("w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            w.writeheader()
+            w.writerows(rows)
+
+    meta["elapsed_s"] = round(time.perf_counter() - t0, 2)
+    meta["cached"] = False
+    return meta
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="bench.datagen", description="生成确定性基准数据集")
+    ap.add_argument("--scale", default="10k", help="1k/10k/100k/1m 或具体数量")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--force", action="store_true", help="已存在也重建")
+    args = ap.parse_args()
+    n = parse_scale(args.scale)
+    info = generate(n, args.seed, force=args.force)
+    print(f"✅ 数据集 {dataset_paths(n, args.seed)['db']}：{info}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+# bench/loadsim.py
+# 扫码工位负载模拟：asyncio + httpx 压一台正在运行的 uvicorn，按真实工作流混合回放
+#
+#   # 1) 起服务（指向基准库，避免污染正式数据）
+#   STOCKFLOW_DATABASE_PATH=bench/_data/n10000_s42/run.db uvicorn api.server:app --port 8000
+#   # 2) 压测：4 个扫码工位 + 1 个后台 + 1 台打印，爬坡 10 秒、稳态 60 秒
+#   python -m bench.loadsim --db bench/_data/n10000_s42/run.db --stations 4 --duration 60
+#   # 3) 找饱和点：依次 1/2/4/8/16 个工位，每档稳态 30 秒
+#   python -m bench.loadsim --db bench/_data/n10000_s42/run.db --sweep 1,2,4,8,16 --duration 30
+#
+# 压测会真实借出/归还/改价/标记已打印。--db 不在 bench/_data 下时拒绝运行，除非显式加 --allow-non-scratch。
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from bench.datagen import BENCH_DIR
+from bench.stats import summarize
+
+try:
+    import httpx
+except ImportError:   # 仅压测工具需要
+    httpx = None
+
+
+class Recorder:
+    """
+    按操作记录延迟与错误。只统计爬坡结束后开始的请求（稳态）。
+    错误分类：conflict = 409（并发下同一件商品被抢先借出，属业务冲突）；
+             server = 5xx；lock = 响应里带 "database is locked"；timeout / transport = 客户端侧。
+    """
+
+    def __init__(self, steady_at: float):
+        self.steady_at = steady_at
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, Counter] = defaultdict(Counter)
+
+    async def call(self, op: str, send, ok=(200, 302, 303)):
+        t0 = time.perf_counter()
+        kind = None
+        resp = None
+        try:
+            resp = await send()
+            if resp.status_code not in ok:
+                if resp.status_code == 409:
+                    kind = "conflict"
+                elif "database is locked" in resp.text:
+                    kind = "lock"
+                elif resp.status_code >= 500:
+                    kind = "server"
+                else:
+                    kind = f"http_{resp.status_code}"
+        except httpx.TimeoutException:
+            kind = "timeout"
+        except httpx.TransportError:
+            kind = "transport"
+        if t0 >= self.steady_at:
+            self.samples[op].append(time.perf_counter() - t0)
+            if kind:
+                self.errors[op][kind] += 1
+        return resp if kind is None else None
+
+
+# 商品编辑表单的完整字段（/products/{pid}/update 对没提交的 detail 等字段会写成空值）
+_FORM_COLUMNS = "category, detail, spec, cost_price, sale_price, login_date, tax_included, remark"
+
+
+def product_form(row, price: int, remark: str) -> dict:
+    """按库里的当前行拼出完整的编辑表单，只改售价与备注。row 依次为 _FORM_COLUMNS 的各列。"""
+    category, detail, spec, cost, _, login_date, tax_included, _ = row
+    return {
+        "category": category or "",
+        "detail": detail or "",
+        "weight": "" if spec is None else str(spec),
+        "cost": str(int(cost or 0)),
+        "price": str(price),
+        "login_date": login_date or "",
+        "tax_included": "0" if tax_included == 0 else "1",
+        "remark": remark,
+    }
+
+
+class Pool:
+    """工位共享的可借出商品池（单线程事件循环内无需加锁）。"""
+
+    def __init__(self, rows: list[tuple], rng: random.Random, db_path: str | None = None):
+        self.rows = list(rows)
+        rng.shuffle(self.rows)
+        self.ids = [r[0] for r in self.rows]
+        self.db_path = db_path
+        self._conn = None
+
+    def form_row(self, pid: int):
+        """编辑前先读商品当前的表单字段（只读连接，查主键一行，不拖慢事件循环）。"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(Path(self.db_path).resolve().as_uri() + "?mode=ro", uri=True)
+        return self._conn.execute(f"SELECT {_FORM_COLUMNS} FROM products WHERE id = ?", (pid,)).fetchone()
+
+    def take(self, k: int) -> list[tuple]:
+        out = []
+        while self.rows and len(out) < k:
+            out.append(self.rows.pop())
+        return out
+
+    def put_back(self, rows: list[tuple]):
+        self.rows[:0] = rows
+
+
+def _load_pool(db_path: str, rng: random.Random) -> Pool:
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    rows = conn.execute("""
+        SELECT id, sku, qr_payload, sale_price FROM products
+         WHERE status='在库' AND qr_payload IS NOT NULL
+    """).fetchall()
+    conn.close()
+    if not rows:
+        raise SystemExit(f"{db_path} 中没有可借出的商品")
+    return Pool(rows, rng, db_path)
+
+
+def is_scratch_db(db_path: str) -> bool:
+    """bench/_data 下的基准库（datagen 生成、可随时重建）才算可以随便写的库。"""
+    try:
+        Path(db_path).resolve().relative_to(BENCH_DIR.resolve())
+        return True
+    except ValueError:
+        return False
+
+
+def _think(rng: random.Random, mean_s: float) -> float:
+    if mean_s <= 0:
+        return 0.0
+    return min(rng.expovariate(1.0 / mean_s), mean_s * 5)
+
+
+async def _login(client, user: str, password: str):
+    r = await client.post("/login", data={"username": user, "password": password})
+    if r.status_code not in (302, 303):
+        raise SystemExit(f"登录失败：HTTP {r.status_code}")
+
+
+# —— 角色 ——
+async def scan_station(idx, args, client, rec, pool, deadline, rng):
+    """扫码工位：打开出库页 → 逐件扫码解析 → 提交借出单；约一半的单稍后扫码归还。"""
+    await rec.call("outbound_page", lambda: client.get("/outbound"))
+    held: list[list[tuple]] = []
+    while time.perf_counter() < deadline:
+        items = pool.take(rng.randint(1, args.max_items))
+        if not items:
+            await asyncio.sleep(0.5)
+            continue
+        for it in items:
+            await rec.call("qr_resolve", lambda: client.post("/api/qr/resolve", json={"codes": [it[2]]}))
+            await asyncio.sleep(_think(rng, args.scan_interval))
+        r = await rec.call("loan_create", lambda: client.post("/api/loans/create", json={
+            "company": f"loadsim-{idx}", "discount": 0.9, "items": [{"sku": it[1]} for it in items]}))
+        if r is None:
+            pool.put_back(items)
+        elif rng.random() < 0.5:
+            held.append(items)
+        await asyncio.sleep(_think(rng, args.think))
+        if held and rng.random() < 0.5:
+            back = held.pop(0)
+            r = await rec.call("loan_return", lambda: client.post(
+                "/api/loans/return", json={"codes": [it[2] for it in back]}))
+            if r is not None:
+                pool.put_back(back)
+
+
+async def back_office(idx, args, client, rec, pool, deadline, rng):
+    """后台：浏览商品/标签页、编辑商品、查看借出单。"""
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        if roll < 0.3:
+            await rec.call("products_page", lambda: client.get("/products"))
+        elif roll < 0.6:
+            await rec.call("labels_page", lambda: client.get(f"/labels?page_size=100&page={rng.randint(1, 20)}"))
+        elif roll < 0.85:
+            pid = rng.choice(pool.ids)
+            row = pool.form_row(pid)
+            if row is not None:
+                form = product_form(row, rng.randrange(10_000, 2_000_000, 100), f"loadsim {idx}")
+                await rec.call("product_update", lambda: client.post(f"/products/{pid}/update", data=form))
+        else:
+            await rec.call("loan_detail", lambda: client.get(f"/loans/{rng.randint(1, 50)}"), ok=(200, 404))
+        await asyncio.sleep(_think(rng, args.think))
+
+
+async def label_printer(idx, args, client, rec, pool, deadline, rng):
+    """打印：列出未打印标签 → 打开打印版式 → 标记已打印。"""
+    while time.perf_counter() < deadline:
+        await rec.call("labels_unprinted", lambda: client.get("/labels?only_unprinted=1&page_size=100"))
+        ids = ",".join(str(rng.choice(pool.ids)) for _ in range(rng.randint(4, 24)))
+        await rec.call("labels_print", lambda: client.get(f"/labels/print?ids={ids}"))
+        await rec.call("labels_mark_printed", lambda: client.post("/labels/mark-printed", data={"ids": ids}))
+        await asyncio.sleep(_think(rng, args.think * 3))
+
+
+# —— 一档负载 ——
+async def _stats(client) -> dict:
+    out = {}
+    for name in ("writer", "readers"):
+        try:
+            r = await client.get(f"/api/stats/{name}")
+            out[name] = r.json() if r.status_code == 200 else None
+        except httpx.HTTPError:
+            out[name] = None
+    return out
+
+
+async def run_stage(args, stations: int, pool: Pool) -> dict:
+    rng = random.Random(args.seed + stations)
+    start = time.perf_counter()
+    steady_at = start + args.ramp_up
+    deadline = steady_at + args.duration
+    rec = Recorder(steady_at)
+
+    roles = ([scan_station] * stations + [back_office] * args.backoffice + [label_printer] * args.printers)
+    limits = httpx.Limits(max_connections=len(roles) + 1)
+    timeout = httpx.Timeout(args.timeout)
+    clients = [httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) for _ in roles]
+    try:
+        for c in clients:
+            await _login(c, args.user, args.password)
+        before = await _stats(clients[0])
+
+        async def _start(i, role, client):
+            # 爬坡：按角色序号均匀错开启动
+            await asyncio.sleep(args.ramp_up * i / max(1, len(roles)))
+            await role(i, args, client, rec, pool, deadline, random.Random(rng.random()))
+
+        await asyncio.gather(*[_start(i, role, c) for i, (role, c) in enumerate(zip(roles, clients))])
+        after = await _stats(clients[0])
+    finally:
+        for c in clients:
+            await c.aclose()
+
+    wall = max(1e-9, min(time.perf_counter(), deadline) - steady_at)
+    ops = {}
+    total_n, total_err = 0, Counter()
+    for op, samples in sorted(rec.samples.items()):
+        errs = rec.errors.get(op, Counter())
+        ops[op] = {**summarize(samples, wall, sum(errs.values())), "error_kinds": dict(errs)}
+        total_n += len(samples)
+        total_err.update(errs)
+
+    writer_delta = None
+    if before.get("writer") and after.get("writer"):
+        writer_delta = {k: after["writer"][k] - before["writer"][k]
+                        for k in ("batches", "jobs", "failed_jobs", "failed_commits")}
+        writer_delta["avg_batch_size"] = round(writer_delta["jobs"] / (writer_delta["batches"] or 1), 2)
+
+    n = total_n or 1
+    return {
+        "stations": stations,
+        "backoffice": args.backoffice,
+        "printers": args.printers,
+        "steady_s": round(wall, 2),
+        "requests": total_n,
+        "throughput_rps": round(total_n / wall, 2),
+        "error_rate": round(sum(total_err.values()) / n, 4),
+        "conflict_rate": round(total_err["conflict"] / n, 4),
+        "lock_failure_rate": round(total_err["lock"] / n, 4),
+        "server_error_rate": round(total_err["server"] / n, 4),
+        "client_error_rate": round((total_err["timeout"] + total_err["transport"]) / n, 4),
+        "ops": ops,
+        "writer_delta": writer_delta,
+        "readers_after": after.get("readers"),
+    }
+
+
+def find_saturation(stages: list[dict], slo_ms: float) -> dict | None:
+    """
+    饱和点：第一档出现以下任一情况 —— 吞吐较上一档增长不足 10%；
+    关键操作（loan_create / qr_resolve）p95 超过 SLO；错误率（不含业务冲突）超过 1%。
+    """
+    prev = None
+    for st in stages:
+        reasons = []
+        if prev and st["throughput_rps"] < prev["throughput_rps"] * 1.10:
+            reasons.append(f"吞吐仅 {prev['throughput_rps']} → {st['throughput_rps']} req/s")
+        for op in ("loan_create", "qr_resolve"):
+            p95 = st["ops"].get(op, {}).get("p95_ms", 0)
+            if p95 > slo_ms:
+                reasons.append(f"{op} p95={p95}ms > {slo_ms}ms")
+        if st["error_rate"] - st["conflict_rate"] > 0.01:
+            reasons.append(f"错误率 {st['error_rate']:.2%}")
+        if reasons:
+            return {"stations": st["stations"], "reasons": reasons,
+                    "last_healthy": prev["stations"] if prev else None}
+        prev = st
+    return None
+
+
+def _print_stage(st: dict):
+    print(f"\n== {st['stations']} 工位 + {st['backoffice']} 后台 + {st['printers']} 打印："
+          f"{st['throughput_rps']} req/s，错误 {st['error_rate']:.2%}（冲突 {st['conflict_rate']:.2%}，"
+          f"锁 {st['lock_failure_rate']:.2%}，5xx {st['server_error_rate']:.2%}）")
+    for op, r in st["ops"].items():
+        print(f"  - {op:<20} n={r['n']:<6} p50={r['p50_ms']:>9}ms p95={r['p95_ms']:>9}ms "
+              f"p99={r['p99_ms']:>9}ms errors={r['errors']}")
+    if st["writer_delta"]:
+        print(f"  writer: {st['writer_delta']}")
+
+
+async def main_async(args) -> dict:
+    db_path = args.db or os.environ.get("STOCKFLOW_DATABASE_PATH")
+    if not db_path:
+        from utils.config import load_config
+        db_path = load_config().database_path
+    if not is_scratch_db(db_path) and not args.allow_non_scratch:
+        raise SystemExit(f"{db_path} 不在 {BENCH_DIR} 下：压测会改写商品与借出数据，"
+                         f"确认是可丢弃的库请加 --allow-non-scratch")
+    pool = _load_pool(db_path, random.Random(args.seed))
+    counts = [int(x) for x in args.sweep.split(",")] if args.sweep else [args.stations]
+
+    stages = []
+    for n in counts:
+        st = await run_stage(args, n, pool)
+        _print_stage(st)
+        stages.append(st)
+
+    result = {
+        "meta": {
+            "base_url": args.base_url, "db": db_path, "seed": args.seed,
+            "ramp_up_s": args.ramp_up, "duration_s": args.duration,
+            "think_s": args.think, "scan_interval_s": args.scan_interval,
+            "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "stages": stages,
+        "saturation": find_saturation(stages, args.slo_ms) if len(stages) > 1 else None,
+    }
+    if result["saturation"]:
+        s = result["saturation"]
+        print(f"\n⚠ 饱和点：{s['stations']} 工位（{'；'.join(s['reasons'])}），最后健康档：{s['last_healthy']}")
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="bench.loadsim", description="扫码工位负载模拟（需先启动 uvicorn）")
+    ap.add_argument("--base-url", default="http://127.0.0.1:8000")
+    ap.add_argument("--db", help="服务端使用的库文件（只读取可借出商品池），默认取 STOCKFLOW_DATABASE_PATH/config.yaml")
+    ap.add_argument("--user", default=os.environ.get("STOCKFLOW_BENCH_USER", "admin"),
+                    help="登录用户（默认取环境变量 STOCKFLOW_BENCH_USER）")
+    ap.add_argument("--password", default=os.environ.get("STOCKFLOW_BENCH_PASSWORD", ""),
+                    help="登录密码（默认取环境变量 STOCKFLOW_BENCH_PASSWORD）")
+    ap.add_argument("--stations", type=int, default=4, help="扫码工位数")
+    ap.add_argument("--sweep", help="逐档工位数，如 1,2,4,8,16（用于找饱和点）")
+    ap.add_argument("--backoffice", type=int, default=1, help="后台编辑用户数")
+    ap.add_argument("--printers", type=int, default=1, help="标签打印工位数")
+    ap.add_argument("--ramp-up", type=float, default=10.0, help="爬坡秒数（不计入统计）")
+    ap.add_argument("--duration", type=float, default=60.0, help="每档稳态秒数")
+    ap.add_argument("--think", type=float, default=2.0, help="操作间平均思考时间（秒，指数分布）")
+    ap.add_argument("--scan-interval", type=float, default=0.4, help="连续扫码间隔（秒）")
+    ap.add_argument("--max-items", type=int, default=5, help="每张借出单最多件数")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--slo-ms", type=float, default=500.0, help="loan_create/qr_resolve 的 p95 目标")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="结果 JSON，默认 bench/results/loadsim_<时间>.json")
+    ap.add_argument("--allow-non-scratch", action="store_true",
+                    help="允许对 bench/_data 以外的库压测（会真实改写数据）")
+    args = ap.parse_args()
+    if not args.password:
+        ap.error("需要 --password 或环境变量 STOCKFLOW_BENCH_PASSWORD")
+    if httpx is None:
+        raise SystemExit("需要 httpx：pip install httpx")
+
+    result = asyncio.run(main_async(args))
+    out = Path(args.out) if args.out else Path("bench/results") / f"loadsim_{datetime.now():%Y%m%d_%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ 结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
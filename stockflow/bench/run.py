@@ -0,0 +1,142 @@
+# bench/run.py
+# 基准入口：准备数据集 → 逐场景测量 → 汇总 p50/p95/p99/吞吐写 JSON（可与旧结果对比）
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bench.datagen import load_meta, use_dataset, parse_scale, dataset_paths
+from bench.stats import summarize
+
+RESULTS_DIR = Path("bench/results")
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+def run(n_products: int, seed: int, iterations: int, names: list[str] | None, no_cap: bool,
+        user: str, password: str) -> dict:
+    info = load_meta(n_products, seed)
+    if info is None:
+        # 生成放在子进程：生成过程会导入 api.deps 并绑定到原始数据集
+        subprocess.run([sys.executable, "-m", "bench.datagen", "--scale", str(n_products),
+                        "--seed", str(seed)], check=True)
+        info = load_meta(n_products, seed)
+    use_dataset(n_products, seed, run_copy=True)
+
+    # 数据集就绪后才导入应用（api.deps 按环境变量打开基准库）
+    from fastapi.testclient import TestClient
+    from api.server import app
+    from api.deps import get_db, get_cfg
+    from bench.scenarios import Context, by_name
+
+    client = TestClient(app)
+    cfg = get_cfg()
+    r = client.post("/login", data={"username": user, "password": password}, follow_redirects=False)
+    if r.status_code not in (302, 303):
+        raise SystemExit(f"登录失败：HTTP {r.status_code}")
+    client.cookies.set(cfg.security["cookie_name"], r.cookies.get(cfg.security["cookie_name"]))
+
+    ctx = Context(client, get_db(), n_products, seed)
+    results = {}
+    for sc in by_name(names):
+        if sc.max_products and n_products > sc.max_products and not no_cap:
+            results[sc.name] = {"skipped": f"规模超过 {sc.max_products}（--no-cap 强制运行）"}
+            print(f"  - {sc.name:<20} skipped")
+            continue
+        for _ in range(sc.warmup):
+            sc.step(ctx)
+        n = min(iterations, sc.max_iter or iterations)
+        samples, errors = [], 0
+        wall0 = time.perf_counter()
+        for _ in range(n):
+            t0 = time.perf_counter()
+            ok = sc.step(ctx)
+            samples.append(time.perf_counter() - t0)
+            if not ok:
+                errors += 1
+        res = summarize(samples, time.perf_counter() - wall0, errors)
+        results[sc.name] = res
+        print(f"  - {sc.name:<20} p50={res['p50_ms']:>9}ms p95={res['p95_ms']:>9}ms "
+              f"p99={res['p99_ms']:>9}ms {res['throughput_rps']:>8} req/s errors={errors}")
+
+    return {
+        "meta": {
+            "n_products": n_products,
+            "seed": seed,
+            "iterations": iterations,
+            "dataset": info,
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold_pct: float) -> list[str]:
+    """按 p95 对比，返回回退超过阈值的场景名。"""
+    regressions = []
+    print(f"\n对比基线（git {baseline['meta'].get('git_rev')}，阈值 +{threshold_pct}% p95）")
+    for name, cur in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old or "p95_ms" not in old or "p95_ms" not in cur:
+            continue
+        delta = (cur["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        mark = ""
+        if delta > threshold_pct:
+            mark = "  ⚠ 回退"
+            regressions.append(name)
+        print(f"  - {name:<20} {old['p95_ms']:>9}ms → {cur['p95_ms']:>9}ms ({delta:+.1f}%){mark}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(prog="bench.run", description="StockFlow 性能基准")
+    ap.add_argument("--scale", default="10k", help="1k/10k/100k/1m 或具体数量")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--scenario", action="append", help="只跑指定场景（可多次）")
+    ap.add_argument("--no-cap", action="store_true", help="大规模下也运行全量渲染类场景")
+    ap.add_argument("--out", help="结果 JSON 路径，默认 bench/results/<时间>_<规模>.json")
+    ap.add_argument("--compare", help="基线结果 JSON：p95 回退超过阈值时退出码为 1")
+    ap.add_argument("--threshold", type=float, default=10.0, help="回退阈值（百分比）")
+    ap.add_argument("--user", default=os.environ.get("STOCKFLOW_BENCH_USER", "admin"),
+                    help="登录用户（默认取环境变量 STOCKFLOW_BENCH_USER）")
+    ap.add_argument("--password", default=os.environ.get("STOCKFLOW_BENCH_PASSWORD", ""),
+                    help="登录密码（默认取环境变量 STOCKFLOW_BENCH_PASSWORD）")
+    args = ap.parse_args()
+    if not args.password:
+        ap.error("需要 --password 或环境变量 STOCKFLOW_BENCH_PASSWORD")
+
+    n = parse_scale(args.scale)
+    print(f"StockFlow bench: {n} products, seed={args.seed}, db={dataset_paths(n, args.seed)['db']}")
+    result = run(n, args.seed, args.iterations, args.scenario, args.no_cap, args.user, args.password)
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_n{n}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"✅ 结果已写入 {out}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# bench/scenarios.py
+# 基准场景：HTTP 场景经 FastAPI TestClient 走完整中间件/路由/模板；svc_* 场景直接调服务层
+from __future__ import annotations
+import random
+import tempfile
+
+
+class Context:
+    """场景共享状态：TestClient、服务对象、可借出的 SKU 池、已借出待归还的 SKU。"""
+
+    def __init__(self, client, db, n_products: int, seed: int):
+        self.client = client
+        self.db = db
+        self.n_products = n_products
+        self.rng = random.Random(seed)
+        self.tmp = tempfile.mkdtemp(prefix="sf-bench-")
+        with db.read() as conn:
+            self.in_stock = [r["sku"] for r in conn.execute(
+                "SELECT sku FROM products WHERE status='在库' ORDER BY id")]
+            self.payloads = [r["qr_payload"] for r in conn.execute(
+                "SELECT qr_payload FROM products ORDER BY id")]
+        self.rng.shuffle(self.in_stock)
+        self.borrowed: list[list[str]] = []
+
+    def get(self, url: str):
+        r = self.client.get(url)
+        return r.status_code == 200
+
+    def post(self, url: str, json: dict, ok=(200,)):
+        r = self.client.post(url, json=json)
+        return r.status_code in ok
+
+
+class Scenario:
+    """
+    name：结果键；step(ctx) 返回 True 表示成功；
+    max_iter：单个场景的迭代上限（重场景）；max_products：超过该规模时跳过（全量渲染类页面）。
+    """
+
+    def __init__(self, name, step, max_iter=None, max_products=None, warmup=1):
+        self.name = name
+        self.step = step
+        self.max_iter = max_iter
+        self.max_products = max_products
+        self.warmup = warmup
+
+
+# —— HTTP 场景 ——
+def _labels_page(ctx):
+    return ctx.get("/labels?page_size=100")
+
+
+def _labels_deep_page(ctx):
+    last = max(1, ctx.n_products // 100)
+    return ctx.get(f"/labels?page_size=100&page={ctx.rng.randint(1, last)}")
+
+
+def _labels_search(ctx):
+    return ctx.get("/labels?page_size=100&q=" + ctx.rng.choice(["钻石", "翡翠", "戒指", "BENCH0001-24"]))
+
+
+def _labels_all(ctx):
+    return ctx.get("/labels")
+
+
+def _products_page(ctx):
+    return ctx.get("/products")
+
+
+def _outbound_page(ctx):
+    return ctx.get("/outbound")
+
+
+def _qr_resolve(ctx):
+    codes = [ctx.payloads[ctx.rng.randrange(len(ctx.payloads))] for _ in range(10)]
+    return ctx.post("/api/qr/resolve", {"codes": codes})
+
+
+def _loan_create(ctx):
+    k = ctx.rng.randint(1, 3)
+    if len(ctx.in_stock) < k:
+        return False
+    skus = [ctx.in_stock.pop() for _ in range(k)]
+    ok = ctx.post("/api/loans/create", {
+        "company": "bench", "discount": 0.9, "items": [{"sku": s} for s in skus]})
+    if ok:
+        ctx.borrowed.append(skus)
+    return ok
+
+
+def _loan_return(ctx):
+    if not ctx.borrowed:
+        return False
+    skus = ctx.borrowed.pop()
+    ok = ctx.post("/api/loans/return", {"codes": skus})
+    if ok:
+        ctx.in_stock.extend(skus)
+    return ok
+
+
+# —— 服务层场景 ——
+def _svc_list_products(ctx):
+    from core.services.inventory import InventoryService
+    return isinstance(InventoryService(ctx.db).list_products(), list)
+
+
+def _svc_stock_snapshot(ctx):
+    from export.snapshot import snapshot_stocks_to_csv_gz
+    return bool(snapshot_stocks_to_csv_gz(ctx.db, ctx.tmp))
+
+
+SCENARIOS = [
+    Scenario("labels_page", _labels_page),
+    Scenario("labels_deep_page", _labels_deep_page),
+    Scenario("labels_search", _labels_search),
+    Scenario("labels_all", _labels_all, max_iter=10, max_products=100_000),
+    Scenario("products_page", _products_page, max_iter=10, max_products=100_000),
+    Scenario("outbound_page", _outbound_page, max_iter=10, max_products=100_000),
+    Scenario("qr_resolve", _qr_resolve, warmup=2),
+    Scenario("loan_create", _loan_create, warmup=0),
+    Scenario("loan_return", _loan_return, warmup=0),
+    Scenario("svc_list_products", _svc_list_products, max_iter=10),
+    Scenario("svc_stock_snapshot", _svc_stock_snapshot, max_iter=5),
+]
+
+
+def by_name(names: list[str] | None) -> list[Scenario]:
+    if not names:
+        return list(SCENARIOS)
+    known = {s.name: s for s in SCENARIOS}
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        raise SystemExit(f"未知场景：{', '.join(unknown)}（可选：{', '.join(known)}）")
+    return [known[n] for n in names]
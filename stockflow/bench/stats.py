@@ -0,0 +1,27 @@
+# bench/stats.py
+# 延迟样本汇总：p50/p95/p99（最近秩法）、均值、吞吐
+from __future__ import annotations
+import math
+
+
+def percentile(sorted_samples: list[float], p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    k = max(0, math.ceil(p / 100.0 * len(sorted_samples)) - 1)
+    return sorted_samples[min(k, len(sorted_samples) - 1)]
+
+
+def summarize(samples: list[float], wall_s: float, errors: int = 0) -> dict:
+    """samples 为单次耗时（秒）；wall_s 为整段墙钟时间，用于算吞吐。"""
+    s = sorted(samples)
+    n = len(s)
+    return {
+        "n": n,
+        "errors": errors,
+        "p50_ms": round(percentile(s, 50) * 1000, 3),
+        "p95_ms": round(percentile(s, 95) * 1000, 3),
+        "p99_ms": round(percentile(s, 99) * 1000, 3),
+        "mean_ms": round(sum(s) / n * 1000, 3) if n else 0.0,
+        "max_ms": round(s[-1] * 1000, 3) if n else 0.0,
+        "throughput_rps": round(n / wall_s, 2) if wall_s > 0 else 0.0,
+    }
@@ -1,7 +1,8 @@
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True)
 class Product:
+    """轻量商品行（__slots__，无逐行 __dict__）；由 core.services.catalog 按需从列存生成。"""
     id: int | None
     sku: str
     name: str
@@ -10,3 +11,11 @@ class Product:
     cost_price: float = 0.0
     sale_price: float = 0.0
     enabled: bool = True
+    category: str | None = None
+    detail: str | None = None
+    status: str | None = None
+    borrower: str | None = None
+    photo_path: str | None = None
+    login_date: str | None = None
+    qr_payload: str | None = None
+    row_version: int | None = None
@@ -0,0 +1,215 @@
+# core/services/analytics.py
+# 库存分析（NumPy 向量化）：一次查询按列取出商品数据，转成数组后做估值/毛利/库龄分桶/分组汇总。
+# 列数据按 products 的变更版本（迁移 0013 的 table_versions）缓存，数据不变时重复出报表只做数组运算。
+# numpy 为可选依赖：只有调用报表时才导入，缺失时抛 AnalyticsUnavailable。
+from __future__ import annotations
+import re
+import threading
+from datetime import date
+
+from infra.db_interface import DB
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+# 库龄分桶上界（天，左闭右开）：[0,30) [30,90) [90,180) [180,365) [365,∞)
+DEFAULT_AGING_BUCKETS = (30, 90, 180, 365)
+
+UNCATEGORIZED = "（未分类）"
+
+
+class AnalyticsUnavailable(RuntimeError):
+    pass
+
+
+def _np():
+    try:
+        import numpy
+    except ImportError:
+        raise AnalyticsUnavailable("缺少依赖：numpy，请先安装 pip install numpy")
+    return numpy
+
+
+class ProductColumns:
+    """products 的列式快照：数值列为 float64，状态/品类为整数编码 + 取值表，登录日期为 datetime64[D]（未知为 NaT）。"""
+
+    def __init__(self, rows: list[tuple]):
+        np = _np()
+        n = len(rows)
+        self.n = n
+        if n:
+            ids, cats, statuses, cost, sale, login = zip(*rows)
+        else:
+            ids = cats = statuses = cost = sale = login = ()
+        self.id = np.fromiter(ids, dtype=np.int64, count=n)
+        self.cost = np.fromiter(cost, dtype=np.float64, count=n)
+        self.sale = np.fromiter(sale, dtype=np.float64, count=n)
+        self.category_names, self.category = np.unique(np.array(cats, dtype=object), return_inverse=True) \
+            if n else (np.array([], dtype=object), np.array([], dtype=np.int64))
+        self.status_names, self.status = np.unique(np.array(statuses, dtype=object), return_inverse=True) \
+            if n else (np.array([], dtype=object), np.array([], dtype=np.int64))
+        self.login = np.array([s[:10] if s and _DATE_RE.match(s) else "NaT" for s in login],
+                              dtype="datetime64[D]")
+
+
+_COLUMNS_SQL = """
+    SELECT id,
+           COALESCE(NULLIF(TRIM(category), ''), ?)  AS category,
+           COALESCE(NULLIF(TRIM(status), ''), '在库') AS status,
+           COALESCE(cost_price, 0)                  AS cost_price,
+           COALESCE(sale_price, 0)                  AS sale_price,
+           login_date
+      FROM products
+     WHERE enabled = 1
+"""
+
+
+class InventoryAnalytics:
+    """
+    tracker：infra.db_interface.ChangeTracker；给定时按 products 版本缓存列快照，
+    为 None（CLI）时每次重新取数。
+    """
+
+    def __init__(self, db: DB, tracker=None):
+        self.db = db
+        self.tracker = tracker
+        self._lock = threading.Lock()
+        self._cols: ProductColumns | None = None
+        self._version = None
+        self.loads = 0
+
+    def columns(self) -> ProductColumns:
+        version = self.tracker.token(("products",))[0] if self.tracker is not None else None
+        with self._lock:
+            if self._cols is not None and version is not None and version == self._version:
+                return self._cols
+            with self.db.read() as conn:
+                # 按元组取（不转 dict），转置后直接灌进数组
+                cur = conn.cursor()
+                cur.row_factory = None
+                rows = cur.execute(_COLUMNS_SQL, (UNCATEGORIZED,)).fetchall()
+            self._cols = ProductColumns(rows)
+            self._version = version
+            self.loads += 1
+            return self._cols
+
+    # ====== 分组工具 ======
+    @staticmethod
+    def _group(np, codes, names, mask, cost, sale) -> list[dict]:
+        k = len(names)
+        c = codes[mask]
+        cnt = np.bincount(c, minlength=k)
+        cost_sum = np.bincount(c, weights=cost[mask], minlength=k)
+        sale_sum = np.bincount(c, weights=sale[mask], minlength=k)
+        out = []
+        for i in np.flatnonzero(cnt):
+            out.append(_valuation_row(str(names[i]), int(cnt[i]), float(cost_sum[i]), float(sale_sum[i])))
+        out.sort(key=lambda r: r["cost_total"], reverse=True)
+        return out
+
+    def _status_mask(self, np, cols: ProductColumns, include_sold: bool):
+        if include_sold:
+            return np.ones(cols.n, dtype=bool)
+        sold = np.flatnonzero(cols.status_names == "已出售")
+        return ~np.isin(cols.status, sold)
+
+    # ====== 报表 ======
+    def valuation(self, include_sold: bool = False) -> dict:
+        """库存估值：成本/售价合计、毛利与毛利率，总计 + 按状态 + 按品类。默认不含“已出售”。"""
+        np = _np()
+        cols = self.columns()
+        mask = self._status_mask(np, cols, include_sold)
+        total = _valuation_row("合计", int(mask.sum()), float(cols.cost[mask].sum()), float(cols.sale[mask].sum()))
+        return {
+            "include_sold": include_sold,
+            "total": total,
+            "by_status": self._group(np, cols.status, cols.status_names, mask, cols.cost, cols.sale),
+            "by_category": self._group(np, cols.category, cols.category_names, mask, cols.cost, cols.sale),
+        }
+
+    def aging(self, as_of: str | None = None, buckets=DEFAULT_AGING_BUCKETS,
+              include_sold: bool = False) -> dict:
+        """按登录日期算库龄并分桶（件数/成本/售价），另给出按品类的平均与最大库龄。"""
+        np = _np()
+        cols = self.columns()
+        today = np.datetime64(as_of or date.today().isoformat(), "D")
+        bounds = np.asarray(sorted(int(b) for b in buckets), dtype=np.int64)
+        mask = self._status_mask(np, cols, include_sold)
+
+        known = mask & ~np.isnat(cols.login)
+        age = (today - cols.login[known]).astype(np.int64)
+        age = np.maximum(age, 0)
+        idx = np.searchsorted(bounds, age, side="right")       # 0..len(bounds)
+        k = len(bounds) + 1
+        cnt = np.bincount(idx, minlength=k)
+        cost_sum = np.bincount(idx, weights=cols.cost[known], minlength=k)
+        sale_sum = np.bincount(idx, weights=cols.sale[known], minlength=k)
+
+        labels = []
+        lo = 0
+        for b in bounds:
+            labels.append(f"{lo}-{int(b) - 1}天")
+            lo = int(b)
+        labels.append(f"{lo}天以上")
+        out_buckets = [_valuation_row(labels[i], int(cnt[i]), float(cost_sum[i]), float(sale_sum[i]))
+                       for i in range(k)]
+        unknown = mask & np.isnat(cols.login)
+        out_buckets.append(_valuation_row("日期未知", int(unknown.sum()),
+                                          float(cols.cost[unknown].sum()), float(cols.sale[unknown].sum())))
+
+        # 按品类：平均库龄 / 最大库龄（只计有日期的）
+        ncat = len(cols.category_names)
+        cat = cols.category[known]
+        cat_cnt = np.bincount(cat, minlength=ncat)
+        cat_age = np.bincount(cat, weights=age, minlength=ncat)
+        cat_max = np.zeros(ncat, dtype=np.int64)
+        np.maximum.at(cat_max, cat, age)
+        by_category = [{
+            "name": str(cols.category_names[i]),
+            "count": int(cat_cnt[i]),
+            "avg_age_days": round(float(cat_age[i] / cat_cnt[i]), 1),
+            "max_age_days": int(cat_max[i]),
+        } for i in np.flatnonzero(cat_cnt)]
+        by_category.sort(key=lambda r: r["avg_age_days"], reverse=True)
+
+        return {
+            "as_of": str(today),
+            "include_sold": include_sold,
+            "buckets": out_buckets,
+            "avg_age_days": round(float(age.mean()), 1) if age.size else 0.0,
+            "by_category": by_category,
+        }
+
+    def categories(self, include_sold: bool = False) -> dict:
+        """品类 × 状态 交叉表（件数），外加各品类估值。"""
+        np = _np()
+        cols = self.columns()
+        mask = self._status_mask(np, cols, include_sold)
+        ncat, nst = len(cols.category_names), len(cols.status_names)
+        cross = np.zeros((ncat, nst), dtype=np.int64)
+        np.add.at(cross, (cols.category[mask], cols.status[mask]), 1)
+        statuses = [str(s) for s in cols.status_names]
+        rows = []
+        for i in np.flatnonzero(cross.sum(axis=1)):
+            rows.append({"name": str(cols.category_names[i]),
+                         "by_status": {statuses[j]: int(cross[i, j]) for j in np.flatnonzero(cross[i])}})
+        return {
+            "include_sold": include_sold,
+            "statuses": statuses,
+            "rows": rows,
+            "valuation": self._group(np, cols.category, cols.category_names, mask, cols.cost, cols.sale),
+        }
+
+    def stats(self) -> dict:
+        return {"loads": self.loads, "rows": self._cols.n if self._cols is not None else 0}
+
+
+def _valuation_row(name: str, count: int, cost: float, sale: float) -> dict:
+    margin = sale - cost
+    return {
+        "name": name,
+        "count": count,
+        "cost_total": round(cost, 2),
+        "sale_total": round(sale, 2),
+        "margin": round(margin, 2),
+        "margin_pct": round(margin / sale * 100, 2) if sale else 0.0,
+    }
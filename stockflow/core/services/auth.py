@@ -22,7 +22,7 @@ class AuthService:
             cur.execute("SELECT id FROM roles WHERE code='admin'")
             role = cur.fetchone()
             if role:
-                cur.execute("INSERT OR IGNORE INTO user_roles (user_id, role_id) VALUES (?,?)",
+                cur.execute("INSERT INTO user_roles (user_id, role_id) VALUES (?,?) ON CONFLICT DO NOTHING",
                             (user_id, role["id"]))
 
     def register_user(self, username: str, password: str, role_codes: list[str] | None=None) -> int:
@@ -36,12 +36,12 @@ class AuthService:
                     cur.execute("SELECT id FROM roles WHERE code=?", (code,))
                     r = cur.fetchone()
                     if r:
-                        cur.execute("INSERT OR IGNORE INTO user_roles (user_id, role_id) VALUES (?,?)",
+                        cur.execute("INSERT INTO user_roles (user_id, role_id) VALUES (?,?) ON CONFLICT DO NOTHING",
                                     (uid, r["id"]))
             return uid
 
     def authenticate(self, username: str, password: str) -> dict | None:
-        with self.db.connect() as conn:
+        with self.db.read() as conn:
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE username=? AND is_active=1", (username,))
             u = cur.fetchone()
@@ -59,7 +59,7 @@ class AuthService:
             return {"id": u["id"], "username": u["username"], "roles": roles}
 
     def has_role(self, user_id: int, role_code: str) -> bool:
-        with self.db.connect() as conn:
+        with self.db.read() as conn:
             cur = conn.cursor()
             cur.execute("""
                 SELECT 1 FROM user_roles ur
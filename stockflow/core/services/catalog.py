@@ -0,0 +1,329 @@
+# core/services/catalog.py
+# 进程内商品目录（列存）：列表页/标签页/出入库页的商品读取不再每次查库、逐行转 dict。
+# - 数值列放 array（id/行版本/价格/标志位），低基数文本列（状态/品类/单位）存成编码 + 码表，
+#   其余文本列为驻留字符串（sys.intern）列表——相同的日期/借出方/规格在内存里只存一份；
+# - 按 ChangeTracker 的 products 版本刷新：版本没变什么都不做；变了只比对 (id, row_version)、补读变了的行；
+# - 过滤/排序/分页在内存里做，调用方拿到 (id, row_version) 键，再按需物化成 dict / Product。
+from __future__ import annotations
+import sys
+import threading
+from array import array
+
+from core.models import Product
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+# 数值列：类型码；None 存成 0（row_version 存 -1，读回时还原为 None）
+_NUM_COLS = {
+    "id": "q",
+    "row_version": "q",
+    "enabled": "b",
+    "tax_included": "b",
+    "label_printed_count": "l",
+    "cost_price": "d",
+    "sale_price": "d",
+}
+# 低基数文本列：编码存 array('I')，0 = NULL
+_CODE_COLS = ("status", "category", "unit")
+# 其余文本列：驻留字符串列表
+_TEXT_COLS = ("sku", "name", "spec", "created_at", "photo_path", "detail", "label_printed_at", "login_date",
+              "remark", "borrower", "borrower_company", "borrower_receiver", "borrower_handler", "borrowed_at",
+              "qr_payload")
+# 物化成 dict 时的列顺序（与 products 表一致）
+_ALL_COLS = ("id", "sku", "name", "spec", "unit", "cost_price", "sale_price", "enabled", "created_at",
+             "photo_path", "category", "detail", "label_printed_count", "label_printed_at", "login_date",
+             "tax_included", "remark", "status", "borrower", "borrower_company", "borrower_receiver",
+             "borrower_handler", "borrowed_at", "qr_payload", "row_version")
+
+_FETCH_CHUNK = 500
+
+
+def _intern(v):
+    return sys.intern(v) if isinstance(v, str) else v
+
+
+class _Codes:
+    """码表：字符串 ↔ 小整数。"""
+    __slots__ = ("names", "index")
+
+    def __init__(self):
+        self.names: list = [None]
+        self.index: dict = {None: 0}
+
+    def code(self, v) -> int:
+        c = self.index.get(v)
+        if c is None:
+            c = self.index[v] = len(self.names)
+            self.names.append(_intern(v))
+        return c
+
+
+class ProductCatalog:
+    """
+    线程安全（一把 RLock 串行刷新与查询；查询都是纯内存操作，持锁时间很短）。
+    tracker 为 None（CLI 等）时每次查询都整表重读。
+    """
+
+    def __init__(self, db, tracker=None):
+        self.db = db
+        self.tracker = tracker
+        self._lock = threading.RLock()
+        self._reset()
+        self._version = None
+        self._loaded = False
+        self._has_row_version = True
+        self._orders: dict[str, list[int]] = {}
+        self.loads = 0
+        self.syncs = 0
+        self.rows_fetched = 0
+
+    # ====== 列存 ======
+    def _reset(self):
+        self._num = {c: array(t) for c, t in _NUM_COLS.items()}
+        self._codes = {c: _Codes() for c in _CODE_COLS}
+        self._coded = {c: array("I") for c in _CODE_COLS}
+        self._text: dict[str, list] = {c: [] for c in _TEXT_COLS}
+        self._search: list[str] = []      # 小写的 sku/名称/详情/品类，关键词过滤用
+        self._alive = array("b")
+        self._slot: dict[int, int] = {}   # id → 槽位
+        self._by_sku: dict[str, int] = {}
+        self._dead = 0
+
+    def _put(self, r, cols):
+        """写入/覆盖一行（r 为 sqlite3.Row 或 dict；cols 为这批结果实际有的列，旧库可能缺列）。"""
+        get = (lambda c: r[c] if c in cols else None)
+        pid = int(r["id"])
+        slot = self._slot.get(pid)
+        if slot is None:
+            slot = len(self._alive)
+            self._alive.append(1)
+            for c, arr in self._num.items():
+                arr.append(0)
+            for arr in self._coded.values():
+                arr.append(0)
+            for lst in self._text.values():
+                lst.append(None)
+            self._search.append("")
+            self._slot[pid] = slot
+        else:
+            old_sku = self._text["sku"][slot]
+            if self._by_sku.get(old_sku) == slot:
+                del self._by_sku[old_sku]
+        for c, arr in self._num.items():
+            v = get(c)
+            if c == "row_version":
+                arr[slot] = -1 if v is None else int(v)
+            elif _NUM_COLS[c] == "d":
+                arr[slot] = float(v or 0)
+            else:
+                arr[slot] = int(v or 0)
+        for c, arr in self._coded.items():
+            arr[slot] = self._codes[c].code(get(c))
+        for c, lst in self._text.items():
+            lst[slot] = _intern(get(c))
+        sku = self._text["sku"][slot]
+        if sku is not None:
+            self._by_sku[sku] = slot
+        self._search[slot] = "\x00".join(
+            (v or "").lower() for v in (sku, get("name"), get("detail"), get("category")))
+
+    def _kill(self, pid: int):
+        slot = self._slot.pop(pid, None)
+        if slot is None:
+            return
+        self._alive[slot] = 0
+        sku = self._text["sku"][slot]
+        if self._by_sku.get(sku) == slot:
+            del self._by_sku[sku]
+        for lst in self._text.values():
+            lst[slot] = None
+        self._search[slot] = ""
+        self._dead += 1
+
+    def _compact(self):
+        """删除留下的空槽超过四分之一时整体重排（纯内存，不查库）。"""
+        rows = [self._row(s) for s in range(len(self._alive)) if self._alive[s]]
+        self._reset()
+        cols = frozenset(_ALL_COLS)
+        for r in rows:
+            self._put(r, cols)
+
+    # ====== 刷新 ======
+    def refresh(self) -> bool:
+        """products 版本变了才同步；返回是否有变化。"""
+        token = self.tracker.token(("products",))[0] if self.tracker is not None else None
+        with self._lock:
+            if self._loaded and token is not None and token == self._version:
+                return False
+            with self.db.read() as conn:
+                if not self._loaded or not self._has_row_version:
+                    self._load_all(conn)
+                else:
+                    self._sync(conn)
+            if self._dead > max(1024, len(self._slot) // 4):
+                self._compact()
+            self._version = token
+            self._orders.clear()
+            return True
+
+    def _load_all(self, conn):
+        self._reset()
+        n = 0
+        cols = None
+        for r in conn.stream("SELECT * FROM products"):
+            if cols is None:
+                cols = frozenset(r.keys())
+                self._has_row_version = "row_version" in cols
+            self._put(r, cols)
+            n += 1
+        self._loaded = True
+        self.loads += 1
+        self.rows_fetched += n
+
+    def _sync(self, conn):
+        rv = self._num["row_version"]
+        current = conn.execute("SELECT id, row_version FROM products").fetchall()
+        changed = []
+        for pid, ver in current:
+            slot = self._slot.get(pid)
+            if slot is None or rv[slot] != ver:
+                changed.append(pid)
+        gone = set(self._slot).difference(r[0] for r in current)
+        # 大面积变化（导入/批量改价）时整表重读更省
+        if len(changed) > max(_FETCH_CHUNK, len(current) // 2):
+            self._load_all(conn)
+            return
+        for pid in gone:
+            self._kill(pid)
+        for i in range(0, len(changed), _FETCH_CHUNK):
+            ids = changed[i:i + _FETCH_CHUNK]
+            ph = ",".join(["?"] * len(ids))
+            cur = conn.execute(f"SELECT * FROM products WHERE id IN ({ph})", tuple(ids))
+            cols = frozenset(d[0] for d in cur.description)
+            for r in cur:
+                self._put(r, cols)
+        self.syncs += 1
+        self.rows_fetched += len(changed)
+
+    # ====== 排序 ======
+    def _ordered(self, order: str) -> list[int]:
+        """存活槽位按 order 排好的列表；同一数据版本内缓存。"""
+        slots = self._orders.get(order)
+        if slots is not None:
+            return slots
+        ids = self._num["id"]
+        live = [s for s in range(len(self._alive)) if self._alive[s]]
+        if order == "-id":
+            live.sort(key=ids.__getitem__, reverse=True)
+        elif order == "-login_date":
+            # 与 ORDER BY COALESCE(login_date, '') DESC, id DESC 一致
+            ld = self._text["login_date"]
+            live.sort(key=lambda s: (ld[s] or "", ids[s]), reverse=True)
+        else:
+            raise ValueError(f"unknown order: {order}")
+        self._orders[order] = live
+        return live
+
+    # ====== 查询 ======
+    def select(self, *, keyword: str = "", enabled_only: bool = False, exclude_status: str | None = None,
+               only_unprinted: bool = False, order: str = "-id", page: int = 1,
+               page_size: int = 0) -> tuple[int, list[tuple[int, int | None]]]:
+        """
+        过滤 + 排序 + 分页，返回 (总数, [(id, row_version), ...])。
+        keyword 对 SKU/名称/详情/品类做不区分大小写的包含匹配（同 SQL LIKE '%kw%'）；
+        exclude_status 同 (status IS NULL OR status <> ?)；page_size<=0 表示全部。
+        """
+        self.refresh()
+        kw = (keyword or "").strip().lower()
+        with self._lock:
+            slots = self._ordered(order)
+            if kw:
+                search = self._search
+                slots = [s for s in slots if kw in search[s]]
+            if enabled_only:
+                en = self._num["enabled"]
+                slots = [s for s in slots if en[s] == 1]
+            if exclude_status is not None:
+                code = self._codes["status"].index.get(exclude_status)
+                if code is not None:
+                    st = self._coded["status"]
+                    slots = [s for s in slots if st[s] != code]
+            if only_unprinted:
+                printed = self._num["label_printed_count"]
+                slots = [s for s in slots if printed[s] == 0]
+            total = len(slots)
+            if page_size and page_size > 0:
+                start = (max(1, int(page)) - 1) * int(page_size)
+                slots = slots[start:start + int(page_size)]
+            ids, rv = self._num["id"], self._num["row_version"]
+            return total, [(ids[s], rv[s] if rv[s] >= 0 else None) for s in slots]
+
+    def _row(self, slot: int) -> dict:
+        out = {}
+        for c in _ALL_COLS:
+            if c in self._num:
+                v = self._num[c][slot]
+                if c == "row_version" and v < 0:
+                    v = None
+            elif c in self._coded:
+                v = self._codes[c].names[self._coded[c][slot]]
+            else:
+                v = self._text[c][slot]
+            out[c] = v
+        return out
+
+    def row(self, pid: int) -> dict | None:
+        """单行物化为 dict（列名同 SELECT * FROM products）；不存在返回 None。"""
+        with self._lock:
+            slot = self._slot.get(int(pid))
+            return self._row(slot) if slot is not None else None
+
+    def by_sku(self, sku: str) -> dict | None:
+        self.refresh()
+        with self._lock:
+            slot = self._by_sku.get(sku)
+            return self._row(slot) if slot is not None else None
+
+    def products(self, keys) -> list[Product]:
+        """把 select() 的键物化成 Product（__slots__ 对象），已删除的行跳过。"""
+        num, text, coded, names = self._num, self._text, self._coded, self._codes
+        out = []
+        with self._lock:
+            for pid, _ in keys:
+                s = self._slot.get(pid)
+                if s is None:
+                    continue
+                rv = num["row_version"][s]
+                out.append(Product(
+                    id=pid, sku=text["sku"][s], name=text["name"][s], spec=text["spec"][s],
+                    unit=names["unit"].names[coded["unit"][s]], cost_price=num["cost_price"][s],
+                    sale_price=num["sale_price"][s], enabled=bool(num["enabled"][s]),
+                    category=names["category"].names[coded["category"][s]], detail=text["detail"][s],
+                    status=names["status"].names[coded["status"][s]], borrower=text["borrower"][s],
+                    photo_path=text["photo_path"][s], login_date=text["login_date"][s],
+                    qr_payload=text["qr_payload"][s], row_version=rv if rv >= 0 else None))
+        return out
+
+    # ====== 统计 ======
+    def nbytes(self) -> int:
+        """列存大致占用：数组缓冲 + 列表指针 + 去重后的字符串对象。"""
+        with self._lock:
+            n = sum(a.itemsize * len(a) for a in (*self._num.values(), *self._coded.values(), self._alive))
+            seen = set()
+            for lst in (*self._text.values(), self._search, *(c.names for c in self._codes.values())):
+                n += sys.getsizeof(lst)
+                for v in lst:
+                    if v is not None and id(v) not in seen:
+                        seen.add(id(v))
+                        n += sys.getsizeof(v)
+            n += sys.getsizeof(self._slot) + sys.getsizeof(self._by_sku)
+            return n
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows, dead = len(self._slot), self._dead
+        nb = self.nbytes()
+        return {"rows": rows, "dead_slots": dead, "loads": self.loads, "syncs": self.syncs,
+                "rows_fetched": self.rows_fetched, "bytes": nb,
+                "bytes_per_row": round(nb / rows, 1) if rows else 0.0}
@@ -3,6 +3,8 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Optional
 
+from infra.storage import dialect_of
+
 # —— 工具 —— #
 def _scope_yymm(dt: datetime | None = None) -> str:
     d = dt or datetime.now()
@@ -25,30 +27,26 @@ def _ensure_schema(conn) -> None:
 def next_sequence(conn, scope: str) -> int:
     """
     从 sequences(scope) 中“取号并+1”，必须在**外层事务**中调用。
-    事务建议使用 IMMEDIATE/EXCLUSIVE（你的 db.transaction() 已可满足）。
+    事务建议使用 IMMEDIATE/EXCLUSIVE（db.run_write() 的写线程即 BEGIN IMMEDIATE）。
     返回：本次分配到的序号（已保证同事务下原子）
     """
-    # 读取
+    # 首次：先占一行 next=1（并发首取时另一方等本方提交后什么也不做）
+    conn.execute(
+        "INSERT INTO sequences(scope, next) VALUES(?, 1) ON CONFLICT DO NOTHING",
+        (scope,)
+    )
+    # 读取（并发写的引擎上加行锁，取号与自增之间不会被插队）
     row = conn.execute(
-        "SELECT next FROM sequences WHERE scope=? LIMIT 1",
+        "SELECT next FROM sequences WHERE scope=?" + dialect_of(conn).for_update,
         (scope,)
     ).fetchone()
-
-    if not row:
-        # 首次：插入 next=2，并返回 1
-        conn.execute(
-            "INSERT INTO sequences(scope, next) VALUES(?, ?)",
-            (scope, 2)
-        )
-        return 1
-    else:
-        cur_next = int(row["next"] or 1)
-        # 自增
-        conn.execute(
-            "UPDATE sequences SET next=? WHERE scope=?",
-            (cur_next + 1, scope)
-        )
-        return cur_next
+    cur_next = int(row["next"] or 1)
+    # 自增
+    conn.execute(
+        "UPDATE sequences SET next=? WHERE scope=?",
+        (cur_next + 1, scope)
+    )
+    return cur_next
 
 def alloc_sku(db, company_code: str) -> str:
     """
@@ -61,8 +59,8 @@ def alloc_sku(db, company_code: str) -> str:
 
     scope = _scope_yymm()
 
-    # 关键点：只用 **一个** 连接（同一事务）完成所有步骤
-    with db.transaction() as conn:
+    # 关键点：只用 **一个** 连接（同一事务）完成所有步骤；交给写线程执行
+    def _job(conn):
         _ensure_schema(conn)
 
         n = next_sequence(conn, scope)
@@ -79,3 +77,5 @@ def alloc_sku(db, company_code: str) -> str:
             sku = f"{company_code}-{scope}-{n:04d}"
 
         return sku
+
+    return db.run_write(_job)
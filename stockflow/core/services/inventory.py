@@ -1,75 +1,127 @@
 from infra.db_interface import DB
+from infra.storage import dialect_of
 from utils.exceptions import NotFound
+from core.services.ledger import StockLedger
 
 class InventoryService:
-    def __init__(self, db: DB):
+    def __init__(self, db: DB, checkpoint_every: int = StockLedger.CHECKPOINT_EVERY):
         self.db = db
+        self.ledger = StockLedger(db, checkpoint_every)
 
     # 商品
     def add_product(self, sku: str, name: str, spec: str|None=None,
                     unit: str="pcs", cost_price: float=0.0, sale_price: float=0.0) -> int:
-        with self.db.transaction() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO products (sku, name, spec, unit, cost_price, sale_price) VALUES (?,?,?,?,?,?)",
-                (sku, name, spec, unit, cost_price, sale_price),
-            )
-            return cur.lastrowid
+        return self.db.run_write(lambda conn: self._add_product(conn, sku, name, spec, unit, cost_price, sale_price))
+
+    @staticmethod
+    def _add_product(conn, sku, name, spec=None, unit="pcs", cost_price=0.0, sale_price=0.0) -> int:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO products (sku, name, spec, unit, cost_price, sale_price) VALUES (?,?,?,?,?,?)",
+            (sku, name, spec, unit, cost_price, sale_price),
+        )
+        return cur.lastrowid
 
     def list_products(self):
-        with self.db.connect() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM products WHERE enabled=1 ORDER BY id DESC")
-            return [dict(r) for r in cur.fetchall()]
+        return list(self.iter_products())
+
+    def iter_products(self, page: int = 1, page_size: int = 0):
+        """逐行产出商品（游标迭代，不一次性 fetchall；PostgreSQL 为服务端游标）；page_size<=0 表示全部。"""
+        sql = "SELECT * FROM products WHERE enabled=1 ORDER BY id DESC"
+        params: tuple = ()
+        if page_size and page_size > 0:
+            sql += " LIMIT ? OFFSET ?"
+            params = (int(page_size), (max(1, int(page)) - 1) * int(page_size))
+        with self.db.read() as conn:
+            for r in conn.stream(sql, params):
+                yield dict(r)
+
+    def iter_stocks(self, product_id: int | None = None, warehouse_id: int | None = None,
+                    page: int = 1, page_size: int = 0):
+        sql = """
+            SELECT s.product_id, p.sku, p.name, s.warehouse_id, w.code AS wh_code,
+                   s.qty_on_hand, s.qty_reserved
+              FROM stocks s
+              JOIN products p   ON p.id = s.product_id
+              JOIN warehouses w ON w.id = s.warehouse_id
+             WHERE 1=1
+        """
+        params: list = []
+        if product_id is not None:
+            sql += " AND s.product_id = ?"
+            params.append(int(product_id))
+        if warehouse_id is not None:
+            sql += " AND s.warehouse_id = ?"
+            params.append(int(warehouse_id))
+        sql += " ORDER BY w.code, p.sku"
+        if page_size and page_size > 0:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(page_size), (max(1, int(page)) - 1) * int(page_size)]
+        with self.db.read() as conn:
+            for r in conn.stream(sql, tuple(params)):
+                yield dict(r)
 
     # 仓库
     def add_warehouse(self, code: str, name: str) -> int:
-        with self.db.transaction() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO warehouses (code, name) VALUES (?,?)",
-                (code, name),
-            )
-            return cur.lastrowid
+        return self.db.run_write(lambda conn: self._add_warehouse(conn, code, name))
+
+    @staticmethod
+    def _add_warehouse(conn, code: str, name: str) -> int:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO warehouses (code, name) VALUES (?,?)",
+            (code, name),
+        )
+        return cur.lastrowid
+
+    @staticmethod
+    def _ensure_stock_row(conn, product_id: int, warehouse_id: int):
+        conn.execute(
+            "INSERT INTO stocks (product_id, warehouse_id, qty_on_hand, qty_reserved) VALUES (?, ?, 0, 0)"
+            " ON CONFLICT DO NOTHING",
+            (product_id, warehouse_id),
+        )
 
     def ensure_stock_row(self, product_id: int, warehouse_id: int):
-        with self.db.transaction() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT OR IGNORE INTO stocks (product_id, warehouse_id, qty_on_hand, qty_reserved) VALUES (?, ?, 0, 0)",
-                (product_id, warehouse_id),
-            )
+        self.db.run_write(lambda conn: self._ensure_stock_row(conn, product_id, warehouse_id))
 
     # 入库（最小版）
-    def inbound(self, product_id: int, warehouse_id: int, qty: float):
-        self.ensure_stock_row(product_id, warehouse_id)
-        with self.db.transaction() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE stocks SET qty_on_hand = qty_on_hand + ? WHERE product_id=? AND warehouse_id=?",
-                (qty, product_id, warehouse_id),
-            )
+    def inbound(self, product_id: int, warehouse_id: int, qty: float, ref: str | None = None):
+        self.db.run_write(lambda conn: self._inbound(conn, product_id, warehouse_id, qty, ref))
+
+    def _inbound(self, conn, product_id: int, warehouse_id: int, qty: float, ref: str | None = None):
+        self._ensure_stock_row(conn, product_id, warehouse_id)
+        conn.execute(
+            "UPDATE stocks SET qty_on_hand = qty_on_hand + ? WHERE product_id=? AND warehouse_id=?",
+            (qty, product_id, warehouse_id),
+        )
+        # 同一事务写流水（失败则结存与流水一起回滚）
+        self.ledger.record(conn, product_id, warehouse_id, qty, "inbound", ref)
 
     # 出库（最小版，未做保留量与订单机制）
-    def outbound(self, product_id: int, warehouse_id: int, qty: float):
-        with self.db.transaction() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT qty_on_hand FROM stocks WHERE product_id=? AND warehouse_id=?",
-                (product_id, warehouse_id),
-            )
-            row = cur.fetchone()
-            if not row:
-                raise NotFound("库存记录不存在")
-            if row["qty_on_hand"] < qty:
-                raise ValueError("库存不足")
-            cur.execute(
-                "UPDATE stocks SET qty_on_hand = qty_on_hand - ? WHERE product_id=? AND warehouse_id=?",
-                (qty, product_id, warehouse_id),
-            )
+    def outbound(self, product_id: int, warehouse_id: int, qty: float, ref: str | None = None):
+        self.db.run_write(lambda conn: self._outbound(conn, product_id, warehouse_id, qty, ref))
+
+    def _outbound(self, conn, product_id: int, warehouse_id: int, qty: float, ref: str | None = None):
+        cur = conn.cursor()
+        # 并发写的引擎上先锁住这一行，检查与扣减之间不会被别的出库插队
+        cur.execute(
+            "SELECT qty_on_hand FROM stocks WHERE product_id=? AND warehouse_id=?" + dialect_of(conn).for_update,
+            (product_id, warehouse_id),
+        )
+        row = cur.fetchone()
+        if not row:
+            raise NotFound("库存记录不存在")
+        if row["qty_on_hand"] < qty:
+            raise ValueError("库存不足")
+        cur.execute(
+            "UPDATE stocks SET qty_on_hand = qty_on_hand - ? WHERE product_id=? AND warehouse_id=?",
+            (qty, product_id, warehouse_id),
+        )
+        self.ledger.record(conn, product_id, warehouse_id, -qty, "outbound", ref)
 
     def stock_of(self, product_id: int, warehouse_id: int):
-        with self.db.connect() as conn:
+        with self.db.read() as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT qty_on_hand, qty_reserved FROM stocks WHERE product_id=? AND warehouse_id=?",
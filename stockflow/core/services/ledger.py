@@ -0,0 +1,209 @@
+# core/services/ledger.py
+# 库存流水账本：stock_moves 只追加，stock_checkpoints 定期记结存（迁移 0014）。
+# 时点查询 = 最近检查点 + 其后到该时点的流水，每个（商品, 仓库）最多扫 checkpoint_every 条左右。
+from __future__ import annotations
+from datetime import datetime
+
+from infra.db_interface import DB
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def normalize_as_of(s: str) -> str:
+    """'YYYY-MM-DD' 视为当天结束；完整时间原样返回。"""
+    s = (s or "").strip()
+    if len(s) == 10:
+        return s + " 23:59:59"
+    return s or _now()
+
+
+def normalize_start(s: str) -> str:
+    s = (s or "").strip()
+    return s + " 00:00:00" if len(s) == 10 else s
+
+
+# 单个（商品, 仓库）的时点结存：检查点取 as_of 不晚于时点的最近一条，
+# 流水按 (product_id, warehouse_id, created_at) 索引只扫 [检查点时间, 时点] 区间
+_PAIR_AS_OF_SQL = """
+    WITH cp AS (
+      SELECT move_id, as_of, qty
+        FROM stock_checkpoints
+       WHERE product_id = :p AND warehouse_id = :w AND as_of <= :t
+       ORDER BY as_of DESC, move_id DESC
+       LIMIT 1
+    )
+    SELECT COALESCE((SELECT qty FROM cp), 0)
+         + COALESCE((SELECT SUM(m.delta) FROM stock_moves m
+                      WHERE m.product_id = :p AND m.warehouse_id = :w
+                        AND m.created_at >= COALESCE((SELECT as_of FROM cp), '')
+                        AND m.created_at <= :t
+                        AND m.id > COALESCE((SELECT move_id FROM cp), 0)), 0) AS qty
+"""
+
+# 仓库维度：以 stocks 里出现过的（商品, 仓库）为集合逐对计算，避免扫整个仓库的流水
+_WAREHOUSE_AS_OF_SQL = """
+    WITH pairs AS (
+      SELECT s.product_id, s.warehouse_id,
+             (SELECT c.move_id FROM stock_checkpoints c
+               WHERE c.product_id = s.product_id AND c.warehouse_id = s.warehouse_id AND c.as_of <= :t
+               ORDER BY c.as_of DESC, c.move_id DESC LIMIT 1) AS cp_move
+        FROM stocks s
+       WHERE (:w IS NULL OR s.warehouse_id = :w)
+    ),
+    base AS (
+      SELECT pr.product_id, pr.warehouse_id, pr.cp_move,
+             COALESCE(c.qty, 0) AS cp_qty, COALESCE(c.as_of, '') AS cp_as_of
+        FROM pairs pr
+        LEFT JOIN stock_checkpoints c
+          ON c.product_id = pr.product_id AND c.warehouse_id = pr.warehouse_id AND c.move_id = pr.cp_move
+    )
+    SELECT b.product_id, b.warehouse_id, p.sku, p.name, w.code AS wh_code,
+           b.cp_qty + COALESCE((SELECT SUM(m.delta) FROM stock_moves m
+                                 WHERE m.product_id = b.product_id AND m.warehouse_id = b.warehouse_id
+                                   AND m.created_at >= b.cp_as_of AND m.created_at <= :t
+                                   AND m.id > COALESCE(b.cp_move, 0)), 0) AS qty
+      FROM base b
+      JOIN products p   ON p.id = b.product_id
+      JOIN warehouses w ON w.id = b.warehouse_id
+     ORDER BY w.code, p.sku
+"""
+
+
+class StockLedger:
+    CHECKPOINT_EVERY = 100
+
+    def __init__(self, db: DB, checkpoint_every: int = CHECKPOINT_EVERY):
+        self.db = db
+        self.checkpoint_every = max(1, int(checkpoint_every))
+
+    # ====== 写入（在调用方的写任务/事务内执行） ======
+    def record(self, conn, product_id: int, warehouse_id: int, delta: float,
+               kind: str, ref: str | None = None) -> int:
+        """
+        追加一条流水；距上次检查点满 checkpoint_every 条时，用 stocks 的当前结存记一次检查点。
+        必须在 stocks 已更新之后、同一事务里调用。
+        """
+        now = _now()
+        cur = conn.execute(
+            "INSERT INTO stock_moves(product_id, warehouse_id, delta, kind, ref, created_at) VALUES (?,?,?,?,?,?)",
+            (product_id, warehouse_id, delta, kind, ref, now),
+        )
+        move_id = cur.lastrowid
+        # 距上次检查点的流水数：按检查点时间走 (商品, 仓库, 时间) 索引，只数最近一段
+        last = conn.execute(
+            "SELECT move_id, as_of FROM stock_checkpoints WHERE product_id=? AND warehouse_id=?"
+            " ORDER BY move_id DESC LIMIT 1",
+            (product_id, warehouse_id),
+        ).fetchone()
+        since = conn.execute(
+            "SELECT COUNT(1) FROM stock_moves WHERE product_id=? AND warehouse_id=? AND created_at >= ? AND id > ?",
+            (product_id, warehouse_id, last[1] if last else "", last[0] if last else 0),
+        ).fetchone()[0]
+        if since >= self.checkpoint_every:
+            self._checkpoint_pair(conn, product_id, warehouse_id, move_id, now)
+        return move_id
+
+    @staticmethod
+    def _checkpoint_pair(conn, product_id: int, warehouse_id: int, move_id: int, as_of: str):
+        conn.execute("""
+            INSERT INTO stock_checkpoints(product_id, warehouse_id, move_id, as_of, qty)
+            SELECT product_id, warehouse_id, ?, ?, qty_on_hand
+              FROM stocks WHERE product_id=? AND warehouse_id=?
+            ON CONFLICT DO NOTHING
+        """, (move_id, as_of, product_id, warehouse_id))
+
+    def checkpoint_all(self) -> int:
+        """
+        定期任务（如每日/月结）：给自上次检查点后有新流水的每一对补一个检查点。
+        返回新增检查点数。
+        """
+        def _job(conn):
+            cur = conn.execute("""
+                INSERT INTO stock_checkpoints(product_id, warehouse_id, move_id, as_of, qty)
+                SELECT x.product_id, x.warehouse_id, x.move_id, m.created_at, x.qty
+                  FROM (SELECT s.product_id, s.warehouse_id, s.qty_on_hand AS qty,
+                               (SELECT m.id FROM stock_moves m
+                                 WHERE m.product_id = s.product_id AND m.warehouse_id = s.warehouse_id
+                                 ORDER BY m.created_at DESC, m.id DESC LIMIT 1) AS move_id,
+                               (SELECT MAX(c.move_id) FROM stock_checkpoints c
+                                 WHERE c.product_id = s.product_id AND c.warehouse_id = s.warehouse_id) AS last_cp
+                          FROM stocks s) x
+                  JOIN stock_moves m ON m.id = x.move_id
+                 WHERE x.move_id > COALESCE(x.last_cp, 0)
+                ON CONFLICT DO NOTHING
+            """)
+            return cur.rowcount
+        return self.db.run_write(_job)
+
+    # ====== 查询 ======
+    def on_hand_as_of(self, product_id: int, warehouse_id: int, as_of: str) -> float:
+        with self.db.read() as conn:
+            row = conn.execute(_PAIR_AS_OF_SQL, {"p": product_id, "w": warehouse_id,
+                                                 "t": normalize_as_of(as_of)}).fetchone()
+            return float(row["qty"] or 0)
+
+    def stock_as_of(self, as_of: str, warehouse_id: int | None = None,
+                    include_zero: bool = False) -> list[dict]:
+        with self.db.read() as conn:
+            rows = [dict(r) for r in conn.execute(
+                _WAREHOUSE_AS_OF_SQL, {"w": warehouse_id, "t": normalize_as_of(as_of)})]
+        if not include_zero:
+            rows = [r for r in rows if r["qty"]]
+        return rows
+
+    def movements(self, start: str, end: str, warehouse_id: int | None = None,
+                  product_id: int | None = None, limit: int = 500, offset: int = 0) -> list[dict]:
+        sql = """
+            SELECT m.id, m.product_id, p.sku, m.warehouse_id, w.code AS wh_code,
+                   m.delta, m.kind, m.ref, m.created_at
+              FROM stock_moves m
+              JOIN products p   ON p.id = m.product_id
+              JOIN warehouses w ON w.id = m.warehouse_id
+             WHERE m.created_at >= ? AND m.created_at <= ?
+        """
+        params: list = [normalize_start(start), normalize_as_of(end)]
+        if warehouse_id is not None:
+            sql += " AND m.warehouse_id = ?"
+            params.append(int(warehouse_id))
+        if product_id is not None:
+            sql += " AND m.product_id = ?"
+            params.append(int(product_id))
+        sql += " ORDER BY m.created_at, m.id LIMIT ? OFFSET ?"
+        params += [int(limit), int(offset)]
+        with self.db.read() as conn:
+            return [dict(r) for r in conn.execute(sql, tuple(params))]
+
+    def movement_summary(self, start: str, end: str, warehouse_id: int | None = None) -> list[dict]:
+        """区间内按（商品, 仓库）汇总入/出库量；只扫区间内的流水（created_at 索引）。"""
+        sql = """
+            SELECT m.product_id, p.sku, m.warehouse_id, w.code AS wh_code,
+                   SUM(CASE WHEN m.delta > 0 THEN m.delta ELSE 0 END)  AS qty_in,
+                   SUM(CASE WHEN m.delta < 0 THEN -m.delta ELSE 0 END) AS qty_out,
+                   SUM(m.delta) AS net, COUNT(1) AS moves
+              FROM stock_moves m
+              JOIN products p   ON p.id = m.product_id
+              JOIN warehouses w ON w.id = m.warehouse_id
+             WHERE m.created_at >= ? AND m.created_at <= ?
+        """
+        params: list = [normalize_start(start), normalize_as_of(end)]
+        if warehouse_id is not None:
+            sql += " AND m.warehouse_id = ?"
+            params.append(int(warehouse_id))
+        sql += " GROUP BY m.product_id, p.sku, m.warehouse_id, w.code ORDER BY w.code, p.sku"
+        with self.db.read() as conn:
+            return [dict(r) for r in conn.execute(sql, tuple(params))]
+
+    def verify(self) -> list[dict]:
+        """对账：流水合计与 stocks 当前结存不一致的（商品, 仓库）。"""
+        with self.db.read() as conn:
+            return [dict(r) for r in conn.execute("""
+                SELECT s.product_id, s.warehouse_id, s.qty_on_hand,
+                       COALESCE(SUM(m.delta), 0) AS ledger_qty
+                  FROM stocks s
+                  LEFT JOIN stock_moves m
+                    ON m.product_id = s.product_id AND m.warehouse_id = s.warehouse_id
+                 GROUP BY s.product_id, s.warehouse_id
+                HAVING ABS(s.qty_on_hand - COALESCE(SUM(m.delta), 0)) > 1e-9
+            """)]
@@ -0,0 +1,128 @@
+# core/services/loans.py
+from __future__ import annotations
+from datetime import datetime
+
+from infra.db_interface import DB
+from core.services.outbox import enqueue
+
+
+def parse_scan_code(raw: str) -> str:
+    """
+    扫码内容 → SKU：
+    - SF1:<COMP>:<SKU>:<CHK> 取第 3 段
+    - 其他内容按 SKU 本身处理（去空白、转大写）
+    """
+    s = (raw or "").strip()
+    if s.startswith("SF1:"):
+        parts = s.split(":")
+        if len(parts) >= 4:
+            return parts[2].strip().upper()
+    return s.upper()
+
+
+class LoanService:
+    def __init__(self, db: DB):
+        self.db = db
+
+    def return_items(self, codes: list[str], loan_id: int | None = None, user: str | None = None) -> dict:
+        """
+        批量归还（一次请求处理整批扫码）：
+        1) 扫码内容统一解析为 SKU 并去重；
+        2) 一条 IN 查询找出对应的“未归还”明细（可限定某张借出单）；
+        3) 同一事务内：明细标记归还 → 商品恢复“在库” → 借出单重算归还件数/金额与状态；
+           给了 user 时同一事务记一条 loan_return 事件（发件箱）。
+        返回 {returned, items, not_found, orders}
+        """
+        sku_list = [parse_scan_code(c) for c in codes if (c or "").strip()]
+        sku_list = list(dict.fromkeys(s for s in sku_list if s))
+        if not sku_list:
+            return {"returned": 0, "items": [], "not_found": [], "orders": []}
+
+        now_local = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ph = ",".join(["?"] * len(sku_list))
+        sql = f"""
+            SELECT li.id, li.order_id, li.product_id, li.sku, li.price,
+                   lo.loan_no, lo.discount
+              FROM loan_items li
+              JOIN loan_orders lo ON lo.id = li.order_id
+             WHERE li.returned = 0
+               AND li.sku IN ({ph})
+        """
+        params: list = list(sku_list)
+        if loan_id is not None:
+            sql += " AND li.order_id = ?"
+            params.append(int(loan_id))
+        sql += " ORDER BY li.id"
+
+        def _job(conn):
+            rows = [dict(r) for r in conn.execute(sql, tuple(params)).fetchall()]
+            hit = {(r["sku"] or "").upper() for r in rows}
+            not_found = [s for s in sku_list if s not in hit]
+            if not rows:
+                return rows, not_found, []
+
+            item_ids = [int(r["id"]) for r in rows]
+            product_ids = list(dict.fromkeys(int(r["product_id"]) for r in rows))
+            order_ids = list(dict.fromkeys(int(r["order_id"]) for r in rows))
+            ph_items = ",".join(["?"] * len(item_ids))
+            ph_prods = ",".join(["?"] * len(product_ids))
+            ph_orders = ",".join(["?"] * len(order_ids))
+
+            # 明细：标记归还
+            conn.execute(f"""
+                UPDATE loan_items
+                   SET returned = 1, returned_at = ?
+                 WHERE id IN ({ph_items})
+            """, (now_local, *item_ids))
+
+            # 商品：借出 → 在库，清空借出方
+            conn.execute(f"""
+                UPDATE products
+                   SET status = '在库', borrower = NULL
+                 WHERE id IN ({ph_prods}) AND status = '借出'
+            """, tuple(product_ids))
+
+            # 借出单：按明细重算归还件数/折后金额
+            conn.execute(f"""
+                UPDATE loan_orders
+                   SET returned_qty = (SELECT COUNT(1) FROM loan_items li
+                                        WHERE li.order_id = loan_orders.id AND li.returned = 1),
+                       returned_amt = (SELECT COALESCE(SUM(CAST(ROUND(li.price * loan_orders.discount) AS INTEGER)), 0)
+                                         FROM loan_items li
+                                        WHERE li.order_id = loan_orders.id AND li.returned = 1)
+                 WHERE id IN ({ph_orders})
+            """, tuple(order_ids))
+
+            # 状态：全部归还 → 已归还（记录结单时间），否则部分归还
+            conn.execute(f"""
+                UPDATE loan_orders
+                   SET status    = CASE WHEN returned_qty >= total_qty THEN '已归还' ELSE '部分归还' END,
+                       closed_at = CASE WHEN returned_qty >= total_qty THEN ? ELSE NULL END
+                 WHERE id IN ({ph_orders})
+            """, (now_local, *order_ids))
+
+            orders = [dict(r) for r in conn.execute(f"""
+                SELECT id, loan_no, total_qty, returned_qty, returned_amt, status, closed_at
+                  FROM loan_orders
+                 WHERE id IN ({ph_orders})
+                 ORDER BY id
+            """, tuple(order_ids)).fetchall()]
+
+            if user is not None:
+                enqueue(conn, {
+                    "type": "loan_return",
+                    "loan_ids": [o["id"] for o in orders],
+                    "items": [r["sku"] for r in rows],
+                    "not_found": not_found,
+                    "user": user,
+                    "returned_at": now_local,
+                })
+            return rows, not_found, orders
+
+        rows, not_found, orders = self.db.run_write(_job)
+        items = [{
+            "sku": r["sku"], "product_id": r["product_id"],
+            "loan_id": r["order_id"], "loan_no": r["loan_no"],
+            "returned_at": now_local,
+        } for r in rows]
+        return {"returned": len(items), "items": items, "not_found": not_found, "orders": orders}
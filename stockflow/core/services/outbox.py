@@ -0,0 +1,176 @@
+# core/services/outbox.py
+# 事务性发件箱：路由在业务写事务里 enqueue(conn, event)，事件与业务数据一起提交或一起回滚；
+# OutboxExporter 后台线程按 id 顺序分批投递到各下游（export.event_logger 的 CSV/JSONL），
+# 每个下游一条游标：先写下游、再推进游标（至少一次），崩溃重启后从游标处继续。
+# 多 worker 共用一个库时，靠 outbox_cursors 上的租约保证同一下游同一时刻只有一个进程在导。
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from infra.storage import dialect_of
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+
+def enqueue(conn, event: dict) -> None:
+    """在调用方的写事务里记一条事件（event["type"] 为事件类型）。"""
+    dialect_of(conn).serialize_appends(conn, "outbox")
+    conn.execute(
+        "INSERT INTO outbox(kind, payload, created_at) VALUES (?, ?, ?)",
+        (event.get("type") or "", json.dumps(event, ensure_ascii=False, default=str),
+         datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+class OutboxExporter:
+    """
+    后台导出：每 poll_ms 醒来一次，把各下游游标之后的事件按批（batch 条）投递。
+    下游写失败时本批不推进，下一轮重试；所有下游都投递过的行随后删除。
+    """
+
+    def __init__(self, db, sinks: list, poll_ms: int = 500, batch: int = 500, lease_s: int = 30):
+        self.db = db
+        self.sinks = sinks
+        self.poll_s = max(0.0, poll_ms / 1000.0)
+        self.batch = max(1, int(batch))
+        self.lease_s = int(lease_s)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._purged = 0
+        self.exported = 0
+        self.errors = 0
+        self.last_error: str | None = None
+
+    def start(self):
+        if self.poll_s <= 0 or not self.sinks or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._loop, name="sf-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+            self._release()
+
+    def _loop(self):
+        while not self._stop.wait(self.poll_s):
+            try:
+                self.drain()
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.warning(f"outbox export failed: {e}")
+
+    # ====== 导出 ======
+    def drain(self) -> int:
+        """投递到各下游直到追平（或失去租约/下游出错）；返回本轮投递条数（按下游累计）。"""
+        n = 0
+        for sink in self.sinks:
+            n += self._drain_sink(sink)
+        self._purge()
+        return n
+
+    def _claim(self, sink: str) -> int | None:
+        """取得（或续期）该下游的租约，返回其游标；别的进程持有未过期租约时返回 None。"""
+        now = int(time.time())
+
+        def _job(conn):
+            conn.execute("INSERT INTO outbox_cursors(sink) VALUES (?) ON CONFLICT DO NOTHING", (sink,))
+            cur = conn.execute("""
+                UPDATE outbox_cursors SET owner = ?, lease_until = ?
+                 WHERE sink = ? AND (owner IS NULL OR owner = ? OR lease_until < ?)
+            """, (self.owner, now + self.lease_s, sink, self.owner, now))
+            if cur.rowcount != 1:
+                return None
+            return int(conn.execute("SELECT last_id FROM outbox_cursors WHERE sink = ?", (sink,)).fetchone()[0])
+
+        return self.db.run_write(_job)
+
+    def _drain_sink(self, sink) -> int:
+        # 已追平就不碰租约：空闲时不产生写事务
+        with self.db.read() as conn:
+            r = conn.execute("SELECT last_id FROM outbox_cursors WHERE sink = ?", (sink.name,)).fetchone()
+            top = conn.execute("SELECT MAX(id) FROM outbox").fetchone()[0]
+        if top is None or (r is not None and int(r[0]) >= int(top)):
+            return 0
+        last = self._claim(sink.name)
+        if last is None:
+            return 0
+        done = 0
+        while not self._stop.is_set():
+            with self.db.read() as conn:
+                rows = conn.execute(
+                    "SELECT id, payload, created_at FROM outbox WHERE id > ? ORDER BY id LIMIT ?",
+                    (last, self.batch)).fetchall()
+            if not rows:
+                break
+            try:
+                sink.write([(int(r[0]), r[2], json.loads(r[1])) for r in rows])
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{sink.name}: {e}"
+                logger.warning(f"outbox sink {sink.name} failed at id>{last}: {e}")
+                break
+            upto = int(rows[-1][0])
+            # 只有仍持有租约、且游标没被别人动过才推进；否则本批算重复投递，交给接手的进程
+            moved = self.db.run_write(lambda conn: conn.execute("""
+                UPDATE outbox_cursors SET last_id = ?, lease_until = ?
+                 WHERE sink = ? AND owner = ? AND last_id = ?
+            """, (upto, int(time.time()) + self.lease_s, sink.name, self.owner, last)).rowcount)
+            if moved != 1:
+                break
+            done += len(rows)
+            self.exported += len(rows)
+            last = upto
+            if len(rows) < self.batch:
+                break
+        return done
+
+    def _purge(self):
+        names = [s.name for s in self.sinks]
+        ph = ",".join(["?"] * len(names))
+        with self.db.read() as conn:
+            r = conn.execute(f"SELECT MIN(last_id), COUNT(1) FROM outbox_cursors WHERE sink IN ({ph})",
+                             tuple(names)).fetchone()
+        # 还有下游没建游标（从未投递过）时不清理
+        if r is None or r[0] is None or int(r[1]) < len(names):
+            return
+        upto = int(r[0])
+        if upto > self._purged:
+            self.db.run_write(lambda conn: conn.execute("DELETE FROM outbox WHERE id <= ?", (upto,)))
+            self._purged = upto
+
+    def _release(self):
+        """停机时放掉租约，别的 worker 不必等到期就能接手。"""
+        try:
+            self.db.run_write(lambda conn: conn.execute(
+                "UPDATE outbox_cursors SET owner = NULL, lease_until = 0 WHERE owner = ?", (self.owner,)))
+        except Exception as e:
+            logger.warning(f"outbox lease release failed: {e}")
+
+    def stats(self) -> dict:
+        with self.db.read() as conn:
+            cursors = {r[0]: {"last_id": int(r[1]), "owner": r[2], "lease_until": int(r[3])}
+                       for r in conn.execute("SELECT sink, last_id, owner, lease_until FROM outbox_cursors")}
+            rows = int(conn.execute("SELECT COUNT(1) FROM outbox").fetchone()[0])
+            pending = {s.name: int(conn.execute(
+                "SELECT COUNT(1) FROM outbox WHERE id > ?",
+                (cursors.get(s.name, {}).get("last_id", 0),)).fetchone()[0]) for s in self.sinks}
+        return {
+            "sinks": [s.name for s in self.sinks],
+            "owner": self.owner,
+            "rows": rows,
+            "pending": pending,
+            "cursors": cursors,
+            "exported": self.exported,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
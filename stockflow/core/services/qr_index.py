@@ -0,0 +1,282 @@
+# core/services/qr_index.py
+from __future__ import annotations
+import hmac
+import hashlib
+import os
+import threading
+from base64 import b32encode
+
+from infra.db_interface import DB
+from infra.storage import OperationalError
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+
+# ----------------------------
+# 载荷与校验码：SF1:<COMP>:<SKU>:<CHK>
+# ----------------------------
+def make_chk(secret: str, comp: str, sku: str) -> str:
+    """
+    计算 HMAC-SHA256 校验值，取前 6 个 base32 字符（约 30 bit），
+    足以防止误录与低概率冲突。
+    """
+    mac = hmac.new(
+        secret.encode("utf-8"),
+        f"{comp}|{sku}".encode("utf-8"),
+        hashlib.sha256,
+    ).digest()
+    return b32encode(mac)[:6].decode("ascii")
+
+
+def build_qr_payload(comp: str, sku: str, secret: str) -> str:
+    """
+    构建二维码载荷：SF1:<COMP>:<SKU>:<CHK>
+    """
+    chk = make_chk(secret, comp, sku)
+    return f"SF1:{comp}:{sku}:{chk}"
+
+
+def verify_qr_payload(payload: str, secret: str, company_code: str | None = None) -> tuple[str | None, str | None]:
+    """
+    离线校验载荷（不查库）。返回 (sku, None) 或 (None, 错误原因)。
+    company_code 给定时同时校验公司代码，防止扫到别家的标签。
+    """
+    parts = (payload or "").strip().split(":")
+    if len(parts) != 4 or parts[0] != "SF1" or not parts[1] or not parts[2]:
+        return None, "载荷格式错误"
+    _, comp, sku, chk = parts
+    if company_code and comp != company_code:
+        return None, "公司代码不符"
+    if not hmac.compare_digest(make_chk(secret, comp, sku), chk.upper()):
+        return None, "校验码错误"
+    return sku, None
+
+
+# ----------------------------
+# 内存索引：payload/SKU → 商品摘要
+# ----------------------------
+_INDEX_COLS = "id, sku, name, sale_price, category, spec, photo_path, status, borrower, qr_payload"
+
+
+def _summary(row) -> dict:
+    """与 outbound.html 的 PRODUCTS 条目同形，前端可直接合并。"""
+    pp = str(row["photo_path"] or "").replace("\\", "/")
+    return {
+        "id": row["id"],
+        "sku": row["sku"],
+        "name": row["name"] or "",
+        "price": int(row["sale_price"] or 0),
+        "category": row["category"] or "",
+        "spec": row["spec"] or "",
+        "photo": (f"/photos/{os.path.basename(pp)}" if pp else ""),
+        "status": row["status"] or "在库",
+        "borrower": row["borrower"] or "",
+        "qr_payload": row["qr_payload"] or "",
+    }
+
+
+class QrIndex:
+    """
+    进程内扫码索引：首次使用时整表装载一次，之后由写路径调用 refresh()/remove() 增量维护。
+    解析时先做 HMAC 离线校验，伪造/误录的载荷不会触达数据库。
+    listeners：refresh()/remove() 之后以 (变更后的摘要列表, 删除的 {id, sku} 列表) 回调（服务端推送用）。
+    多 worker 部署时别的进程改了商品，由失效总线调 invalidate()，下次使用前 sync() 按 row_version 增量对齐。
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.company_code: str | None = None
+        self._by_id: dict[int, dict] = {}
+        self._by_sku: dict[str, dict] = {}
+        self._by_payload: dict[str, dict] = {}
+        self._listeners: list = []
+        self._versions: dict[int, int | None] = {}     # id → row_version（旧库无此列时为 None）
+        self._stale = False
+        self._settings_stale = False
+        self._sync_lock = threading.Lock()      # 后台线程与读线程可能同时来同步，只让一个做
+        self.syncs = 0
+
+    def add_listener(self, fn):
+        self._listeners.append(fn)
+
+    def _notify(self, items: list[dict], removed: list[dict]):
+        for fn in self._listeners:
+            try:
+                fn(items, removed)
+            except Exception as e:
+                logger.warning(f"qr index listener failed: {e}")
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def ready(self) -> bool:
+        """已装载且没有待同步的外部变更：可以直接在事件循环里纯内存解析。"""
+        return self._loaded and not self._stale and not self._settings_stale
+
+    @staticmethod
+    def _select(conn, where: str = "", params: tuple = ()):
+        try:
+            return conn.execute(f"SELECT {_INDEX_COLS}, row_version FROM products {where}", params).fetchall()
+        except OperationalError:
+            # 旧库还没有 row_version 列（迁移 0012 之前）
+            return conn.execute(f"SELECT {_INDEX_COLS} FROM products {where}", params).fetchall()
+
+    def _put_row(self, row) -> dict:
+        item = _summary(row)
+        self._put(item)
+        self._versions[item["id"]] = row["row_version"] if "row_version" in row.keys() else None
+        return item
+
+    def ensure_loaded(self):
+        if self._loaded:
+            if self._stale or self._settings_stale:
+                self.sync()
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            with self.db.read() as conn:
+                rows = self._select(conn)
+                crow = conn.execute("SELECT value FROM settings WHERE key='company_code' LIMIT 1").fetchone()
+            self.company_code = ((crow["value"] if crow else "") or "").strip() or None
+            for r in rows:
+                self._put_row(r)
+            self._stale = self._settings_stale = False
+            self._loaded = True
+
+    # —— 跨进程失效 ——
+    def invalidate(self, tables=("products",)):
+        """失效总线回调（O(1)）：只做标记，真正的同步推迟到下次使用或后台线程。"""
+        if "settings" in tables or "*" in tables:
+            self._settings_stale = True
+        if "products" in tables or "*" in tables:
+            self._stale = True
+
+    def sync(self):
+        """
+        与库对齐：读 (id, row_version) 全表对比，只重读版本变了/新增的行，删掉库里没有的行。
+        变化照常经 refresh()/remove() 通知订阅者（别的 worker 的改动也能推给本 worker 的 SSE 连接）。
+        旧库没有 row_version 时退化为整表重载。
+        """
+        if not self._loaded:
+            return
+        with self._sync_lock:
+            self._sync()
+
+    def _sync(self):
+        if self._settings_stale:
+            self._settings_stale = False
+            with self.db.read() as conn:
+                crow = conn.execute("SELECT value FROM settings WHERE key='company_code' LIMIT 1").fetchone()
+            self.company_code = ((crow["value"] if crow else "") or "").strip() or None
+        if not self._stale:
+            return
+        # 先清标记再读：读的过程中又有新变化会重新标记，不会漏
+        self._stale = False
+        self.syncs += 1
+        try:
+            with self.db.read() as conn:
+                current = dict(conn.execute("SELECT id, row_version FROM products").fetchall())
+        except OperationalError:
+            with self._lock:
+                self._loaded = False
+                self._by_id.clear(); self._by_sku.clear(); self._by_payload.clear(); self._versions.clear()
+            self.ensure_loaded()
+            return
+        with self._lock:
+            known = dict(self._versions)
+        changed = [pid for pid, rv in current.items() if known.get(pid, -1) != rv]
+        gone = [pid for pid in known if pid not in current]
+        if changed or gone:
+            self.refresh(changed + gone)
+
+    def _put(self, item: dict):
+        old = self._by_id.get(item["id"])
+        if old:
+            self._by_sku.pop((old["sku"] or "").upper(), None)
+            if old["qr_payload"]:
+                self._by_payload.pop(old["qr_payload"], None)
+        self._by_id[item["id"]] = item
+        self._by_sku[(item["sku"] or "").upper()] = item
+        if item["qr_payload"]:
+            self._by_payload[item["qr_payload"]] = item
+
+    def refresh(self, product_ids):
+        """写路径提交后调用：按 id 重读这些商品（不存在的视为已删除）。"""
+        ids = [int(x) for x in product_ids]
+        # 索引未装载且没人订阅变化时无事可做（首次装载会读到最新数据）
+        if not ids or not (self._loaded or self._listeners):
+            return
+        ph = ",".join(["?"] * len(ids))
+        with self.db.read() as conn:
+            rows = self._select(conn, f"WHERE id IN ({ph})", tuple(ids))
+        items = [_summary(r) for r in rows]
+        seen = {it["id"] for it in items}
+        removed = []
+        with self._lock:
+            if self._loaded:
+                for r in rows:
+                    self._put_row(r)
+            for pid in ids:
+                if pid not in seen:
+                    removed.append(self._remove(pid))
+        self._notify(items, removed)
+
+    def load_missing(self, sku: str | None, payload: str | None = None) -> bool:
+        """索引里查不到时按 SKU/载荷回库补读一次（别的进程新增的商品）；找到返回 True。"""
+        with self.db.read() as conn:
+            row = conn.execute("SELECT id FROM products WHERE sku IN (?, ?) OR qr_payload=? LIMIT 1",
+                               (sku or "", (sku or "").upper(), payload or "")).fetchone()
+        if not row:
+            return False
+        self.refresh([row["id"]])
+        return True
+
+    def remove(self, product_id: int):
+        with self._lock:
+            gone = self._remove(int(product_id))
+        self._notify([], [gone])
+
+    def _remove(self, pid: int) -> dict:
+        self._versions.pop(pid, None)
+        old = self._by_id.pop(pid, None)
+        if old:
+            self._by_sku.pop((old["sku"] or "").upper(), None)
+            if old["qr_payload"]:
+                self._by_payload.pop(old["qr_payload"], None)
+        return {"id": pid, "sku": old["sku"] if old else None}
+
+    def resolve(self, codes: list[str], secret: str) -> list[dict]:
+        """
+        批量解析扫码内容：
+        - SF1 载荷：先离线校验 HMAC（索引已装载时同时校验公司代码），通过后按载荷（其次 SKU）查索引；
+        - 其他内容：按 SKU 查索引（verified=False）。
+        """
+        checked = []
+        for raw in codes:
+            code = (raw or "").strip()
+            if code.startswith("SF1:"):
+                sku, err = verify_qr_payload(code, secret, self.company_code)
+                checked.append((code, sku, err, True))
+            else:
+                checked.append((code, code.upper(), None if code else "内容为空", False))
+
+        if any(err is None for _, _, err, _ in checked):
+            self.ensure_loaded()
+
+        out = []
+        for code, sku, err, signed in checked:
+            if err:
+                out.append({"code": code, "ok": False, "error": err})
+                continue
+            item = (self._by_payload.get(code) if signed else None) or self._by_sku.get(sku.upper())
+            if not item:
+                out.append({"code": code, "ok": False, "sku": sku, "error": "商品不存在"})
+                continue
+            out.append({"code": code, "ok": True, "verified": signed, "sku": item["sku"], "product": item})
+        return out
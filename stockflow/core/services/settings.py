@@ -7,16 +7,16 @@ class SettingsService:
         self.db = db
 
     def get(self, key: str) -> str | None:
-        with self.db.connect() as conn:
+        with self.db.read() as conn:
             cur = conn.cursor()
             cur.execute("SELECT value FROM settings WHERE key=? LIMIT 1", (key,))
             row = cur.fetchone()
             return row["value"] if row else None
 
     def set(self, key: str, value: str):
-        with self.db.transaction() as conn:
-            conn.execute("INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-                         (key, value))
+        self.db.run_write(lambda conn: conn.execute(
+            "INSERT INTO settings(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+            (key, value)))
 
     def has_company_code(self) -> bool:
         return bool(self.get("company_code"))
@@ -1,5 +1,5 @@
 from pathlib import Path
-import csv, datetime
+import csv, datetime, json, os
 
 def append_event(base_dir: str, event: dict):
     Path(base_dir).mkdir(parents=True, exist_ok=True)
@@ -11,3 +11,64 @@ def append_event(base_dir: str, event: dict):
         if new_file:
             writer.writeheader()
         writer.writerow(event)
+
+# ====== 发件箱下游（core.services.outbox 的导出线程按批调用） ======
+# write(events) 收到按 id 升序的 [(event_id, created_at, event_dict)]；返回前须已落盘，
+# 抛异常则本批不算投递，下一轮从同一位置重试（至少一次：崩溃重启后可能重复，按 event_id 去重）。
+
+def _by_day(events):
+    days: dict[str, list] = {}
+    for ev_id, created_at, ev in events:
+        day = (created_at or "")[:10].replace("-", "") or datetime.datetime.now().strftime("%Y%m%d")
+        days.setdefault(day, []).append((ev_id, ev))
+    return days
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+class CsvSink:
+    """按天一个 flow_YYYYMMDD.csv（与 append_event 同格式，event_id 追加为最后一列，原有列位置不变）；日期取事件发生时间。"""
+    name = "csv"
+
+    def __init__(self, base_dir: str):
+        self.base_dir = Path(base_dir)
+
+    def write(self, events):
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        for day, rows in _by_day(events).items():
+            file = self.base_dir / f"flow_{day}.csv"
+            new_file = not file.exists()
+            with file.open("a", newline="", encoding="utf-8") as f:
+                for i, (ev_id, ev) in enumerate(rows):
+                    row = {**ev, "event_id": ev_id}
+                    writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+                    if new_file and i == 0:
+                        writer.writeheader()
+                    writer.writerow(row)
+                _sync(f)
+
+class JsonlSink:
+    """按天一个 flow_YYYYMMDD.jsonl，每行一个事件（含 event_id / created_at），便于下游程序解析。"""
+    name = "jsonl"
+
+    def __init__(self, base_dir: str):
+        self.base_dir = Path(base_dir)
+
+    def write(self, events):
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        by_id = {ev_id: created_at for ev_id, created_at, _ in events}
+        for day, rows in _by_day(events).items():
+            with (self.base_dir / f"flow_{day}.jsonl").open("a", encoding="utf-8") as f:
+                for ev_id, ev in rows:
+                    f.write(json.dumps({"event_id": ev_id, "created_at": by_id[ev_id], **ev},
+                                       ensure_ascii=False, default=str) + "\n")
+                _sync(f)
+
+SINKS = {"csv": CsvSink, "jsonl": JsonlSink}
+
+def make_sinks(names, base_dir: str) -> list:
+    unknown = [n for n in names if n not in SINKS]
+    if unknown:
+        raise ValueError(f"unknown outbox sink(s): {', '.join(unknown)}")
+    return [SINKS[n](base_dir) for n in dict.fromkeys(names)]
@@ -0,0 +1,428 @@
+# export/label_pdf.py
+# 标签 PDF：与 labels_print.html 相同的 A4 网格/半页布局，服务端直接排版成矢量 PDF。
+# - 二维码画成原生矩形路径（同一行相邻的黑模块合并为一个矩形），不依赖浏览器取 SVG；
+# - 字号收敛规则照搬打印页的 fitDown（0.25pt 步长），宽度按字体度量表计算，结果确定、可缓存；
+# - 按页生成并逐页输出（内容流 zlib 压缩），几百张标签也不必整份放进内存再发。
+# 坐标：页面先做 mm→pt 缩放，之后一律以 mm 为单位、原点在左下角。
+from __future__ import annotations
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, astuple
+from functools import lru_cache
+
+PAGE_W, PAGE_H = 210.0, 297.0
+_MM_PER_PT = 25.4 / 72.0
+_PT_PER_MM = 72.0 / 25.4
+
+# Helvetica / Helvetica-Bold 的 ASCII 32..126 字宽（1/1000 em，标准 AFM）
+_HELV = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELV_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+
+# 字体资源名 → (度量表 | None=CJK)
+_F_REGULAR, _F_BOLD, _F_CJK = "F1", "F2", "F3"
+
+# 各 font_mode 的起始（最大）字号 pt：(信息半, 金额, SKU)；auto 与打印页 JS 的 data-max 一致
+_FONT_MAX = {
+    "auto":   (12.0, 12.0, 9.0),
+    "small":  (7.0, 9.0, 6.0),
+    "medium": (8.0, 10.0, 7.0),
+    "large":  (9.0, 11.0, 8.0),
+}
+_FONT_MIN = (6.0, 6.0, 5.0)
+_LINE_H = 1.2
+
+
+@dataclass(frozen=True)
+class LabelLayout:
+    """与 /labels/print 的查询参数一一对应（单位 mm）。"""
+    w: float = 30.0
+    h: float = 30.0
+    margin_top: float = 10.0
+    margin_right: float = 10.0
+    margin_bottom: float = 10.0
+    margin_left: float = 10.0
+    gap_x: float = 2.0
+    gap_y: float = 2.0
+    start_row: int = 1
+    start_col: int = 1
+    show_category: int = 1
+    show_detail: int = 1
+    show_weight: int = 1
+    font_mode: str = "auto"
+
+    @property
+    def cols(self) -> int:
+        inner_w = PAGE_W - self.margin_left - self.margin_right
+        return max(1, int((inner_w + self.gap_x) // (self.w + self.gap_x)))
+
+    @property
+    def rows(self) -> int:
+        inner_h = PAGE_H - self.margin_top - self.margin_bottom
+        return max(1, int((inner_h + self.gap_y) // (self.h + self.gap_y)))
+
+    @property
+    def start_skip(self) -> int:
+        return (max(1, self.start_row) - 1) * self.cols + (max(1, self.start_col) - 1)
+
+
+# ====== 文本度量与换行 ======
+def _is_latin(s: str) -> bool:
+    try:
+        s.encode("cp1252")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def _char_w(ch: str, font: str) -> float:
+    """单字宽（em）。CJK 字体里 ASCII 按 0.5em（与 /W 声明一致），其余全角 1em。"""
+    o = ord(ch)
+    if font == _F_CJK:
+        return 0.5 if 32 <= o <= 126 else 1.0
+    table = _HELV_BOLD if font == _F_BOLD else _HELV
+    if 32 <= o <= 126:
+        return table[o - 32] / 1000.0
+    return 0.556   # ¥ 等 WinAnsi 扩展字符：按数字宽度
+
+
+def text_width(s: str, font: str, size_mm: float) -> float:
+    return sum(_char_w(c, font) for c in s) * size_mm
+
+
+def _wrap(text: str, font: str, size_mm: float, max_w: float) -> list[str]:
+    """pre-wrap + break-word：保留换行符，优先在空格处/连字符后断行，单词过长时逐字断开。"""
+    out: list[str] = []
+    for para in text.split("\n"):
+        line, line_w = "", 0.0
+        brk, drop = -1, 0        # 可断点位置；drop=1 表示断点处是空格（断开后丢弃）
+        for ch in para:
+            cw = _char_w(ch, font) * size_mm
+            if line and line_w + cw > max_w:
+                if ch == " ":
+                    out.append(line)
+                    line, line_w, brk = "", 0.0, -1
+                    continue
+                if 0 < brk < len(line) + drop:
+                    out.append(line[:brk])
+                    line = line[brk + drop:]
+                else:
+                    out.append(line)
+                    line = ""
+                line_w = text_width(line, font, size_mm)
+                brk = -1
+            if ch == " ":
+                brk, drop = len(line), 1
+            line += ch
+            line_w += cw
+            if ch == "-":
+                brk, drop = len(line), 0
+        out.append(line)
+    return out
+
+
+def _fit_block(lines: list[str], font: str, max_w: float, max_h: float,
+               max_pt: float, min_pt: float) -> tuple[float, list[str]]:
+    """多行块：从 max_pt 每次降 0.25pt，直到换行后总高不超过 max_h 且没有超宽（到 min_pt 为止）。"""
+    pt = max_pt
+    while True:
+        size = pt * _MM_PER_PT
+        wrapped = [w for ln in lines for w in _wrap(ln, font, size, max_w)]
+        too_high = len(wrapped) * size * _LINE_H > max_h + 1e-6
+        too_wide = any(text_width(w, font, size) > max_w + 1e-6 for w in wrapped)
+        if (not too_high and not too_wide) or pt <= min_pt:
+            return pt, wrapped
+        pt = max(min_pt, pt - 0.25)
+
+
+def _fit_line(text: str, font: str, max_w: float, max_pt: float, min_pt: float) -> tuple[float, bool]:
+    """单行：返回 (字号, 是否放得下)。"""
+    pt = max_pt
+    while text_width(text, font, pt * _MM_PER_PT) > max_w + 1e-6:
+        if pt <= min_pt:
+            return min_pt, False
+        pt = max(min_pt, pt - 0.25)
+    return pt, True
+
+
+# ====== 二维码 ======
+@lru_cache(maxsize=20000)
+def _qr_runs(payload: str) -> tuple[int, tuple]:
+    """返回 (模块数, ((行, 起列, 长度), ...))；同一载荷的矩阵只算一次。"""
+    import qrcode
+    qr = qrcode.QRCode(border=1, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        n = len(row)
+        while x < n:
+            if row[x]:
+                x0 = x
+                while x < n and row[x]:
+                    x += 1
+                runs.append((y, x0, x - x0))
+            else:
+                x += 1
+    return len(matrix), tuple(runs)
+
+
+def _qr_ops(payload: str, x: float, y: float, side: float) -> str:
+    n, runs = _qr_runs(payload)
+    m = side / n
+    top = y + side
+    parts = ["0 g"]
+    for ry, rx, rl in runs:
+        parts.append(f"{x + rx * m:.3f} {top - (ry + 1) * m:.3f} {rl * m:.3f} {m:.3f} re")
+    parts.append("f")
+    return "\n".join(parts)
+
+
+# ====== 内容流 ======
+def _pdf_text(s: str, font: str) -> str:
+    if font == _F_CJK:
+        # UniGB-UCS2-H：UTF-16BE 码元（BMP 以外替换为 ?）
+        return "<" + "".join(f"{(ord(c) if ord(c) < 0x10000 else 0x3F):04X}" for c in s) + ">"
+    raw = s.encode("cp1252", errors="replace")
+    return "(" + raw.decode("latin-1").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _text_op(s: str, font: str, size_mm: float, x: float, baseline: float) -> str:
+    return f"BT /{font} {size_mm:.3f} Tf {x:.3f} {baseline:.3f} Td {_pdf_text(s, font)} Tj ET"
+
+
+def _lines_ops(lines: list[str], font: str, size_mm: float, x0: float, width: float,
+               top: float, align: str) -> list[str]:
+    ops = []
+    lh = size_mm * _LINE_H
+    for i, ln in enumerate(lines):
+        if not ln:
+            continue
+        x = x0 + (width - text_width(ln, font, size_mm)) / 2 if align == "center" else x0
+        # 行盒高 1.2em，基线约在行顶下方 0.9em 处
+        ops.append(_text_op(ln, font, size_mm, x, top - i * lh - 0.9 * size_mm))
+    return ops
+
+
+def _cell_ops(r: dict, layout: LabelLayout) -> str:
+    """单张标签（原点在标签左下角）。"""
+    W, H = layout.w, layout.h
+    hh = H / 2 - 1.0                       # 半页高度（与打印页 calc(50% - 1mm) 相同）
+    info_max, price_max, sku_max = _FONT_MAX.get(layout.font_mode, _FONT_MAX["auto"])
+    info_min, price_min, sku_min = _FONT_MIN
+    ops = [
+        "0 G 0.2 w",
+        f"0 0 {W:.3f} {H:.3f} re S",
+        f"0.85 G [0.6 0.6] 0 d 1 {H / 2:.3f} m {W - 1:.3f} {H / 2:.3f} l S [] 0 d 0 G",
+    ]
+
+    # —— 上半：信息块，旋转 180°（对折后朝外） ——
+    info = []
+    if layout.show_category == 1 and r.get("category"):
+        info.append(str(r["category"]))
+    if layout.show_detail == 1 and r.get("detail"):
+        info.append(str(r["detail"]))
+    if layout.show_weight == 1 and r.get("weight_fmt"):
+        info.append(str(r["weight_fmt"]))
+    if info:
+        inner_w = W - 2.0
+        pt, wrapped = _fit_block(info, _F_CJK, inner_w, hh, info_max, info_min)
+        size = pt * _MM_PER_PT
+        block_h = len(wrapped) * size * _LINE_H
+        top = hh - max(0.0, (hh - block_h) / 2)
+        ops.append(f"q -1 0 0 -1 {W:.3f} {H:.3f} cm 0 g")
+        ops += _lines_ops(wrapped, _F_CJK, size, 1.0, inner_w, top, "center")
+        ops.append("Q")
+
+    # —— 下半：二维码 + 金额/SKU ——
+    price = f"¥{r['price_fmt']}"
+    price_font = _F_BOLD if _is_latin(price) else _F_CJK
+    scale = 1.0
+    side = hh
+    text_w = W - 2.0 - side - 1.0
+    price_pt, ok = _fit_line(price, price_font, text_w, price_max, price_min)
+    # 金额放不下：二维码按 5% 缩小（不小于 10mm、不低于 50%），给文字腾宽度
+    while not ok and scale > 0.5 + 1e-9 and side > 10.0 + 1e-9:
+        scale -= 0.05
+        side = hh * scale
+        text_w = W - 2.0 - side - 1.0
+        price_pt, ok = _fit_line(price, price_font, text_w, price_max, price_min)
+
+    ops.append(_qr_ops(r["qr_payload"], 1.0, hh - side, side))
+
+    x_text = 1.0 + side + 1.0
+    price_size = price_pt * _MM_PER_PT
+    ops += ["0 g"] + _lines_ops([price], price_font, price_size, x_text, text_w, hh, "left")
+
+    sku = str(r.get("sku") or "")
+    sku_font = _F_REGULAR if _is_latin(sku) else _F_CJK
+    remain_h = hh - price_size * _LINE_H
+    sku_pt, sku_lines = _fit_block([sku], sku_font, text_w, remain_h, sku_max, sku_min)
+    ops += _lines_ops(sku_lines, sku_font, sku_pt * _MM_PER_PT, x_text, text_w,
+                      hh - price_size * _LINE_H, "left")
+    return "\n".join(ops)
+
+
+def _page_ops(cells: list[tuple[int, dict]], layout: LabelLayout) -> bytes:
+    ops = [f"{_PT_PER_MM:.6f} 0 0 {_PT_PER_MM:.6f} 0 0 cm"]
+    cols = layout.cols
+    for slot, r in cells:
+        row, col = divmod(slot, cols)
+        x = layout.margin_left + col * (layout.w + layout.gap_x)
+        y = PAGE_H - layout.margin_top - row * (layout.h + layout.gap_y) - layout.h
+        ops.append(f"q 1 0 0 1 {x:.3f} {y:.3f} cm")
+        ops.append(_cell_ops(r, layout))
+        ops.append("Q")
+    return "\n".join(ops).encode("latin-1")
+
+
+def paginate(rows: list[dict], layout: LabelLayout) -> list[list[tuple[int, dict]]]:
+    """按网格分页：首页跳过 start_row/start_col 之前的格子，之后每页从第一格开始。"""
+    per_page = layout.cols * layout.rows
+    pages: list[list[tuple[int, dict]]] = []
+    slot = min(layout.start_skip, per_page - 1)
+    cur: list[tuple[int, dict]] = []
+    for r in rows:
+        cur.append((slot, r))
+        slot += 1
+        if slot >= per_page:
+            pages.append(cur)
+            cur, slot = [], 0
+    if cur:
+        pages.append(cur)
+    return pages
+
+
+# ====== PDF 封装（逐页输出） ======
+_FONT_OBJS = {
+    3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    4: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    # 中文用阅读器内置的 Adobe-GB1 字体（不嵌入），ASCII 固定 0.5em 宽，与度量一致
+    5: b"<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H /DescendantFonts [6 0 R] >>",
+    6: (b"<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light"
+        b" /CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >>"
+        b" /FontDescriptor 7 0 R /DW 1000 /W [1 95 500] >>"),
+    7: (b"<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [-25 -254 1000 880]"
+        b" /ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>"),
+}
+_RESOURCES = b"<< /Font << /F1 3 0 R /F2 4 0 R /F3 5 0 R >> >>"
+
+
+def iter_pdf(rows: list[dict], layout: LabelLayout):
+    """
+    生成器：逐块产出 PDF 字节。rows 需已带 price_fmt / weight_fmt / qr_payload。
+    对象号：1=Catalog 2=Pages 3..7=字体，之后每页（内容流, Page）各占一个号；Pages 最后写出。
+    """
+    offset = 0
+    xref: dict[int, int] = {}
+
+    def obj(num: int, body: bytes) -> bytes:
+        nonlocal offset
+        xref[num] = offset
+        data = b"%d 0 obj\n" % num + body + b"\nendobj\n"
+        offset += len(data)
+        return data
+
+    head = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    offset = len(head)
+    yield head
+    yield b"".join(obj(n, body) for n, body in _FONT_OBJS.items())
+
+    kids = []
+    next_num = 8
+    for cells in paginate(rows, layout) or [[]]:
+        content = zlib.compress(_page_ops(cells, layout), 6)
+        c_num, p_num = next_num, next_num + 1
+        next_num += 2
+        kids.append(p_num)
+        yield (obj(c_num, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+               + obj(p_num, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595.276 841.89]"
+                            b" /Resources " + _RESOURCES + b" /Contents %d 0 R >>" % c_num))
+
+    tail = obj(2, b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids)
+               + b"] /Count %d >>" % len(kids))
+    tail += obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    xref_at = offset
+    tail += b"xref\n0 %d\n0000000000 65535 f \n" % next_num
+    tail += b"".join(b"%010d 00000 n \n" % xref[n] for n in range(1, next_num))
+    tail += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (next_num, xref_at)
+    yield tail
+
+
+def cache_key(layout: LabelLayout, rows: list[dict], company_code: str) -> str:
+    """id 集合 + 各行 row_version（内容变了键就变）+ 版式参数 + 公司代码。"""
+    ident = [(r["id"], r.get("row_version"), r.get("qr_payload")) for r in rows]
+    raw = repr((astuple(layout), ident, company_code))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class PdfCache:
+    """按字节数限额的 LRU：缓存整份生成好的 PDF。"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self._data: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key: str, val: bytes):
+        if len(val) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._data[key] = val
+            self._size += len(val)
+            while self._size > self.max_bytes:
+                _, ev = self._data.popitem(last=False)
+                self._size -= len(ev)
+
+    def tee(self, key: str, chunks):
+        """边输出边攒整份，正常结束才入缓存（客户端中途断开不缓存半份）。"""
+        buf = []
+        for c in chunks:
+            buf.append(c)
+            yield c
+        self.put(key, b"".join(buf))
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
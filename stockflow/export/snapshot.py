@@ -5,7 +5,7 @@ def snapshot_stocks_to_csv_gz(db, out_dir: str):
     Path(out_dir).mkdir(parents=True, exist_ok=True)
     stamp = datetime.datetime.now().strftime("%Y%m%d")
     out = Path(out_dir) / f"stocks_{stamp}.csv.gz"
-    with db.connect() as conn, gzip.open(out, "wt", newline="", encoding="utf-8") as f:
+    with db.read() as conn, gzip.open(out, "wt", newline="", encoding="utf-8") as f:
         cur = conn.cursor()
         cur.execute("""
           SELECT s.product_id, s.warehouse_id, s.qty_on_hand, s.qty_reserved,
@@ -1,15 +1,152 @@
 from pathlib import Path
+import os
 import sqlite3
+import threading
+import time
 from contextlib import contextmanager
 from utils.logging import setup_logger
+from utils.metrics import record_db
+from infra.sqltrace import SqlTracer
+from infra.storage import SQLITE, OperationalError, has_column
 
 logger = setup_logger()
 
+
+# —— 计时连接：每条 SQL 的条数/耗时记入当前请求（utils.metrics），开启追踪时同时交给 SqlTracer ——
+_tracer = None   # infra.sqltrace.SqlTracer；None = 未开启
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def _observe(conn, sql, parameters, elapsed: float, failed: bool):
+    record_db(elapsed)
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(conn, sql, parameters, elapsed, failed)
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            res = super().execute(sql, parameters)
+            failed = False
+            return res
+        finally:
+            _observe(self.connection, sql, parameters, time.perf_counter() - t0, failed)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            res = super().executemany(sql, seq_of_parameters)
+            failed = False
+            return res
+        finally:
+            # executemany 没有单组参数可供 EXPLAIN，只做计数
+            _observe(self.connection, sql, (), time.perf_counter() - t0, failed)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.connect(..., factory=TimedConnection)；conn.execute() 与 cursor().execute() 都会计时。"""
+
+    dialect = SQLITE
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def stream(self, sql, parameters=(), chunk: int = 1000):
+        """逐行迭代大结果集；SQLite 游标本身就是按步取行，直接迭代即可（PostgreSQL 引擎用服务端游标）。"""
+        return self.execute(sql, parameters)
+
+
+class SqliteTuning:
+    """
+    每条连接打开时执行的 PRAGMA（配置 performance.sqlite_* / busy_timeout_ms）：
+    - synchronous：WAL 下 NORMAL 不会损坏库，只是断电时可能丢最后几个事务，提交少一次 fsync；
+    - cache_size：每条连接的页缓存（读连接按请求新开，跨请求复用靠 mmap 映射的系统页缓存）；
+    - mmap_size：读直接走内存映射，省掉 read() 拷贝；
+    - temp_store：排序/临时表放内存；busy_timeout：撞上写锁/检查点时等待而不是立刻报 SQLITE_BUSY。
+    """
+
+    _SYNC = ("OFF", "NORMAL", "FULL", "EXTRA")
+    _TEMP = ("DEFAULT", "FILE", "MEMORY")
+
+    def __init__(self, synchronous: str = "NORMAL", cache_mb: float = 16, mmap_mb: float = 256,
+                 temp_store: str = "MEMORY", busy_timeout_ms: int = 5000):
+        self.synchronous = str(synchronous).upper()
+        self.temp_store = str(temp_store).upper()
+        if self.synchronous not in self._SYNC:
+            raise ValueError(f"sqlite_synchronous must be one of {self._SYNC}")
+        if self.temp_store not in self._TEMP:
+            raise ValueError(f"sqlite_temp_store must be one of {self._TEMP}")
+        self.cache_kib = int(float(cache_mb) * 1024)
+        self.mmap_bytes = int(float(mmap_mb) * 1024 * 1024)
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        # executescript 执行：不经过 TimedConnection.execute，不计入请求的 SQL 条数
+        self.script = (
+            f"PRAGMA synchronous = {self.synchronous};"
+            f"PRAGMA cache_size = -{self.cache_kib};"
+            f"PRAGMA mmap_size = {self.mmap_bytes};"
+            f"PRAGMA temp_store = {self.temp_store};"
+            f"PRAGMA busy_timeout = {self.busy_timeout_ms};"
+        )
+
+    @classmethod
+    def from_config(cls, perf: dict) -> "SqliteTuning":
+        return cls(perf["sqlite_synchronous"], perf["sqlite_cache_mb"], perf["sqlite_mmap_mb"],
+                   perf["sqlite_temp_store"], perf["busy_timeout_ms"])
+
+    def apply(self, conn):
+        conn.executescript(self.script)
+
+    def as_dict(self) -> dict:
+        return {"synchronous": self.synchronous, "cache_kib": self.cache_kib, "mmap_bytes": self.mmap_bytes,
+                "temp_store": self.temp_store, "busy_timeout_ms": self.busy_timeout_ms}
+
+
 class DB:
-    def __init__(self, db_path: str):
+    dialect = SQLITE
+
+    def __init__(self, db_path: str, tuning: SqliteTuning | None = None):
         self.db_path = db_path
+        self.writer = None   # infra.writer.WriteQueue，挂上后写操作统一交给写线程
+        self.tuning = tuning or SqliteTuning()
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         self._ensure_pragmas()
+        # 只读连接走 URI：mode=ro 在打开层面拒绝写入
+        self._ro_uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+
+    def attach_writer(self, writer):
+        self.writer = writer
+        if writer.tuning is None:
+            writer.tuning = self.tuning   # 写线程的连接用同一套 PRAGMA
+        writer.start()
+
+    def run_write(self, fn):
+        """
+        执行写任务 fn(conn) 并返回其结果：
+        挂了写线程时排队合并提交；否则（CLI/启动阶段）退化为一次普通事务。
+        fn 内不要自行 commit。
+        """
+        if self.writer is not None:
+            return self.writer.call(fn)
+        with self.transaction() as conn:
+            return fn(conn)
 
     def _ensure_pragmas(self):
         with self.connect() as conn:
@@ -20,13 +157,130 @@ class DB:
 
     @contextmanager
     def connect(self):
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, factory=TimedConnection)
         conn.row_factory = sqlite3.Row
+        self.tuning.apply(conn)
         try:
             yield conn
         finally:
             conn.close()
 
+    @contextmanager
+    def read(self):
+        """
+        只读连接（纯查询用）：mode=ro + query_only 双保险。
+        WAL 下读者只看自己开始时的快照，既不等待写线程，也不会持有写锁。
+        """
+        conn = sqlite3.connect(self._ro_uri, uri=True, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        self.tuning.apply(conn)
+        conn.execute("PRAGMA query_only = ON;")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def open_probe(self):
+        """ChangeTracker 常驻的探测连接：不走 TimedConnection（每个请求都会来问一次，计入请求 SQL 统计只会是噪音）。"""
+        conn = sqlite3.connect(self._ro_uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON;")
+        return conn
+
+    @staticmethod
+    def data_version(conn) -> int:
+        # 别的连接提交后才会变，不产生任何 I/O
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def checkpoint(self, mode: str = "PASSIVE") -> dict:
+        """
+        手动 WAL 检查点（独立连接，不经过写线程）：
+        PASSIVE 不等待读写者；RESTART/TRUNCATE 会等待读者结束后重置 WAL。
+        """
+        mode = mode.upper()
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"unknown checkpoint mode: {mode}")
+        t0 = time.perf_counter()
+        with self.connect() as conn:
+            busy, log, done = conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+        return {"mode": mode, "busy": busy, "wal_pages": log, "checkpointed": done,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+    # —— 存储维护（infra.maintenance 定时调用） ——
+    def storage_stats(self) -> dict:
+        """库文件/WAL 大小与空闲页比例（碎片化程度）；只读查询，不加锁。"""
+        with self.read() as conn:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        wal = Path(self.db_path + "-wal")
+        return {
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist,
+            "free_ratio": round(freelist / page_count, 4) if page_count else 0.0,
+            "db_bytes": page_size * page_count,
+            "wal_bytes": wal.stat().st_size if wal.exists() else 0,
+            "auto_vacuum": ("none", "full", "incremental")[auto_vacuum] if auto_vacuum in (0, 1, 2) else auto_vacuum,
+        }
+
+    def optimize(self) -> dict:
+        """
+        更新查询规划器统计：从没分析过的库先做一次有上限的 ANALYZE（analysis_limit 控制每个索引的采样行数），
+        之后交给 PRAGMA optimize 只重算变化大的表。
+        """
+        t0 = time.perf_counter()
+        with self.connect() as conn:
+            conn.execute("PRAGMA analysis_limit = 1000;")
+            first = not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sqlite_stat1'").fetchone()
+            if first:
+                conn.execute("ANALYZE;")
+            conn.execute("PRAGMA optimize;")
+            conn.commit()
+        return {"analyze": first, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+    def vacuum(self, max_pages: int = 0) -> dict:
+        """
+        回收空闲页：auto_vacuum=INCREMENTAL 的库做 incremental_vacuum（max_pages=0 为全部）；
+        否则做一次完整 VACUUM，并顺带把库切到 INCREMENTAL，以后只需增量回收。
+        完整 VACUUM 重写整个库文件、期间一直持有写锁：后台调度只对小库做（vacuum_full_max_mb），
+        大库用 CLI `vacuum --full` 在停机窗口切换。
+        """
+        t0 = time.perf_counter()
+        before = self.storage_stats()
+        with self.connect() as conn:
+            if before["auto_vacuum"] == "incremental":
+                # execute() 只单步一次（只回收一页），executescript 会一直执行到完成
+                conn.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+                mode = "incremental"
+            else:
+                logger.warning(f"VACUUM: switching auto_vacuum {before['auto_vacuum']} -> incremental, "
+                               f"rewriting {before['db_bytes']} bytes; writes wait until done ({self.db_path})")
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+                conn.execute("VACUUM;")
+                mode = "full"
+            conn.commit()
+        after = self.storage_stats()
+        if mode == "full":
+            logger.warning(f"VACUUM: auto_vacuum is now {after['auto_vacuum']}, "
+                           f"{before['db_bytes']} -> {after['db_bytes']} bytes in {time.perf_counter() - t0:.1f}s")
+        return {"mode": mode, "freed_pages": before["page_count"] - after["page_count"],
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+    # —— SQL 追踪（按需开启；进程内所有连接共用一个聚合器） ——
+    def enable_trace(self, slow_ms: float = 50.0) -> SqlTracer:
+        tracer = get_tracer()
+        if tracer is None:
+            tracer = SqlTracer(slow_ms)
+            set_tracer(tracer)
+        else:
+            tracer.slow = float(slow_ms) / 1000.0
+        return tracer
+
+    def disable_trace(self):
+        set_tracer(None)
+
     @contextmanager
     def transaction(self):
         with self.connect() as conn:
@@ -38,7 +292,125 @@ class DB:
                 logger.error(f"DB transaction rollback: {e}")
                 raise
 
+class Checkpointer:
+    """
+    后台定时检查点：写线程关闭自动检查点（wal_autocheckpoint=0）后由这里按固定间隔做 PASSIVE，
+    WAL 过大（超过 truncate_pages）时改做 TRUNCATE 收缩文件。
+    """
+
+    def __init__(self, db: DB, interval_s: float, truncate_pages: int = 10000):
+        self.db = db
+        self.interval_s = float(interval_s)
+        self.truncate_pages = int(truncate_pages)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.runs = 0
+        self.last: dict | None = None
+
+    def start(self):
+        if self.interval_s <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._loop, name="sf-checkpoint", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                res = self.db.checkpoint("PASSIVE")
+                if res["wal_pages"] > self.truncate_pages:
+                    res = self.db.checkpoint("TRUNCATE")
+                self.runs += 1
+                self.last = res
+            except sqlite3.Error as e:
+                logger.warning(f"checkpoint failed: {e}")
+
+    def stats(self) -> dict:
+        return {"interval_s": self.interval_s, "runs": self.runs, "last": self.last}
+
+class ChangeTracker:
+    """
+    廉价的“数据变了没”令牌：常驻一条只读探测连接，先看 db.data_version()
+    （SQLite 为 PRAGMA data_version；PostgreSQL 为各表版本号之和），变了才重读 table_versions（迁移 0013 的触发器维护）。
+    未迁移的旧库退化为只用 data_version（所有表共用一个版本号）。
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self._versions: dict[str, tuple[int, int]] = {}
+        self.checks = 0
+        self.reloads = 0
+
+    def versions(self, blocking: bool = True) -> dict[str, tuple[int, int]] | None:
+        """
+        {表名: (version, changed_at epoch 秒)}；返回的是内部快照，调用方不要修改。
+        blocking=False 时别的线程正在查（如后台轮询在重读）就不等，返回 None。
+        """
+        if not self._lock.acquire(blocking):
+            return None
+        try:
+            self.checks += 1
+            try:
+                if self._conn is None:
+                    self._conn = self.db.open_probe()
+                dv = self.db.data_version(self._conn)
+                if dv != self._data_version:
+                    try:
+                        rows = self._conn.execute(
+                            "SELECT name, version, changed_at FROM table_versions").fetchall()
+                        self._versions = {r[0]: (int(r[1]), int(r[2] or 0)) for r in rows}
+                    except OperationalError:
+                        self._versions = {"*": self._file_version(dv)}
+                    self._data_version = dv
+                    self.reloads += 1
+            except Exception as e:
+                logger.warning(f"change tracker failed: {e}")
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn, self._data_version = None, None
+                raise
+            return self._versions
+        finally:
+            self._lock.release()
+
+    def _file_version(self, dv: int) -> tuple[int, int]:
+        """
+        未迁移 0013 的旧库：SQLite 的 data_version 只是本连接的计数，各进程的值不可比（会误判 304），
+        改用库文件与 WAL 的大小/修改时间作版本，所有进程看到的都一样。
+        """
+        path = getattr(self.db, "db_path", None)
+        if not path:
+            return int(dv), int(time.time())
+        sig, newest = [], 0
+        for p in (path, path + "-wal"):
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            sig += [st.st_size, st.st_mtime_ns]
+            newest = max(newest, int(st.st_mtime))
+        return hash(tuple(sig)) & 0x7FFFFFFF, newest
+
+    def token(self, tables) -> tuple[tuple, int]:
+        """返回 (各表版本元组, 最近变更时间)；表不在计数表里时用 "*" 兜底。"""
+        vs = self.versions()
+        picked = tuple(vs.get(t) or vs.get("*") or (0, 0) for t in tables)
+        return tuple(v for v, _ in picked), max((ts for _, ts in picked), default=0)
+
+    def stats(self) -> dict:
+        return {"checks": self.checks, "reloads": self.reloads,
+                "tables": {k: v[0] for k, v in self._versions.items()}}
+
 def run_migrations(db: DB):
+    # PostgreSQL 引擎有自己的一套建表脚本（infra/migrations/pg/），按版本表逐个执行
+    if db.dialect is not SQLITE:
+        db.migrate()
+        return
     # 仅执行一次的简易迁移：检测基础表是否存在，不存在就执行 0001
     with db.connect() as conn:
         cur = conn.cursor()
@@ -52,3 +424,126 @@ def run_migrations(db: DB):
         sql = sql_path.read_text(encoding="utf-8")
         cur.executescript(sql)
         conn.commit()
+
+
+def migrate_all(db: DB):
+    """
+    完整迁移（服务端、CLI、扫码常驻进程共用）：基础表 → 按序执行 infra/migrations 下的各个脚本 → 兜底补列/索引。
+    各脚本都是幂等的，重复执行无副作用。PostgreSQL 的建表脚本（infra/migrations/pg）已是完整结构，只走 run_migrations。
+    """
+    run_migrations(db)
+    if db.dialect is not SQLITE:
+        return
+
+    files_in_order = [
+        "0002_auth.sql",
+        "0003_product_photo.sql",
+        "0004_product_extra.sql",
+        "0005_product_tax.sql",
+        "0006_product_remark.sql",
+        "0007_settings.sql",
+        "0008_sku_qr.sql",
+        "0009_label_print.sql",
+        "0010_loans.sql",          # ✅ 新增
+        "0011_loan_returns.sql",   # 借出单归还字段
+        "0012_product_row_version.sql",  # 商品行版本号（片段缓存键）
+        "0013_table_versions.sql",       # 按表变更计数（列表页 ETag）
+        "0014_stock_ledger.sql",         # 库存流水 + 结存检查点
+        "0015_outbox.sql",               # 事务性发件箱（事件与业务同事务提交）
+        "0016_maintenance.sql",          # 后台维护任务执行记录（多 worker 认领）
+    ]
+
+    with db.connect() as conn:
+        for fname in files_in_order:
+            f = Path(f"infra/migrations/{fname}")
+            if f.exists():
+                try:
+                    conn.executescript(f.read_text(encoding="utf-8"))
+                except OperationalError:
+                    pass  # 幂等忽略
+
+        # 兜底列（避免旧库缺列）
+        for col, ddl in [
+            ("photo_path",   "ALTER TABLE products ADD COLUMN photo_path TEXT"),
+            ("category",     "ALTER TABLE products ADD COLUMN category TEXT"),
+            ("detail",       "ALTER TABLE products ADD COLUMN detail TEXT"),
+            ("login_date",   "ALTER TABLE products ADD COLUMN login_date TEXT"),
+            ("tax_included", "ALTER TABLE products ADD COLUMN tax_included INTEGER NOT NULL DEFAULT 1"),
+            ("remark",       "ALTER TABLE products ADD COLUMN remark TEXT"),
+            ("status",       "ALTER TABLE products ADD COLUMN status TEXT"),
+            ("borrower",     "ALTER TABLE products ADD COLUMN borrower TEXT"),
+            # ✅ 新增借出字段兜底
+            ("borrower_company",  "ALTER TABLE products ADD COLUMN borrower_company TEXT"),
+            ("borrower_receiver", "ALTER TABLE products ADD COLUMN borrower_receiver TEXT"),
+            ("borrower_handler",  "ALTER TABLE products ADD COLUMN borrower_handler TEXT"),
+            ("borrowed_at",       "ALTER TABLE products ADD COLUMN borrowed_at TEXT"),
+            ("sku",          "ALTER TABLE products ADD COLUMN sku TEXT"),
+            ("qr_payload",   "ALTER TABLE products ADD COLUMN qr_payload TEXT"),
+        ]:
+            if not has_column(conn, "products", col):
+                try:
+                    conn.execute(ddl)
+                except OperationalError:
+                    pass
+
+        # 借出单归还字段兜底（0011 中途失败时逐列补齐）
+        for table, col, ddl in [
+            ("loan_orders", "returned_qty", "ALTER TABLE loan_orders ADD COLUMN returned_qty INTEGER NOT NULL DEFAULT 0"),
+            ("loan_orders", "returned_amt", "ALTER TABLE loan_orders ADD COLUMN returned_amt INTEGER NOT NULL DEFAULT 0"),
+            ("loan_orders", "closed_at",    "ALTER TABLE loan_orders ADD COLUMN closed_at TEXT"),
+            ("loan_items",  "returned",     "ALTER TABLE loan_items ADD COLUMN returned INTEGER NOT NULL DEFAULT 0"),
+            ("loan_items",  "returned_at",  "ALTER TABLE loan_items ADD COLUMN returned_at TEXT"),
+        ]:
+            if not has_column(conn, table, col):
+                try:
+                    conn.execute(ddl)
+                except OperationalError:
+                    pass
+        try:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_loan_items_sku_open ON loan_items(sku, returned)")
+        except OperationalError:
+            pass
+
+        # 商品行版本号兜底（0012 中途失败时补列/补触发器）
+        if not has_column(conn, "products", "row_version"):
+            try:
+                conn.execute("ALTER TABLE products ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+            except OperationalError:
+                pass
+        try:
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS trg_products_row_version
+                AFTER UPDATE ON products
+                WHEN NEW.row_version = OLD.row_version
+                BEGIN
+                  UPDATE products SET row_version = OLD.row_version + 1 WHERE id = NEW.id;
+                END
+            """)
+        except OperationalError:
+            pass
+
+        # 默认 status
+        try:
+            conn.execute("UPDATE products SET status='在库' WHERE status IS NULL OR status=''")
+        except:
+            pass
+
+        try:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_sku ON products(sku)")
+        except OperationalError:
+            pass
+        try:
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_qr_payload ON products(qr_payload)")
+        except OperationalError:
+            pass
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sequences (
+                  scope TEXT PRIMARY KEY,
+                  next  INTEGER NOT NULL
+                )
+            """)
+        except OperationalError:
+            pass
+
+        conn.commit()
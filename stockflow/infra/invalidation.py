@@ -0,0 +1,111 @@
+# infra/invalidation.py
+# 多进程（uvicorn/gunicorn 多 worker）下的进程内缓存失效：各 worker 各有一份内存缓存，
+# 别的 worker 提交的写入靠 ChangeTracker 感知（PRAGMA data_version 无 I/O；变了才读 table_versions），
+# 比较各表版本号找出变了的表，回调订阅了这些表的缓存。
+# - 每个请求进来先 check() 一次（未变化时只是一条 PRAGMA），保证本次请求看不到过期缓存；
+# - 后台线程按 poll_ms 轮询，没有请求时也能及时同步（如扫码索引变化要推给 SSE 订阅者）。
+from __future__ import annotations
+import threading
+
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+
+class InvalidationBus:
+    """
+    subscribe(tables, fn)：fn(changed_tables) 在发现变化的线程里同步调用（请求线程/事件循环），
+      只应做“标记失效”这类 O(1) 操作；
+    subscribe(tables, fn, background=True)：只在后台线程里调用，可以做重活（回库增量同步）。
+    本进程自己的写入同样会让版本号变化——订阅者自行判断是否真的需要重建。
+    """
+
+    def __init__(self, tracker, poll_ms: float = 500):
+        self.tracker = tracker
+        self.poll_s = max(0.05, float(poll_ms) / 1000.0)
+        self._lock = threading.Lock()
+        self._subs: list[tuple[frozenset, object, bool]] = []
+        self._seen: dict | None = None
+        self._snapshot = None
+        self._pending: set[str] = set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.checks = 0
+        self.changes = 0
+        self.callbacks = 0
+        self.errors = 0
+
+    def subscribe(self, tables, fn, background: bool = False):
+        self._subs.append((frozenset(tables), fn, background))
+
+    def check(self, blocking: bool = True) -> set[str]:
+        """对比版本号，返回这次发现变化的表（没变化返回空集）；blocking=False 时探测连接正忙就跳过这次。"""
+        self.checks += 1
+        try:
+            vs = self.tracker.versions(blocking)
+        except Exception:
+            return set()
+        if vs is None:
+            return set()
+        # ChangeTracker 在 data_version 不变时返回同一个字典对象：最快路径
+        if vs is self._snapshot:
+            return set()
+        with self._lock:
+            if vs is self._snapshot:
+                return set()
+            prev, self._seen, self._snapshot = self._seen, dict(vs), vs
+            if prev is None:
+                return set()
+            changed = {t for t in set(prev) | set(vs) if prev.get(t, (None,))[0] != vs.get(t, (None,))[0]}
+            if not changed:
+                return set()
+            self.changes += 1
+            self._pending |= changed
+        # 旧库没有 table_versions 时只有 "*"：视为所有表都变了
+        self._dispatch(changed, background=False)
+        self._wake.set()
+        return changed
+
+    def _dispatch(self, changed: set[str], background: bool):
+        wildcard = "*" in changed
+        for tables, fn, bg in self._subs:
+            if bg != background or not (wildcard or tables & changed):
+                continue
+            try:
+                fn(changed)
+                self.callbacks += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"invalidation callback failed: {e}")
+
+    # —— 后台轮询 ——
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.check()    # 建立基线
+        self._thread = threading.Thread(target=self._loop, name="sf-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_s)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.check()
+            with self._lock:
+                pending, self._pending = self._pending, set()
+            if pending:
+                self._dispatch(pending, background=True)
+
+    def stats(self) -> dict:
+        return {"poll_ms": round(self.poll_s * 1000), "subscribers": len(self._subs),
+                "checks": self.checks, "changes": self.changes,
+                "callbacks": self.callbacks, "errors": self.errors}
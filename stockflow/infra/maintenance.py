@@ -0,0 +1,169 @@
+# infra/maintenance.py
+# 进程内维护调度（仅 SQLite）：一条后台线程每 tick_s 醒来一次，
+# - 库空闲（idle_s 内没有任何连接提交）且 WAL 文件非空时做 TRUNCATE 检查点，把 WAL 收回 0 字节；
+# - 按各自间隔跑登记的任务（PRAGMA optimize、碎片多时回收空闲页、账本结存检查点……）。
+# 多 worker 共用一个库时，任务靠 maintenance_runs 表认领（迁移 0016）：同一任务同一周期只有一个进程执行。
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+
+def vacuum_if_fragmented(db, min_ratio: float, min_pages: int = 256, full_max_bytes: int = 0) -> dict | None:
+    """
+    空闲页占比达到 min_ratio（且至少 min_pages 页，小库不折腾）才回收；否则返回 None。
+    还没切到增量回收的库要做完整 VACUUM（整库重写、阻塞写入）：超过 full_max_bytes 的不在后台做，
+    记一条日志提示用 CLI `vacuum --full` 离线切换。
+    """
+    st = db.storage_stats()
+    if st["free_ratio"] < min_ratio or st["freelist_count"] < min_pages:
+        return None
+    if st["auto_vacuum"] != "incremental" and st["db_bytes"] > full_max_bytes:
+        logger.warning(f"vacuum skipped: auto_vacuum={st['auto_vacuum']} and {st['db_bytes']} bytes exceeds "
+                       f"the background full-VACUUM limit ({full_max_bytes}); run `python -m ui.cli vacuum --full` offline")
+        return None
+    return db.vacuum()
+
+
+class _Task:
+    __slots__ = ("name", "every_s", "fn", "idle_only", "runs", "last", "last_error")
+
+    def __init__(self, name: str, every_s: float, fn, idle_only: bool):
+        self.name = name
+        self.every_s = float(every_s)
+        self.fn = fn                  # fn() -> dict | None；返回 None 表示本轮条件不满足、没做事
+        self.idle_only = idle_only
+        self.runs = 0
+        self.last: dict | None = None
+        self.last_error: str | None = None
+
+
+class MaintenanceScheduler:
+    """
+    add(name, every_s, fn, idle_only) 登记任务；start() 后台执行，stop() 停止。
+    every_s <= 0 的任务不登记；tick_s <= 0 时整个调度不启动。
+    """
+
+    def __init__(self, db, tick_s: float = 60, idle_s: float = 30):
+        self.db = db
+        self.tick_s = float(tick_s)
+        self.idle_s = float(idle_s)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.tasks: dict[str, _Task] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._probe = None
+        self._data_version = None
+        self._changed_at = time.monotonic()
+        self.truncates = 0
+        self.last_truncate: dict | None = None
+
+    def add(self, name: str, every_s: float, fn, idle_only: bool = True):
+        if every_s > 0:
+            self.tasks[name] = _Task(name, every_s, fn, idle_only)
+
+    def start(self):
+        if self.tick_s <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._loop, name="sf-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._probe is not None:
+            self._probe.close()
+            self._probe = None
+
+    def _loop(self):
+        while not self._stop.wait(self.tick_s):
+            try:
+                self.tick()
+            except sqlite3.Error as e:
+                logger.warning(f"maintenance tick failed: {e}")
+
+    # ====== 调度 ======
+    def idle(self) -> bool:
+        """data_version 连续 idle_s 秒没变 = 这段时间没有任何连接（含别的 worker）提交过。"""
+        if self._probe is None:
+            self._probe = self.db.open_probe()
+        dv = self.db.data_version(self._probe)
+        now = time.monotonic()
+        if dv != self._data_version:
+            self._data_version, self._changed_at = dv, now
+        return now - self._changed_at >= self.idle_s
+
+    def tick(self):
+        idle = self.idle()
+        for task in self.tasks.values():
+            if self._stop.is_set():
+                return
+            if task.idle_only and not idle:
+                continue
+            if self._claim(task):
+                self._run(task)
+        # 空闲时把 WAL 收回 0 字节；认领/任务本身的写入会让 data_version 变，下一个空闲窗口再收
+        if idle and self.db.storage_stats()["wal_bytes"] > 0:
+            res = self.db.checkpoint("TRUNCATE")
+            if not res["busy"]:
+                self.truncates += 1
+            self.last_truncate = res
+
+    def _claim(self, task: _Task) -> bool:
+        """到期且抢到本周期的执行权才返回 True（UPDATE 带到期条件，多进程只有一个能改到行）。"""
+        now = int(time.time())
+
+        def _job(conn):
+            conn.execute("INSERT INTO maintenance_runs(task) VALUES (?) ON CONFLICT DO NOTHING", (task.name,))
+            return conn.execute(
+                "UPDATE maintenance_runs SET ran_at = ?, owner = ? WHERE task = ? AND ran_at <= ?",
+                (now, self.owner, task.name, now - int(task.every_s))).rowcount == 1
+
+        return self.db.run_write(_job)
+
+    def _run(self, task: _Task):
+        t0 = time.perf_counter()
+        try:
+            res = task.fn()
+        except Exception as e:
+            task.last_error = str(e)
+            logger.warning(f"maintenance task {task.name} failed: {e}")
+            res = {"error": str(e)}
+        else:
+            if res is not None:
+                task.runs += 1
+                task.last = res
+        result = "skipped" if res is None else ("error" if "error" in res else "ok")
+        self.db.run_write(lambda conn: conn.execute(
+            "UPDATE maintenance_runs SET result = ?, elapsed_ms = ? WHERE task = ? AND owner = ?",
+            (result, round((time.perf_counter() - t0) * 1000, 3), task.name, self.owner)))
+
+    # ====== 统计 ======
+    def stats(self) -> dict:
+        with self.db.read() as conn:
+            runs = {r[0]: {"ran_at": int(r[1]), "owner": r[2], "result": r[3], "elapsed_ms": r[4]}
+                    for r in conn.execute("SELECT task, ran_at, owner, result, elapsed_ms FROM maintenance_runs")}
+            pragmas = {k: conn.execute(f"PRAGMA {k}").fetchone()[0]
+                       for k in ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout")}
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "tick_s": self.tick_s,
+            "idle_s": self.idle_s,
+            "idle_for_s": round(time.monotonic() - self._changed_at, 1) if self._data_version is not None else None,
+            "storage": self.db.storage_stats(),
+            "tuning": self.db.tuning.as_dict(),
+            "pragmas": pragmas,   # 读连接上实际生效的值
+            "truncates": self.truncates,
+            "last_truncate": self.last_truncate,
+            "tasks": {t.name: {"every_s": t.every_s, "idle_only": t.idle_only, "runs": t.runs,
+                               "last": t.last, "last_error": t.last_error} for t in self.tasks.values()},
+            "runs": runs,
+        }
@@ -0,0 +1,10 @@
+-- 0011_loan_returns.sql
+-- 借出单归还字段（0010 建表时缺少；已有列会报错，由 api.deps 兜底逐列补齐）
+ALTER TABLE loan_orders ADD COLUMN returned_qty INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE loan_orders ADD COLUMN returned_amt INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE loan_orders ADD COLUMN closed_at TEXT;
+ALTER TABLE loan_items  ADD COLUMN returned INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE loan_items  ADD COLUMN returned_at TEXT;
+
+-- 归还扫码按 SKU 找未归还明细
+CREATE INDEX IF NOT EXISTS idx_loan_items_sku_open ON loan_items(sku, returned);
@@ -0,0 +1,11 @@
+-- 0012_product_row_version.sql
+-- 商品行版本号：每次 UPDATE 自增，供行级片段缓存（装饰结果/行 HTML）做键
+ALTER TABLE products ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0;
+
+-- 只在调用方没有自己改 row_version 时自增（默认不开 recursive_triggers，不会自触发）
+CREATE TRIGGER IF NOT EXISTS trg_products_row_version
+AFTER UPDATE ON products
+WHEN NEW.row_version = OLD.row_version
+BEGIN
+  UPDATE products SET row_version = OLD.row_version + 1 WHERE id = NEW.id;
+END;
@@ -0,0 +1,112 @@
+-- 0013_table_versions.sql
+-- 按表计数的变更版本：任一行增删改都让该表 version+1 并记下时间（epoch 秒），
+-- 列表页用它拼 ETag/Last-Modified，数据没变时直接回 304，不再查询与渲染
+CREATE TABLE IF NOT EXISTS table_versions (
+  name       TEXT PRIMARY KEY,
+  version    INTEGER NOT NULL DEFAULT 0,
+  changed_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s','now') AS INTEGER))
+);
+
+INSERT OR IGNORE INTO table_versions(name) VALUES ('products'), ('warehouses'), ('stocks'), ('loan_orders'), ('loan_items'), ('settings');
+
+-- products
+CREATE TRIGGER IF NOT EXISTS trg_tv_products_insert
+AFTER INSERT ON products
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'products';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_products_update
+AFTER UPDATE ON products
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'products';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_products_delete
+AFTER DELETE ON products
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'products';
+END;
+
+-- warehouses
+CREATE TRIGGER IF NOT EXISTS trg_tv_warehouses_insert
+AFTER INSERT ON warehouses
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'warehouses';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_warehouses_update
+AFTER UPDATE ON warehouses
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'warehouses';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_warehouses_delete
+AFTER DELETE ON warehouses
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'warehouses';
+END;
+
+-- stocks
+CREATE TRIGGER IF NOT EXISTS trg_tv_stocks_insert
+AFTER INSERT ON stocks
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'stocks';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_stocks_update
+AFTER UPDATE ON stocks
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'stocks';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_stocks_delete
+AFTER DELETE ON stocks
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'stocks';
+END;
+
+-- loan_orders
+CREATE TRIGGER IF NOT EXISTS trg_tv_loan_orders_insert
+AFTER INSERT ON loan_orders
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'loan_orders';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_loan_orders_update
+AFTER UPDATE ON loan_orders
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'loan_orders';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_loan_orders_delete
+AFTER DELETE ON loan_orders
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'loan_orders';
+END;
+
+-- loan_items
+CREATE TRIGGER IF NOT EXISTS trg_tv_loan_items_insert
+AFTER INSERT ON loan_items
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'loan_items';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_loan_items_update
+AFTER UPDATE ON loan_items
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'loan_items';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_loan_items_delete
+AFTER DELETE ON loan_items
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'loan_items';
+END;
+
+-- settings
+CREATE TRIGGER IF NOT EXISTS trg_tv_settings_insert
+AFTER INSERT ON settings
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'settings';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_settings_update
+AFTER UPDATE ON settings
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'settings';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_tv_settings_delete
+AFTER DELETE ON settings
+BEGIN
+  UPDATE table_versions SET version = version + 1, changed_at = CAST(strftime('%s','now') AS INTEGER) WHERE name = 'settings';
+END;
@@ -0,0 +1,33 @@
+-- 0014_stock_ledger.sql
+-- 库存流水（只追加）+ 按（商品, 仓库）的结存检查点：
+-- 入/出库与 stocks 更新在同一事务里写一条流水；每满 N 条流水记一次检查点，
+-- 历史时点库存 = 最近检查点 + 其后至该时点的流水（扫描量有上界）
+CREATE TABLE IF NOT EXISTS stock_moves (
+  id           INTEGER PRIMARY KEY AUTOINCREMENT,
+  product_id   INTEGER NOT NULL,
+  warehouse_id INTEGER NOT NULL,
+  delta        REAL NOT NULL,              -- 入库为正、出库为负
+  kind         TEXT NOT NULL,              -- opening / inbound / outbound
+  ref          TEXT,                       -- 业务单号等（可空）
+  created_at   TEXT NOT NULL               -- 本地时间 YYYY-MM-DD HH:MM:SS
+);
+CREATE INDEX IF NOT EXISTS idx_stock_moves_pair_time ON stock_moves(product_id, warehouse_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_moves_wh_time   ON stock_moves(warehouse_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_moves_time      ON stock_moves(created_at);
+
+CREATE TABLE IF NOT EXISTS stock_checkpoints (
+  product_id   INTEGER NOT NULL,
+  warehouse_id INTEGER NOT NULL,
+  move_id      INTEGER NOT NULL,           -- 结存截至（含）这条流水
+  as_of        TEXT NOT NULL,              -- 该流水的时间
+  qty          REAL NOT NULL,
+  PRIMARY KEY (product_id, warehouse_id, move_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_stock_cp_pair_asof ON stock_checkpoints(product_id, warehouse_id, as_of);
+
+-- 期初：账本为空时把现有结存记为 opening 流水（只在首次迁移时生效）
+INSERT INTO stock_moves(product_id, warehouse_id, delta, kind, ref, created_at)
+SELECT s.product_id, s.warehouse_id, s.qty_on_hand, 'opening', '0014', datetime('now', 'localtime')
+  FROM stocks s
+ WHERE s.qty_on_hand <> 0
+   AND NOT EXISTS (SELECT 1 FROM stock_moves);
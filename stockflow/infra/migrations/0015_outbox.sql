@@ -0,0 +1,16 @@
+-- 0015_outbox.sql
+-- 事务性发件箱：业务写入与事件记录在同一事务里提交，后台导出线程再按 id 顺序投递到日志等下游；
+-- 每个下游一条游标（至少一次投递：先写下游、再推进游标），所有下游都投递过的行会被清理。
+CREATE TABLE IF NOT EXISTS outbox (
+  id         INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind       TEXT NOT NULL,              -- 事件类型（product_add / loan_create / ...）
+  payload    TEXT NOT NULL,              -- 事件 JSON
+  created_at TEXT NOT NULL               -- 本地时间 YYYY-MM-DD HH:MM:SS
+);
+
+CREATE TABLE IF NOT EXISTS outbox_cursors (
+  sink        TEXT PRIMARY KEY,          -- 下游名（csv / jsonl / ...）
+  last_id     INTEGER NOT NULL DEFAULT 0,-- 已投递到（含）这条
+  owner       TEXT,                      -- 持有租约的导出进程（多 worker 时只有一个在导）
+  lease_until INTEGER NOT NULL DEFAULT 0 -- 租约到期（epoch 秒），过期后别的进程可接手
+);
@@ -0,0 +1,10 @@
+-- 0016_maintenance.sql
+-- 后台维护任务的执行记录（infra.maintenance）：多 worker 共用一个库时按 ran_at 认领，
+-- 同一任务同一周期只有一个进程执行（optimize / vacuum / 账本结存检查点等）。
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+  task       TEXT PRIMARY KEY,          -- 任务名
+  ran_at     INTEGER NOT NULL DEFAULT 0,-- 最近一次认领时间（epoch 秒）
+  owner      TEXT,                      -- 认领的进程
+  result     TEXT,                      -- ok / skipped（条件不满足）/ error
+  elapsed_ms REAL                       -- 耗时
+);
@@ -0,0 +1,195 @@
+-- pg/0001_schema.sql
+-- PostgreSQL 引擎的完整建表脚本（对应 SQLite 的 0001~0014 迁移的最终结构）。
+-- 约定与 SQLite 版一致：时间列存 'YYYY-MM-DD HH:MM:SS' 文本，布尔列存 0/1 整数，业务 SQL 两边通用。
+
+-- ====== 商品 / 仓库 / 库存 ======
+CREATE TABLE IF NOT EXISTS products (
+  id                  INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  sku                 TEXT NOT NULL UNIQUE,
+  name                TEXT NOT NULL,
+  spec                TEXT,
+  unit                TEXT DEFAULT 'pcs',
+  cost_price          DOUBLE PRECISION DEFAULT 0,
+  sale_price          DOUBLE PRECISION DEFAULT 0,
+  enabled             INTEGER NOT NULL DEFAULT 1,
+  created_at          TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'),
+  photo_path          TEXT,
+  category            TEXT,
+  detail              TEXT,
+  label_printed_count INTEGER NOT NULL DEFAULT 0,
+  label_printed_at    TEXT,
+  login_date          TEXT,
+  tax_included        INTEGER NOT NULL DEFAULT 1,
+  remark              TEXT,
+  status              TEXT,
+  borrower            TEXT,
+  borrower_company    TEXT,
+  borrower_receiver   TEXT,
+  borrower_handler    TEXT,
+  borrowed_at         TEXT,
+  qr_payload          TEXT UNIQUE,
+  row_version         INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS warehouses (
+  id         INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  name       TEXT NOT NULL,
+  code       TEXT NOT NULL UNIQUE,
+  enabled    INTEGER NOT NULL DEFAULT 1,
+  created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+);
+
+CREATE TABLE IF NOT EXISTS stocks (
+  product_id   INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  warehouse_id INTEGER NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
+  qty_on_hand  DOUBLE PRECISION NOT NULL DEFAULT 0,
+  qty_reserved DOUBLE PRECISION NOT NULL DEFAULT 0,
+  PRIMARY KEY (product_id, warehouse_id)
+);
+
+-- ====== 用户 / 角色 ======
+CREATE TABLE IF NOT EXISTS users (
+  id            INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  username      TEXT UNIQUE NOT NULL,
+  password_hash TEXT NOT NULL,
+  is_active     INTEGER NOT NULL DEFAULT 1,
+  created_at    TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+);
+
+CREATE TABLE IF NOT EXISTS roles (
+  id   INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  code TEXT UNIQUE NOT NULL,
+  name TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS user_roles (
+  user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  role_id INTEGER NOT NULL REFERENCES roles(id) ON DELETE CASCADE,
+  PRIMARY KEY (user_id, role_id)
+);
+
+CREATE TABLE IF NOT EXISTS revoked_tokens (
+  jti        TEXT PRIMARY KEY,
+  revoked_at TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS')
+);
+
+INSERT INTO roles (id, code, name) VALUES
+  (1, 'admin', '管理员'),
+  (2, 'operator', '操作员'),
+  (3, 'viewer', '只读')
+ON CONFLICT DO NOTHING;
+-- 显式指定了 id：把自增起点挪到已有最大值之后
+SELECT setval(pg_get_serial_sequence('roles', 'id'), (SELECT MAX(id) FROM roles));
+
+-- ====== 设置 / 序列号 ======
+CREATE TABLE IF NOT EXISTS settings (
+  key   TEXT PRIMARY KEY,
+  value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sequences (
+  scope TEXT PRIMARY KEY,
+  next  INTEGER NOT NULL
+);
+
+-- ====== 借出单 ======
+CREATE TABLE IF NOT EXISTS loan_orders (
+  id           INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  loan_no      TEXT NOT NULL UNIQUE,
+  company      TEXT,
+  receiver     TEXT,
+  handler      TEXT,
+  discount     DOUBLE PRECISION NOT NULL DEFAULT 1.0,
+  total_qty    INTEGER NOT NULL DEFAULT 0,
+  total_amount INTEGER NOT NULL DEFAULT 0,
+  status       TEXT NOT NULL DEFAULT '借出中',
+  created_at   TEXT,
+  returned_qty INTEGER NOT NULL DEFAULT 0,
+  returned_amt INTEGER NOT NULL DEFAULT 0,
+  closed_at    TEXT
+);
+
+CREATE TABLE IF NOT EXISTS loan_items (
+  id          INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  order_id    INTEGER NOT NULL REFERENCES loan_orders(id) ON DELETE CASCADE,
+  product_id  INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+  sku         TEXT NOT NULL,
+  price       INTEGER NOT NULL DEFAULT 0,
+  returned    INTEGER NOT NULL DEFAULT 0,
+  returned_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_loan_items_order    ON loan_items(order_id);
+CREATE INDEX IF NOT EXISTS idx_loan_items_product  ON loan_items(product_id);
+CREATE INDEX IF NOT EXISTS idx_loan_items_sku      ON loan_items(sku);
+CREATE INDEX IF NOT EXISTS idx_loan_items_sku_open ON loan_items(sku, returned);
+
+-- ====== 库存流水 / 结存检查点 ======
+CREATE TABLE IF NOT EXISTS stock_moves (
+  id           BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  product_id   INTEGER NOT NULL,
+  warehouse_id INTEGER NOT NULL,
+  delta        DOUBLE PRECISION NOT NULL,
+  kind         TEXT NOT NULL,
+  ref          TEXT,
+  created_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_stock_moves_pair_time ON stock_moves(product_id, warehouse_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_moves_time      ON stock_moves(created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_moves_wh_time   ON stock_moves(warehouse_id, created_at);
+
+CREATE TABLE IF NOT EXISTS stock_checkpoints (
+  product_id   INTEGER NOT NULL,
+  warehouse_id INTEGER NOT NULL,
+  move_id      BIGINT NOT NULL,
+  as_of        TEXT NOT NULL,
+  qty          DOUBLE PRECISION NOT NULL,
+  PRIMARY KEY (product_id, warehouse_id, move_id)
+);
+CREATE INDEX IF NOT EXISTS idx_stock_cp_pair_asof ON stock_checkpoints(product_id, warehouse_id, as_of);
+
+-- ====== 商品行版本号（片段缓存键） ======
+CREATE OR REPLACE FUNCTION sf_products_row_version() RETURNS trigger AS $$
+BEGIN
+  IF NEW.row_version = OLD.row_version THEN
+    NEW.row_version := OLD.row_version + 1;
+  END IF;
+  RETURN NEW;
+END $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_row_version ON products;
+CREATE TRIGGER trg_products_row_version
+BEFORE UPDATE ON products
+FOR EACH ROW EXECUTE FUNCTION sf_products_row_version();
+
+-- ====== 按表变更计数（列表页 ETag / 跨 worker 失效） ======
+CREATE TABLE IF NOT EXISTS table_versions (
+  name       TEXT PRIMARY KEY,
+  version    BIGINT NOT NULL DEFAULT 0,
+  changed_at BIGINT NOT NULL DEFAULT extract(epoch FROM now())::bigint
+);
+INSERT INTO table_versions(name)
+VALUES ('products'), ('warehouses'), ('stocks'), ('loan_orders'), ('loan_items'), ('settings')
+ON CONFLICT DO NOTHING;
+
+-- 计数行是热点：改成提交时才触发（延迟约束触发器），行锁只在提交前一瞬间持有，
+-- 写同一张表的并发事务不会从第一条 UPDATE 起就排队；同一事务内每张表只加一次。
+CREATE OR REPLACE FUNCTION sf_bump_table_version() RETURNS trigger AS $$
+BEGIN
+  IF coalesce(current_setting('sf.tv_' || TG_TABLE_NAME, true), '') = '' THEN
+    PERFORM set_config('sf.tv_' || TG_TABLE_NAME, '1', true);
+    UPDATE table_versions
+       SET version = version + 1, changed_at = extract(epoch FROM now())::bigint
+     WHERE name = TG_TABLE_NAME;
+  END IF;
+  RETURN NULL;
+END $$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY['products', 'warehouses', 'stocks', 'loan_orders', 'loan_items', 'settings'] LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_tv_%s ON %I', t, t);
+    EXECUTE format('CREATE CONSTRAINT TRIGGER trg_tv_%s AFTER INSERT OR UPDATE OR DELETE ON %I'
+                   ' DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION sf_bump_table_version()', t, t);
+  END LOOP;
+END $$;
@@ -0,0 +1,16 @@
+-- pg/0002_outbox.sql
+-- 事务性发件箱（同 SQLite 的 0015_outbox.sql）。
+-- 插入方在事务里先取 serialize_appends 的咨询锁，id 顺序与提交顺序一致，导出端按 id 游标消费不会漏行。
+CREATE TABLE IF NOT EXISTS outbox (
+  id         BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+  kind       TEXT NOT NULL,
+  payload    TEXT NOT NULL,
+  created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS outbox_cursors (
+  sink        TEXT PRIMARY KEY,
+  last_id     BIGINT NOT NULL DEFAULT 0,
+  owner       TEXT,
+  lease_until BIGINT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,10 @@
+-- pg/0003_maintenance.sql
+-- 后台维护任务的执行记录（同 SQLite 的 0016_maintenance.sql）。
+-- PostgreSQL 引擎目前不起进程内维护调度（VACUUM/ANALYZE 交给 autovacuum），建表只为两边结构一致。
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+  task       TEXT PRIMARY KEY,
+  ran_at     BIGINT NOT NULL DEFAULT 0,
+  owner      TEXT,
+  result     TEXT,
+  elapsed_ms DOUBLE PRECISION
+);
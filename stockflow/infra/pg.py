@@ -0,0 +1,367 @@
+# infra/pg.py
+# PostgreSQL 存储引擎（可选依赖 psycopg[pool]）：与 infra.db_interface.DB 同一套接口，
+# 服务/路由的 SQL 不用改——连接层把 ? / :name 占位符翻译成 psycopg 的 %s / %(name)s，
+# 行对象兼容 sqlite3.Row（下标、列名、dict(row) 都能用），INSERT 自动补 RETURNING id 以提供 lastrowid。
+# - 连接池：psycopg_pool.ConnectionPool，读写都从池里借连接；
+# - 没有单写者：run_write() 直接在池连接上开事务（READ COMMITTED），多个写事务真正并发，
+#   读-改-写的地方用 dialect.for_update 加行锁；死锁/序列化失败时整段任务重试；
+# - stream() 用服务端命名游标分批取行，大列表不会整表拉进内存；
+# - 建表脚本在 infra/migrations/pg/，按文件名顺序执行一次，记录在 schema_migrations。
+from __future__ import annotations
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import count
+from pathlib import Path
+
+from utils.logging import setup_logger
+from infra.db_interface import DB, _observe
+from infra.storage import POSTGRES
+
+logger = setup_logger()
+
+MIGRATIONS_DIR = Path("infra/migrations/pg")
+
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_INSERT_INTO = re.compile(r"^\s*INSERT\s+INTO\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_cursor_names = count(1)
+
+
+def _psycopg():
+    try:
+        import psycopg
+        import psycopg_pool
+    except ImportError as e:
+        raise RuntimeError("PostgreSQL 引擎需要安装 psycopg[pool]（pip install 'psycopg[binary,pool]'）") from e
+    return psycopg, psycopg_pool
+
+
+# ====== SQL 翻译 ======
+@lru_cache(maxsize=4096)
+def translate(sql: str) -> str:
+    """
+    ? → %s，:name → %(name)s，字面 % → %%（psycopg 传参时整条语句都按 % 解析，引号内也一样）；
+    LIKE → ILIKE（SQLite 的 LIKE 对 ASCII 不分大小写，保持搜索行为一致）。
+    引号内与 -- 注释内只做 % 转义；:: 类型转换原样保留。
+    """
+    out = []
+    i, n = 0, len(sql)
+    quote = None
+    while i < n:
+        ch = sql[i]
+        if quote:
+            out.append("%%" if ch == "%" else ch)
+            if ch == quote:
+                quote = None
+            i += 1
+            continue
+        if ch in ("'", '"'):
+            quote = ch
+            out.append(ch)
+        elif ch == "-" and sql.startswith("--", i):
+            j = sql.find("\n", i)
+            j = n if j < 0 else j
+            out.append(sql[i:j].replace("%", "%%"))
+            i = j
+            continue
+        elif ch == "?":
+            out.append("%s")
+        elif ch == "%":
+            out.append("%%")
+        elif ch == ":":
+            if sql.startswith("::", i):
+                out.append("::")
+                i += 2
+                continue
+            m = _IDENT.match(sql, i + 1)
+            if m:
+                out.append(f"%({m.group()})s")
+                i = m.end()
+                continue
+            out.append(ch)
+        elif ch.isalpha() or ch == "_":
+            m = _IDENT.match(sql, i)
+            word = m.group()
+            out.append("ILIKE" if word.upper() == "LIKE" else word)
+            i = m.end()
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+# ====== 行对象 ======
+class PgRow(tuple):
+    """兼容 sqlite3.Row：row[0] / row["col"] / row.keys() / dict(row)。"""
+    __slots__ = ()
+    _names: tuple = ()
+    _index: dict = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return list(self._names)
+
+
+@lru_cache(maxsize=1024)
+def _row_class(names: tuple):
+    return type("PgRow", (PgRow,), {"__slots__": (), "_names": names,
+                                    "_index": {n: i for i, n in enumerate(names)}})
+
+
+def _row_factory(cursor):
+    desc = cursor.description
+    if not desc:
+        return tuple
+    return _row_class(tuple(d.name for d in desc))
+
+
+def _params(parameters):
+    # 一律传参（哪怕是空元组）：psycopg 只有传了参数才解析占位符与 %% 转义
+    if parameters is None:
+        return ()
+    return parameters if isinstance(parameters, dict) else tuple(parameters)
+
+
+# ====== 连接 / 游标包装 ======
+class PgCursor:
+    def __init__(self, conn: "PgConnection"):
+        self.connection = conn
+        self._cur = conn.raw.cursor(row_factory=_row_factory)
+        self.lastrowid = None
+        self.row_factory = None   # 与 sqlite3 接口对齐；行始终是 PgRow（本身就是元组）
+
+    def execute(self, sql, parameters=()):
+        q = translate(sql)
+        m = _INSERT_INTO.match(q)
+        returning = bool(m) and m.group(1).lower() in self.connection.id_tables and "RETURNING" not in q.upper()
+        if returning:
+            q = q.rstrip().rstrip(";") + " RETURNING id"
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            self._cur.execute(q, _params(parameters))
+            failed = False
+        finally:
+            _observe(self.connection, sql, parameters, time.perf_counter() - t0, failed)
+        self.lastrowid = None
+        if returning:
+            row = self._cur.fetchone()
+            self.lastrowid = row[0] if row else None
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            self._cur.executemany(translate(sql), [_params(p) for p in seq_of_parameters])
+            failed = False
+        finally:
+            _observe(self.connection, sql, (), time.perf_counter() - t0, failed)
+        return self
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def fetchone(self):
+        return self._cur.fetchone() if self._cur.description else None
+
+    def fetchall(self):
+        return self._cur.fetchall() if self._cur.description else []
+
+    def fetchmany(self, size: int = 1000):
+        return self._cur.fetchmany(size) if self._cur.description else []
+
+    def __iter__(self):
+        return iter(self._cur) if self._cur.description else iter(())
+
+    def close(self):
+        self._cur.close()
+
+
+class PgConnection:
+    dialect = POSTGRES
+
+    def __init__(self, raw, id_tables: frozenset):
+        self.raw = raw
+        self.id_tables = id_tables
+        self.row_factory = None
+
+    def cursor(self):
+        return PgCursor(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql: str):
+        # 多语句脚本：不带参数执行，原样交给服务端
+        self.raw.execute(sql)
+
+    def stream(self, sql, parameters=(), chunk: int = 1000):
+        """服务端游标：每次往返取 chunk 行，迭代过程中结果集留在服务端。需在事务内（read()/connect() 的连接都是）。"""
+        cur = self.raw.cursor(name=f"sf_stream_{next(_cursor_names)}", row_factory=_row_factory)
+        cur.itersize = max(1, int(chunk))
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            cur.execute(translate(sql), _params(parameters))
+            failed = False
+        finally:
+            _observe(self, sql, parameters, time.perf_counter() - t0, failed)
+        try:
+            yield from cur
+        finally:
+            cur.close()
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.raw.info.transaction_status != 0   # 0 = IDLE
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        # 连接归池由 PostgresDB 的上下文管理器负责
+        pass
+
+
+# ====== 引擎 ======
+class PostgresDB:
+    dialect = POSTGRES
+
+    def __init__(self, url: str, pool_min: int = 1, pool_max: int = 10, write_retries: int = 3):
+        psycopg, psycopg_pool = _psycopg()
+        self.url = url
+        self.db_path = url
+        self.writer = None          # 没有单写者线程
+        self.write_retries = max(1, int(write_retries))
+        self._retryable = (psycopg.errors.SerializationFailure, psycopg.errors.DeadlockDetected)
+        self._pool = psycopg_pool.ConnectionPool(url, min_size=max(1, int(pool_min)),
+                                                 max_size=max(1, int(pool_max), int(pool_min)),
+                                                 kwargs={"autocommit": False}, name="stockflow", open=True)
+        self.id_tables: frozenset = frozenset()
+        self._load_id_tables()
+
+    def _load_id_tables(self):
+        # 有自增 id 列的表：这些表的 INSERT 自动补 RETURNING id
+        with self._pool.connection() as raw:
+            rows = raw.execute("""
+                SELECT table_name FROM information_schema.columns
+                 WHERE table_schema = current_schema() AND column_name = 'id'
+                   AND (is_identity = 'YES' OR column_default LIKE 'nextval(%%')
+            """, ()).fetchall()
+            raw.rollback()
+        self.id_tables = frozenset(r[0] for r in rows)
+
+    def attach_writer(self, writer):
+        raise RuntimeError("PostgreSQL 引擎不使用写线程")
+
+    @contextmanager
+    def connect(self):
+        """与 SQLite 一致：调用方自行 commit，未提交的改动在归还时回滚。"""
+        with self._pool.connection() as raw:
+            try:
+                yield PgConnection(raw, self.id_tables)
+            finally:
+                raw.rollback()
+
+    @contextmanager
+    def read(self):
+        with self._pool.connection() as raw:
+            raw.read_only = True
+            try:
+                yield PgConnection(raw, self.id_tables)
+            finally:
+                raw.rollback()
+                raw.read_only = False
+
+    @contextmanager
+    def transaction(self):
+        with self._pool.connection() as raw:
+            conn = PgConnection(raw, self.id_tables)
+            try:
+                yield conn
+                raw.commit()
+            except Exception as e:
+                raw.rollback()
+                logger.error(f"DB transaction rollback: {e}")
+                raise
+
+    def run_write(self, fn):
+        """写任务直接在池连接上执行（可并发）；死锁/序列化失败时短暂退避后整段重试。fn 内不要自行 commit。"""
+        for attempt in range(self.write_retries):
+            try:
+                with self.transaction() as conn:
+                    return fn(conn)
+            except self._retryable as e:
+                if attempt == self.write_retries - 1:
+                    raise
+                logger.warning(f"write retry {attempt + 1}: {e}")
+                time.sleep(0.005 * (2 ** attempt))
+
+    def checkpoint(self, mode: str = "PASSIVE") -> dict:
+        # WAL/检查点由 PostgreSQL 服务端自己管理
+        return {"mode": mode.upper(), "engine": "postgresql", "skipped": True}
+
+    def open_probe(self):
+        """ChangeTracker 的探测连接：独立于池、autocommit（每次查询都看到最新提交）。"""
+        psycopg, _ = _psycopg()
+        return psycopg.connect(self.url, autocommit=True)
+
+    @staticmethod
+    def data_version(conn) -> int:
+        # 各表版本号只增不减：和变了就说明有表变了
+        return int(conn.execute("SELECT COALESCE(SUM(version), 0) FROM table_versions").fetchone()[0])
+
+    # SQL 追踪与 SQLite 引擎共用一个聚合器（只统计次数/耗时，不抓查询计划）
+    enable_trace = DB.enable_trace
+    disable_trace = DB.disable_trace
+
+    def migrate(self):
+        """按文件名顺序执行 infra/migrations/pg/*.sql，各文件只执行一次；多进程同时启动时用咨询锁串行。"""
+        with self._pool.connection() as raw:
+            raw.execute("SELECT pg_advisory_lock(hashtext('stockflow.migrate'))")
+            try:
+                raw.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                                 name TEXT PRIMARY KEY,
+                                 applied_at TIMESTAMPTZ NOT NULL DEFAULT now())""")
+                raw.commit()
+                done = {r[0] for r in raw.execute("SELECT name FROM schema_migrations").fetchall()}
+                for f in sorted(MIGRATIONS_DIR.glob("*.sql")):
+                    if f.name in done:
+                        continue
+                    raw.execute(f.read_text(encoding="utf-8"))
+                    raw.execute("INSERT INTO schema_migrations(name) VALUES (%s)", (f.name,))
+                    raw.commit()
+                    logger.info(f"pg migration applied: {f.name}")
+            except Exception:
+                raw.rollback()
+                raise
+            finally:
+                raw.execute("SELECT pg_advisory_unlock(hashtext('stockflow.migrate'))")
+                raw.commit()
+        self._load_id_tables()
+
+    def stats(self) -> dict:
+        s = self._pool.get_stats()
+        return {"engine": "postgresql", "pool_size": s.get("pool_size"), "pool_available": s.get("pool_available"),
+                "requests_waiting": s.get("requests_waiting"), "requests_num": s.get("requests_num")}
+
+    def close(self):
+        self._pool.close()
@@ -0,0 +1,80 @@
+# infra/readers.py
+# 读路径专用线程池：把阻塞的 sqlite3 读取与模板渲染从 anyio 默认线程池中隔离出来
+from __future__ import annotations
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+
+class ReaderPool:
+    """
+    固定大小的读线程池。
+    - run(fn, ...)：在池中执行同步函数并 await 结果（contextvars 随任务传递）；
+    - 统计“排队等待”与“实际执行”两段耗时，排队过久时打告警日志，便于判断池子是否偏小。
+    """
+
+    def __init__(self, workers: int = 4, slow_wait_ms: float = 200.0, name: str = "sf-reader"):
+        self.workers = max(1, int(workers))
+        self.slow_wait_ms = float(slow_wait_ms)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._exec_total = 0.0
+        self._exec_max = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def _job():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return ctx.run(fn, *args, **kwargs)
+            finally:
+                self._record(started - submitted, time.perf_counter() - started, getattr(fn, "__name__", "?"))
+
+        return await loop.run_in_executor(self._executor, _job)
+
+    def _record(self, wait: float, execute: float, name: str):
+        with self._lock:
+            self._running -= 1
+            self._count += 1
+            self._wait_total += wait
+            self._exec_total += execute
+            self._wait_max = max(self._wait_max, wait)
+            self._exec_max = max(self._exec_max, execute)
+        if wait * 1000 > self.slow_wait_ms:
+            logger.warning(f"reader pool: {name} waited {wait * 1000:.1f} ms in queue (workers={self.workers})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._count or 1
+            return {
+                "workers": self.workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._count,
+                "wait_avg_ms": round(self._wait_total / n * 1000, 3),
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+                "exec_avg_ms": round(self._exec_total / n * 1000, 3),
+                "exec_max_ms": round(self._exec_max * 1000, 3),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
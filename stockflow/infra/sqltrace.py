@@ -0,0 +1,152 @@
+# infra/sqltrace.py
+# SQL 语句追踪（按需开启）：按归一化语句聚合次数/耗时，慢语句自动抓 EXPLAIN QUERY PLAN 并标记全表扫描
+from __future__ import annotations
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# 字符串/数字字面量 → ?；IN (?, ?, …) → IN (?…)；空白折叠
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_SPACE = re.compile(r"\s+")
+
+# 只对这些语句做 EXPLAIN（PRAGMA/BEGIN/SAVEPOINT 之类没有查询计划）
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+def normalize_sql(sql: str) -> str:
+    s = _RE_STRING.sub("?", sql)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_SPACE.sub(" ", s).strip()
+    return _RE_IN_LIST.sub("(?…)", s)
+
+
+def is_full_scan(detail: str) -> bool:
+    """
+    EXPLAIN QUERY PLAN 明细里的 "SCAN <表>"（不带 USING INDEX）即全表扫描；
+    老版本 SQLite 写作 "SCAN TABLE <表>"。
+    """
+    d = detail.strip().upper()
+    return d.startswith("SCAN ") and " USING " not in d and not d.startswith("SCAN CONSTANT ROW")
+
+
+class _Stat:
+    __slots__ = ("sql", "count", "total", "max", "errors", "plan", "full_scan", "slow")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.slow = 0
+        self.plan: list[str] | None = None
+        self.full_scan = False
+
+    def as_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total / (self.count or 1) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "slow": self.slow,
+            "errors": self.errors,
+            "full_scan": self.full_scan,
+            "plan": self.plan,
+        }
+
+
+class SqlTracer:
+    """
+    语句聚合器（线程安全）。由 infra.db_interface 的计时连接在每条语句执行后调用 record()。
+    - 超过 slow_ms 的语句（同一归一化文本只抓一次）用同一连接执行 EXPLAIN QUERY PLAN；
+    - 聚合条目上限 max_statements，超出后新语句计入 "<other>"，防止拼接 SQL 撑爆内存。
+    """
+
+    def __init__(self, slow_ms: float = 50.0, max_statements: int = 1000):
+        self.slow = float(slow_ms) / 1000.0
+        self.max_statements = int(max_statements)
+        self.started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._lock = threading.Lock()
+        self._stats: dict[str, _Stat] = {}
+
+    def record(self, conn: sqlite3.Connection, sql: str, params, elapsed: float, failed: bool = False):
+        key = normalize_sql(sql)
+        with self._lock:
+            st = self._stats.get(key)
+            if st is None:
+                if len(self._stats) >= self.max_statements:
+                    key = "<other>"
+                    st = self._stats.get(key)
+                if st is None:
+                    st = self._stats[key] = _Stat(key)
+            st.count += 1
+            st.total += elapsed
+            st.max = max(st.max, elapsed)
+            if failed:
+                st.errors += 1
+            need_plan = elapsed >= self.slow and not failed
+            if need_plan:
+                st.slow += 1
+                need_plan = st.plan is None and key != "<other>"
+        if need_plan:
+            plan = self._explain(conn, sql, params)
+            if plan is not None:
+                with self._lock:
+                    st.plan = plan
+                    st.full_scan = any(is_full_scan(d) for d in plan)
+
+    @staticmethod
+    def _explain(conn: sqlite3.Connection, sql: str, params) -> list[str] | None:
+        # EXPLAIN QUERY PLAN 是 SQLite 的；其他引擎的连接只聚合次数/耗时
+        if not isinstance(conn, sqlite3.Connection) or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        try:
+            # 用基类游标执行，避免再次进入计时/追踪
+            cur = sqlite3.Cursor(conn)
+            rows = cur.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            cur.close()
+        except sqlite3.Error:
+            return None
+        return [r[3] for r in rows]
+
+    def snapshot(self, order_by: str = "total_ms", limit: int | None = None) -> dict:
+        with self._lock:
+            rows = [st.as_dict() for st in self._stats.values()]
+        rows.sort(key=lambda r: r.get(order_by) or 0, reverse=True)
+        if limit:
+            rows = rows[:limit]
+        return {
+            "started_at": self.started_at,
+            "slow_ms": self.slow * 1000,
+            "statements": rows,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    def dump(self, path: str) -> str:
+        p = Path(path)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return str(p)
+
+
+def format_report(snap: dict, limit: int = 20) -> str:
+    """CLI 输出：按总耗时排序的语句表，慢语句附查询计划，全表扫描标 ⚠。"""
+    lines = [f"SQL trace since {snap.get('started_at')}  (slow ≥ {snap.get('slow_ms')} ms)"]
+    for i, r in enumerate(snap.get("statements", [])[:limit], 1):
+        flag = " ⚠ FULL SCAN" if r.get("full_scan") else ""
+        lines.append(f"[{i}] count={r['count']} total={r['total_ms']}ms avg={r['avg_ms']}ms "
+                     f"max={r['max_ms']}ms slow={r['slow']} errors={r['errors']}{flag}")
+        lines.append(f"    {r['sql']}")
+        for d in r.get("plan") or []:
+            lines.append(f"      · {d}")
+    return "\n".join(lines)
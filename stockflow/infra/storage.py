@@ -0,0 +1,140 @@
+# infra/storage.py
+# 存储抽象：服务/路由拿到的 db 只需提供 connect() / read() / transaction() / run_write() / checkpoint()，
+# 连接提供 execute() / cursor() / commit() / rollback() / stream() 与 dialect 属性。
+# 库方言的差异（表/列自省、事务开头、锁等待）集中在 Dialect 里，业务 SQL 只写两边都认的语法：
+# - 占位符统一用 ?（PostgreSQL 引擎在连接层翻译成 %s）；
+# - 插入去重用 INSERT ... ON CONFLICT DO NOTHING（SQLite ≥ 3.24 与 PostgreSQL 都支持）；
+# - 不直接查 sqlite_master / PRAGMA table_info，改用 table_names() / column_names()。
+# open_storage() 按配置选引擎：database_url 为 postgresql:// 时用 infra.pg.PostgresDB，否则 SQLite。
+from __future__ import annotations
+import sqlite3
+from abc import ABC, abstractmethod
+
+# 违反唯一/外键约束：业务层按“这条数据有问题”处理（批量模式跳过该条）
+try:
+    import psycopg as _psycopg
+    IntegrityError: tuple = (sqlite3.IntegrityError, _psycopg.IntegrityError)
+    OperationalError: tuple = (sqlite3.OperationalError, _psycopg.errors.UndefinedColumn,
+                               _psycopg.errors.UndefinedTable)
+except ImportError:
+    IntegrityError = (sqlite3.IntegrityError,)
+    OperationalError = (sqlite3.OperationalError,)
+
+
+class Dialect(ABC):
+    name = ""
+    for_update = ""     # 读-改-写时追加在 SELECT 末尾的行锁子句
+
+    @abstractmethod
+    def table_names(self, conn) -> list[str]:
+        ...
+
+    @abstractmethod
+    def column_names(self, conn, table: str) -> list[str]:
+        ...
+
+    def has_table(self, conn, table: str) -> bool:
+        return table in self.table_names(conn)
+
+    def has_column(self, conn, table: str, column: str) -> bool:
+        try:
+            return column in self.column_names(conn, table)
+        except Exception:
+            return False
+
+    @abstractmethod
+    def begin_write(self, conn):
+        """开启一个写事务（手动管理事务的连接上用）。"""
+
+    @abstractmethod
+    def set_lock_timeout(self, conn, ms: int):
+        ...
+
+    @abstractmethod
+    def serialize_appends(self, conn, name: str):
+        """让本事务对某张只追加表的插入按提交顺序排队（自增 id 与提交顺序一致，按 id 游标消费时不漏行）。"""
+
+
+class SqliteDialect(Dialect):
+    name = "sqlite"     # 单写者：写事务本身就是串行的，不需要行锁
+
+    def table_names(self, conn) -> list[str]:
+        return [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()]
+
+    def column_names(self, conn, table: str) -> list[str]:
+        return [c[1] for c in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+    def begin_write(self, conn):
+        # 一开始就拿写锁，避免读后升级写锁时撞上 SQLITE_BUSY
+        conn.execute("BEGIN IMMEDIATE")
+
+    def set_lock_timeout(self, conn, ms: int):
+        conn.execute(f"PRAGMA busy_timeout = {int(ms)}")
+
+    def serialize_appends(self, conn, name: str):
+        pass    # 写事务已串行，id 天然按提交顺序递增
+
+
+class PostgresDialect(Dialect):
+    name = "postgresql"
+    for_update = " FOR UPDATE"
+
+    def table_names(self, conn) -> list[str]:
+        return [r[0] for r in conn.execute(
+            "SELECT table_name FROM information_schema.tables"
+            " WHERE table_schema = current_schema() AND table_type = 'BASE TABLE'").fetchall()]
+
+    def column_names(self, conn, table: str) -> list[str]:
+        return [r[0] for r in conn.execute(
+            "SELECT column_name FROM information_schema.columns"
+            " WHERE table_schema = current_schema() AND table_name = ? ORDER BY ordinal_position",
+            (table,)).fetchall()]
+
+    def begin_write(self, conn):
+        # psycopg 非 autocommit 连接在第一条语句前自动 BEGIN，这里不用再发
+        pass
+
+    def set_lock_timeout(self, conn, ms: int):
+        conn.execute(f"SET lock_timeout = {int(ms)}")
+
+    def serialize_appends(self, conn, name: str):
+        # 并发事务先取号的可能后提交：事务级咨询锁持有到提交，取号顺序 = 提交顺序
+        conn.execute("SELECT pg_advisory_xact_lock(hashtext(?))", (f"stockflow.append.{name}",))
+
+
+SQLITE = SqliteDialect()
+POSTGRES = PostgresDialect()
+
+
+def dialect_of(conn) -> Dialect:
+    return getattr(conn, "dialect", None) or SQLITE
+
+
+def table_names(conn) -> list[str]:
+    return dialect_of(conn).table_names(conn)
+
+
+def column_names(conn, table: str) -> list[str]:
+    return dialect_of(conn).column_names(conn, table)
+
+
+def has_column(conn, table: str, column: str) -> bool:
+    return dialect_of(conn).has_column(conn, table, column)
+
+
+def is_postgres_url(url: str | None) -> bool:
+    return bool(url) and url.split(":", 1)[0] in ("postgres", "postgresql")
+
+
+def open_storage(database_path: str, database_url: str = "", pool_min: int = 1, pool_max: int = 10,
+                 tuning=None):
+    """
+    按配置打开存储引擎：database_url 指向 PostgreSQL 时用连接池引擎，否则是 database_path 的 SQLite 库
+    （tuning 为 infra.db_interface.SqliteTuning，只对 SQLite 生效）。
+    """
+    if is_postgres_url(database_url):
+        from infra.pg import PostgresDB
+        return PostgresDB(database_url, pool_min=pool_min, pool_max=pool_max)
+    from infra.db_interface import DB
+    return DB(database_path, tuning)
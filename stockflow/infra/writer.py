@@ -0,0 +1,244 @@
+# infra/writer.py
+# 单写线程：独占写连接，把短时间窗口内到达的写任务合并为一次提交（group commit）
+from __future__ import annotations
+import asyncio
+import contextvars
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from infra.db_interface import TimedConnection
+from utils.logging import setup_logger
+
+logger = setup_logger()
+
+# 批大小分布的桶上界
+_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _Job:
+    __slots__ = ("fn", "future", "ctx")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.future: Future = Future()
+        self.ctx = contextvars.copy_context()
+
+
+class WriteQueue:
+    """
+    SQLite 同一时刻只允许一个写者，与其让各请求各自抢锁，不如交给一个写线程串行执行：
+    - submit(fn)：fn(conn) 在写线程里执行，返回 Future；call()/run() 为同步/异步等待版本；
+    - 写线程拿到第一个任务后，在 window_ms 内继续收集后续任务（最多 max_batch 个），
+      用一个 BEGIN IMMEDIATE … COMMIT 提交；每个任务包在 SAVEPOINT 里，
+      单个任务抛错只回滚它自己，结果/异常逐个回填到各自的 Future；
+    - 写线程不因意外异常退出：出错的那一批全部以该异常失败，循环继续；写连接打不开时，
+      已排队和之后提交的任务都直接失败，不会让 call() 永远等下去；
+    - 任务函数内不要调用 conn.commit()/rollback()/executescript()，提交由写线程统一负责。
+    """
+
+    def __init__(self, db_path: str, window_ms: float = 2.0, max_batch: int = 64,
+                 busy_timeout_ms: int = 5000, wal_autocheckpoint: int = 1000, tuning=None):
+        self.db_path = db_path
+        self.tuning = tuning    # infra.db_interface.SqliteTuning；None 时由 DB.attach_writer 补上库的配置
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.max_batch = max(1, int(max_batch))
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.wal_autocheckpoint = int(wal_autocheckpoint)
+        self._q: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._broken: BaseException | None = None   # 写连接打不开时记下原因
+        # 统计
+        self._batches = 0
+        self._jobs = 0
+        self._failed_jobs = 0
+        self._failed_commits = 0
+        self._batch_hist = [0] * (len(_BATCH_BUCKETS) + 1)
+        self._commit_total = 0.0
+        self._commit_max = 0.0
+
+    # ---------- 生命周期 ----------
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name="sf-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread and self._thread.is_alive():
+            self._q.put(None)
+            self._thread.join(timeout)
+
+    @property
+    def in_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    # ---------- 提交任务 ----------
+    def submit(self, fn) -> Future:
+        job = _Job(fn)
+        self._q.put(job)
+        if self._broken is not None:
+            self._drain(self._broken)
+        return job.future
+
+    def call(self, fn):
+        """同步等待结果；在写线程内部（任务里再发起写）时直接用当前连接执行，避免自锁。"""
+        if self.in_writer_thread:
+            return fn(self._conn)
+        return self.submit(fn).result()
+
+    async def run(self, fn):
+        return await asyncio.wrap_future(self.submit(fn))
+
+    # ---------- 写线程 ----------
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, isolation_level=None, factory=TimedConnection)   # 手动管理事务
+        conn.row_factory = sqlite3.Row
+        if self.tuning is not None:
+            self.tuning.apply(conn)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms};")
+        # 0 = 写线程提交时不再顺带做检查点，交给 Checkpointer 独立处理
+        conn.execute(f"PRAGMA wal_autocheckpoint = {self.wal_autocheckpoint};")
+        return conn
+
+    def _loop(self):
+        try:
+            self._conn = self._open()
+        except Exception as e:
+            logger.error(f"writer: cannot open {self.db_path}: {e}")
+            self._broken = e
+            self._drain(e)
+            return
+        try:
+            while True:
+                job = self._q.get()
+                if job is None:
+                    break
+                batch = [job]
+                stop = self._collect(batch)
+                try:
+                    self._commit_batch(batch)
+                except Exception as e:
+                    # 意外错误（不是任务自身抛的）：本批失败，写线程继续服务后面的任务
+                    try:
+                        if self._conn.in_transaction:
+                            self._conn.execute("ROLLBACK")
+                    except sqlite3.Error:
+                        pass
+                    self._fail_all(batch, e)
+                if stop:
+                    break
+        finally:
+            self._conn.close()
+
+    def _drain(self, err: BaseException):
+        """写线程起不来：把队列里的任务全部以 err 失败（停止信号直接丢掉）。"""
+        while True:
+            try:
+                job = self._q.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None and not job.future.done():
+                job.future.set_exception(err)
+
+    def _collect(self, batch: list) -> bool:
+        """在窗口期内继续收集任务；返回是否收到了停止信号。"""
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                job = self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait()
+            except queue.Empty:
+                return False
+            if job is None:
+                return True
+            batch.append(job)
+        return False
+
+    def _commit_batch(self, batch: list):
+        conn = self._conn
+        done = []
+        t0 = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            self._fail_all(batch, e)
+            return
+        for job in batch:
+            try:
+                conn.execute("SAVEPOINT sf_job")
+                res = job.ctx.run(job.fn, conn)
+                conn.execute("RELEASE sf_job")
+                done.append((job, res, None))
+            except BaseException as e:
+                try:
+                    conn.execute("ROLLBACK TO sf_job")
+                    conn.execute("RELEASE sf_job")
+                except sqlite3.Error as e2:
+                    # 整个事务已被 SQLite 回滚（如磁盘满），本批全部失败
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    self._fail_all(batch, e2)
+                    return
+                done.append((job, None, e))
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            self._fail_all(batch, e)
+            return
+        elapsed = time.perf_counter() - t0
+        self._record(len(batch), elapsed, sum(1 for _, _, err in done if err))
+        for job, res, err in done:
+            if err is not None:
+                job.future.set_exception(err)
+            else:
+                job.future.set_result(res)
+
+    def _fail_all(self, batch: list, err: Exception):
+        logger.error(f"writer: batch of {len(batch)} failed: {err}")
+        with self._lock:
+            self._failed_commits += 1
+            self._failed_jobs += len(batch)
+        for job in batch:
+            if not job.future.done():
+                job.future.set_exception(err)
+
+    def _record(self, size: int, elapsed: float, failed: int):
+        with self._lock:
+            self._batches += 1
+            self._jobs += size
+            self._failed_jobs += failed
+            self._commit_total += elapsed
+            self._commit_max = max(self._commit_max, elapsed)
+            for i, ub in enumerate(_BATCH_BUCKETS):
+                if size <= ub:
+                    self._batch_hist[i] += 1
+                    break
+            else:
+                self._batch_hist[-1] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self._batches or 1
+            hist = {str(ub): c for ub, c in zip(_BATCH_BUCKETS, self._batch_hist)}
+            hist["+Inf"] = self._batch_hist[-1]
+            return {
+                "queued": self._q.qsize(),
+                "batches": self._batches,
+                "jobs": self._jobs,
+                "failed_jobs": self._failed_jobs,
+                "failed_commits": self._failed_commits,
+                "avg_batch_size": round(self._jobs / n, 2),
+                "batch_size_hist": hist,
+                "commit_avg_ms": round(self._commit_total / n * 1000, 3),
+                "commit_max_ms": round(self._commit_max * 1000, 3),
+            }
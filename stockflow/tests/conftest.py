@@ -0,0 +1,81 @@
+# tests/conftest.py
+# 测试环境：库文件与事件日志都放临时目录（通过 utils.config 的环境变量覆盖），不碰 data/stockflow.db；
+# 工作目录切到 stockflow/，迁移脚本、模板、静态文件按相对路径查找，与 python main.py 启动时一致。
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+_TMP = Path(tempfile.mkdtemp(prefix="stockflow-test-"))
+os.environ["STOCKFLOW_DATABASE_PATH"] = str(_TMP / "stockflow.db")
+os.environ["STOCKFLOW_EVENT_LOG_DIR"] = str(_TMP / "logs")
+os.chdir(ROOT)
+sys.path.insert(0, str(ROOT))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "postgres: 需要 STOCKFLOW_TEST_PG_URL 指向可用的 PostgreSQL")
+
+
+@pytest.fixture
+def db(tmp_path):
+    """全新的 SQLite 库（完整迁移），不挂写线程：run_write 直接在调用线程提交。"""
+    from infra.db_interface import DB
+    from api.deps import ensure_all_migrations
+    d = DB(str(tmp_path / "t.db"))
+    ensure_all_migrations(d)
+    return d
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    """整个会话共用的 TestClient（默认库在临时目录），已设置公司代码并以 admin 登录。"""
+    from fastapi.testclient import TestClient
+    from api.deps import get_cfg, get_db
+    from api.server import app
+    from core.services.settings import SettingsService
+    ss = SettingsService(get_db())
+    if not ss.has_company_code():
+        ss.set("company_name", "Test")
+        ss.set("company_abbrev", "TST")
+        ss.set("company_code", "TST0001")
+    c = TestClient(app)
+    r = c.post("/login", data={"username": "admin", "password": "admin123"}, follow_redirects=False)
+    assert r.status_code == 302, r.text
+    cookie = get_cfg().security["cookie_name"]
+    c.cookies.set(cookie, r.cookies.get(cookie))
+    return c
+
+
+@pytest.fixture(scope="session")
+def staff_client(app_client):
+    """非管理员（operator 角色）登录的 TestClient，用于检查管理接口的权限。"""
+    from fastapi.testclient import TestClient
+    from api.deps import get_cfg, get_db
+    from api.server import app
+    from core.services.auth import AuthService
+    AuthService(get_db()).register_user("staff", "staff123", ["operator"])
+    c = TestClient(app)
+    r = c.post("/login", data={"username": "staff", "password": "staff123"}, follow_redirects=False)
+    assert r.status_code == 302, r.text
+    cookie = get_cfg().security["cookie_name"]
+    c.cookies.set(cookie, r.cookies.get(cookie))
+    return c
+
+
+@pytest.fixture
+def make_product(app_client):
+    """经 POST /products 新建商品，返回库里的整行。"""
+    from api.deps import get_db
+
+    def _make(price: int = 1000, detail: str = "ring", **extra) -> dict:
+        r = app_client.post("/products", data={"price": str(price), "detail": detail, **extra},
+                            follow_redirects=False)
+        assert r.status_code == 303, r.text
+        with get_db().read() as conn:
+            return dict(conn.execute("SELECT * FROM products ORDER BY id DESC LIMIT 1").fetchone())
+
+    return _make
@@ -0,0 +1,66 @@
+# 库存分析：估值/毛利、库龄分桶、品类 × 状态交叉表；没装 numpy 时给出明确错误
+import importlib.util
+
+import pytest
+
+from core.services.analytics import AnalyticsUnavailable, InventoryAnalytics
+from core.services.inventory import InventoryService
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+
+@pytest.fixture
+def analytics(db):
+    svc = InventoryService(db)
+    data = [  # (sku, category, status, cost, sale, login_date, enabled)
+        ("A1", "戒指", "在库", 100, 300, "2024-01-01", 1),
+        ("A2", "戒指", "借出", 200, 500, "2024-03-01 10:00:00", 1),
+        ("A3", "", "已出售", 50, 100, "2023-01-01", 1),
+        ("A4", "项链", None, 0, 0, None, 1),
+        ("A5", "戒指", "在库", 999, 999, "2024-01-01", 0),     # 停用的不计
+    ]
+    for sku, cat, status, cost, sale, login, enabled in data:
+        pid = svc.add_product(sku, sku, cost_price=cost, sale_price=sale)
+        db.run_write(lambda conn: conn.execute(
+            "UPDATE products SET category=?, status=?, login_date=?, enabled=? WHERE id=?",
+            (cat, status, login, enabled, pid)))
+    return InventoryAnalytics(db)
+
+
+@pytest.mark.skipif(HAS_NUMPY, reason="numpy 已安装")
+def test_missing_numpy_is_reported(analytics, app_client):
+    with pytest.raises(AnalyticsUnavailable):
+        analytics.valuation()
+    r = app_client.get("/api/reports/valuation")
+    assert r.status_code == 500 and "numpy" in r.json()["detail"]
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+def test_valuation(analytics):
+    rep = analytics.valuation()
+    assert rep["total"] == {"name": "合计", "count": 3, "cost_total": 300.0, "sale_total": 800.0,
+                            "margin": 500.0, "margin_pct": 62.5}
+    assert [(r["name"], r["count"], r["cost_total"]) for r in rep["by_status"]] == [("借出", 1, 200.0), ("在库", 2, 100.0)]
+    assert {r["name"]: r["count"] for r in rep["by_category"]} == {"戒指": 2, "项链": 1}
+    full = analytics.valuation(include_sold=True)
+    assert full["total"]["count"] == 4 and full["total"]["cost_total"] == 350.0
+    assert {r["name"] for r in full["by_category"]} == {"戒指", "项链", "（未分类）"}
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+def test_aging(analytics):
+    rep = analytics.aging("2024-04-01")
+    counts = {b["name"]: b["count"] for b in rep["buckets"]}
+    assert counts == {"0-29天": 0, "30-89天": 1, "90-179天": 1, "180-364天": 0, "365天以上": 0, "日期未知": 1}
+    assert rep["avg_age_days"] == 61.0
+    assert rep["by_category"] == [{"name": "戒指", "count": 2, "avg_age_days": 61.0, "max_age_days": 91}]
+    rep = analytics.aging("2024-04-01", buckets=(60,), include_sold=True)
+    assert [b["count"] for b in rep["buckets"]] == [1, 2, 1]
+
+
+@pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+def test_categories(analytics):
+    rep = analytics.categories()
+    assert sorted(rep["statuses"]) == sorted(["在库", "借出", "已出售"])
+    assert {r["name"]: r["by_status"] for r in rep["rows"]} == {"戒指": {"在库": 1, "借出": 1}, "项链": {"在库": 1}}
+    assert analytics.stats()["loads"] == 1 and analytics.stats()["rows"] == 4
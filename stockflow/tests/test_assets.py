@@ -0,0 +1,31 @@
+# 指纹静态资源：每种编码各自的 ETag，条件请求只在同一编码下 304
+import gzip
+
+from api.assets import asset_url, get_assets
+
+
+def test_etag_per_encoding(app_client):
+    url = asset_url("js/outbound.js")
+    assert url.startswith("/assets/js/outbound.")
+    a = get_assets().lookup(url[len("/assets/"):])
+    assert "gzip" in a.variants
+
+    gz = app_client.get(url, headers={"Accept-Encoding": "gzip"})
+    raw = app_client.get(url, headers={"Accept-Encoding": "identity"})
+    assert gz.headers["content-encoding"] == "gzip" and "content-encoding" not in raw.headers
+    assert gz.headers["etag"] == f'"{a.digest}-gzip"' and raw.headers["etag"] == f'"{a.digest}"'
+    assert gz.content == raw.content == gzip.decompress(a.variants["gzip"].read_bytes())
+
+    # 手里是 gzip 版的 ETag，换成不压缩的请求必须拿到正文
+    r = app_client.get(url, headers={"Accept-Encoding": "identity", "If-None-Match": gz.headers["etag"]})
+    assert r.status_code == 200
+    r = app_client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": gz.headers["etag"]})
+    assert r.status_code == 304 and r.headers["etag"] == gz.headers["etag"]
+    r = app_client.get(url, headers={"Accept-Encoding": "identity",
+                                     "If-None-Match": f'W/{raw.headers["etag"]}'})
+    assert r.status_code == 304
+    assert r.headers["cache-control"].endswith("immutable")
+
+
+def test_unknown_asset_404(app_client):
+    assert app_client.get("/assets/js/nope.000000000000.js").status_code == 404
@@ -0,0 +1,42 @@
+# CLI 批量模式：错误行号对应原文件（注释/空行不让行号漂移），单条失败只回滚自己
+import io
+
+from core.services.inventory import InventoryService
+from ui.batch import BatchRunner, read_ops
+
+CSV_OPS = """# 期初入库
+op,sku,wh_code,qty
+
+# 先建仓库与商品
+wh-add,,,
+inbound,NOPE,W1,1
+# 下面这条的备注跨行
+inbound,TST-B1,W1,"2"
+"""
+
+
+def test_csv_line_numbers_match_file():
+    ops = list(read_ops(io.StringIO(CSV_OPS)))
+    assert [no for no, _ in ops] == [5, 6, 8]
+    assert ops[2][1] == {"op": "inbound", "sku": "TST-B1", "wh_code": "W1", "qty": "2"}
+
+    multi = 'op,sku,name\n# c\nproduct-add,TST-M,"two\nlines"\n\nwh-add,,\n'
+    assert [no for no, _ in read_ops(io.StringIO(multi), "csv")] == [3, 6]
+
+
+def test_jsonl_line_numbers_match_file():
+    text = '# c\n\n{"op": "wh-add", "code": "W1", "name": "m"}\nnot json\n'
+    ops = list(read_ops(io.StringIO(text)))
+    assert [no for no, _ in ops] == [3, 4] and "_error" in ops[1][1]
+
+
+def test_runner_reports_original_lines(db):
+    svc = InventoryService(db)
+    svc.add_product("TST-B1", "ring")
+    svc.add_warehouse("W1", "main")
+    out = []
+    summary = BatchRunner(svc, chunk=2).run(read_ops(io.StringIO(CSV_OPS)), out.append)
+    assert summary["ok"] == 1 and summary["failed"] == 2
+    assert [(r["line"], r["ok"]) for r in out] == [(5, False), (6, False), (8, True)]
+    assert "NOPE" in out[1]["error"]
+    assert svc.stock_of(1, 1)["qty_on_hand"] == 2
@@ -0,0 +1,44 @@
+# 基准工具：百分位/汇总、回退对比、规模解析、凭据不写死
+import pytest
+
+from bench.datagen import parse_scale
+from bench.run import compare
+from bench.stats import percentile, summarize
+
+
+def test_percentile_nearest_rank():
+    s = [float(i) for i in range(1, 101)]
+    assert percentile(s, 50) == 50.0
+    assert percentile(s, 95) == 95.0
+    assert percentile(s, 100) == 100.0
+    assert percentile([], 50) == 0.0
+
+
+def test_summarize():
+    res = summarize([0.001, 0.003, 0.002, 0.004], wall_s=0.5, errors=1)
+    assert res["n"] == 4 and res["errors"] == 1
+    assert res["p50_ms"] == 2.0 and res["max_ms"] == 4.0 and res["mean_ms"] == 2.5
+    assert res["throughput_rps"] == 8.0
+
+
+def test_compare_flags_p95_regressions():
+    base = {"meta": {"git_rev": "x"}, "scenarios": {"a": {"p95_ms": 10.0}, "b": {"p95_ms": 10.0}}}
+    cur = {"scenarios": {"a": {"p95_ms": 10.5}, "b": {"p95_ms": 12.0}, "c": {"skipped": "-"}}}
+    assert compare(cur, base, 10.0) == ["b"]
+
+
+def test_parse_scale():
+    assert parse_scale("10k") == 10_000
+    assert parse_scale("1m") == 1_000_000
+    assert parse_scale("250") == 250
+
+
+@pytest.mark.parametrize("module", ["bench.run", "bench.loadsim"])
+def test_password_is_required(module, monkeypatch):
+    import importlib
+    import sys
+    monkeypatch.delenv("STOCKFLOW_BENCH_PASSWORD", raising=False)
+    monkeypatch.setattr(sys, "argv", [module])
+    with pytest.raises(SystemExit) as e:
+        importlib.import_module(module).main()
+    assert e.value.code == 2
@@ -0,0 +1,71 @@
+# 列存商品目录：过滤/排序/分页与 SQL 语义一致；按 products 版本增量同步，只补读变了的行
+import pytest
+
+from core.services.catalog import ProductCatalog
+from core.services.inventory import InventoryService
+from infra.db_interface import ChangeTracker
+
+
+@pytest.fixture
+def seeded(db):
+    svc = InventoryService(db)
+    rows = [  # (sku, name, category, status, login_date, label_printed_count, enabled)
+        ("TST-1", "Gold Ring", "戒指", "在库", "2024-01-02", 0, 1),
+        ("TST-2", "chain", "项链", "已出售", "2024-01-03", 1, 1),
+        ("TST-3", "silver ring", None, None, None, 0, 1),
+        ("TST-4", "old", "戒指", "在库", "2024-01-01", 0, 0),
+    ]
+    for sku, name, cat, status, login, printed, enabled in rows:
+        pid = svc.add_product(sku, name, sale_price=100)
+        db.run_write(lambda conn: conn.execute(
+            "UPDATE products SET category=?, status=?, login_date=?, label_printed_count=?, enabled=? WHERE id=?",
+            (cat, status, login, printed, enabled, pid)))
+    tracker = ChangeTracker(db)
+    return ProductCatalog(db, tracker), svc
+
+
+def _skus(cat, keys):
+    return [cat.row(pid)["sku"] for pid, _ in keys]
+
+
+def test_select_matches_sql_semantics(seeded):
+    cat, _ = seeded
+    total, keys = cat.select()
+    assert total == 4 and _skus(cat, keys) == ["TST-4", "TST-3", "TST-2", "TST-1"]
+    assert _skus(cat, cat.select(keyword="RING")[1]) == ["TST-3", "TST-1"]
+    assert _skus(cat, cat.select(keyword="戒指", enabled_only=True)[1]) == ["TST-1"]
+    # status IS NULL OR status <> '已出售'
+    assert _skus(cat, cat.select(exclude_status="已出售")[1]) == ["TST-4", "TST-3", "TST-1"]
+    assert _skus(cat, cat.select(only_unprinted=True, order="-login_date")[1]) == ["TST-1", "TST-4", "TST-3"]
+    total, keys = cat.select(page=2, page_size=3)
+    assert total == 4 and _skus(cat, keys) == ["TST-1"]
+    with pytest.raises(ValueError):
+        cat.select(order="name")
+
+
+def test_row_and_products_round_trip(seeded, db):
+    cat, _ = seeded
+    cat.refresh()
+    with db.read() as conn:
+        expected = dict(conn.execute("SELECT * FROM products WHERE sku='TST-3'").fetchone())
+    row = cat.by_sku("TST-3")
+    assert {k: row[k] for k in expected} == expected
+    (p,) = cat.products([(row["id"], row["row_version"]), (999, None)])
+    assert (p.sku, p.category, p.status, p.enabled) == ("TST-3", None, None, True)
+
+
+def test_incremental_sync(seeded):
+    cat, svc = seeded
+    cat.select()
+    assert not cat.refresh()                        # 版本没变：什么都不做
+    loads, fetched = cat.loads, cat.rows_fetched
+
+    pid = cat.by_sku("TST-1")["id"]
+    svc.db.run_write(lambda conn: conn.execute("UPDATE products SET name='Rose Ring' WHERE id=?", (pid,)))
+    svc.db.run_write(lambda conn: conn.execute("DELETE FROM products WHERE sku='TST-2'"))
+    new = svc.add_product("TST-5", "bangle")
+    assert cat.refresh()
+    assert cat.loads == loads and cat.syncs == 1 and cat.rows_fetched == fetched + 2
+    assert cat.row(pid)["name"] == "Rose Ring" and cat.by_sku("TST-2") is None
+    assert cat.select(keyword="rose")[1][0][0] == pid
+    assert cat.select()[1][0][0] == new and cat.stats()["dead_slots"] == 1
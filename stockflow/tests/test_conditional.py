@@ -0,0 +1,49 @@
+# 条件 GET：ETag 只取决于数据与页面代码，不随进程变化（多 worker 下同样能 304）
+import json
+import subprocess
+import sys
+
+from infra.db_interface import DB, ChangeTracker
+
+
+def test_etag_round_trip_and_stable_across_processes(app_client, make_product):
+    make_product()
+    r = app_client.get("/products")
+    etag = r.headers["etag"]
+    assert app_client.get("/products", headers={"If-None-Match": etag}).status_code == 304
+
+    # 另起一个 Python 进程（≈ 另一个 worker/重启后的进程）：用同一个库、同一个用户算 ETag，应与服务端给的一致
+    from api.deps import get_cfg
+    from utils.security import decode_jwt
+    sec = get_cfg().security
+    token = next(c.value for c in app_client.cookies.jar if c.name == sec["cookie_name"])
+    user = decode_jwt(token, sec["secret_key"])
+    script = (
+        "import json, sys\n"
+        "from starlette.requests import Request\n"
+        "from api.conditional import validator\n"
+        "req = Request({'type': 'http', 'method': 'GET', 'path': '/products', 'query_string': b'', 'headers': []})\n"
+        "print(validator(req, json.loads(sys.argv[1]), ('products',)).etag)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", script, json.dumps(user)],
+                         capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == etag
+
+    make_product()
+    r = app_client.get("/products", headers={"If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+
+
+def test_fallback_version_agrees_between_connections(tmp_path):
+    # 没有 table_versions 的库：各连接的 data_version 不可比，两个跟踪器仍应给出同一个令牌
+    db = DB(str(tmp_path / "old.db"))
+    with db.connect() as conn:
+        conn.execute("CREATE TABLE products(id INTEGER PRIMARY KEY)")
+        conn.commit()
+    early = ChangeTracker(db)
+    early.token(("products",))
+    with db.connect() as conn:
+        conn.execute("INSERT INTO products DEFAULT VALUES")
+        conn.commit()
+    late = ChangeTracker(db)
+    assert early.token(("products",)) == late.token(("products",))
@@ -0,0 +1,20 @@
+# 读写分离：只读连接拒绝写入；手动检查点接口只给管理员、模式白名单
+import sqlite3
+
+import pytest
+
+
+def test_read_connection_is_read_only(db):
+    with db.read() as conn:
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            conn.execute("INSERT INTO warehouses(code, name) VALUES ('X', 'x')")
+
+
+def test_checkpoint_requires_admin(staff_client):
+    assert staff_client.post("/api/db/checkpoint").status_code == 403
+
+
+def test_checkpoint_mode_validated(app_client):
+    assert app_client.post("/api/db/checkpoint", params={"mode": "bogus"}).status_code == 400
+    r = app_client.post("/api/db/checkpoint", params={"mode": "passive"})
+    assert r.status_code == 200 and r.json()["mode"] == "PASSIVE"
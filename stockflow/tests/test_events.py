@@ -0,0 +1,44 @@
+# 事件导出与写库失败时的照片清理
+import csv
+from pathlib import Path
+
+import pytest
+
+import api.routes_inventory as routes_inventory
+from export.event_logger import CsvSink, append_event
+
+
+def test_csv_sink_keeps_existing_columns(tmp_path):
+    ev = {"type": "product_add", "sku": "TST-1", "user": "admin"}
+    append_event(str(tmp_path / "old"), dict(ev))
+    CsvSink(str(tmp_path / "new")).write([(7, "2024-03-05 10:00:00", dict(ev)),
+                                          (8, "2024-03-05 10:00:01", {**ev, "sku": "TST-2"})])
+    (old,) = (tmp_path / "old").glob("flow_*.csv")
+    with old.open(encoding="utf-8") as f:
+        old_header = next(csv.reader(f))
+    with (tmp_path / "new" / "flow_20240305.csv").open(encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    # 原有列位置不变，event_id 在最后
+    assert rows[0] == old_header + ["event_id"]
+    assert [r[-1] for r in rows[1:]] == ["7", "8"] and rows[2][1] == "TST-2"
+
+
+def _photos() -> set:
+    return set(Path("data/photos").glob("*"))
+
+
+def _fail_enqueue(conn, ev):
+    raise RuntimeError("boom")
+
+
+def test_rolled_back_product_writes_leave_no_photo(app_client, make_product, monkeypatch):
+    p = make_product()
+    before = _photos()
+    monkeypatch.setattr(routes_inventory, "enqueue", _fail_enqueue)
+    files = {"photo": ("x.jpg", b"\xff\xd8jpeg", "image/jpeg")}
+
+    with pytest.raises(RuntimeError):
+        app_client.post("/products", data={"price": "100", "detail": "ring"}, files=files)
+    with pytest.raises(RuntimeError):
+        app_client.post(f"/products/{p['id']}/update", data={"price": "100", "detail": "ring"}, files=files)
+    assert _photos() == before
@@ -0,0 +1,62 @@
+# 服务端推送：序号续传、缓冲覆盖不到时 reset、消费过慢的订阅者被截断
+import asyncio
+
+from api.events import EventBus, product_listener
+
+
+class _Req:
+    async def is_disconnected(self):
+        return False
+
+
+def test_backlog_and_reset():
+    async def main():
+        bus = EventBus(buffer_size=3)
+        for i in range(5):
+            bus.publish("product", {"i": i})
+        _, backlog, seq = bus.subscribe(3)
+        assert seq == 5 and [ev[0] for ev in backlog] == [4, 5]
+        assert bus.subscribe(1)[1] is None          # 序号 2 已被挤出缓冲
+        assert bus.subscribe(None)[1] is None
+        assert bus.parse_id(bus.event_id(4)) == 4 and bus.parse_id("other-4") is None
+
+    asyncio.run(main())
+
+
+def test_stream_resumes_and_pushes_live():
+    async def main():
+        bus = EventBus()
+        bus.publish("product", {"i": 1})
+        bus.publish("product", {"i": 2})
+        gen = bus.stream(_Req(), bus.event_id(1), heartbeat_s=1, max_age_s=5)
+        assert await gen.__anext__() == "retry: 3000\n\n"
+        assert await gen.__anext__() == bus.format((2, "product", {"i": 2}))
+        bus.publish("product_removed", {"id": 9, "sku": "X"})
+        live = await asyncio.wait_for(gen.__anext__(), 2)
+        assert live.startswith(f"id: {bus.event_id(3)}\nevent: product_removed\n")
+        await gen.aclose()
+        assert bus.stats()["subscribers"] == 0
+
+    asyncio.run(main())
+
+
+def test_slow_subscriber_is_cut_off():
+    async def main():
+        bus = EventBus(queue_size=2)
+        sub, _, _ = bus.subscribe(None)
+        for i in range(3):
+            bus.publish("product", {"i": i})
+        await asyncio.sleep(0)
+        assert sub.overflowed and sub.queue.get_nowait() is None
+        bus.unsubscribe(sub)
+        assert bus.stats()["dropped_subscribers"] == 1
+
+    asyncio.run(main())
+
+
+def test_product_listener_publishes_changes():
+    bus = EventBus()
+    item = {"id": 1, "sku": "A", "status": "借出", "borrower": "x", "price": 100, "name": "ring"}
+    product_listener(bus)([item], [{"id": 2, "sku": "B"}])
+    assert bus.stats()["published"] == 2
+    assert list(bus._ring)[0][2] == {"id": 1, "sku": "A", "status": "借出", "borrower": "x", "price": 100}
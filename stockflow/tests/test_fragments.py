@@ -0,0 +1,34 @@
+# 行级片段缓存：键带 row_version，改行即换键；LRU 限量；旧库无 row_version 不缓存
+from jinja2 import DictLoader, Environment
+
+from api.fragments import FragmentCache, render_rows, row_key
+
+
+def test_lru_and_stats():
+    cache = FragmentCache(maxsize=2)
+    built = []
+
+    def build(v):
+        return lambda: built.append(v) or v
+
+    assert cache.get_or_build("a", build("A")) == "A"
+    assert cache.get_or_build("b", build("B")) == "B"
+    assert cache.get_or_build("a", build("A2")) == "A"      # 命中，a 变为最近使用
+    cache.get_or_build("c", build("C"))                      # 挤出 b
+    assert cache.get_or_build("b", build("B2")) == "B2"
+    assert built == ["A", "B", "C", "B2"]
+    st = cache.stats()
+    assert (st["size"], st["hits"], st["misses"]) == (2, 1, 4)
+    assert FragmentCache(0).get_or_build("x", build("X")) == "X" and FragmentCache(0).stats()["size"] == 0
+
+
+def test_render_rows_reuses_unchanged_rows():
+    env = Environment(loader=DictLoader({"row.html": "<td>{{ r.sku }}</td>"}), autoescape=True)
+    cache = FragmentCache()
+    rows = [{"id": 1, "row_version": 1, "sku": "A<1>"}, {"id": 2, "row_version": 1, "sku": "B"}]
+    assert [str(h) for h in render_rows(cache, env, "row.html", rows)] == ["<td>A&lt;1&gt;</td>", "<td>B</td>"]
+
+    rows[1] = {"id": 2, "row_version": 2, "sku": "B2"}
+    out = render_rows(cache, env, "row.html", rows)
+    assert str(out[1]) == "<td>B2</td>" and cache.stats()["hits"] == 1
+    assert row_key("row.html", {"id": 3, "row_version": None}) is None
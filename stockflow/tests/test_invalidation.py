@@ -0,0 +1,25 @@
+# 跨进程失效：版本号变了才通知订阅者；事件循环上的非阻塞检查遇到探测连接忙时直接跳过
+from core.services.inventory import InventoryService
+from infra.db_interface import ChangeTracker
+from infra.invalidation import InvalidationBus
+
+
+def test_check_reports_changed_tables(db):
+    bus = InvalidationBus(ChangeTracker(db))
+    seen = []
+    bus.subscribe(["products"], seen.append)
+    assert bus.check() == set()                     # 建立基线
+    InventoryService(db).add_product("TST-1", "ring")
+    assert "products" in bus.check()
+    assert seen and "products" in seen[0]
+
+
+def test_non_blocking_check_skips_when_tracker_busy(db):
+    tracker = ChangeTracker(db)
+    bus = InvalidationBus(tracker)
+    bus.check()
+    InventoryService(db).add_product("TST-1", "ring")
+    with tracker._lock:                              # 后台轮询正占着探测连接
+        assert tracker.versions(blocking=False) is None
+        assert bus.check(blocking=False) == set()
+    assert "products" in bus.check(blocking=False)   # 锁空出来后照常发现变化
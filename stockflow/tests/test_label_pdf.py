@@ -0,0 +1,67 @@
+# 标签 PDF：网格/分页、换行与字号适配、交叉引用表偏移、按字节限额的整份缓存
+import re
+import zlib
+
+import pytest
+
+from export.label_pdf import (LabelLayout, PdfCache, _F_REGULAR, _fit_line, _wrap, cache_key, iter_pdf,
+                              paginate, text_width)
+
+
+def test_grid_and_pagination():
+    lay = LabelLayout()                       # A4，30mm 标签，左右/上下各 10mm 边距，2mm 间隔
+    assert (lay.cols, lay.rows) == (6, 8)
+    rows = [{"id": i} for i in range(60)]
+    pages = paginate(rows, LabelLayout(start_row=2, start_col=3))
+    assert [len(p) for p in pages] == [40, 20]
+    assert pages[0][0][0] == 8 and pages[1][0][0] == 0    # 首页从第 2 行第 3 格开始
+    assert paginate([], lay) == []
+
+
+def test_wrap_and_fit():
+    size = 2.0
+    lines = _wrap("alpha beta-gamma delta", _F_REGULAR, size, text_width("alpha beta-", _F_REGULAR, size))
+    assert lines == ["alpha beta-", "gamma", "delta"]
+    assert _wrap("a\nb", _F_REGULAR, size, 100) == ["a", "b"]
+    pt, ok = _fit_line("¥12,345", _F_REGULAR, 10.0, 12.0, 6.0)
+    assert ok and 6.0 <= pt < 12.0
+    assert _fit_line("¥" + "9" * 40, _F_REGULAR, 10.0, 12.0, 6.0) == (6.0, False)
+
+
+def test_empty_pdf_structure():
+    pdf = b"".join(iter_pdf([], LabelLayout()))
+    assert pdf.startswith(b"%PDF-1.4") and pdf.rstrip().endswith(b"%%EOF")
+    # xref 里记录的偏移都指向对应的 "n 0 obj"
+    xref_at = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    entries = pdf[xref_at:].split(b"\n")[3:]
+    for num, line in enumerate(entries[:9], start=1):
+        off = int(line[:10])
+        assert pdf[off:].startswith(b"%d 0 obj" % num)
+    content = re.search(rb"stream\n(.*?)\nendstream", pdf, re.S).group(1)
+    assert zlib.decompress(content).endswith(b"cm")
+
+
+def test_pdf_with_labels():
+    pytest.importorskip("qrcode")
+    rows = [{"id": i, "sku": f"TST-{i}", "price_fmt": "1,000", "weight_fmt": "1.5g", "category": "戒指",
+             "detail": "K18", "qr_payload": f"SF1:TST0001:TST-{i}:ABCDEF"} for i in range(50)]
+    pdf = b"".join(iter_pdf(rows, LabelLayout()))
+    assert b"/Count 2" in pdf
+
+
+def test_cache_key_and_pdf_cache():
+    rows = [{"id": 1, "row_version": 1, "qr_payload": "p"}]
+    k = cache_key(LabelLayout(), rows, "TST0001")
+    assert k == cache_key(LabelLayout(), [dict(rows[0])], "TST0001")
+    assert k != cache_key(LabelLayout(), [{**rows[0], "row_version": 2}], "TST0001")
+    assert k != cache_key(LabelLayout(font_mode="small"), rows, "TST0001")
+
+    cache = PdfCache(max_bytes=10)
+    assert list(cache.tee("a", [b"abc", b"de"])) == [b"abc", b"de"]
+    assert cache.get("a") == b"abcde"
+    cache.put("b", b"123456")                 # 超出 10 字节：挤出最久未用的 a
+    assert cache.get("a") is None and cache.get("b") == b"123456"
+    cache.put("big", b"x" * 11)               # 单份超过上限不缓存
+    assert cache.get("big") is None
+    st = cache.stats()
+    assert (st["entries"], st["bytes"], st["hits"]) == (1, 6, 2)
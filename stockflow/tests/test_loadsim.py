@@ -0,0 +1,27 @@
+# 负载模拟：后台编辑提交完整表单（不清空商品数据）；只允许对基准库压测
+from bench.datagen import BENCH_DIR
+from bench.loadsim import _FORM_COLUMNS, is_scratch_db, product_form
+
+
+def test_product_update_form_keeps_other_fields(app_client, make_product):
+    from api.deps import get_db
+    p = make_product(price=5000, detail="ring A", category="戒指", weight="12.5", cost="800",
+                     login_date="2024-01-02", tax_included="0", remark="old")
+    with get_db().read() as conn:
+        row = conn.execute(f"SELECT {_FORM_COLUMNS} FROM products WHERE id = ?", (p["id"],)).fetchone()
+
+    r = app_client.post(f"/products/{p['id']}/update", data=product_form(tuple(row), 7700, "loadsim 0"),
+                        follow_redirects=False)
+    assert r.status_code == 303
+
+    with get_db().read() as conn:
+        after = dict(conn.execute("SELECT * FROM products WHERE id = ?", (p["id"],)).fetchone())
+    assert after["sale_price"] == 7700 and after["remark"] == "loadsim 0"
+    for col in ("name", "detail", "category", "spec", "cost_price", "login_date", "tax_included"):
+        assert after[col] == p[col], col
+
+
+def test_is_scratch_db(tmp_path):
+    assert is_scratch_db(str(BENCH_DIR / "n1000_s42" / "run.db"))
+    assert not is_scratch_db("data/stockflow.db")
+    assert not is_scratch_db(str(tmp_path / "x.db"))
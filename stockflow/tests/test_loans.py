@@ -0,0 +1,38 @@
+# 批量归还：扫码解析、部分归还/全部归还的状态与金额
+from core.services.loans import parse_scan_code
+
+
+def test_parse_scan_code():
+    assert parse_scan_code("SF1:TST0001:tst-00012:abcd") == "TST-00012"
+    assert parse_scan_code("  tst-1 ") == "TST-1"
+    assert parse_scan_code("SF1:broken") == "SF1:BROKEN"
+
+
+def _loan(client, skus, discount=0.5):
+    r = client.post("/api/loans", json={"company": "ACME", "discount": discount,
+                                        "items": [{"sku": s} for s in skus]})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_partial_then_full_return(app_client, make_product):
+    a, b = make_product(price=1000), make_product(price=3000)
+    loan = _loan(app_client, [a["sku"], b["sku"]])
+
+    r = app_client.post("/api/loans/return", json={"codes": [a["qr_payload"], "NOPE-1"]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["returned"] == 1 and body["not_found"] == ["NOPE-1"]
+    order = body["orders"][0]
+    assert order["id"] == loan["loan_id"] and order["status"] == "部分归还"
+    assert order["returned_qty"] == 1 and order["returned_amt"] == 500
+
+    r = app_client.post("/api/loans/return", json={"codes": [b["sku"].lower(), a["sku"]]})
+    order = r.json()["orders"][0]
+    assert order["status"] == "已归还" and order["returned_amt"] == 2000 and order["closed_at"]
+
+
+def test_return_nothing_open_is_404(app_client, make_product):
+    p = make_product()
+    assert app_client.post("/api/loans/return", json={"codes": [p["sku"]]}).status_code == 404
+    assert app_client.post("/api/loans/return", json={"codes": []}).status_code == 400
@@ -0,0 +1,49 @@
+# 空闲页回收：大库不在后台做完整 VACUUM；切换需走 CLI vacuum --full，之后后台只做增量回收
+import sys
+
+import pytest
+
+from infra.maintenance import vacuum_if_fragmented
+
+
+def _fragment(db, rows=2000):
+    def _job(conn):
+        conn.execute("CREATE TABLE IF NOT EXISTS junk (id INTEGER PRIMARY KEY, pad BLOB)")
+        conn.executemany("INSERT INTO junk (pad) VALUES (zeroblob(1024))", [()] * rows)
+    db.run_write(_job)
+    db.run_write(lambda conn: conn.execute("DELETE FROM junk"))
+    st = db.storage_stats()
+    assert st["freelist_count"] >= 256 and st["free_ratio"] >= 0.2
+    return st
+
+
+def test_large_db_is_not_fully_vacuumed_in_background(db):
+    st = _fragment(db)
+    assert st["auto_vacuum"] == "none"
+    assert vacuum_if_fragmented(db, 0.2, full_max_bytes=st["db_bytes"] - 1) is None
+    assert db.storage_stats()["auto_vacuum"] == "none"
+
+    res = vacuum_if_fragmented(db, 0.2, full_max_bytes=st["db_bytes"])
+    assert res["mode"] == "full" and res["freed_pages"] > 0
+    assert db.storage_stats()["auto_vacuum"] == "incremental"
+
+    # 切换之后不再受大小限制：只做增量回收
+    _fragment(db)
+    res = vacuum_if_fragmented(db, 0.2, full_max_bytes=0)
+    assert res["mode"] == "incremental" and res["freed_pages"] > 0
+
+
+def test_cli_vacuum_requires_full_for_first_switch(tmp_path, monkeypatch, capsys):
+    from ui import cli
+    monkeypatch.setenv("STOCKFLOW_DATABASE_PATH", str(tmp_path / "cli.db"))
+    _fragment(cli.get_service().db)
+
+    monkeypatch.setattr(sys, "argv", ["stockflow", "vacuum"])
+    with pytest.raises(SystemExit):
+        cli.main()
+    assert "--full" in capsys.readouterr().out
+
+    monkeypatch.setattr(sys, "argv", ["stockflow", "vacuum", "--full"])
+    cli.main()
+    assert "full" in capsys.readouterr().out
+    assert cli.get_service().db.storage_stats()["auto_vacuum"] == "incremental"
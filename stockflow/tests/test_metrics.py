@@ -0,0 +1,44 @@
+# 请求指标：跨线程累加不丢计数；/metrics 需要令牌或白名单地址
+import contextvars
+import threading
+
+from utils.metrics import HttpMetrics, begin_request, end_request, record_db
+
+
+def test_request_db_counts_from_many_threads():
+    acc, token = begin_request()
+    try:
+        def work():
+            for _ in range(2000):
+                record_db(0.001)
+
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(work,)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        end_request(token)
+    assert acc.statements == 16000
+    assert abs(acc.seconds - 16.0) < 1e-6
+
+
+def test_histogram_render():
+    m = HttpMetrics()
+    m.enter()
+    m.leave("GET", "/loans/{loan_id}", 200, 0.02, 3, 0.004)
+    text = m.render()
+    assert 'stockflow_http_requests_total{method="GET",route="/loans/{loan_id}",status="200"} 1' in text
+    assert 'stockflow_http_request_db_statements_bucket{method="GET",route="/loans/{loan_id}",le="5"} 1' in text
+    assert "stockflow_http_requests_in_flight 0" in text
+
+
+def test_metrics_endpoint_requires_token_or_allowed_address(app_client, monkeypatch):
+    from api.deps import get_cfg
+    sec = get_cfg().security
+    monkeypatch.setitem(sec, "metrics_token", "s3cret")
+    # TestClient 的来源地址不是 IP，不在白名单里
+    assert app_client.get("/metrics").status_code == 403
+    assert app_client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    r = app_client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+    assert r.status_code == 200 and "stockflow_http_requests_total" in r.text
@@ -0,0 +1,144 @@
+# PostgreSQL 引擎：SQL 翻译、行对象、方言 SQL 的单元测试（不需要 psycopg）；
+# 标了 postgres 的集成测试需要 STOCKFLOW_TEST_PG_URL 指向一个可用的库（在独立 schema 里建表，跑完删掉）。
+import os
+import uuid
+
+import pytest
+
+from infra.pg import translate, _row_class, PgRow
+from infra.storage import Dialect, POSTGRES, SQLITE, dialect_of, is_postgres_url
+
+
+# ====== translate ======
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t WHERE a=? AND b=?", "SELECT * FROM t WHERE a=%s AND b=%s"),
+    ("SELECT * FROM t WHERE a=:p AND b=:w_1", "SELECT * FROM t WHERE a=%(p)s AND b=%(w_1)s"),
+    ("SELECT x::text FROM t", "SELECT x::text FROM t"),
+    ("SELECT 'a?:b%' , 5 % 2", "SELECT 'a?:b%%' , 5 %% 2"),
+    ("SELECT \"we?rd\" FROM t", "SELECT \"we?rd\" FROM t"),
+    ("SELECT 1 -- 50% ?\nWHERE a=?", "SELECT 1 -- 50%% ?\nWHERE a=%s"),
+    ("WHERE name like ? AND likes=1", "WHERE name ILIKE %s AND likes=1"),
+])
+def test_translate(sql, expected):
+    assert translate(sql) == expected
+
+
+# ====== PgRow ======
+def test_pg_row_behaves_like_sqlite_row():
+    cls = _row_class(("id", "sku"))
+    row = cls((7, "TST-1"))
+    assert isinstance(row, PgRow) and isinstance(row, tuple)
+    assert row[0] == 7 and row["sku"] == "TST-1"
+    assert row.keys() == ["id", "sku"]
+    assert dict(zip(row.keys(), row)) == {"id": 7, "sku": "TST-1"}
+    assert _row_class(("id", "sku")) is cls
+    with pytest.raises(KeyError):
+        row["nope"]
+
+
+# ====== 方言 ======
+class _Recorder:
+    """只记录语句的假连接，用来检查方言发出的 SQL。"""
+
+    def __init__(self, rows=()):
+        self.sql, self.rows = [], list(rows)
+
+    def execute(self, sql, params=()):
+        self.sql.append((sql, params))
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_dialect_is_abstract():
+    with pytest.raises(TypeError):
+        Dialect()
+
+    class Partial(Dialect):
+        def table_names(self, conn):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_postgres_dialect_sql():
+    conn = _Recorder(rows=[("id",), ("sku",)])
+    assert POSTGRES.column_names(conn, "products") == ["id", "sku"]
+    sql, params = conn.sql[-1]
+    assert "information_schema.columns" in sql and params == ("products",)
+    assert POSTGRES.has_column(conn, "products", "sku")
+
+    conn = _Recorder()
+    POSTGRES.set_lock_timeout(conn, 2500.7)
+    POSTGRES.serialize_appends(conn, "outbox")
+    POSTGRES.begin_write(conn)          # psycopg 自动开事务，不发语句
+    assert conn.sql == [("SET lock_timeout = 2500", ()),
+                        ("SELECT pg_advisory_xact_lock(hashtext(?))", ("stockflow.append.outbox",))]
+    assert POSTGRES.for_update == " FOR UPDATE" and SQLITE.for_update == ""
+
+
+def test_dialect_selection():
+    assert dialect_of(object()) is SQLITE
+    assert is_postgres_url("postgresql://u@h/db") and is_postgres_url("postgres://h/db")
+    assert not is_postgres_url("") and not is_postgres_url("sqlite:///x.db")
+
+
+# ====== 集成：真实 PostgreSQL ======
+@pytest.fixture
+def pg_db():
+    url = os.environ.get("STOCKFLOW_TEST_PG_URL")
+    if not url:
+        pytest.skip("STOCKFLOW_TEST_PG_URL 未设置")
+    psycopg = pytest.importorskip("psycopg")
+    pytest.importorskip("psycopg_pool")
+    from psycopg.conninfo import make_conninfo
+    from infra.pg import PostgresDB
+
+    schema = f"sf_test_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(url, autocommit=True) as admin:
+        admin.execute(f"CREATE SCHEMA {schema}")
+    db = PostgresDB(make_conninfo(url, options=f"-c search_path={schema}"), pool_min=1, pool_max=4)
+    try:
+        db.migrate()
+        yield db
+    finally:
+        db.close()
+        with psycopg.connect(url, autocommit=True) as admin:
+            admin.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+@pytest.mark.postgres
+def test_pg_engine_round_trip(pg_db):
+    from core.services.inventory import InventoryService
+    from core.services.outbox import enqueue
+
+    with pg_db.read() as conn:
+        names = set(conn.dialect.table_names(conn))
+    assert {"products", "stocks", "stock_moves", "outbox", "maintenance_runs"} <= names
+
+    svc = InventoryService(pg_db, checkpoint_every=2)
+    pid = svc.add_product("TST-PG1", "ring 50%")
+    wid = svc.add_warehouse("W1", "main")
+    assert isinstance(pid, int) and isinstance(wid, int)      # INSERT 自动补 RETURNING id
+    svc.inbound(pid, wid, 5)
+    svc.inbound(pid, wid, 3)
+    svc.outbound(pid, wid, 2)
+    assert svc.stock_of(pid, wid)["qty_on_hand"] == 6
+    assert svc.ledger.on_hand_as_of(pid, wid, "2999-01-01") == 6
+    assert svc.ledger.verify() == []
+
+    with pg_db.read() as conn:
+        # LIKE → ILIKE、字面 % 转义
+        row = conn.execute("SELECT sku, name FROM products WHERE name LIKE ?", ("RING%",)).fetchone()
+        assert row["sku"] == "TST-PG1" and dict(zip(row.keys(), row))["name"] == "ring 50%"
+        assert [r["sku"] for r in conn.stream("SELECT sku FROM products", chunk=1)] == ["TST-PG1"]
+
+    pg_db.run_write(lambda conn: enqueue(conn, {"type": "test", "n": 1}))
+    with pg_db.read() as conn:
+        assert conn.execute("SELECT COUNT(1) FROM outbox").fetchone()[0] == 1
+    with pg_db.connect() as conn:
+        conn.execute("INSERT INTO warehouses (code, name) VALUES (?, ?)", ("W2", "tmp"))
+    with pg_db.read() as conn:     # 未 commit 的改动在归还时回滚
+        assert conn.execute("SELECT COUNT(1) FROM warehouses WHERE code = ?", ("W2",)).fetchone()[0] == 0
@@ -0,0 +1,61 @@
+# 扫码索引：SF1 载荷离线校验、按载荷/SKU 命中、写路径增量维护与跨进程同步
+import pytest
+
+from core.services.inventory import InventoryService
+from core.services.qr_index import QrIndex, build_qr_payload, make_chk, verify_qr_payload
+
+SECRET = "test-secret"
+
+
+def test_verify_payload():
+    p = build_qr_payload("TST0001", "TST-1", SECRET)
+    assert p == f"SF1:TST0001:TST-1:{make_chk(SECRET, 'TST0001', 'TST-1')}"
+    assert verify_qr_payload(p, SECRET) == ("TST-1", None)
+    assert verify_qr_payload(p[:-6] + p[-6:].lower(), SECRET) == ("TST-1", None)   # 校验码不分大小写
+    assert verify_qr_payload(p, SECRET, "OTHER01") == (None, "公司代码不符")
+    assert verify_qr_payload(p, "wrong") == (None, "校验码错误")
+    assert verify_qr_payload("SF1:TST0001:TST-1", SECRET) == (None, "载荷格式错误")
+
+
+@pytest.fixture
+def index(db):
+    svc = InventoryService(db)
+    pid = svc.add_product("TST-1", "ring")
+    payload = build_qr_payload("TST0001", "TST-1", SECRET)
+
+    def _job(conn):
+        conn.execute("UPDATE products SET qr_payload=?, status='在库' WHERE id=?", (payload, pid))
+        conn.execute("INSERT INTO settings(key, value) VALUES ('company_code', 'TST0001')")
+    db.run_write(_job)
+    return QrIndex(db), svc, pid, payload
+
+
+def test_resolve_and_incremental_updates(index):
+    idx, svc, pid, payload = index
+    forged = payload[:-1] + ("A" if payload[-1] != "A" else "B")
+    res = idx.resolve([payload, "tst-1", forged, "NOPE", ""], SECRET)
+    assert idx.loaded and idx.company_code == "TST0001"
+    assert [r["ok"] for r in res] == [True, True, False, False, False]
+    assert res[0]["verified"] and not res[1]["verified"]
+    assert res[2]["error"] == "校验码错误" and res[3]["error"] == "商品不存在"
+
+    changes = []
+    idx.add_listener(lambda items, removed: changes.append((items, removed)))
+    svc.db.run_write(lambda conn: conn.execute("UPDATE products SET status='借出' WHERE id=?", (pid,)))
+    idx.refresh([pid])
+    assert idx.resolve([payload], SECRET)[0]["product"]["status"] == "借出"
+    idx.remove(pid)
+    assert not idx.resolve(["TST-1"], SECRET)[0]["ok"]
+    assert changes[0][0][0]["status"] == "借出" and changes[1][1] == [{"id": pid, "sku": "TST-1"}]
+
+
+def test_sync_picks_up_other_process_changes(index):
+    idx, svc, pid, _ = index
+    idx.ensure_loaded()
+    # 别的进程新增的商品：未失效前查不到，invalidate 后下次使用按 row_version 对齐
+    other = svc.add_product("TST-2", "chain")
+    assert not idx._by_sku.get("TST-2")
+    idx.invalidate(("products",))
+    assert not idx.ready
+    assert idx.resolve(["TST-2"], SECRET)[0]["product"]["id"] == other
+    assert idx.ready and idx.syncs == 1
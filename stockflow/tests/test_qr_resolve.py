@@ -0,0 +1,42 @@
+# 扫码解析：索引就绪时在事件循环里纯内存解析；有待同步的变更时整个解析（含同步）交给读线程池
+import api.routes_qr as routes_qr
+
+
+class _SpyReaders:
+    def __init__(self, inner):
+        self.inner, self.calls = inner, 0
+
+    async def run(self, fn, *args, **kwargs):
+        self.calls += 1
+        return await self.inner.run(fn, *args, **kwargs)
+
+
+def test_stale_index_syncs_on_reader_pool(app_client, make_product, monkeypatch):
+    seen = {}
+    real_index = routes_qr.get_qr_index
+
+    def _index():
+        seen["index"] = real_index()
+        return seen["index"]
+
+    spy = _SpyReaders(routes_qr.get_readers())
+    monkeypatch.setattr(routes_qr, "get_qr_index", _index)
+    monkeypatch.setattr(routes_qr, "get_readers", lambda: spy)
+
+    p = make_product()
+    resolve = lambda: app_client.post("/api/qr/resolve", json={"codes": [p["qr_payload"]]})
+    assert resolve().json()["results"][0]["ok"]
+    index = seen["index"]
+    assert index.loaded
+
+    index.ensure_loaded()
+    assert index.ready
+    spy.calls = 0
+    assert resolve().json()["results"][0]["sku"] == p["sku"]
+    assert spy.calls == 0
+
+    # 别的 worker 改了库：已装载但不再 ready，同步不能占事件循环
+    index.invalidate(("products",))
+    assert index.loaded and not index.ready
+    assert resolve().json()["results"][0]["ok"]
+    assert spy.calls == 1 and index.ready
@@ -0,0 +1,27 @@
+# 读线程池：contextvars 随任务带过去，异常原样抛回，统计排队/执行次数
+import asyncio
+import contextvars
+
+import pytest
+
+from infra.readers import ReaderPool
+
+_var = contextvars.ContextVar("v", default=None)
+
+
+def test_run_carries_context_and_errors():
+    pool = ReaderPool(workers=2)
+
+    async def main():
+        _var.set("tenant-a")
+        got = await asyncio.gather(*[pool.run(lambda i=i: (_var.get(), i)) for i in range(4)])
+        with pytest.raises(KeyError):
+            await pool.run({}.__getitem__, "missing")
+        return got
+
+    try:
+        assert asyncio.run(main()) == [("tenant-a", i) for i in range(4)]
+        st = pool.stats()
+        assert st["completed"] == 5 and st["queued"] == 0 and st["running"] == 0
+    finally:
+        pool.shutdown()
@@ -0,0 +1,112 @@
+# 扫码常驻模式：CLI 建的库能直接起会话；多连接各自的模式；盘点按（仓库, 商品）计数
+import socket
+import threading
+import time
+
+import pytest
+
+from core.services.inventory import InventoryService
+from ui.scan import ScanSession, serve_socket
+
+
+@pytest.fixture
+def stocked(db):
+    svc = InventoryService(db)
+    pid = svc.add_product("TST-0001", "ring")
+    w1 = svc.add_warehouse("W1", "main")
+    w2 = svc.add_warehouse("W2", "shop")
+    svc.inbound(pid, w1, 5, "init")
+    return svc, pid, w1, w2
+
+
+def on_hand(svc, pid, wid):
+    return svc.stock_of(pid, wid)["qty_on_hand"]
+
+
+def test_cli_created_db_starts_scan_session(tmp_path, monkeypatch):
+    from ui.cli import get_service
+    monkeypatch.setenv("STOCKFLOW_DATABASE_PATH", str(tmp_path / "cli.db"))
+    svc = get_service()
+    svc.add_product("TST-0009", "x")
+    session = ScanSession(svc, "secret")
+    assert session.handle("#wh NOPE")["ok"] is False
+    assert session.index.resolve(["TST-0009"], "secret")[0]["ok"]
+
+
+def test_count_is_kept_per_warehouse(stocked):
+    svc, pid, w1, w2 = stocked
+    s = ScanSession(svc, "secret", action="count", wh_id=w1, apply_count=True)
+    s.handle("TST-0001")
+    s.handle("TST-0001")
+    s.handle("#wh W2")
+    s.handle("TST-0001")
+    report = {(r["wh_id"], r["product_id"]): r for r in s.count_report()}
+    assert report[(w1, pid)]["counted"] == 2 and report[(w1, pid)]["diff"] == -3
+    assert report[(w2, pid)]["counted"] == 1 and report[(w2, pid)]["diff"] == 1
+    assert on_hand(svc, pid, w1) == 2 and on_hand(svc, pid, w2) == 1
+    assert s.counts == {}
+
+
+def test_fork_has_independent_mode(stocked):
+    svc, pid, w1, w2 = stocked
+    base = ScanSession(svc, "secret", action="inbound", wh_id=w1)
+    a, b = base.fork(), base.fork()
+    assert a.index is base.index and a.tally is base.tally
+    a.handle("#action outbound")
+    a.handle("#wh W2")
+    a.handle("#qty 3")
+    assert (b.action, b.wh_id, b.qty) == ("inbound", w1, 1.0)
+    assert b.handle("TST-0001")["wh_id"] == w1
+
+
+def test_socket_clients_do_not_share_mode(stocked):
+    svc, pid, w1, w2 = stocked
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    session = ScanSession(svc, "secret", action="inbound", wh_id=w1)
+    threading.Thread(target=serve_socket, args=(session, "127.0.0.1", port, "jsonl"), daemon=True).start()
+    for _ in range(50):
+        try:
+            a = socket.create_connection(("127.0.0.1", port))
+            break
+        except OSError:
+            time.sleep(0.05)
+    b = socket.create_connection(("127.0.0.1", port))
+    fa, fb = a.makefile("rwb"), b.makefile("rwb")
+
+    def send(f, line):
+        f.write((line + "\n").encode())
+        f.flush()
+        return f.readline().decode()
+
+    send(fa, "#action outbound")
+    send(fa, "#wh W2")
+    assert '"wh_id": %d' % w1 in send(fb, "TST-0001")
+    assert on_hand(svc, pid, w1) == 6 and on_hand(svc, pid, w2) == 0
+    for f, c in ((fa, a), (fb, b)):
+        f.close()
+        c.close()
+
+
+def test_apply_count_rereads_book_at_write_time(stocked, db, monkeypatch):
+    svc, pid, w1, w2 = stocked
+    s = ScanSession(svc, "secret", action="count", wh_id=w1, apply_count=True)
+    s.handle("TST-0001")
+    s.handle("TST-0001")
+    svc.inbound(pid, w1, 3, "other-session")        # 计数之后、报告之前别处入库：账面 5 → 8
+
+    real = db.run_write
+
+    def run_write(fn):
+        s.handle("TST-0001")                          # 报告进行中又扫了一次：不属于本次报告
+        monkeypatch.setattr(db, "run_write", real)
+        return real(fn)
+
+    monkeypatch.setattr(db, "run_write", run_write)
+    (row,) = s.count_report()
+    assert (row["counted"], row["book"], row["diff"]) == (2, 8, -6)
+    assert on_hand(svc, pid, w1) == 2
+    with db.read() as conn:
+        assert conn.execute("SELECT delta FROM stock_moves WHERE kind='count'").fetchone()["delta"] == -6
+    assert s.counts == {(w1, pid): 1}
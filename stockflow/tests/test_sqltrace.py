@@ -0,0 +1,43 @@
+# SQL 追踪：语句归一化聚合、慢语句抓查询计划并标出全表扫描
+from infra.sqltrace import SqlTracer, format_report, is_full_scan, normalize_sql
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT * FROM t WHERE a = 'x''y' AND b = 12.5\n  AND c IN (?, ?, ?)") \
+        == "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?…)"
+
+
+def test_is_full_scan():
+    assert is_full_scan("SCAN products")
+    assert is_full_scan("SCAN TABLE products")
+    assert not is_full_scan("SCAN products USING INDEX idx_products_sku")
+    assert not is_full_scan("SEARCH products USING INTEGER PRIMARY KEY (rowid=?)")
+    assert not is_full_scan("SCAN CONSTANT ROW")
+
+
+def test_trace_captures_plans(db):
+    tracer = db.enable_trace(slow_ms=0)
+    try:
+        tracer.reset()
+        with db.read() as conn:
+            for sku in ("A", "B"):
+                conn.execute("SELECT id FROM products WHERE sku = ?", (sku,)).fetchall()
+            conn.execute("SELECT id FROM products WHERE name = 'ring'").fetchall()
+        snap = tracer.snapshot()
+    finally:
+        db.disable_trace()
+
+    rows = {r["sql"]: r for r in snap["statements"]}
+    by_sku = rows["SELECT id FROM products WHERE sku = ?"]
+    by_name = rows["SELECT id FROM products WHERE name = ?"]
+    assert by_sku["count"] == 2 and not by_sku["full_scan"] and by_sku["plan"]
+    assert by_name["full_scan"]
+    assert "⚠ FULL SCAN" in format_report(snap)
+
+
+def test_statement_cap_folds_into_other():
+    tracer = SqlTracer(slow_ms=1000, max_statements=2)
+    for t in ("a", "b", "c", "d"):
+        tracer.record(None, f"SELECT * FROM {t}", (), 0.001)
+    assert {r["sql"]: r["count"] for r in tracer.snapshot()["statements"]} == \
+        {"SELECT * FROM a": 1, "SELECT * FROM b": 1, "<other>": 2}
@@ -0,0 +1,75 @@
+# 多租户：流式响应发送正文期间仍计入在途请求，发完才归还（路由不会在中途关掉租户）
+import asyncio
+
+from fastapi.responses import StreamingResponse
+
+from api.deps import get_tenant_router
+from api.server import app
+
+
+def test_streaming_body_holds_tenant(app_client, monkeypatch):
+    router = get_tenant_router()
+    monkeypatch.setattr(router, "enabled", True)     # 未匹配的 Host 落到默认库
+    state = router.default
+    base = state.active
+    seen = []
+
+    async def _body():
+        for i in range(3):
+            await asyncio.sleep(0)
+            seen.append(state.active)
+            yield f"chunk{i}\n"
+
+    path = "/__test/stream"
+    app.add_api_route(path, lambda: StreamingResponse(_body(), media_type="text/plain"))
+    try:
+        r = app_client.get(path)
+        assert r.status_code == 200 and r.text.count("chunk") == 3
+        assert seen == [base + 1] * 3
+        assert state.active == base
+        # 普通响应同样配对归还
+        assert app_client.get("/products").status_code == 200
+        assert state.active == base
+    finally:
+        app.router.routes[:] = [rt for rt in app.router.routes if getattr(rt, "path", None) != path]
+
+
+def test_unread_body_still_releases_tenant(app_client, monkeypatch):
+    # 客户端在正文开始前断开：响应对象被丢掉、正文一次都没读，租户也要归还（只归还一次）
+    import gc
+    from starlette.requests import Request
+    from api.server import tenant_scope
+
+    router = get_tenant_router()
+    monkeypatch.setattr(router, "enabled", True)
+    state = router.default
+    base = state.active
+
+    async def _body():
+        yield "never read"
+
+    async def call_next(request):
+        return StreamingResponse(_body(), media_type="text/plain")
+
+    async def _scope():
+        req = Request({"type": "http", "method": "GET", "path": "/x", "query_string": b"", "headers": []})
+        response = await tenant_scope(req, call_next)
+        assert state.active == base + 1
+        del response
+
+    asyncio.run(_scope())
+    gc.collect()
+    assert state.active == base
+
+    async def _closed():
+        req = Request({"type": "http", "method": "GET", "path": "/x", "query_string": b"", "headers": []})
+        response = await tenant_scope(req, call_next)
+        await response.body_iterator.aclose()
+        await response.body_iterator.aclose()
+        return response
+
+    kept = asyncio.run(_closed())
+    assert state.active == base
+    del kept
+    gc.collect()
+    assert state.active == base
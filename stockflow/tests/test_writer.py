@@ -0,0 +1,81 @@
+# 单写线程：窗口内的任务合并成一次提交，单个任务失败只回滚它自己
+import pytest
+
+from core.services.inventory import InventoryService
+from infra.writer import WriteQueue
+
+
+@pytest.fixture
+def writer(db):
+    w = WriteQueue(db.db_path, window_ms=50, max_batch=8)
+    db.writer = w        # 先排队再启动，保证这些任务落在同一批
+    yield w
+    w.stop()
+
+
+def _add(code):
+    return lambda conn: InventoryService._add_warehouse(conn, code, "x")
+
+
+def _boom(conn):
+    conn.execute("INSERT INTO warehouses (code, name) VALUES ('BAD', 'x')")
+    raise ValueError("boom")
+
+
+def test_group_commit_isolates_failures(db, writer):
+    futs = [writer.submit(_add(f"W{i}")) for i in range(3)]
+    bad = writer.submit(_boom)
+    dup = writer.submit(_add("W0"))          # 唯一约束冲突
+    last = writer.submit(_add("W9"))
+    writer.start()
+
+    assert [f.result(timeout=5) for f in futs] == [1, 2, 3]
+    with pytest.raises(ValueError):
+        bad.result(timeout=5)
+    with pytest.raises(Exception):
+        dup.result(timeout=5)
+    assert last.result(timeout=5) == 4
+    st = writer.stats()
+    assert st["batches"] == 1 and st["jobs"] == 6 and st["failed_jobs"] == 2
+    with db.read() as conn:
+        codes = [r[0] for r in conn.execute("SELECT code FROM warehouses ORDER BY id")]
+    assert codes == ["W0", "W1", "W2", "W9"]
+
+
+def test_nested_write_runs_inline(db, writer):
+    writer.start()
+
+    def _outer(conn):
+        # 任务里再走 run_write：直接用写线程的连接，不排队（否则自锁）
+        return db.run_write(_add("IN")), writer.in_writer_thread
+
+    wid, inline = db.run_write(_outer)
+    assert inline and wid == 1
+    assert writer.stats()["batches"] == 1
+
+
+def test_unexpected_batch_error_keeps_thread_alive(db, writer, monkeypatch):
+    real = writer._record
+
+    def _record_once(*a):
+        monkeypatch.setattr(writer, "_record", real)
+        raise RuntimeError("stats broke")
+
+    monkeypatch.setattr(writer, "_record", _record_once)
+    first = writer.submit(_add("A"))
+    writer.start()
+    with pytest.raises(RuntimeError):
+        first.result(timeout=5)
+    assert writer.submit(_add("B")).result(timeout=5) == 2
+    assert writer.stats()["failed_commits"] == 1
+
+
+def test_open_failure_fails_jobs_instead_of_hanging(tmp_path):
+    w = WriteQueue(str(tmp_path / "missing" / "x.db"))
+    queued = w.submit(_add("A"))
+    w.start()
+    w._thread.join(5)
+    with pytest.raises(Exception):
+        queued.result(timeout=5)
+    with pytest.raises(Exception):
+        w.submit(_add("B")).result(timeout=5)
@@ -0,0 +1,230 @@
+# ui/batch.py
+# CLI 批量模式：从文件/标准输入读 CSV 或 JSONL 操作，一个进程、一条连接，
+# 每 chunk 条一个事务，每条操作包在 SAVEPOINT 里——单条失败只回滚它自己，结果/错误逐行流式输出。
+from __future__ import annotations
+import csv
+import json
+import sys
+import time
+from typing import Iterable, Iterator
+
+from core.services.inventory import InventoryService
+from infra.storage import IntegrityError, dialect_of
+
+OPS = ("inbound", "outbound", "product-add", "wh-add")
+
+
+class BatchError(Exception):
+    pass
+
+
+# ====== 读入 ======
+def read_ops(stream, fmt: str = "auto") -> Iterator[tuple[int, dict]]:
+    """
+    逐行产出 (行号, 操作 dict)；行号是原文件里的物理行号（注释/空行也计数），与编辑器里看到的一致。
+    CSV 需要表头（op,product_id,wh_id,qty,...）；JSONL 每行一个对象；空行与 # 开头的行跳过。
+    auto：首个非空字符是 { 则按 JSONL，否则按 CSV。
+    """
+    lines = (ln for ln in stream)
+    if fmt == "auto":
+        head = []
+        for ln in lines:
+            head.append(ln)
+            if ln.strip() and not ln.lstrip().startswith("#"):
+                break
+        fmt = "jsonl" if head and head[-1].lstrip().startswith("{") else "csv"
+        lines = _chain(head, lines)
+    if fmt == "jsonl":
+        for no, ln in enumerate(lines, 1):
+            s = ln.strip()
+            if not s or s.startswith("#"):
+                continue
+            try:
+                op = json.loads(s)
+            except json.JSONDecodeError as e:
+                yield no, {"_error": f"JSON 解析失败：{e.msg}"}
+                continue
+            yield no, op if isinstance(op, dict) else {"_error": "每行须为 JSON 对象"}
+    else:
+        # DictReader 只看到过滤后的行，它的 line_num 要换算回原文件行号（只保留尚未消费的映射）
+        phys: dict[int, int] = {}
+
+        def _kept():
+            n = 0
+            for no, ln in enumerate(lines, 1):
+                if ln.strip() and not ln.lstrip().startswith("#"):
+                    n += 1
+                    phys[n] = no
+                    yield ln
+
+        reader = csv.DictReader(_kept())
+        if reader.fieldnames is None:
+            return
+        done = reader.line_num
+        for row in reader:
+            # 多行记录（引号内换行）报它的第一行
+            no = phys[done + 1]
+            for k in range(done + 1, reader.line_num + 1):
+                phys.pop(k, None)
+            done = reader.line_num
+            yield no, {k.strip(): (v.strip() if isinstance(v, str) else v)
+                       for k, v in row.items() if k and v not in (None, "")}
+
+
+def _chain(head: list, rest):
+    yield from head
+    yield from rest
+
+
+# ====== 执行 ======
+class BatchRunner:
+    """
+    在同一条连接上按块提交：BEGIN（SQLite 为 IMMEDIATE）→ 每条 SAVEPOINT → COMMIT。
+    sku / wh_code 可代替 product_id / wh_id，解析结果进程内缓存。
+    """
+
+    def __init__(self, svc: InventoryService, chunk: int = 500, stop_on_error: bool = False,
+                 dry_run: bool = False):
+        self.svc = svc
+        self.chunk = max(1, int(chunk))
+        self.stop_on_error = stop_on_error
+        self.dry_run = dry_run
+        self._products: dict[str, int] = {}
+        self._warehouses: dict[str, int] = {}
+        self.ok = 0
+        self.failed = 0
+        self.commits = 0
+
+    # —— 解析引用 ——
+    def _product_id(self, conn, op: dict) -> int:
+        if op.get("product_id") not in (None, ""):
+            return int(op["product_id"])
+        sku = op.get("sku")
+        if not sku:
+            raise BatchError("缺少 product_id 或 sku")
+        if sku not in self._products:
+            row = conn.execute("SELECT id FROM products WHERE sku=?", (sku,)).fetchone()
+            if not row:
+                raise BatchError(f"商品不存在：{sku}")
+            self._products[sku] = row[0]
+        return self._products[sku]
+
+    def _warehouse_id(self, conn, op: dict) -> int:
+        if op.get("wh_id") not in (None, ""):
+            return int(op["wh_id"])
+        code = op.get("wh_code")
+        if not code:
+            raise BatchError("缺少 wh_id 或 wh_code")
+        if code not in self._warehouses:
+            row = conn.execute("SELECT id FROM warehouses WHERE code=?", (code,)).fetchone()
+            if not row:
+                raise BatchError(f"仓库不存在：{code}")
+            self._warehouses[code] = row[0]
+        return self._warehouses[code]
+
+    def _apply(self, conn, op: dict) -> dict:
+        if "_error" in op:
+            raise BatchError(op["_error"])
+        kind = op.get("op")
+        if kind in ("inbound", "outbound"):
+            pid, wid = self._product_id(conn, op), self._warehouse_id(conn, op)
+            try:
+                qty = float(op["qty"])
+            except (KeyError, TypeError, ValueError):
+                raise BatchError("qty 缺失或不是数字")
+            if qty <= 0:
+                raise BatchError("qty 须大于 0")
+            fn = self.svc._inbound if kind == "inbound" else self.svc._outbound
+            fn(conn, pid, wid, qty, op.get("ref"))
+            return {"product_id": pid, "wh_id": wid, "qty": qty}
+        if kind == "product-add":
+            if not op.get("sku") or not op.get("name"):
+                raise BatchError("product-add 需要 sku 与 name")
+            pid = self.svc._add_product(conn, op["sku"], op["name"], op.get("spec"), op.get("unit") or "pcs",
+                                        float(op.get("cost") or 0), float(op.get("price") or 0))
+            self._products[op["sku"]] = pid
+            return {"id": pid}
+        if kind == "wh-add":
+            if not op.get("code") or not op.get("name"):
+                raise BatchError("wh-add 需要 code 与 name")
+            wid = self.svc._add_warehouse(conn, op["code"], op["name"])
+            self._warehouses[op["code"]] = wid
+            return {"id": wid}
+        raise BatchError(f"未知操作：{kind!r}（可选 {', '.join(OPS)}）")
+
+    def run(self, ops: Iterable[tuple[int, dict]], emit) -> dict:
+        """emit(result_dict) 每条调用一次（提交后才输出成功结果，输出即已落库）。"""
+        t0 = time.perf_counter()
+        it = iter(ops)
+        stop = False
+        with self.svc.db.connect() as conn:
+            dialect = dialect_of(conn)
+            dialect.set_lock_timeout(conn, 5000)
+            while not stop:
+                block = []
+                for no, op in it:
+                    block.append((no, op))
+                    if len(block) >= self.chunk:
+                        break
+                if not block:
+                    break
+                dialect.begin_write(conn)
+                results = []
+                try:
+                    for no, op in block:
+                        conn.execute("SAVEPOINT sf_batch")
+                        try:
+                            res = self._apply(conn, op)
+                            conn.execute("RELEASE sf_batch")
+                            results.append({"line": no, "op": op.get("op"), "ok": True, **res})
+                        except (BatchError, *IntegrityError, ValueError, LookupError) as e:
+                            conn.execute("ROLLBACK TO sf_batch")
+                            conn.execute("RELEASE sf_batch")
+                            results.append({"line": no, "op": op.get("op"), "ok": False, "error": str(e)})
+                            if self.stop_on_error:
+                                stop = True
+                                break
+                    if self.dry_run:
+                        conn.rollback()
+                    else:
+                        conn.commit()
+                        self.commits += 1
+                except BaseException:
+                    conn.rollback()
+                    raise
+                for r in results:
+                    if r["ok"]:
+                        self.ok += 1
+                    else:
+                        self.failed += 1
+                    emit(r)
+                # 名称缓存可能引用了被回滚的新增行：预演模式下每块清空
+                if self.dry_run:
+                    self._products.clear()
+                    self._warehouses.clear()
+        return {"ok": self.ok, "failed": self.failed, "commits": self.commits,
+                "dry_run": self.dry_run, "elapsed_s": round(time.perf_counter() - t0, 3)}
+
+
+# ====== 输出 ======
+class RowWriter:
+    """列表输出：text（人读）/ jsonl / csv，逐行写出不攒整表。"""
+
+    def __init__(self, fmt: str, text_fn, out=None):
+        self.fmt = fmt
+        self.text_fn = text_fn
+        self.out = out or sys.stdout
+        self._csv = None
+        self.count = 0
+
+    def write(self, row: dict):
+        if self.fmt == "jsonl":
+            self.out.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        elif self.fmt == "csv":
+            if self._csv is None:
+                self._csv = csv.DictWriter(self.out, fieldnames=list(row.keys()), extrasaction="ignore")
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        else:
+            self.out.write(self.text_fn(row) + "\n")
+        self.count += 1
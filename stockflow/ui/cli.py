@@ -1,16 +1,38 @@
 import argparse
+import json
+import sys
+from pathlib import Path
 from utils.config import load_config
-from infra.db_interface import DB, run_migrations
+from infra.db_interface import SqliteTuning, migrate_all
+from infra.storage import open_storage
 from core.services.inventory import InventoryService
+from core.services.analytics import InventoryAnalytics, AnalyticsUnavailable
+from infra.sqltrace import format_report
+from ui.batch import BatchRunner, RowWriter, read_ops
+from ui.scan import run as run_scan
+from api.tenancy import tenant_db_path
 
-def get_service():
+def get_service(tenant: str | None = None):
     cfg = load_config()
-    db = DB(cfg.database_path)
-    run_migrations(db)
-    return InventoryService(db)
+    # --tenant：操作某个租户的库（不存在则新建；服务端首次访问时会补齐其余迁移）
+    tuning = SqliteTuning.from_config(cfg.performance)
+    if tenant:
+        db = open_storage(tenant_db_path(cfg.tenants, tenant), tuning=tuning)
+    else:
+        db = open_storage(cfg.database_path, cfg.database_url,
+                          cfg.performance["pg_pool_min"], cfg.performance["pg_pool_max"], tuning)
+    # 与服务端同一套完整迁移：CLI 新建的库也有扫码索引、账本等用到的全部表与列
+    migrate_all(db)
+    return InventoryService(db, cfg.performance["ledger_checkpoint_every"])
+
+def _add_list_args(p):
+    p.add_argument("--page", type=int, default=1)
+    p.add_argument("--page-size", type=int, default=0, help="每页条数；0 表示全部（逐行流式输出）")
+    p.add_argument("--format", default="text", choices=["text", "jsonl", "csv"])
 
 def main():
     parser = argparse.ArgumentParser(prog="stockflow", description="StockFlow 出入库最小CLI")
+    parser.add_argument("--tenant", help="租户代码（多租户部署时指定操作哪家店的库）")
     sub = parser.add_subparsers(dest="cmd")
 
     # product add
@@ -22,8 +44,9 @@ def main():
     p_add.add_argument("--cost", type=float, default=0.0)
     p_add.add_argument("--price", type=float, default=0.0)
 
-    # product list
-    sub.add_parser("product-list", help="商品列表")
+    # product list（分页 + text/jsonl/csv 流式输出）
+    p_list = sub.add_parser("product-list", help="商品列表")
+    _add_list_args(p_list)
 
     # warehouse add
     w_add = sub.add_parser("wh-add", help="新增仓库")
@@ -43,21 +66,82 @@ def main():
     ob.add_argument("--qty", type=float, required=True)
 
     # stock show
-    ss = sub.add_parser("stock", help="查询库存")
-    ss.add_argument("--product-id", type=int, required=True)
-    ss.add_argument("--wh-id", type=int, required=True)
+    ss = sub.add_parser("stock", help="查询库存（同时给商品和仓库查单条，否则按条件列出）")
+    ss.add_argument("--product-id", type=int)
+    ss.add_argument("--wh-id", type=int)
+    _add_list_args(ss)
+
+    # batch：一个进程内批量执行（CSV/JSONL，文件或标准输入）
+    bt = sub.add_parser("batch", help="批量执行 inbound/outbound/product-add/wh-add（CSV 或 JSONL）")
+    bt.add_argument("file", nargs="?", default="-", help="操作文件，- 或省略表示标准输入")
+    bt.add_argument("--input-format", default="auto", choices=["auto", "csv", "jsonl"])
+    bt.add_argument("--chunk", type=int, default=500, help="每个事务的操作条数")
+    bt.add_argument("--stop-on-error", action="store_true", help="遇到第一条失败即停止（已提交的块保留）")
+    bt.add_argument("--dry-run", action="store_true", help="只校验执行、全部回滚")
+    bt.add_argument("--quiet", action="store_true", help="只输出失败行与汇总")
+
+    # 历史时点库存（流水账本）
+    sa = sub.add_parser("stock-asof", help="查询某时点库存（最近检查点 + 流水回放）")
+    sa.add_argument("--date", required=True, help="YYYY-MM-DD 或 YYYY-MM-DD HH:MM:SS")
+    sa.add_argument("--wh-id", type=int)
+    sa.add_argument("--product-id", type=int)
+
+    # 账本维护：定期补检查点 / 对账
+    sub.add_parser("ledger-checkpoint", help="为有新流水的（商品, 仓库）补记结存检查点（可由计划任务定期执行）")
+    sub.add_parser("ledger-verify", help="核对流水合计与当前结存")
+
+    # 回收空闲页（仅 SQLite）：首次需 --full 做完整 VACUUM 并切到增量回收，期间阻塞写入，宜停服执行
+    vc = sub.add_parser("vacuum", help="回收空闲页；--full 允许完整 VACUUM 并把库切到增量回收模式（仅 SQLite）")
+    vc.add_argument("--full", action="store_true", help="库还不是增量回收模式时做一次完整 VACUUM")
+
+    # 库存分析（需要 numpy）
+    rp = sub.add_parser("report", help="库存分析报表：估值/库龄/品类")
+    rp.add_argument("kind", choices=["valuation", "aging", "categories"])
+    rp.add_argument("--date", help="库龄基准日 YYYY-MM-DD，默认今天")
+    rp.add_argument("--buckets", default="30,90,180,365", help="库龄分桶上界（天）")
+    rp.add_argument("--include-sold", action="store_true")
+    rp.add_argument("--json", action="store_true", help="输出 JSON")
+
+    # scan：扫码枪常驻模式（标准输入或本机 TCP）
+    sc = sub.add_parser("scan", help="扫码常驻模式：逐行读扫码内容并执行入库/出库/归还/盘点")
+    sc.add_argument("--action", default="inbound", choices=["inbound", "outbound", "return", "count"])
+    sc.add_argument("--wh-id", type=int)
+    sc.add_argument("--wh-code")
+    sc.add_argument("--qty", type=float, default=1.0)
+    sc.add_argument("--ref", default="scan", help="写入流水的 ref")
+    sc.add_argument("--signed-only", action="store_true", help="只接受带校验码的 SF1 载荷")
+    sc.add_argument("--apply-count", action="store_true", help="盘点结束时按差异调整结存并记流水")
+    sc.add_argument("--listen", help="HOST:PORT，改为监听本机 TCP（如 127.0.0.1:8799）")
+    sc.add_argument("--format", default="text", choices=["text", "jsonl"])
+
+    # sql trace（读取服务端导出的追踪快照）
+    st = sub.add_parser("sql-trace", help="查看 SQL 追踪报告（慢语句/全表扫描）")
+    st.add_argument("--file", help="追踪快照 JSON，默认 <event_log_dir>/sql_trace.json")
+    st.add_argument("--limit", type=int, default=20)
+    st.add_argument("--order", default="total_ms", choices=["total_ms", "max_ms", "avg_ms", "count"])
 
     args = parser.parse_args()
-    svc = get_service()
+
+    if args.cmd == "sql-trace":
+        path = Path(args.file or Path(load_config().paths["event_log_dir"]) / "sql_trace.json")
+        if not path.exists():
+            print(f"❌ 未找到追踪快照：{path}（先开启 performance.sql_trace 或 POST /api/admin/sql-trace/dump）")
+            return
+        snap = json.loads(path.read_text(encoding="utf-8"))
+        snap["statements"].sort(key=lambda r: r.get(args.order) or 0, reverse=True)
+        print(format_report(snap, args.limit))
+        return
+
+    svc = get_service(args.tenant)
 
     if args.cmd == "product-add":
         pid = svc.add_product(args.sku, args.name, args.spec, args.unit, args.cost, args.price)
         print(f"✅ 新增商品 ID={pid}")
     elif args.cmd == "product-list":
-        rows = svc.list_products()
-        if not rows: print("（空）"); return
-        for r in rows:
-            print(f"[{r['id']}] {r['sku']} {r['name']} ({r.get('spec') or ''}) unit={r['unit']} cost={r['cost_price']} price={r['sale_price']}")
+        out = RowWriter(args.format, lambda r: f"[{r['id']}] {r['sku']} {r['name']} ({r.get('spec') or ''}) unit={r['unit']} cost={r['cost_price']} price={r['sale_price']}")
+        for r in svc.iter_products(args.page, args.page_size):
+            out.write(r)
+        if not out.count and args.format == "text": print("（空）")
     elif args.cmd == "wh-add":
         wid = svc.add_warehouse(args.code, args.name)
         print(f"✅ 新增仓库 ID={wid}")
@@ -68,8 +152,79 @@ def main():
         svc.outbound(args.product_id, args.wh_id, args.qty)
         print("✅ 出库完成")
     elif args.cmd == "stock":
-        s = svc.stock_of(args.product_id, args.wh_id)
-        print(f"📦 qty_on_hand={s['qty_on_hand']} | qty_reserved={s['qty_reserved']}")
+        if args.product_id is not None and args.wh_id is not None and args.format == "text":
+            s = svc.stock_of(args.product_id, args.wh_id)
+            print(f"📦 qty_on_hand={s['qty_on_hand']} | qty_reserved={s['qty_reserved']}")
+            return
+        out = RowWriter(args.format, lambda r: f"[{r['wh_code']}] {r['sku']} {r['name']} qty_on_hand={r['qty_on_hand']} | qty_reserved={r['qty_reserved']}")
+        for r in svc.iter_stocks(args.product_id, args.wh_id, args.page, args.page_size):
+            out.write(r)
+        if not out.count and args.format == "text": print("（空）")
+    elif args.cmd == "scan":
+        run_scan(svc, load_config(), args)
+    elif args.cmd == "batch":
+        src = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="")
+        def _emit(r):
+            if not r["ok"]:
+                print(json.dumps(r, ensure_ascii=False), file=sys.stderr, flush=True)
+            elif not args.quiet:
+                print(json.dumps(r, ensure_ascii=False))
+        try:
+            runner = BatchRunner(svc, args.chunk, args.stop_on_error, args.dry_run)
+            summary = runner.run(read_ops(src, args.input_format), _emit)
+        finally:
+            if src is not sys.stdin:
+                src.close()
+        print(json.dumps({"summary": summary}, ensure_ascii=False), file=sys.stderr)
+        if summary["failed"]:
+            sys.exit(1)
+    elif args.cmd == "stock-asof":
+        if args.product_id is not None and args.wh_id is not None:
+            print(f"📦 {args.date}: qty={svc.ledger.on_hand_as_of(args.product_id, args.wh_id, args.date)}")
+            return
+        rows = svc.ledger.stock_as_of(args.date, args.wh_id)
+        if not rows: print("（空）"); return
+        for r in rows:
+            print(f"[{r['wh_code']}] {r['sku']} {r['name']} qty={r['qty']}")
+    elif args.cmd == "vacuum":
+        if not hasattr(svc.db, "vacuum"):
+            print("❌ 仅 SQLite 引擎需要手动回收（PostgreSQL 由 autovacuum 负责）"); return
+        st = svc.db.storage_stats()
+        if st["auto_vacuum"] != "incremental" and not args.full:
+            print(f"❌ 库尚未切到增量回收（auto_vacuum={st['auto_vacuum']}，{st['db_bytes'] // 1048576} MB）："
+                  "首次需加 --full 做一次完整 VACUUM，期间写入会被阻塞，建议停服后执行")
+            sys.exit(1)
+        res = svc.db.vacuum()
+        print(f"✅ {res['mode']} 回收 {res['freed_pages']} 页，耗时 {res['elapsed_ms']} ms")
+    elif args.cmd == "ledger-checkpoint":
+        print(f"✅ 新增检查点 {svc.ledger.checkpoint_all()} 个")
+    elif args.cmd == "report":
+        an = InventoryAnalytics(svc.db)
+        try:
+            if args.kind == "valuation":
+                rep = an.valuation(args.include_sold)
+            elif args.kind == "aging":
+                rep = an.aging(args.date, [int(b) for b in args.buckets.split(",") if b.strip()], args.include_sold)
+            else:
+                rep = an.categories(args.include_sold)
+        except AnalyticsUnavailable as e:
+            print(f"❌ {e}"); return
+        if args.json:
+            print(json.dumps(rep, ensure_ascii=False, indent=2)); return
+        if args.kind == "valuation":
+            rows = [rep["total"]] + rep["by_status"] + rep["by_category"]
+        elif args.kind == "aging":
+            print(f"基准日 {rep['as_of']}，平均库龄 {rep['avg_age_days']} 天")
+            rows = rep["buckets"]
+        else:
+            rows = rep["valuation"]
+        for r in rows:
+            print(f"{r['name']}: {r['count']} 件 cost={r['cost_total']} price={r['sale_total']} margin={r['margin']} ({r['margin_pct']}%)")
+    elif args.cmd == "ledger-verify":
+        bad = svc.ledger.verify()
+        if not bad: print("✅ 流水与结存一致"); return
+        for r in bad:
+            print(f"❌ product={r['product_id']} wh={r['warehouse_id']} stocks={r['qty_on_hand']} ledger={r['ledger_qty']}")
     else:
         parser.print_help()
 
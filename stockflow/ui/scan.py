@@ -0,0 +1,309 @@
+# ui/scan.py
+# 扫码枪常驻模式：扫码枪按键盘方式逐行输入，进程常驻，省掉每次扫码的启动/迁移检查。
+# - 启动时装载一次扫码索引（SKU / qr_payload → 商品），SF1 载荷先离线校验 HMAC 与公司代码；
+# - 写操作交给写线程（infra.writer.WriteQueue），同一窗口内的多次扫码合并为一次提交；
+# - 输入来自标准输入，或 --listen 的本机 TCP 端口（多个工作站共用一个常驻进程；
+#   每个连接一个会话，动作/仓库/数量/盘点计数互不影响，只共用服务、写线程、扫码索引与统计）。
+from __future__ import annotations
+import json
+import socketserver
+import sys
+import threading
+import time
+
+from infra.storage import SQLITE
+from infra.writer import WriteQueue
+from core.services.inventory import InventoryService
+from core.services.loans import LoanService
+from core.services.qr_index import QrIndex
+
+ACTIONS = ("inbound", "outbound", "return", "count")
+
+_ACTION_TEXT = {"inbound": "入库", "outbound": "出库", "return": "归还", "count": "盘点"}
+
+
+class ScanTally:
+    """扫码次数/失败数/耗时：同一进程的所有会话（TCP 连接）共用一份。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.scans = 0
+        self.errors = 0
+        self._lat_total = 0.0
+        self._lat_max = 0.0
+
+    def add(self, ok: bool, ms: float):
+        with self._lock:
+            self.scans += 1
+            self.errors += 0 if ok else 1
+            self._lat_total += ms
+            self._lat_max = max(self._lat_max, ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"scans": self.scans, "errors": self.errors,
+                    "avg_ms": round(self._lat_total / self.scans, 2) if self.scans else 0.0,
+                    "max_ms": round(self._lat_max, 2)}
+
+
+class ScanSession:
+    """
+    一个扫码会话（一台扫码枪 / 一个 TCP 连接）：当前动作/仓库/数量可用控制行切换（扫码枪可打印成控制条码）：
+      #action inbound|outbound|return|count   #wh <仓库编码>   #qty <数量>   #report   #stats
+    count 只在内存里按（仓库, 商品）计数，#report 逐仓输出与账面的差异；apply_count=True 时按差异写盘点流水。
+    fork() 给新连接开会话：共用服务/扫码索引/统计，模式与计数各自独立。
+    """
+
+    def __init__(self, svc: InventoryService, secret: str, action: str = "inbound",
+                 wh_id: int | None = None, qty: float = 1.0, signed_only: bool = False,
+                 ref: str = "scan", apply_count: bool = False,
+                 index: QrIndex | None = None, tally: ScanTally | None = None):
+        self.svc = svc
+        self.db = svc.db
+        self.loans = LoanService(self.db)
+        if index is None:
+            index = QrIndex(self.db)
+            index.ensure_loaded()
+        self.index = index
+        self.tally = tally or ScanTally()
+        self.secret = secret
+        self.action = action
+        self.wh_id = wh_id
+        self.qty = float(qty)
+        self.signed_only = signed_only
+        self.ref = ref
+        self.apply_count = apply_count
+        self._lock = threading.Lock()
+        self.counts: dict[tuple[int, int], float] = {}   # (仓库, 商品) → 实盘数
+
+    def fork(self) -> "ScanSession":
+        """新连接的会话：初始模式取自本会话（命令行参数），之后各改各的。"""
+        return ScanSession(self.svc, self.secret, self.action, self.wh_id, self.qty, self.signed_only,
+                           self.ref, self.apply_count, index=self.index, tally=self.tally)
+
+    # ====== 解析 ======
+    def _resolve(self, code: str) -> dict:
+        res = self.index.resolve([code], self.secret)[0]
+        if not res["ok"] and res.get("error") == "商品不存在":
+            # 索引建立后由别的进程（网页端）新增的商品：按 SKU/载荷补读一次
+            if self.index.load_missing(res.get("sku") or code, code):
+                res = self.index.resolve([code], self.secret)[0]
+        if res["ok"] and self.signed_only and not res["verified"]:
+            return {"code": code, "ok": False, "error": "只接受带校验码的 SF1 标签"}
+        return res
+
+    def _warehouse_id(self, code: str) -> int:
+        with self.db.read() as conn:
+            row = conn.execute("SELECT id FROM warehouses WHERE code=?", (code,)).fetchone()
+        if not row:
+            raise ValueError(f"仓库不存在：{code}")
+        return row["id"]
+
+    # ====== 控制行 ======
+    def _control(self, line: str) -> dict:
+        cmd, _, arg = line[1:].strip().partition(" ")
+        arg = arg.strip()
+        if cmd == "action":
+            if arg not in ACTIONS:
+                raise ValueError(f"未知动作：{arg}（可选 {', '.join(ACTIONS)}）")
+            self.action = arg
+        elif cmd == "wh":
+            self.wh_id = self._warehouse_id(arg)
+        elif cmd == "qty":
+            q = float(arg)
+            if q <= 0:
+                raise ValueError("数量须大于 0")
+            self.qty = q
+        elif cmd == "report":
+            return {"ok": True, "report": self.count_report()}
+        elif cmd == "stats":
+            return {"ok": True, "stats": self.stats()}
+        else:
+            raise ValueError(f"未知控制命令：{cmd}")
+        return {"ok": True, "action": self.action, "wh_id": self.wh_id, "qty": self.qty}
+
+    # ====== 处理一行 ======
+    def handle(self, line: str) -> dict | None:
+        line = (line or "").strip()
+        if not line:
+            return None
+        t0 = time.perf_counter()
+        try:
+            if line.startswith("#"):
+                return self._control(line)
+            out = self._apply(line)
+        except Exception as e:
+            out = {"code": line, "ok": False, "error": str(e)}
+        ms = (time.perf_counter() - t0) * 1000
+        self.tally.add(out["ok"], ms)
+        out["ms"] = round(ms, 2)
+        return out
+
+    def _apply(self, code: str) -> dict:
+        res = self._resolve(code)
+        if not res["ok"]:
+            return res
+        item = res["product"]
+        base = {"code": code, "ok": True, "action": self.action, "sku": item["sku"], "product_id": item["id"]}
+        if self.action == "return":
+            r = self.loans.return_items([item["sku"]])
+            if not r["returned"]:
+                return {**base, "ok": False, "error": "没有未归还的借出记录"}
+            self.index.refresh([item["id"]])
+            return {**base, "loan_no": r["items"][0]["loan_no"]}
+        if self.wh_id is None:
+            return {**base, "ok": False, "error": "未指定仓库（--wh-code 或 #wh <编码>）"}
+        if self.action == "count":
+            key = (self.wh_id, item["id"])
+            with self._lock:
+                n = self.counts[key] = self.counts.get(key, 0) + self.qty
+            return {**base, "counted": n, "wh_id": self.wh_id}
+        if self.action == "inbound":
+            self.svc.inbound(item["id"], self.wh_id, self.qty, self.ref)
+        else:
+            self.svc.outbound(item["id"], self.wh_id, self.qty, self.ref)
+        return {**base, "qty": self.qty, "wh_id": self.wh_id}
+
+    # ====== 盘点 ======
+    def count_report(self) -> list[dict]:
+        """
+        盘点差异：本次计数 vs 各自仓库的账面结存（计数时记下的仓库，中途 #wh 切换不会串仓）；
+        apply_count 时在写事务里重读账面、把结存直接设成实盘数，按 实盘-账面 写 kind=count 的流水
+        （计数之后别的会话/网页端的出入库不会被覆盖）；入账后只扣掉本次报告用到的计数，报告期间新扫的保留。
+        """
+        with self._lock:
+            counts = dict(self.counts)
+        if not counts:
+            return []
+        by_wh: dict[int, list[int]] = {}
+        for wid, pid in counts:
+            by_wh.setdefault(wid, []).append(pid)
+        if self.apply_count:
+            return self._apply_counts(counts)
+        book: dict[tuple[int, int], float] = {}
+        with self.db.read() as conn:
+            for wid, ids in by_wh.items():
+                ph = ",".join(["?"] * len(ids))
+                for r in conn.execute(
+                        f"SELECT product_id, qty_on_hand FROM stocks WHERE warehouse_id=? AND product_id IN ({ph})",
+                        (wid, *ids)):
+                    book[(wid, r["product_id"])] = r["qty_on_hand"]
+        return [{"wh_id": wid, "product_id": pid, "counted": n, "book": book.get((wid, pid), 0.0),
+                 "diff": n - book.get((wid, pid), 0.0)}
+                for (wid, pid), n in sorted(counts.items())]
+
+    def _apply_counts(self, counts: dict[tuple[int, int], float]) -> list[dict]:
+        def _job(conn):
+            rows = []
+            for (wid, pid), n in sorted(counts.items()):
+                self.svc._ensure_stock_row(conn, pid, wid)
+                book = conn.execute("SELECT qty_on_hand FROM stocks WHERE product_id=? AND warehouse_id=?",
+                                    (pid, wid)).fetchone()["qty_on_hand"]
+                diff = n - book
+                if diff:
+                    conn.execute("UPDATE stocks SET qty_on_hand = ? WHERE product_id=? AND warehouse_id=?",
+                                 (n, pid, wid))
+                    self.svc.ledger.record(conn, pid, wid, diff, "count", self.ref)
+                rows.append({"wh_id": wid, "product_id": pid, "counted": n, "book": book, "diff": diff})
+            return rows
+
+        rows = self.db.run_write(_job)
+        with self._lock:
+            for key, n in counts.items():
+                left = self.counts.get(key, 0) - n
+                if left > 0:
+                    self.counts[key] = left
+                else:
+                    self.counts.pop(key, None)
+        return rows
+
+    def stats(self) -> dict:
+        out = self.tally.stats()
+        if self.db.writer is not None:
+            out["writer"] = self.db.writer.stats()
+        return out
+
+
+def format_result(r: dict, fmt: str) -> str:
+    if fmt == "jsonl":
+        return json.dumps(r, ensure_ascii=False)
+    if "report" in r:
+        return "\n".join(f"📋 仓库={x['wh_id']} product={x['product_id']} 实盘={x['counted']} 账面={x['book']} 差异={x['diff']}"
+                         for x in r["report"]) or "📋 （无盘点记录）"
+    if "stats" in r:
+        return "📊 " + json.dumps(r["stats"], ensure_ascii=False)
+    if not r["ok"]:
+        return f"❌ {r.get('code', '')} {r['error']}"
+    if "sku" not in r:
+        return f"⚙️ 动作={_ACTION_TEXT[r['action']]} 仓库={r['wh_id']} 数量={r['qty']}"
+    extra = f" 计数={r['counted']}" if "counted" in r else (f" 单号={r['loan_no']}" if "loan_no" in r else "")
+    return f"✅ {r['sku']} {_ACTION_TEXT[r['action']]}{extra} ({r['ms']}ms)"
+
+
+# ====== 输入源 ======
+def serve_stdin(session: ScanSession, fmt: str):
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        r = session.handle(line)
+        if r is not None:
+            print(format_result(r, fmt), flush=True)
+
+
+def serve_socket(session: ScanSession, host: str, port: int, fmt: str):
+    """
+    本机 TCP：每个连接逐行收扫码、逐行回结果；多个连接的写入在写线程里合并提交。
+    每个连接 fork 一个会话：一台工作站的 #action/#wh/#qty 不会改到别的工作站。
+    """
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            conn_session = session.fork()
+            for raw in self.rfile:
+                r = conn_session.handle(raw.decode("utf-8", "replace"))
+                if r is not None:
+                    self.wfile.write((format_result(r, fmt) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+            # 断开时还有没出报告的盘点计数：出一次报告（apply_count 时入账），记到服务端日志
+            if conn_session.counts:
+                print(format_result({"ok": True, "report": conn_session.count_report()}, fmt),
+                      file=sys.stderr, flush=True)
+
+    class _Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    with _Server((host, port), _Handler) as srv:
+        print(f"🔌 扫码服务监听 {host}:{port}，动作={_ACTION_TEXT[session.action]}", file=sys.stderr, flush=True)
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def run(svc: InventoryService, cfg, args):
+    perf = cfg.performance
+    writer = None
+    # PostgreSQL 引擎没有单写者，多个工作站的扫码直接并发写
+    if svc.db.dialect is SQLITE:
+        writer = WriteQueue(svc.db.db_path, window_ms=perf["writer_window_ms"], max_batch=perf["writer_max_batch"],
+                            busy_timeout_ms=perf["busy_timeout_ms"])
+        svc.db.attach_writer(writer)
+    try:
+        session = ScanSession(svc, cfg.security["secret_key"], args.action, None, args.qty,
+                              args.signed_only, args.ref, args.apply_count)
+        if args.wh_code:
+            session.wh_id = session._warehouse_id(args.wh_code)
+        elif args.wh_id is not None:
+            session.wh_id = args.wh_id
+        if args.listen:
+            host, _, port = args.listen.rpartition(":")
+            serve_socket(session, host or "127.0.0.1", int(port), args.format)
+        else:
+            serve_stdin(session, args.format)
+        if session.action == "count" or session.counts:
+            print(format_result({"ok": True, "report": session.count_report()}, args.format))
+        print(format_result({"ok": True, "stats": session.stats()}, args.format), file=sys.stderr)
+    finally:
+        if writer is not None:
+            writer.stop()
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from pathlib import Path
+import os
 import yaml
 from typing import Any, Dict, Optional
 
@@ -7,15 +8,20 @@ from typing import Any, Dict, Optional
 class AppConfig:
     app_name: str
     database_path: str
+    database_url: str
     features: Dict[str, Any]
     security: Dict[str, Any]
     paths: Dict[str, Any]
     logging: Optional[Dict[str, Any]] = None
+    performance: Optional[Dict[str, Any]] = None
+    tenants: Optional[Dict[str, Any]] = None
 
 def _with_defaults(data: dict) -> dict:
     # 基本默认
     data.setdefault("app_name", "StockFlow")
     data.setdefault("database_path", "./data/stockflow.db")
+    # 非空（postgresql://…）时改用 PostgreSQL 引擎（需 psycopg[pool]），database_path 不再使用
+    data.setdefault("database_url", "")
     data.setdefault("features", {})
 
     # security 默认
@@ -24,17 +30,64 @@ def _with_defaults(data: dict) -> dict:
     sec.setdefault("access_token_minutes", 30)
     sec.setdefault("refresh_token_days", 14)
     sec.setdefault("cookie_name", "sf_session")
+    sec.setdefault("metrics_token", "")          # 非空时 /metrics 接受 Authorization: Bearer <token>
+    sec.setdefault("metrics_allow", ["127.0.0.1/32", "::1/128"])  # 不带令牌时允许抓取 /metrics 的来源地址（CIDR）
 
     # paths 默认
     paths = data.setdefault("paths", {})
     paths.setdefault("event_log_dir", "./logs")
     paths.setdefault("snapshots_dir", "./snapshots")
     paths.setdefault("backups_dir", "./backups")
+    paths.setdefault("template_cache_dir", "./cache/jinja")
+    paths.setdefault("asset_cache_dir", "./cache/assets")
 
     # logging 可选
     log = data.setdefault("logging", {})
     log.setdefault("level", "INFO")
 
+    # performance 可选（运行时调优参数）
+    perf = data.setdefault("performance", {})
+    perf.setdefault("reader_workers", 4)         # 读线程池大小
+    perf.setdefault("reader_slow_wait_ms", 200)  # 读任务排队超过该值打告警
+    perf.setdefault("writer_window_ms", 2)       # 写线程合并提交的收集窗口
+    perf.setdefault("writer_max_batch", 64)      # 单次合并提交的最大任务数
+    perf.setdefault("busy_timeout_ms", 5000)     # 写锁等待上限
+    perf.setdefault("checkpoint_interval_s", 0)  # >0 时由后台线程定时做 WAL 检查点
+    perf.setdefault("checkpoint_truncate_pages", 10000)  # WAL 超过该页数时做 TRUNCATE
+    perf.setdefault("sqlite_synchronous", "NORMAL")  # 每条连接的 PRAGMA synchronous（WAL 下 NORMAL 不损坏库）
+    perf.setdefault("sqlite_cache_mb", 16)       # 每条连接的页缓存（MB）
+    perf.setdefault("sqlite_mmap_mb", 256)       # 内存映射读取上限（MB，0=关闭）
+    perf.setdefault("sqlite_temp_store", "MEMORY")  # 排序/临时表放内存
+    perf.setdefault("maintenance_tick_s", 60)    # 后台维护线程检查间隔（0=不启动）
+    perf.setdefault("maintenance_idle_s", 30)    # 多少秒无写入算空闲（空闲时才收缩 WAL / 跑维护任务）
+    perf.setdefault("optimize_interval_s", 3600)     # PRAGMA optimize 间隔（0=不做）
+    perf.setdefault("vacuum_interval_s", 86400)      # 检查碎片并回收空闲页的间隔（0=不做）
+    perf.setdefault("vacuum_free_ratio", 0.2)        # 空闲页占比达到该值才回收
+    perf.setdefault("vacuum_full_max_mb", 64)        # 未切到增量回收的库，后台只对不超过该大小的做完整 VACUUM
+    perf.setdefault("ledger_checkpoint_interval_s", 86400)  # 补记账本结存检查点的间隔（0=不做）
+    perf.setdefault("sql_trace", False)          # 启动即开启 SQL 追踪
+    perf.setdefault("sql_slow_ms", 50)           # 超过该耗时的语句抓 EXPLAIN QUERY PLAN
+    perf.setdefault("fragment_cache_rows", 100000)  # 行级片段缓存条目上限（0=关闭）
+    perf.setdefault("ledger_checkpoint_every", 100)  # 每对（商品, 仓库）每多少条流水记一次结存检查点
+    perf.setdefault("label_pdf_cache_mb", 64)    # 标签 PDF 缓存上限（MB，0=不缓存）
+    perf.setdefault("event_buffer", 1000)        # 推送事件环形缓冲（断线重连可补发的条数）
+    perf.setdefault("event_stream_max_s", 300)   # 单条 SSE 连接最长存活秒数，到期由浏览器自动续连
+    perf.setdefault("invalidation_poll_ms", 500) # 跨 worker 缓存失效的后台轮询间隔（0=只在请求前检查）
+    perf.setdefault("pg_pool_min", 1)            # PostgreSQL 连接池最小/最大连接数（每个进程）
+    perf.setdefault("pg_pool_max", 10)
+    perf.setdefault("outbox_sinks", ["csv"])     # 发件箱导出目标：csv / jsonl（可多选）
+    perf.setdefault("outbox_poll_ms", 500)       # 导出线程轮询间隔（0=不启动导出线程，事件留在 outbox 表）
+    perf.setdefault("outbox_batch", 500)         # 每批导出条数
+
+    # 多租户（一家店一个库）：按 Host 映射租户代码，库文件为 <dir>/<代码>/stockflow.db
+    ten = data.setdefault("tenants", {})
+    ten.setdefault("enabled", False)
+    ten.setdefault("hosts", {})                  # {"shop-a.example.com": "SHOPA", ...}
+    ten.setdefault("header", "")                 # 非空时也接受该请求头指定租户（如 X-Tenant，仅限内网反代后）
+    ten.setdefault("dir", "./data/tenants")
+    ten.setdefault("max_open", 16)               # 同时打开的租户库上限（LRU，空闲的先关）
+    ten.setdefault("fallback_default", True)     # 未匹配的 Host 用 database_path 的默认库；False 则 404
+
     # 确保数据库目录存在
     db_path = Path(data["database_path"])
     db_path.parent.mkdir(parents=True, exist_ok=True)
@@ -43,11 +96,20 @@ def _with_defaults(data: dict) -> dict:
     Path(paths["event_log_dir"]).mkdir(parents=True, exist_ok=True)
     Path(paths["snapshots_dir"]).mkdir(parents=True, exist_ok=True)
     Path(paths["backups_dir"]).mkdir(parents=True, exist_ok=True)
+    Path(paths["template_cache_dir"]).mkdir(parents=True, exist_ok=True)
+    Path(paths["asset_cache_dir"]).mkdir(parents=True, exist_ok=True)
 
     return data
 
 def load_config(path: str = "config.yaml") -> AppConfig:
     with open(path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f) or {}
+    # 环境变量覆盖：基准测试/临时实例指向别的库与日志目录，不必改 config.yaml
+    if os.environ.get("STOCKFLOW_DATABASE_PATH"):
+        data["database_path"] = os.environ["STOCKFLOW_DATABASE_PATH"]
+    if os.environ.get("STOCKFLOW_DATABASE_URL"):
+        data["database_url"] = os.environ["STOCKFLOW_DATABASE_URL"]
+    if os.environ.get("STOCKFLOW_EVENT_LOG_DIR"):
+        data.setdefault("paths", {})["event_log_dir"] = os.environ["STOCKFLOW_EVENT_LOG_DIR"]
     data = _with_defaults(data)
     return AppConfig(**data)
@@ -0,0 +1,171 @@
+# utils/metrics.py
+# 进程内指标：按路由统计延迟直方图 / 并发数 / 状态码 / 每请求 SQL 条数与耗时，
+# 以 Prometheus 文本格式导出（不依赖 prometheus_client）
+from __future__ import annotations
+import contextvars
+import threading
+
+# 延迟桶（秒）与每请求 SQL 条数桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+class RequestDb:
+    """
+    单个请求的 DB 统计（语句数 / 耗时秒）。读线程池与写线程复制上下文后指向同一个对象，
+    同一请求的 SQL 可能同时在几个线程里执行，累加要加锁。
+    """
+    __slots__ = ("_lock", "statements", "seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.seconds = 0.0
+
+    def add(self, elapsed: float):
+        with self._lock:
+            self.statements += 1
+            self.seconds += elapsed
+
+
+# 当前请求的 RequestDb；由中间件设置
+_request_db: contextvars.ContextVar[RequestDb | None] = contextvars.ContextVar("sf_request_db", default=None)
+
+
+def begin_request() -> tuple[RequestDb, contextvars.Token]:
+    acc = RequestDb()
+    return acc, _request_db.set(acc)
+
+
+def end_request(token: contextvars.Token):
+    _request_db.reset(token)
+
+
+def record_db(elapsed: float):
+    """每执行一条 SQL 调用一次（infra.db_interface 的连接工厂负责）。"""
+    acc = _request_db.get()
+    if acc is not None:
+        acc.add(elapsed)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.sum += v
+        self.count += 1
+        for i, ub in enumerate(self.buckets):
+            if v <= ub:
+                self.counts[i] += 1
+                break
+
+
+def _fmt_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for k, v in labels.items():
+        v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_num(v) -> str:
+    if isinstance(v, float):
+        return repr(round(v, 6))
+    return str(v)
+
+
+class HttpMetrics:
+    """
+    HTTP 请求指标登记表（线程安全）。
+    route 使用路由模板（如 /loans/{loan_id}），避免路径参数导致标签爆炸。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._requests: dict[tuple, int] = {}          # (method, route, status) → 次数
+        self._errors: dict[tuple, int] = {}            # (method, route) → 未捕获异常次数
+        self._latency: dict[tuple, _Histogram] = {}    # (method, route) → 延迟
+        self._db_stmts: dict[tuple, _Histogram] = {}   # (method, route) → 每请求语句数
+        self._db_seconds: dict[tuple, float] = {}      # (method, route) → DB 累计耗时
+
+    def enter(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def leave(self, method: str, route: str, status: int, elapsed: float,
+              db_statements: int, db_seconds: float, error: bool = False):
+        key = (method, route)
+        with self._lock:
+            self._in_flight -= 1
+            rk = (method, route, int(status))
+            self._requests[rk] = self._requests.get(rk, 0) + 1
+            if error:
+                self._errors[key] = self._errors.get(key, 0) + 1
+            h = self._latency.get(key)
+            if h is None:
+                h = self._latency[key] = _Histogram(LATENCY_BUCKETS)
+            h.observe(elapsed)
+            s = self._db_stmts.get(key)
+            if s is None:
+                s = self._db_stmts[key] = _Histogram(STATEMENT_BUCKETS)
+            s.observe(db_statements)
+            self._db_seconds[key] = self._db_seconds.get(key, 0.0) + db_seconds
+
+    # ---------- 导出 ----------
+    @staticmethod
+    def _histogram_lines(name: str, data: dict[tuple, _Histogram]) -> list[str]:
+        lines = []
+        for (method, route), h in sorted(data.items()):
+            base = {"method": method, "route": route}
+            acc = 0
+            for ub, c in zip(h.buckets, h.counts):
+                acc += c
+                lines.append(f"{name}_bucket{_fmt_labels({**base, 'le': _fmt_num(ub)})} {acc}")
+            lines.append(f"{name}_bucket{_fmt_labels({**base, 'le': '+Inf'})} {h.count}")
+            lines.append(f"{name}_sum{_fmt_labels(base)} {_fmt_num(h.sum)}")
+            lines.append(f"{name}_count{_fmt_labels(base)} {h.count}")
+        return lines
+
+    def render(self) -> str:
+        with self._lock:
+            out = [
+                "# HELP stockflow_http_requests_in_flight Requests currently being served.",
+                "# TYPE stockflow_http_requests_in_flight gauge",
+                f"stockflow_http_requests_in_flight {self._in_flight}",
+                "# HELP stockflow_http_requests_total Requests by method, route and status code.",
+                "# TYPE stockflow_http_requests_total counter",
+            ]
+            for (method, route, status), n in sorted(self._requests.items()):
+                out.append(f"stockflow_http_requests_total"
+                           f"{_fmt_labels({'method': method, 'route': route, 'status': status})} {n}")
+
+            out += ["# HELP stockflow_http_exceptions_total Unhandled exceptions by route.",
+                    "# TYPE stockflow_http_exceptions_total counter"]
+            for (method, route), n in sorted(self._errors.items()):
+                out.append(f"stockflow_http_exceptions_total{_fmt_labels({'method': method, 'route': route})} {n}")
+
+            out += ["# HELP stockflow_http_request_duration_seconds Request latency.",
+                    "# TYPE stockflow_http_request_duration_seconds histogram"]
+            out += self._histogram_lines("stockflow_http_request_duration_seconds", self._latency)
+
+            out += ["# HELP stockflow_http_request_db_statements SQL statements executed per request.",
+                    "# TYPE stockflow_http_request_db_statements histogram"]
+            out += self._histogram_lines("stockflow_http_request_db_statements", self._db_stmts)
+
+            out += ["# HELP stockflow_http_request_db_seconds_total Time spent executing SQL per route.",
+                    "# TYPE stockflow_http_request_db_seconds_total counter"]
+            for (method, route), v in sorted(self._db_seconds.items()):
+                out.append(f"stockflow_http_request_db_seconds_total"
+                           f"{_fmt_labels({'method': method, 'route': route})} {_fmt_num(v)}")
+        return "\n".join(out) + "\n"
+
+
+http_metrics = HttpMetrics()